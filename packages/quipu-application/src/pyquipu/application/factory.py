@@ -4,6 +4,7 @@ from pathlib import Path
 from pyquipu.engine.config import ConfigManager
 from pyquipu.engine.git_db import GitDB
 from pyquipu.engine.git_object_storage import GitObjectHistoryReader, GitObjectHistoryWriter
+from pyquipu.engine.snapshot_policy import SnapshotPolicy
 from pyquipu.engine.state_machine import Engine
 
 from .utils import find_git_repository_root
@@ -26,11 +27,33 @@ def create_engine(work_dir: Path, lazy: bool = False) -> Engine:
     config = ConfigManager(project_root)
     storage_type = config.get("storage.type", "git_object")
     logger.debug(f"Engine factory configured with storage type: '{storage_type}'")
-    git_db = GitDB(project_root)
+    # 未配置任何限制时不启用策略，快照行为与旧版本完全一致
+    snapshot_policy = SnapshotPolicy(
+        max_file_size=config.get("snapshot.max_file_size", 0),
+        binary_max_size=config.get("snapshot.binary_max_size", 0),
+        exclude=config.get("snapshot.exclude", []),
+        sample_hash=config.get("snapshot.pointer_sample_hash", True),
+    )
+    git_db = GitDB(
+        project_root,
+        native_reader=config.get("storage.native_reader", True),
+        native_writer=config.get("storage.native_writer", True),
+        tree_hasher=config.get("snapshot.tree_hasher", True),
+        persistent_index=config.get("snapshot.persistent_index", True),
+        fsmonitor=config.get("snapshot.fsmonitor"),
+        watch_journal=config.get("watch.journal", True),
+        targeted_checkout=config.get("checkout.targeted", True),
+        checkout_workers=config.get("checkout.workers", 8),
+        diff_cache_size=config.get("diff_cache.max_entries", 4096),
+        compact_heads=config.get("refs.compact_heads", True),
+        pack_refs_interval=config.get("refs.pack_interval", 200),
+        snapshot_policy=snapshot_policy if snapshot_policy.active else None,
+    )
     db_manager = None
 
     # 默认和备用后端
-    reader = GitObjectHistoryReader(git_db)
+    snapshot_path = git_db.quipu_dir / "graph.snapshot" if config.get("storage.graph_snapshot", True) else None
+    reader = GitObjectHistoryReader(git_db, snapshot_path=snapshot_path)
     writer = GitObjectHistoryWriter(git_db)
 
     if storage_type == "sqlite":
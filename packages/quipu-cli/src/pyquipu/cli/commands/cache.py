@@ -100,14 +100,70 @@ def cache_prune_refs(
         refs_to_delete = []
         for c_hash, ref_name in local_heads:
             if c_hash in redundant_commits:
-                refs_to_delete.append(ref_name)
+                refs_to_delete.append((ref_name, c_hash))
 
         bus.info("cache.prune.info.found", count=len(refs_to_delete), total=len(local_heads))
 
+        # 带旧值校验的单个事务：扫描期间若有引用被移动，整批删除都不会生效
         deleted_count = 0
-        for ref in refs_to_delete:
-            engine.git_db.delete_ref(ref)
-            deleted_count += 1
+        with engine.git_db.ref_transaction() as transaction:
+            for ref, c_hash in refs_to_delete:
+                transaction.delete(ref, c_hash)
+                deleted_count += 1
 
         bus.success("cache.prune.success", count=deleted_count)
         return
+
+
+@cache_app.command("commit-graph")
+def cache_commit_graph(
+    ctx: typer.Context,
+    work_dir: Annotated[
+        Path,
+        typer.Option(
+            "--work-dir", "-w", help="操作执行的根目录（工作区）", file_okay=False, dir_okay=True, resolve_path=True
+        ),
+    ] = DEFAULT_WORK_DIR,
+):
+    setup_logging()
+
+    with engine_context(work_dir) as engine:
+        bus.info("cache.commitGraph.info.writing")
+        try:
+            count = engine.git_db.write_commit_graph()
+        except RuntimeError as e:
+            bus.error("cache.commitGraph.error", error=str(e))
+            ctx.exit(1)
+            return
+        bus.success("cache.commitGraph.success", count=count)
+
+
+@cache_app.command("reindex")
+def cache_reindex(
+    ctx: typer.Context,
+    work_dir: Annotated[
+        Path,
+        typer.Option(
+            "--work-dir", "-w", help="操作执行的根目录（工作区）", file_okay=False, dir_okay=True, resolve_path=True
+        ),
+    ] = DEFAULT_WORK_DIR,
+):
+    setup_logging()
+
+    with engine_context(work_dir) as engine:
+        if engine.db_manager is None:
+            bus.error("cache.reindex.error.unsupported")
+            ctx.exit(1)
+            return
+
+        try:
+            # 冷节点的内容尚未缓存；批量回填后再重建，使索引覆盖全部计划内容
+            bus.info("cache.reindex.info.loading")
+            engine.reader.prefetch_contents(engine.reader.load_all_nodes())
+            count = engine.db_manager.rebuild_fulltext_index()
+        except Exception as e:
+            logger.error("重建全文索引失败", exc_info=True)
+            bus.error("cache.reindex.error", error=str(e))
+            ctx.exit(1)
+            return
+        bus.success("cache.reindex.success", count=count)
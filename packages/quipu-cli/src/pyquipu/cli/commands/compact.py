@@ -0,0 +1,55 @@
+import logging
+from pathlib import Path
+from typing import Annotated, Optional
+
+import typer
+from pyquipu.common.messaging import bus
+from pyquipu.engine.config import ConfigManager
+
+from ..config import DEFAULT_WORK_DIR
+from .helpers import engine_context
+
+logger = logging.getLogger(__name__)
+
+
+def register(app: typer.Typer):
+    @app.command(help="将旧的连续 capture 节点链合并为单个节点，控制历史图谱的规模。")
+    def compact(
+        ctx: typer.Context,
+        older_than: Annotated[
+            Optional[float],
+            typer.Option("--older-than", min=0, help="只合并早于该天数的节点 (默认取 compaction.captures 配置)。"),
+        ] = None,
+        min_length: Annotated[
+            Optional[int],
+            typer.Option("--min-length", min=2, help="连续 capture 节点少于该数量时不合并。"),
+        ] = None,
+        work_dir: Annotated[
+            Path,
+            typer.Option(
+                "--work-dir", "-w", help="操作执行的根目录（工作区）", file_okay=False, dir_okay=True, resolve_path=True
+            ),
+        ] = DEFAULT_WORK_DIR,
+    ):
+        with engine_context(work_dir) as engine:
+            config = ConfigManager(engine.root_dir)
+            days = older_than if older_than is not None else config.get("compaction.captures.older_than_days", 7)
+            length = min_length if min_length is not None else config.get("compaction.captures.min_length", 3)
+
+            bus.info("compact.info.starting", days=days, min_length=length)
+            try:
+                result = engine.compact_captures(days * 86400, length)
+            except (RuntimeError, NotImplementedError) as e:
+                logger.error("压缩历史失败", exc_info=True)
+                bus.error("compact.error.failed", error=str(e))
+                ctx.exit(1)
+
+            if not result.chains:
+                bus.success("compact.info.nothingToDo")
+                return
+            bus.success(
+                "compact.success",
+                chains=result.chains,
+                removed=result.removed,
+                rewritten=len(result.rewritten) - result.removed,
+            )
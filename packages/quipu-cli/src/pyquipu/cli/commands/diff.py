@@ -0,0 +1,74 @@
+import json
+import logging
+from pathlib import Path
+from typing import Annotated
+
+import typer
+from pyquipu.common.messaging import bus
+from pyquipu.engine.state_machine import Engine
+
+from ..config import DEFAULT_WORK_DIR
+from .helpers import engine_context
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve_tree(engine: Engine, ref: str) -> str:
+    # 优先匹配历史节点 (commit_hash 或 output_tree 前缀)，否则接受完整的 tree 哈希
+    output_trees = {node.output_tree for node in engine.history_graph.find_by_prefix(ref)}
+    if len(output_trees) == 1:
+        return output_trees.pop()
+    if len(output_trees) > 1:
+        bus.error("diff.error.notUnique", hash_prefix=ref, count=len(output_trees))
+        raise typer.Exit(1)
+    if len(ref) == 40 and engine.git_db.batch_check_objects([ref]).get(ref, ("",))[0] == "tree":
+        return ref
+    bus.error("diff.error.notFound", hash_prefix=ref)
+    raise typer.Exit(1)
+
+
+def register(app: typer.Typer):
+    @app.command(help="比较两个历史状态之间的差异 (结果会被缓存，重复查询即时返回)。")
+    def diff(
+        old: Annotated[str, typer.Argument(help="起始状态：节点哈希前缀或 tree 哈希。")],
+        new: Annotated[str, typer.Argument(help="目标状态：节点哈希前缀或 tree 哈希。")],
+        work_dir: Annotated[
+            Path,
+            typer.Option(
+                "--work-dir", "-w", help="操作执行的根目录（工作区）", file_okay=False, dir_okay=True, resolve_path=True
+            ),
+        ] = DEFAULT_WORK_DIR,
+        name_status: Annotated[bool, typer.Option("--name-status", help="仅显示变更文件及其状态。")] = False,
+        numstat: Annotated[bool, typer.Option("--numstat", help="显示每个文件的增删行数。")] = False,
+        json_output: Annotated[bool, typer.Option("--json", help="以 JSON 格式将结果输出到 stdout。")] = False,
+    ):
+        with engine_context(work_dir) as engine:
+            old_tree = _resolve_tree(engine, old)
+            new_tree = _resolve_tree(engine, new)
+            git_db = engine.git_db
+
+            if json_output:
+                changes = git_db.get_diff_name_status(old_tree, new_tree)
+                stats = {path: (added, deleted) for added, deleted, path in git_db.get_diff_numstat(old_tree, new_tree)}
+                files = []
+                for status, path in changes:
+                    added, deleted = stats.get(path, (None, None))
+                    files.append({"status": status, "path": path, "added": added, "deleted": deleted})
+                bus.data(json.dumps({"old_tree": old_tree, "new_tree": new_tree, "files": files}, indent=2))
+                return
+
+            if name_status:
+                lines = [f"{status}\t{path}" for status, path in git_db.get_diff_name_status(old_tree, new_tree)]
+            elif numstat:
+                lines = [
+                    f"{'-' if added is None else added}\t{'-' if deleted is None else deleted}\t{path}"
+                    for added, deleted, path in git_db.get_diff_numstat(old_tree, new_tree)
+                ]
+            else:
+                stat = git_db.get_diff_stat(old_tree, new_tree)
+                lines = stat.splitlines()
+
+            if not lines:
+                bus.info("diff.info.noChanges")
+                return
+            bus.data("\n".join(lines))
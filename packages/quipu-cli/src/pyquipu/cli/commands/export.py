@@ -160,7 +160,7 @@ def register(app: typer.Typer):
                 bus.info("export.info.emptyHistory")
                 ctx.exit(0)
 
-            nodes_to_process = sorted(engine.history_graph.values(), key=lambda n: n.timestamp, reverse=True)
+            nodes_to_process = engine.history_graph.sorted_nodes()
 
             if reachable_only:
                 nodes_to_process = filter_reachable_nodes(engine, nodes_to_process)
@@ -191,6 +191,7 @@ def register(app: typer.Typer):
             # 预计算文件名和节点集合以供导航栏使用
             filename_map = {node.commit_hash: _generate_filename(node) for node in nodes_to_export}
             exported_hashes_set = {node.commit_hash for node in nodes_to_export}
+            engine.reader.prefetch_contents(nodes_to_export)
 
             with typer.progressbar(nodes_to_export, label="导出进度") as progress:
                 for node in progress:
@@ -2,11 +2,12 @@ import logging
 from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Generator, List, Optional
+from typing import Generator, List, Optional
 
 import typer
 from pyquipu.application.factory import create_engine
 from pyquipu.common.messaging import bus
+from pyquipu.engine.graph_store import GraphStore
 from pyquipu.engine.state_machine import Engine
 from pyquipu.interfaces.models import QuipuNode
 
@@ -27,12 +28,11 @@ def engine_context(work_dir: Path) -> Generator[Engine, None, None]:
             engine.close()
 
 
-def _find_current_node(engine: Engine, graph: Dict[str, QuipuNode]) -> Optional[QuipuNode]:
+def _find_current_node(engine: Engine, graph: GraphStore) -> Optional[QuipuNode]:
     current_hash = engine.git_db.get_tree_hash()
-    # 修复：直接从 graph 中通过 output_tree hash 查找
-    for node in graph.values():
-        if node.output_tree == current_hash:
-            return node
+    node = graph.find_by_output_tree(current_hash)
+    if node:
+        return node
 
     bus.warning("navigation.warning.workspaceDirty")
     bus.info("navigation.info.saveHint")
@@ -77,10 +77,6 @@ def filter_reachable_nodes(engine: Engine, nodes: List[QuipuNode]) -> List[Quipu
         # 如果工作区是脏的，无法确定起点，返回所有节点
         return nodes
 
-    current_hash = current_node.output_tree
-    ancestors = engine.reader.get_ancestor_output_trees(current_hash)
-    descendants = engine.reader.get_descendant_output_trees(current_hash)
-    reachable_set = ancestors.union(descendants)
-    reachable_set.add(current_hash)
+    reachable_set = engine.reader.get_reachable_output_trees(current_node.output_tree)
 
     return [node for node in nodes if node.output_tree in reachable_set]
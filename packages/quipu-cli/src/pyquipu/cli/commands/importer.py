@@ -0,0 +1,62 @@
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Annotated, Iterator, TextIO
+
+import typer
+from pyquipu.common.messaging import bus
+from pyquipu.interfaces.models import ImportRecord
+
+from ..config import DEFAULT_WORK_DIR
+from .helpers import engine_context
+
+logger = logging.getLogger(__name__)
+
+
+def _iter_records(stream: TextIO) -> Iterator[ImportRecord]:
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            yield ImportRecord(
+                key=str(data.get("id", line_no)),
+                node_type=data.get("type", "plan"),
+                content=data.get("content", ""),
+                parent=data.get("parent"),
+                summary=data.get("summary"),
+                output_tree=data.get("output_tree"),
+                input_tree=data.get("input_tree"),
+                timestamp=float(data["timestamp"]) if data.get("timestamp") is not None else None,
+            )
+        except (ValueError, TypeError, AttributeError) as e:
+            raise ValueError(f"line {line_no}: {e}") from e
+
+
+def register(app: typer.Typer):
+    @app.command(name="import", help="从 JSONL 文件批量导入历史节点 (每行一个记录，'-' 表示标准输入)。")
+    def import_command(
+        ctx: typer.Context,
+        source: Annotated[str, typer.Argument(help="JSONL 文件路径，或 '-' 读取标准输入。")],
+        work_dir: Annotated[
+            Path,
+            typer.Option(
+                "--work-dir", "-w", help="操作执行的根目录（工作区）", file_okay=False, dir_okay=True, resolve_path=True
+            ),
+        ] = DEFAULT_WORK_DIR,
+    ):
+        with engine_context(work_dir) as engine:
+            bus.info("import.info.starting", source=source)
+            try:
+                if source == "-":
+                    nodes = engine.import_nodes(_iter_records(sys.stdin))
+                else:
+                    with open(source, "r", encoding="utf-8") as f:
+                        nodes = engine.import_nodes(_iter_records(f))
+            except (OSError, ValueError, RuntimeError) as e:
+                logger.error("批量导入失败", exc_info=True)
+                bus.error("import.error.failed", error=str(e))
+                ctx.exit(1)
+
+            bus.success("import.success", count=len(nodes))
@@ -28,7 +28,7 @@ def register(app: typer.Typer):
         with engine_context(work_dir) as engine:
             graph = engine.history_graph
 
-            matches = [node for node in graph.values() if node.output_tree.startswith(hash_prefix)]
+            matches = graph.find_by_prefix(hash_prefix, commit=False)
             if not matches:
                 bus.error("navigation.checkout.error.notFound", hash_prefix=hash_prefix)
                 ctx.exit(1)
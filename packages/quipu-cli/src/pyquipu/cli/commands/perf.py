@@ -0,0 +1,104 @@
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Annotated, Dict, List
+
+import typer
+from pyquipu.application.utils import find_git_repository_root
+from pyquipu.common.messaging import bus
+from pyquipu.engine.git_metrics import append_perf_record, load_perf_records, metrics
+
+from ..config import DEFAULT_WORK_DIR
+
+perf_app = typer.Typer(name="perf", help="查看 Git 子进程的性能统计。")
+
+PERF_LOG_NAME = "perf.jsonl"
+
+
+def _perf_log_path(root: Path) -> Path:
+    return root / ".quipu" / PERF_LOG_NAME
+
+
+def _format_breakdown(stats: Dict[str, Dict]) -> List[str]:
+    lines = [f"  {'subcommand':<24} {'calls':>6} {'spawns':>6} {'time(ms)':>10} {'in(B)':>10} {'out(B)':>12}"]
+    for name, s in sorted(stats.items(), key=lambda item: item[1]["wall_time"], reverse=True):
+        lines.append(
+            f"  {name:<24} {s['calls']:>6} {s['spawns']:>6} {s['wall_time'] * 1000:>10.1f} "
+            f"{s['bytes_in']:>10} {s['bytes_out']:>12}"
+        )
+    return lines
+
+
+def _summarize(record: Dict) -> Dict:
+    stats = record.get("git", {})
+    return {
+        "calls": sum(s["calls"] for s in stats.values()),
+        "spawns": sum(s["spawns"] for s in stats.values()),
+        "git_time": sum(s["wall_time"] for s in stats.values()),
+    }
+
+
+def enable_profiling(ctx: typer.Context):
+    metrics.reset()
+    command = ctx.invoked_subcommand or "quipu"
+
+    def _report():
+        elapsed = time.time() - metrics.started_at
+        record = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "command": command,
+            "elapsed": round(elapsed, 6),
+            "git": metrics.snapshot(),
+        }
+        summary = _summarize(record)
+        bus.info(
+            "perf.info.summary",
+            command=command,
+            elapsed=elapsed * 1000,
+            calls=summary["calls"],
+            spawns=summary["spawns"],
+            git_time=summary["git_time"] * 1000,
+        )
+        for line in _format_breakdown(record["git"]):
+            bus.info("perf.info.line", line=line)
+        for root in metrics.roots:
+            append_perf_record(_perf_log_path(root), record)
+
+    ctx.call_on_close(_report)
+
+
+@perf_app.command("report")
+def perf_report(
+    work_dir: Annotated[
+        Path,
+        typer.Option(
+            "--work-dir", "-w", help="操作执行的根目录（工作区）", file_okay=False, dir_okay=True, resolve_path=True
+        ),
+    ] = DEFAULT_WORK_DIR,
+    last: Annotated[int, typer.Option("--last", "-n", help="显示最近 N 次调用。")] = 5,
+    json_output: Annotated[bool, typer.Option("--json", help="以 JSON 格式输出结果。")] = False,
+):
+    root = find_git_repository_root(work_dir) or work_dir
+    records = load_perf_records(_perf_log_path(root), last)
+    if not records:
+        if json_output:
+            bus.data("[]")
+        else:
+            bus.info("perf.info.noRecords")
+        raise typer.Exit(0)
+
+    if json_output:
+        bus.data(json.dumps(records, indent=2, ensure_ascii=False))
+        raise typer.Exit(0)
+
+    for record in records:
+        summary = _summarize(record)
+        bus.data(
+            f"{record.get('timestamp', '?')}  quipu {record.get('command', '?')}  "
+            f"{record.get('elapsed', 0) * 1000:.1f}ms  "
+            f"git: {summary['calls']} calls / {summary['spawns']} spawns / {summary['git_time'] * 1000:.1f}ms"
+        )
+        for line in _format_breakdown(record.get("git", {})):
+            bus.data(line)
+        bus.data("")
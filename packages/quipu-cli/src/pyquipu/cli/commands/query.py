@@ -2,20 +2,21 @@ import dataclasses
 import json
 from datetime import datetime
 from pathlib import Path
-from typing import Annotated, List, Optional
+from typing import Annotated, Any, Dict, List, Optional
 
 import typer
 from pyquipu.common.messaging import bus
+from pyquipu.engine.state_machine import Engine
 from pyquipu.interfaces.models import QuipuNode
 
 from ..config import DEFAULT_WORK_DIR
 from .helpers import engine_context, filter_nodes, filter_reachable_nodes
 
 
-def _nodes_to_json_str(nodes: List[QuipuNode]) -> str:
+def _nodes_to_json_str(nodes: List[QuipuNode], extras: Optional[List[Dict[str, Any]]] = None) -> str:
     EXCLUDED_FIELDS = {"parent", "children", "content", "filename"}
     node_list = []
-    for node in nodes:
+    for i, node in enumerate(nodes):
         node_dict = {}
         for field in dataclasses.fields(node):
             if field.name in EXCLUDED_FIELDS:
@@ -28,11 +29,50 @@ def _nodes_to_json_str(nodes: List[QuipuNode]) -> str:
 
         # Explicitly add properties
         node_dict["short_hash"] = node.short_hash
+        if extras:
+            node_dict.update(extras[i])
         node_list.append(node_dict)
 
     return json.dumps(node_list, indent=2)
 
 
+def _print_search_results(
+    ctx: typer.Context,
+    engine: Engine,
+    text: str,
+    summary_regex: Optional[str],
+    node_type: Optional[str],
+    limit: int,
+    json_output: bool,
+):
+    try:
+        hits = engine.search_nodes(text, summary_regex=summary_regex, node_type=node_type, limit=limit)
+    except NotImplementedError:
+        bus.error("query.find.error.textUnsupported")
+        ctx.exit(1)
+
+    if not hits:
+        if json_output:
+            bus.data("[]")
+        else:
+            bus.info("query.info.noResults")
+        return
+
+    if json_output:
+        extras = [{"score": hit.score, "snippet": hit.snippet} for hit in hits]
+        bus.data(_nodes_to_json_str([hit.node for hit in hits], extras))
+        return
+
+    bus.info("query.find.ui.header")
+    for hit in hits:
+        node = hit.node
+        ts = node.timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        tag = f"[{node.node_type.upper()}]"
+        bus.data(f"{ts} {tag:<9} {node.output_tree} - {node.summary}")
+        # 片段可能跨行，压缩为单行显示
+        bus.data(f"    {' '.join(hit.snippet.split())}")
+
+
 def register(app: typer.Typer):
     @app.command(help="按时间倒序显示历史图谱。")
     def log(
@@ -61,7 +101,7 @@ def register(app: typer.Typer):
                     bus.info("query.info.emptyHistory")
                 raise typer.Exit(0)
 
-            nodes_to_process = sorted(graph.values(), key=lambda n: n.timestamp, reverse=True)
+            nodes_to_process = graph.sorted_nodes()
 
             if reachable_only:
                 nodes_to_process = filter_reachable_nodes(engine, nodes_to_process)
@@ -93,7 +133,7 @@ def register(app: typer.Typer):
                 data_line = f"{ts} {tag:<9} {node.short_hash} - {summary}"
                 bus.data(data_line)
 
-    @app.command(name="find", help="根据摘要或类型搜索历史节点。")
+    @app.command(name="find", help="根据摘要、类型或全文内容搜索历史节点。")
     def find_command(
         ctx: typer.Context,
         summary_regex: Annotated[
@@ -102,6 +142,10 @@ def register(app: typer.Typer):
         node_type: Annotated[
             Optional[str], typer.Option("--type", "-t", help="节点类型 ('plan' 或 'capture')。")
         ] = None,
+        text: Annotated[
+            Optional[str],
+            typer.Option("--text", help="在摘要、计划内容与私有意图中全文检索，按相关度排序 (需要 SQLite 存储后端)。"),
+        ] = None,
         limit: Annotated[int, typer.Option("--limit", "-n", help="返回的最大结果数量。")] = 10,
         work_dir: Annotated[Path, typer.Option("--work-dir", "-w", help="工作区根目录。")] = DEFAULT_WORK_DIR,
         json_output: Annotated[bool, typer.Option("--json", help="以 JSON 格式输出结果。")] = False,
@@ -114,6 +158,10 @@ def register(app: typer.Typer):
                     bus.info("query.info.emptyHistory")
                 ctx.exit(0)
 
+            if text is not None:
+                _print_search_results(ctx, engine, text, summary_regex, node_type, limit, json_output)
+                ctx.exit(0)
+
             nodes = engine.find_nodes(summary_regex=summary_regex, node_type=node_type, limit=limit)
 
             if not nodes:
@@ -1,7 +1,9 @@
 import subprocess
+import time
+from contextlib import contextmanager
 from enum import Enum
 from pathlib import Path
-from typing import Annotated, Optional
+from typing import Annotated, List, Optional, Tuple
 
 import typer
 from pyquipu.application.utils import find_git_repository_root
@@ -12,6 +14,7 @@ from pyquipu.engine.git_db import GitDB
 
 from ..config import DEFAULT_WORK_DIR
 from ..logger_config import setup_logging
+from .helpers import engine_context
 
 
 class SyncMode(str, Enum):
@@ -35,6 +38,10 @@ def register(app: typer.Typer):
         remote_option: Annotated[
             Optional[str], typer.Option("--remote", "-r", help="Git 远程仓库的名称 (覆盖配置文件)。")
         ] = None,
+        remotes_option: Annotated[
+            Optional[str],
+            typer.Option("--remotes", help="逗号分隔的多个远程仓库 (如 a,b,c)，并发拉取并依次调和/推送。"),
+        ] = None,
         mode: Annotated[
             SyncMode,
             typer.Option(
@@ -44,8 +51,21 @@ def register(app: typer.Typer):
                 case_sensitive=False,
             ),
         ] = SyncMode.BIDIRECTIONAL,
+        depth: Annotated[
+            Optional[int],
+            typer.Option("--depth", min=1, help="浅拉取：每个 head 只拉取最近 N 个节点，更早的历史被视为截断。"),
+        ] = None,
+        since: Annotated[
+            Optional[str],
+            typer.Option(
+                "--since", help="按时间窗口拉取：只拉取该日期之后的历史 (例如 2024-01-01 或 '3 months ago')。"
+            ),
+        ] = None,
     ):
         setup_logging()
+        if depth is not None and since is not None:
+            bus.error("sync.run.error.depthAndSince")
+            ctx.exit(1)
         sync_dir = find_git_repository_root(work_dir) or work_dir
         config = ConfigManager(sync_dir)
         remote = remote_option or config.get("sync.remote_name", "origin")
@@ -71,8 +91,56 @@ def register(app: typer.Typer):
                 bus.warning("sync.setup.info.emailHint")
                 ctx.exit(1)
 
+        remotes = [r.strip() for r in remotes_option.split(",") if r.strip()] if remotes_option else [remote]
+        timings: List[Tuple[str, float]] = []
+
+        @contextmanager
+        def phase(name: str):
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                timings.append((name, time.perf_counter() - started))
+
+        def pull():
+            with phase("fetch"):
+                if len(remotes) == 1:
+                    git_db.fetch_quipu_refs(remotes[0], target_ids_to_fetch, depth=depth, since=since)
+                else:
+                    workers = config.get("sync.fetch_workers", 4)
+                    per_remote = git_db.fetch_quipu_refs_from_remotes(
+                        remotes, target_ids_to_fetch, workers, depth=depth, since=since
+                    )
+                    timings.extend((f"fetch[{r}]", elapsed) for r, elapsed in per_remote.items())
+            bus.info("sync.run.info.reconciling")
+            with phase("reconcile"):
+                for r in remotes:
+                    git_db.reconcile_local_with_remote(r, final_user_id)
+
+        def compact_unpublished():
+            # 推送前合并尚未发布的 capture 链，已发布的历史不会被改写
+            with phase("compact"), engine_context(sync_dir) as engine:
+                result = engine.compact_captures(
+                    config.get("compaction.captures.older_than_days", 7) * 86400,
+                    config.get("compaction.captures.min_length", 3),
+                )
+            if result.chains:
+                bus.info("sync.run.info.compacted", chains=result.chains, removed=result.removed)
+
+        def push(force: bool = False):
+            if config.get("compaction.captures.auto", False):
+                compact_unpublished()
+            with phase("push"):
+                for r in remotes:
+                    git_db.push_quipu_refs(r, final_user_id, force=force)
+
+        git_db = None
         try:
-            git_db = GitDB(sync_dir)
+            git_db = GitDB(
+                sync_dir,
+                compact_heads=config.get("refs.compact_heads", True),
+                pack_refs_interval=config.get("refs.pack_interval", 200),
+            )
             subscriptions = config.get("sync.subscriptions", [])
             target_ids_to_fetch = set(subscriptions)
             target_ids_to_fetch.add(final_user_id)
@@ -83,44 +151,41 @@ def register(app: typer.Typer):
             match mode:
                 case SyncMode.BIDIRECTIONAL:
                     bus.info("sync.run.info.pulling")
-                    for target_id in sorted(list(target_ids_to_fetch)):
-                        git_db.fetch_quipu_refs(remote, target_id)
-                    bus.info("sync.run.info.reconciling")
-                    git_db.reconcile_local_with_remote(remote, final_user_id)
+                    pull()
                     bus.info("sync.run.info.pushing")
-                    git_db.push_quipu_refs(remote, final_user_id)
+                    push()
                     bus.success("sync.run.success.bidirectional")
 
                 case SyncMode.PULL_ONLY:
                     bus.info("sync.run.info.pulling")
-                    for target_id in sorted(list(target_ids_to_fetch)):
-                        git_db.fetch_quipu_refs(remote, target_id)
-                    bus.info("sync.run.info.reconciling")
-                    git_db.reconcile_local_with_remote(remote, final_user_id)
+                    pull()
                     bus.success("sync.run.success.pullOnly")
 
                 case SyncMode.PULL_PRUNE:
                     bus.info("sync.run.info.pullingPrune")
-                    for target_id in sorted(list(target_ids_to_fetch)):
-                        git_db.fetch_quipu_refs(remote, target_id)
-                    bus.info("sync.run.info.reconciling")
-                    git_db.reconcile_local_with_remote(remote, final_user_id)
+                    pull()
                     bus.info("sync.run.info.pruning")
-                    git_db.prune_local_from_remote(remote, final_user_id)
+                    with phase("prune"):
+                        git_db.prune_local_from_remote(remotes, final_user_id)
                     bus.success("sync.run.success.pullPrune")
 
                 case SyncMode.PUSH_ONLY:
                     bus.info("sync.run.info.pushing")
-                    git_db.push_quipu_refs(remote, final_user_id, force=False)
+                    push()
                     bus.success("sync.run.success.pushOnly")
 
                 case SyncMode.PUSH_FORCE:
                     bus.info("sync.run.info.pushingForce")
-                    git_db.push_quipu_refs(remote, final_user_id, force=True)
+                    push(force=True)
                     bus.success("sync.run.success.pushForce")
 
+            for name, elapsed in timings:
+                bus.info("sync.run.info.timing", phase=name, seconds=elapsed)
             bus.info("sync.run.info.cacheHint")
 
         except RuntimeError as e:
             bus.error("sync.run.error.generic", error=str(e))
             ctx.exit(1)
+        finally:
+            if git_db:
+                git_db.close()
@@ -1,10 +1,11 @@
 import json
 import logging
 from pathlib import Path
-from typing import Annotated, Dict, List, Optional
+from typing import Annotated, List, Optional
 
 import typer
 from pyquipu.common.messaging import bus
+from pyquipu.engine.graph_store import GraphStore
 from rich.console import Console
 from rich.syntax import Syntax
 
@@ -14,12 +15,8 @@ from .helpers import engine_context
 logger = logging.getLogger(__name__)
 
 
-def _find_target_node(graph: Dict, hash_prefix: str):
-    matches = [
-        node
-        for node in graph.values()
-        if node.commit_hash.startswith(hash_prefix) or node.output_tree.startswith(hash_prefix)
-    ]
+def _find_target_node(graph: GraphStore, hash_prefix: str):
+    matches = graph.find_by_prefix(hash_prefix)
     if not matches:
         bus.error("show.error.notFound", hash_prefix=hash_prefix)
         raise typer.Exit(1)
@@ -0,0 +1,44 @@
+from pathlib import Path
+from typing import Annotated
+
+import typer
+from pyquipu.application.utils import find_git_repository_root
+from pyquipu.common.messaging import bus
+from pyquipu.engine.config import ConfigManager
+from pyquipu.engine.git_db import GitDB
+from pyquipu.engine.workspace_watcher import WatcherUnavailableError, WorkspaceWatcher
+
+from ..config import DEFAULT_WORK_DIR
+from ..logger_config import setup_logging
+
+
+def register(app: typer.Typer):
+    @app.command(help="在前台监视工作区变化，使状态检查只需处理变化的文件 (仅 Linux)。")
+    def watch(
+        ctx: typer.Context,
+        work_dir: Annotated[
+            Path,
+            typer.Option(
+                "--work-dir", "-w", help="操作执行的根目录（工作区）", file_okay=False, dir_okay=True, resolve_path=True
+            ),
+        ] = DEFAULT_WORK_DIR,
+    ):
+        setup_logging()
+        watch_dir = find_git_repository_root(work_dir) or work_dir
+        config = ConfigManager(watch_dir)
+
+        git_db = None
+        try:
+            git_db = GitDB(watch_dir)
+            watcher = WorkspaceWatcher(watch_dir, git_db, max_entries=config.get("watch.max_journal_entries", 100000))
+            bus.info("watch.info.started", path=str(watch_dir))
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+        except WatcherUnavailableError as e:
+            bus.error("watch.error.unavailable", error=str(e))
+            ctx.exit(1)
+        finally:
+            if git_db:
+                git_db.close()
+        bus.info("watch.info.stopped")
@@ -57,15 +57,10 @@ def register(app: typer.Typer):
                 ctx.exit(1)
 
             target_tree_hash = engine._read_head()
-            latest_node = None
-            if target_tree_hash:
-                for node in graph.values():
-                    if node.output_tree == target_tree_hash:
-                        latest_node = node
-                        break
+            latest_node = graph.find_by_output_tree(target_tree_hash) if target_tree_hash else None
 
             if not latest_node:
-                latest_node = max(graph.values(), key=lambda n: n.timestamp)
+                latest_node = graph.latest()
                 target_tree_hash = latest_node.output_tree
                 bus.warning("workspace.discard.warning.headMissing", short_hash=latest_node.short_hash)
 
@@ -1,9 +1,26 @@
 import logging
+from typing import Annotated
 
 import typer
 from pyquipu.common.messaging import bus
 
-from .commands import axon, cache, export, navigation, query, remote, run, show, ui, workspace
+from .commands import (
+    axon,
+    cache,
+    compact,
+    diff,
+    export,
+    importer,
+    navigation,
+    perf,
+    query,
+    remote,
+    run,
+    show,
+    ui,
+    watch,
+    workspace,
+)
 from .rendering import TyperRenderer
 
 # --- Global Setup ---
@@ -23,9 +40,22 @@ app = typer.Typer(
     help="Quipu: 一个基于 Git 的、用于文件系统状态溯源与文学化操作的工具。",
 )
 
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    profile: Annotated[
+        bool, typer.Option("--profile", help="统计本次调用中的 git 子进程开销，并记录到 .quipu/perf.jsonl。")
+    ] = False,
+):
+    if profile:
+        perf.enable_profiling(ctx)
+
+
 # --- Command Registration ---
 # 注册子命令应用
 app.add_typer(cache.cache_app)
+app.add_typer(perf.perf_app)
 
 # 注册顶级命令
 axon.register(app)
@@ -37,6 +67,10 @@ run.register(app)
 ui.register(app)
 show.register(app)
 export.register(app)
+diff.register(app)
+importer.register(app)
+compact.register(app)
+watch.register(app)
 
 
 # --- Entry Point ---
@@ -31,13 +31,8 @@ class GraphViewModel:
             self.total_pages = 1
 
         if self.current_output_tree_hash:
-            # 后端直接计算祖先和后代，避免在前端加载整个图谱
-            ancestors = self.reader.get_ancestor_output_trees(self.current_output_tree_hash)
-            descendants = self.reader.get_descendant_output_trees(self.current_output_tree_hash)
-
-            # 合并祖先、后代和当前节点自身，形成完整的可达集合
-            self.reachable_set = ancestors.union(descendants)
-            self.reachable_set.add(self.current_output_tree_hash)
+            # 后端通过祖先索引一次性计算祖先、后代和当前节点自身，避免在前端加载整个图谱
+            self.reachable_set = self.reader.get_reachable_output_trees(self.current_output_tree_hash)
 
     def is_reachable(self, output_tree_hash: str) -> bool:
         if not self.current_output_tree_hash:
@@ -68,6 +63,8 @@ class GraphViewModel:
         offset = (self.current_page - 1) * self.page_size
 
         self.current_page_nodes = self.reader.load_nodes_paginated(limit=self.page_size, offset=offset)
+        # 整页内容一次批量读取，之后切换选中节点时无需再逐个访问存储
+        self.reader.prefetch_contents(self.current_page_nodes)
         self._node_by_key = {str(node.filename): node for node in self.current_page_nodes}
         return self.current_page_nodes
 
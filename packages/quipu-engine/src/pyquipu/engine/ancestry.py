@@ -0,0 +1,132 @@
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from pyquipu.interfaces.models import QuipuNode
+
+logger = logging.getLogger(__name__)
+
+
+class AncestryIndex:
+    def __init__(self, entries: Iterable[Tuple[str, str, Sequence[str]]]):
+        self._ids: Dict[str, int] = {}
+        self._hashes: List[str] = []
+        self._output_trees: List[str] = []
+        raw_parents: List[Sequence[str]] = []
+        for commit_hash, output_tree, parents in entries:
+            if commit_hash in self._ids:
+                continue
+            self._ids[commit_hash] = len(self._hashes)
+            self._hashes.append(commit_hash)
+            self._output_trees.append(output_tree)
+            raw_parents.append(parents)
+
+        # 父节点不在索引内 (例如被截断的历史) 时视为根节点
+        self._parents: List[Tuple[int, ...]] = [
+            tuple(self._ids[p] for p in parents if p in self._ids) for parents in raw_parents
+        ]
+        self._children: List[List[int]] = [[] for _ in self._hashes]
+        for child, parents in enumerate(self._parents):
+            for parent in parents:
+                self._children[parent].append(child)
+
+        self._by_output_tree: Dict[str, List[int]] = {}
+        for idx, output_tree in enumerate(self._output_trees):
+            self._by_output_tree.setdefault(output_tree, []).append(idx)
+
+        self._generation = self._compute_generations()
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[QuipuNode]) -> "AncestryIndex":
+        return cls(
+            (node.commit_hash, node.output_tree, (node.parent.commit_hash,) if node.parent else ()) for node in nodes
+        )
+
+    def _compute_generations(self) -> List[int]:
+        # 拓扑序 (Kahn) 计算生成号：根为 1，其余为 1 + max(父节点生成号)
+        generation = [0] * len(self._hashes)
+        pending = [len(parents) for parents in self._parents]
+        queue = deque(idx for idx, count in enumerate(pending) if count == 0)
+        while queue:
+            idx = queue.popleft()
+            generation[idx] = 1 + max((generation[p] for p in self._parents[idx]), default=0)
+            for child in self._children[idx]:
+                pending[child] -= 1
+                if pending[child] == 0:
+                    queue.append(child)
+        if any(g == 0 for g in generation):
+            # 只有损坏的数据 (环) 才会出现；这些节点不参与剪枝
+            logger.warning("Cycle detected in history graph, ancestry pruning disabled for affected nodes")
+            generation = [g or len(self._hashes) + 1 for g in generation]
+        return generation
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, commit_hash: str) -> bool:
+        return commit_hash in self._ids
+
+    def generation(self, commit_hash: str) -> Optional[int]:
+        idx = self._ids.get(commit_hash)
+        return self._generation[idx] if idx is not None else None
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        # 与 `git merge-base --is-ancestor` 一致：节点是自身的祖先
+        target = self._ids.get(ancestor)
+        start = self._ids.get(descendant)
+        if target is None or start is None:
+            return False
+        if target == start:
+            return True
+
+        target_generation = self._generation[target]
+        if self._generation[start] <= target_generation:
+            return False
+        stack = [start]
+        seen = {start}
+        while stack:
+            idx = stack.pop()
+            for parent in self._parents[idx]:
+                if parent == target:
+                    return True
+                # 生成号不大于目标的节点不可能以目标为祖先，直接剪枝
+                if parent not in seen and self._generation[parent] > target_generation:
+                    seen.add(parent)
+                    stack.append(parent)
+        return False
+
+    def _walk(self, starts: Iterable[int], edges: List) -> Set[int]:
+        visited: Set[int] = set()
+        stack = list(starts)
+        while stack:
+            idx = stack.pop()
+            for nxt in edges[idx]:
+                if nxt not in visited:
+                    visited.add(nxt)
+                    stack.append(nxt)
+        return visited
+
+    def ancestors(self, commit_hash: str) -> Set[str]:
+        idx = self._ids.get(commit_hash)
+        if idx is None:
+            return set()
+        return {self._hashes[i] for i in self._walk([idx], self._parents)}
+
+    def descendants(self, commit_hash: str) -> Set[str]:
+        idx = self._ids.get(commit_hash)
+        if idx is None:
+            return set()
+        return {self._hashes[i] for i in self._walk([idx], self._children)}
+
+    def ancestor_output_trees(self, output_tree: str) -> Set[str]:
+        starts = self._by_output_tree.get(output_tree, [])
+        return {self._output_trees[i] for i in self._walk(starts, self._parents)}
+
+    def descendant_output_trees(self, output_tree: str) -> Set[str]:
+        starts = self._by_output_tree.get(output_tree, [])
+        return {self._output_trees[i] for i in self._walk(starts, self._children)}
+
+    def reachable_output_trees(self, output_tree: str) -> Set[str]:
+        reachable = self.ancestor_output_trees(output_tree) | self.descendant_output_trees(output_tree)
+        reachable.add(output_tree)
+        return reachable
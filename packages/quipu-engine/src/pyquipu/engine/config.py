@@ -11,12 +11,48 @@ logger = logging.getLogger(__name__)
 DEFAULTS = {
     "storage": {
         "type": "sqlite",  # 可选: "git_object", "sqlite"
+        "native_reader": True,  # 使用进程内对象读取器 (loose + packfile)，不支持时自动回退到 git 子进程
+        "native_writer": True,  # 进程内写入 blob/tree/commit 对象与 loose 引用，遇到签名、hook 等情况回退到 git
+        "graph_snapshot": True,  # git_object 后端在 .quipu/graph.snapshot 中持久化节点图，按 refs 指纹校验并增量扩展
+    },
+    "snapshot": {
+        "tree_hasher": True,  # 使用 stat 缓存的进程内 tree 计算，遇到 attributes/子模块等特性时回退到 git add
+        "persistent_index": True,  # git add 回退路径使用跨进程保留的影子索引 (untracked cache + split index)
+        "fsmonitor": None,  # 可选: 为影子索引指定 core.fsmonitor (hook 路径或 "true")，默认沿用仓库配置
+        # 指针条目为可选功能：开启后超限文件只记录路径/大小/mtime，checkout 时无法恢复其旧内容
+        "max_file_size": 0,  # 超过该字节数的文件只记录为指针条目；0 (默认) 表示不限制
+        "binary_max_size": 0,  # 二进制文件 (含 NUL 字节) 超过该字节数即记录为指针条目；0 (默认) 表示不限制
+        "exclude": [],  # 不进入快照的 glob 列表，例如 "*.iso"、"data/raw"；不含 '/' 的模式匹配任意层级的文件名
+        "pointer_sample_hash": True,  # 为指针条目计算抽样哈希，以便区分大小与 mtime 相同的不同文件
+    },
+    "diff_cache": {
+        "max_entries": 4096,  # tree 对之间 diff 结果的持久化缓存条目上限 (LRU 淘汰)，0 表示禁用
+    },
+    "checkout": {
+        "targeted": True,  # 工作区与索引处于当前节点状态时，只按 tree 差异写入/删除受影响的路径，而不是全量 git clean
+        "workers": 8,  # 定向检出时并发写入文件的线程数
+    },
+    "refs": {
+        "compact_heads": True,  # 创建子节点时移除父节点的 head 引用，引用数量与叶子数量成正比
+        "pack_interval": 200,  # 每写入这么多个 head 引用执行一次 git pack-refs；0 表示禁用
+    },
+    "compaction": {
+        "captures": {
+            "older_than_days": 7,  # 只合并早于该天数的 capture 节点
+            "min_length": 3,  # 连续 capture 节点少于该数量时不合并
+            "auto": False,  # `quipu sync` 推送前自动合并尚未发布的 capture 链
+        },
+    },
+    "watch": {
+        "journal": True,  # `quipu watch` 运行时，使用其 journal 增量计算工作区状态
+        "max_journal_entries": 100000,  # journal 超过该条目数时重置，读取端回退到一次全量扫描
     },
     "sync": {
         "remote_name": "origin",
         "persistent_ignores": [".idea", ".vscode", ".envs", "__pycache__", "node_modules", "o.md"],
         "user_id": None,
         "subscriptions": [],
+        "fetch_workers": 4,  # 使用 --remotes 时并发拉取的远程数量上限
     },
     "list_files": {"ignore_patterns": [".git", "__pycache__", ".idea", ".vscode", "node_modules", ".quipu"]},
 }
@@ -0,0 +1,166 @@
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class GitCache:
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+            self._init_schema(self._conn)
+            logger.debug(f"🗃️  成功连接到 Git 缓存: {self.db_path}")
+        return self._conn
+
+    def _init_schema(self, conn: sqlite3.Connection):
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);")
+            # output_tree -> commit 索引，同一个 output_tree 可能对应多个 commit
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS output_trees (
+                    output_tree TEXT(40) NOT NULL,
+                    commit_hash TEXT(40) NOT NULL,
+                    committed_at INTEGER NOT NULL,
+                    PRIMARY KEY (output_tree, commit_hash)
+                ) WITHOUT ROWID;
+                """
+            )
+            # 已经被索引覆盖的 refs/quipu 头，用于增量刷新
+            conn.execute("CREATE TABLE IF NOT EXISTS indexed_heads (commit_hash TEXT(40) PRIMARY KEY) WITHOUT ROWID;")
+            # (old_tree, new_tree) -> diff 结果。tree 不可变，因此条目永远不会过期，只按 LRU 淘汰
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tree_diffs (
+                    old_tree TEXT(40) NOT NULL,
+                    new_tree TEXT(40) NOT NULL,
+                    kind TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    last_used INTEGER NOT NULL,
+                    PRIMARY KEY (old_tree, new_tree, kind)
+                ) WITHOUT ROWID;
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tree_diffs_last_used ON tree_diffs (last_used);")
+
+    def close(self):
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._get_conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def find_commits_by_output_tree(self, output_tree: str) -> List[str]:
+        with self._lock:
+            cursor = self._get_conn().execute(
+                "SELECT commit_hash FROM output_trees WHERE output_tree = ? ORDER BY committed_at DESC",
+                (output_tree,),
+            )
+            rows = cursor.fetchall()
+            return [row[0] for row in rows]
+
+    def add_output_trees(self, entries: Iterable[Tuple[str, str, int]]):
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO output_trees (output_tree, commit_hash, committed_at) VALUES (?, ?, ?)",
+                    entries,
+                )
+
+    def remove_output_tree_commit(self, output_tree: str, commit_hash: str):
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute(
+                    "DELETE FROM output_trees WHERE output_tree = ? AND commit_hash = ?", (output_tree, commit_hash)
+                )
+
+    def remove_output_tree_commits(self, entries: Iterable[Tuple[str, str]]):
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.executemany("DELETE FROM output_trees WHERE output_tree = ? AND commit_hash = ?", entries)
+
+    def get_indexed_heads(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._get_conn().execute("SELECT commit_hash FROM indexed_heads")}
+
+    def set_indexed_heads(self, heads: Iterable[str], fingerprint: str):
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("DELETE FROM indexed_heads")
+                conn.executemany("INSERT INTO indexed_heads (commit_hash) VALUES (?)", ((h,) for h in heads))
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('output_tree_refs_fingerprint', ?)",
+                    (fingerprint,),
+                )
+
+    def clear_output_trees(self):
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("DELETE FROM output_trees")
+                conn.execute("DELETE FROM indexed_heads")
+                conn.execute("DELETE FROM meta WHERE key = 'output_tree_refs_fingerprint'")
+
+    def get_diff(self, old_tree: str, new_tree: str, kind: str) -> Optional[str]:
+        with self._lock:
+            conn = self._get_conn()
+            key = (old_tree, new_tree, kind)
+            row = conn.execute(
+                "SELECT value FROM tree_diffs WHERE old_tree = ? AND new_tree = ? AND kind = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            with conn:
+                conn.execute(
+                    "UPDATE tree_diffs SET last_used = ? WHERE old_tree = ? AND new_tree = ? AND kind = ?",
+                    (time.time_ns(), *key),
+                )
+            return row[0]
+
+    def put_diff(self, old_tree: str, new_tree: str, kind: str, value: str, max_entries: int):
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tree_diffs (old_tree, new_tree, kind, value, last_used)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (old_tree, new_tree, kind, value, time.time_ns()),
+                )
+                (count,) = conn.execute("SELECT COUNT(*) FROM tree_diffs").fetchone()
+                if count > max_entries:
+                    # 淘汰最久未使用的条目
+                    (cutoff,) = conn.execute(
+                        "SELECT last_used FROM tree_diffs ORDER BY last_used LIMIT 1 OFFSET ?",
+                        (count - max_entries - 1,),
+                    ).fetchone()
+                    conn.execute("DELETE FROM tree_diffs WHERE last_used <= ?", (cutoff,))
+
+    def clear_diffs(self):
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("DELETE FROM tree_diffs")
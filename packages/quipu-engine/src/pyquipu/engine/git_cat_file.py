@@ -0,0 +1,186 @@
+import logging
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from .git_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CatFileResult(NamedTuple):
+    object_hash: str
+    object_type: str
+    size: int
+    content: Optional[bytes]
+
+
+class CatFileProcess:
+    def __init__(self, root: Path, mode: str):
+        if mode not in ("--batch", "--batch-check"):
+            raise ValueError(f"Unsupported cat-file mode: {mode}")
+        self.root = root
+        self.mode = mode
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self._spawns = 0
+
+    @property
+    def with_content(self) -> bool:
+        return self.mode == "--batch"
+
+    def _start(self) -> subprocess.Popen:
+        logger.debug(f"Starting persistent git cat-file {self.mode} process in {self.root}")
+        self._spawns += 1
+        return subprocess.Popen(
+            ["git", "cat-file", self.mode],
+            cwd=self.root,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def _ensure_running(self) -> subprocess.Popen:
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = self._start()
+        return self._proc
+
+    def _write_requests(self, proc: subprocess.Popen, payload: bytes, errors: List[BaseException]):
+        try:
+            proc.stdin.write(payload)
+            proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            errors.append(e)
+
+    def _read_response(self, proc: subprocess.Popen, spec: str) -> Optional[CatFileResult]:
+        header_line = proc.stdout.readline()
+        if not header_line:
+            raise EOFError(f"git cat-file {self.mode} terminated unexpectedly")
+
+        header_parts = header_line.rstrip(b"\n").split(b" ")
+        # 对象不存在或名称有歧义: "<spec> missing" / "<spec> ambiguous"
+        if len(header_parts) != 3:
+            logger.debug(f"cat-file could not resolve '{spec}': {header_line!r}")
+            return None
+
+        try:
+            size = int(header_parts[2])
+        except ValueError as e:
+            raise EOFError(f"Invalid size in cat-file header: {header_line!r}") from e
+
+        content = None
+        if self.with_content:
+            content = proc.stdout.read(size)
+            proc.stdout.read(1)  # Consume the trailing LF
+            if len(content) != size:
+                raise EOFError("git cat-file output truncated")
+
+        return CatFileResult(
+            object_hash=header_parts[0].decode("ascii"),
+            object_type=header_parts[1].decode("ascii"),
+            size=size,
+            content=content,
+        )
+
+    def _query_once(self, specs: List[str]) -> List[Optional[CatFileResult]]:
+        proc = self._ensure_running()
+        payload = "".join(f"{spec}\n" for spec in specs).encode("utf-8")
+
+        # 在独立线程中写入请求，避免请求和响应同时填满管道缓冲区时发生死锁。
+        errors: List[BaseException] = []
+        writer = threading.Thread(target=self._write_requests, args=(proc, payload, errors), daemon=True)
+        writer.start()
+        try:
+            results = [self._read_response(proc, spec) for spec in specs]
+        finally:
+            writer.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    def query(self, specs: List[str]) -> List[Optional[CatFileResult]]:
+        if not specs:
+            return []
+
+        with self._lock:
+            spawns_before = self._spawns
+            started = time.perf_counter()
+            results: List[Optional[CatFileResult]] = []
+            try:
+                results = self._query_once(specs)
+                return results
+            except (EOFError, BrokenPipeError, OSError) as e:
+                # 协进程可能已退出 (例如仓库被 gc 或进程被杀)，重启一次后重试
+                logger.debug(f"cat-file {self.mode} process failed ({e}), restarting.")
+                self._terminate()
+                try:
+                    results = self._query_once(specs)
+                    return results
+                except (EOFError, BrokenPipeError, OSError) as retry_error:
+                    self._terminate()
+                    raise RuntimeError(f"Git cat-file {self.mode} failed: {retry_error}") from retry_error
+            finally:
+                metrics.record(
+                    f"cat-file {self.mode}",
+                    time.perf_counter() - started,
+                    bytes_in=sum(len(spec) + 1 for spec in specs),
+                    bytes_out=sum(len(r.content) for r in results if r is not None and r.content is not None),
+                    spawned=self._spawns > spawns_before,
+                )
+
+    def _terminate(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            if proc.stdin:
+                proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        if proc.stdout:
+            proc.stdout.close()
+
+    def close(self):
+        with self._lock:
+            self._terminate()
+
+
+class CatFilePool:
+    def __init__(self, root: Path):
+        self.root = root
+        self._processes: Dict[str, CatFileProcess] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, mode: str) -> CatFileProcess:
+        with self._lock:
+            process = self._processes.get(mode)
+            if process is None:
+                process = CatFileProcess(self.root, mode)
+                self._processes[mode] = process
+            return process
+
+    def read(self, specs: List[str]) -> List[Optional[CatFileResult]]:
+        return self._get("--batch").query(specs)
+
+    def check(self, specs: List[str]) -> List[Optional[CatFileResult]]:
+        return self._get("--batch-check").query(specs)
+
+    def close(self):
+        with self._lock:
+            processes = list(self._processes.values())
+            self._processes.clear()
+        for process in processes:
+            process.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
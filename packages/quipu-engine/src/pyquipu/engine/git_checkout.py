@@ -0,0 +1,176 @@
+import logging
+import os
+import shutil
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+_NULL_SHA = "0" * 40
+_MODE_EXECUTABLE = "100755"
+_MODE_SYMLINK = "120000"
+_MODE_GITLINK = "160000"
+
+
+class UnsupportedDiffError(Exception):
+    pass
+
+
+class TreeChange(NamedTuple):
+    status: str
+    old_mode: str
+    new_mode: str
+    old_sha: str
+    new_sha: str
+    path: bytes
+
+
+def parse_raw_diff(data: bytes) -> List[TreeChange]:
+    # `diff-tree -r -z --raw` 的输出: ":<old_mode> <new_mode> <old_sha> <new_sha> <status>\0<path>\0"
+    # 未开启重命名检测，因此每条记录只有一个路径
+    fields = data.split(b"\0")
+    changes = []
+    for i in range(0, len(fields) - 1, 2):
+        meta = fields[i]
+        if not meta.startswith(b":"):
+            raise ValueError(f"Unexpected diff-tree record: {meta!r}")
+        old_mode, new_mode, old_sha, new_sha, status = meta[1:].decode("ascii").split(" ")
+        changes.append(TreeChange(status, old_mode, new_mode, old_sha, new_sha, fields[i + 1]))
+    return changes
+
+
+class WorkspaceUpdater:
+    def __init__(self, root: Path, workers: int = 8):
+        self.root = os.fsencode(root)
+        self.workers = max(1, workers)
+
+    def _full_path(self, path: bytes) -> bytes:
+        return os.path.join(self.root, path)
+
+    def _remove(self, path: bytes):
+        full_path = self._full_path(path)
+        try:
+            if os.path.isdir(full_path) and not os.path.islink(full_path):
+                shutil.rmtree(full_path)
+            else:
+                os.unlink(full_path)
+        except FileNotFoundError:
+            pass
+
+    def _prune_empty_dirs(self, paths: Iterable[bytes]):
+        # 从深到浅尝试删除因文件删除而变空的目录，非空 (例如仍有被忽略的文件) 则保留
+        candidates: Set[bytes] = set()
+        for path in paths:
+            parent = os.path.dirname(path)
+            while parent:
+                candidates.add(parent)
+                parent = os.path.dirname(parent)
+        for directory in sorted(candidates, key=lambda p: p.count(b"/"), reverse=True):
+            try:
+                os.rmdir(self._full_path(directory))
+            except OSError:
+                pass
+
+    def _ensure_parent(self, path: bytes):
+        parent = os.path.dirname(path)
+        if not parent:
+            return
+        full_parent = self._full_path(parent)
+        if os.path.isdir(full_parent) and not os.path.islink(full_parent):
+            return
+        # 父路径上可能残留着同名文件或符号链接 (文件 -> 目录 的类型变化)
+        while parent:
+            full = self._full_path(parent)
+            if os.path.lexists(full) and (os.path.islink(full) or not os.path.isdir(full)):
+                os.unlink(full)
+                break
+            parent = os.path.dirname(parent)
+        os.makedirs(full_parent, exist_ok=True)
+
+    def _write(self, change: TreeChange, content: bytes):
+        full_path = self._full_path(change.path)
+        self._ensure_parent(change.path)
+        if os.path.lexists(full_path):
+            self._remove(change.path)
+        if change.new_mode == _MODE_SYMLINK:
+            os.symlink(content, full_path)
+            return
+        # 与 git 一致：新建文件的权限为 0666/0777 再经过 umask
+        mode = 0o777 if change.new_mode == _MODE_EXECUTABLE else 0o666
+        fd = os.open(full_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+        try:
+            view = memoryview(content)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+        finally:
+            os.close(fd)
+
+    def _chmod(self, change: TreeChange):
+        full_path = self._full_path(change.path)
+        current = os.lstat(full_path).st_mode
+        if change.new_mode == _MODE_EXECUTABLE:
+            # 只给拥有读权限的角色加上执行权限
+            new_mode = current | ((current & 0o444) >> 2)
+        else:
+            new_mode = current & ~0o111
+        os.chmod(full_path, stat.S_IMODE(new_mode))
+
+    def apply(
+        self,
+        changes: List[TreeChange],
+        read_blobs: Callable[[List[str]], Dict[str, bytes]],
+        keep_paths: Optional[Set[bytes]] = None,
+    ) -> int:
+        if any(_MODE_GITLINK in (c.old_mode, c.new_mode) for c in changes):
+            raise UnsupportedDiffError("Submodules are not supported")
+
+        if keep_paths:
+            # 调用方要求保留工作区中现有内容的路径 (例如指针条目对应的真实文件)
+            changes = [c for c in changes if c.path not in keep_paths]
+        deletions = [c for c in changes if c.status == "D"]
+        chmods = [c for c in changes if c.status == "M" and c.old_sha == c.new_sha]
+        # 类型变化 (T)、新增与内容修改都通过重新写入完成
+        writes = [c for c in changes if c.status != "D" and c not in chmods]
+
+        needed = list({c.new_sha for c in writes})
+        blobs = read_blobs(needed) if needed else {}
+        missing = [sha for sha in needed if sha not in blobs]
+        if missing:
+            raise UnsupportedDiffError(f"Missing blob objects: {missing[:3]}")
+
+        # 1. 先删除，为目录 <-> 文件 的类型变化腾出位置
+        for change in deletions:
+            self._remove(change.path)
+        self._prune_empty_dirs(c.path for c in deletions)
+
+        # 2. 预先创建目录，避免线程之间竞争 makedirs
+        for change in writes:
+            self._ensure_parent(change.path)
+
+        # 3. 并发写入文件内容
+        if len(writes) > 1 and self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                list(pool.map(lambda c: self._write(c, blobs[c.new_sha]), writes))
+        else:
+            for change in writes:
+                self._write(change, blobs[change.new_sha])
+
+        for change in chmods:
+            self._chmod(change)
+
+        logger.debug(f"Targeted checkout: {len(writes)} written, {len(deletions)} deleted, {len(chmods)} chmod")
+        return len(changes)
+
+
+def index_info_for(changes: Iterable[TreeChange]) -> bytes:
+    # `update-index -z --index-info` 的输入：删除条目使用 mode 0
+    lines = []
+    for change in changes:
+        if change.status == "D":
+            lines.append(b"0 " + _NULL_SHA.encode() + b"\t" + change.path + b"\0")
+        else:
+            lines.append(f"{change.new_mode} {change.new_sha}".encode() + b"\t" + change.path + b"\0")
+    return b"".join(lines)
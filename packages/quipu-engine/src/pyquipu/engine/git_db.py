@@ -1,25 +1,171 @@
+import hashlib
+import json
 import logging
 import os
+import re
 import shutil
+import sqlite3
+import stat
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
 
 from pyquipu.common.messaging import bus
 from pyquipu.interfaces.exceptions import ExecutionError
 
+from .ancestry import AncestryIndex
+from .git_cache import GitCache
+from .git_cat_file import CatFilePool
+from .git_checkout import TreeChange, UnsupportedDiffError, WorkspaceUpdater, index_info_for, parse_raw_diff
+from .git_metrics import metrics, subcommand_name
+from .git_odb import NativeObjectStore, PackWriter, format_git_date, parse_tree_entries, serialize_commit
+from .git_refs import RefTransaction, delete_loose_ref, is_simple_refname, write_loose_ref
+from .snapshot_policy import POINTER_MAX_SIZE, SnapshotPolicy, is_pointer
+from .tree_hasher import UnsupportedWorkspaceError, WorkspaceTreeHasher
+from .workspace_watcher import JournalChanges, WatchJournal
+
 logger = logging.getLogger(__name__)
 
+_OUTPUT_TREE_TRAILER_RE = re.compile(r"X-Quipu-Output-Tree:\s*([0-9a-f]{40})")
+
+# journal 中的脏路径超过该数量时，直接全量扫描比逐路径 ls-files 更划算
+_JOURNAL_INCREMENTAL_LIMIT = 1000
+
+# git 读取损坏或不完整的索引文件时输出的错误特征
+_INDEX_CORRUPTION_MARKERS = ("index file", "bad signature", "sharedindex", "bad index", "corrupt")
+
+_OBJECT_ID_RE = re.compile(r"^[0-9a-fA-F]{40}$")
+_FALSE_VALUES = ("false", "no", "off", "0")
+
+# git 在身份信息首尾会剥离的字符 (见 ident.c 中的 crud())；遇到这些情况交给 git 处理
+_IDENT_CRUD = ".,:;<>\"\\'"
+
+# 默认 (core.logAllRefUpdates=true) 情况下会写 reflog 的引用前缀
+_REFLOG_PREFIXES = ("refs/heads/", "refs/remotes/", "refs/notes/")
+
+# `git log -z` 的固定格式：每个 commit 恰好 5 个 NUL 分隔的字段，字段本身不可能包含 NUL
+_LOG_FORMAT = "%H%x00%T%x00%P%x00%ct%x00%B"
+_LOG_FIELDS = 5
+_STREAM_CHUNK_SIZE = 64 * 1024
+# 并发 fetch 争用引用锁时的重试次数
+_FETCH_LOCK_RETRIES = 4
+_LOCK_CONTENTION_RE = re.compile(r"Unable to create '[^']*\.lock'|cannot lock ref")
+
+
+class LogEntry(NamedTuple):
+    commit_hash: str
+    tree: str
+    parents: Tuple[str, ...]
+    timestamp: int
+    body: str
+
+
+def parse_log_stream(chunks: Iterable[bytes]) -> Iterator[LogEntry]:
+    pending = b""
+    fields: List[bytes] = []
+    for chunk in chunks:
+        parts = (pending + chunk).split(b"\0")
+        # 最后一段可能是被截断的字段，留到下一个块
+        pending = parts.pop()
+        for part in parts:
+            fields.append(part)
+            if len(fields) == _LOG_FIELDS:
+                commit_hash, tree, parents, timestamp, body = fields
+                fields = []
+                yield LogEntry(
+                    commit_hash.decode("ascii"),
+                    tree.decode("ascii"),
+                    tuple(parents.decode("ascii").split()),
+                    int(timestamp or 0),
+                    body.decode("utf-8", "replace"),
+                )
+
 
 class GitDB:
-    def __init__(self, root_dir: Path):
+    def __init__(
+        self,
+        root_dir: Path,
+        native_reader: bool = True,
+        native_writer: bool = True,
+        tree_hasher: bool = True,
+        persistent_index: bool = True,
+        fsmonitor: Optional[str] = None,
+        watch_journal: bool = True,
+        targeted_checkout: bool = True,
+        checkout_workers: int = 8,
+        diff_cache_size: int = 4096,
+        compact_heads: bool = True,
+        pack_refs_interval: int = 200,
+        snapshot_policy: Optional[SnapshotPolicy] = None,
+    ):
         if not shutil.which("git"):
             raise ExecutionError("未找到 'git' 命令。请安装 Git 并确保它在系统的 PATH 中。")
 
         self.root = root_dir.resolve()
         self.quipu_dir = self.root / ".quipu"
         self._ensure_git_repo()
+        metrics.register_root(self.root)
+        # 持久化的 cat-file 协进程池，生命周期与 Engine 一致
+        self._cat_file_pool = CatFilePool(self.root)
+        # 进程内对象读取器；遇到不支持的仓库特性时为 None，全部走子进程路径
+        self._odb: Optional[NativeObjectStore] = NativeObjectStore.open(self.root / ".git") if native_reader else None
+        self._config: Optional[Dict[str, str]] = None
+        # 进程内对象/引用写入依赖对象读取器判断对象是否存在
+        self._native_writer = native_writer and self._odb is not None
+        # 基于 stat 缓存的进程内 tree 计算器；仓库特性不受支持时回退到影子索引。
+        # 缓存中的哈希引用的是本仓库对象库中的对象，因此缓存文件放在 .git 内，也不会出现在 git status 中。
+        self._tree_hasher: Optional[WorkspaceTreeHasher] = None
+        # 快照策略：被排除的路径不进入快照，超大或二进制文件只记录为指针条目
+        self._snapshot_policy = snapshot_policy
+        if tree_hasher and self._odb:
+            # 策略不同时缓存的 blob 哈希含义不同，各自使用独立的缓存文件
+            cache_name = f"tree_cache-{snapshot_policy.cache_key}" if snapshot_policy else "tree_cache"
+            cache_path = self.root / ".git" / "quipu" / cache_name
+            self._tree_hasher = WorkspaceTreeHasher(self.root, self._odb, cache_path, snapshot_policy)
+        # `quipu watch` 运行时，根据其 journal 只重新计算变化过的路径
+        self._journal: Optional[WatchJournal] = None
+        if watch_journal and self._tree_hasher:
+            self._journal = WatchJournal(self.quipu_dir / "watch")
+        # output_tree -> commit 等可重建的派生数据，按对象库区分，放在 .git 内
+        self._cache = GitCache(self.root / ".git" / "quipu" / "cache.sqlite")
+        # 回退路径使用跨进程保留的影子索引，而不是每次复制 .git/index
+        self._persistent_index = persistent_index
+        self._fsmonitor = fsmonitor
+        # 检出时只按 tree 之间的差异更新受影响的路径，而不是 read-tree + 全量 git clean
+        self._targeted_checkout = targeted_checkout
+        self._checkout_workers = checkout_workers
+        # tree 之间的 diff 结果按 (old_tree, new_tree) 持久化缓存；0 表示禁用
+        self._diff_cache_size = diff_cache_size
+        # 创建子节点时移除父节点的 head 引用，使引用数量与叶子数量而不是节点数量成正比
+        self._compact_heads = compact_heads
+        # 每写入这么多个 head 引用执行一次 pack-refs；0 表示禁用
+        self._pack_refs_interval = pack_refs_interval
+        # 本进程内的引用写入计数。文件系统指纹在 inode 复用且 mtime 精度不足时可能不变，
+        # 读取端的缓存同时以它为键，保证本进程写入后立即失效
+        self.ref_epoch = 0
+        self._ancestry: Optional[Tuple[Tuple[str, int], AncestryIndex]] = None
+
+    def close(self):
+        self._cat_file_pool.close()
+        self._cache.close()
+        if self._odb:
+            self._odb.close()
+
+    def _native_read(self, object_hash: str, object_type: Optional[str] = None) -> Optional[bytes]:
+        if not self._odb:
+            return None
+        try:
+            if object_type:
+                return self._odb.read_typed(object_hash, object_type)
+            result = self._odb.read(object_hash)
+            return result[1] if result else None
+        except Exception as e:
+            # 任何解析问题都回退到 git 子进程，由 git 给出权威结果
+            logger.debug(f"Native read of {object_hash[:7]} failed, falling back to git: {e}")
+            return None
 
     def _ensure_git_repo(self):
         if not (self.root / ".git").is_dir():
@@ -35,10 +181,11 @@ class GitDB:
         input_data: Optional[Union[str, bytes]] = None,
         capture_as_text: bool = True,
     ) -> subprocess.CompletedProcess:
-        full_env = os.environ.copy()
-        if env:
-            full_env.update(env)
+        # 未指定额外变量时直接继承父进程环境，避免每次调用都复制 os.environ
+        full_env = {**os.environ, **env} if env else None
 
+        started = time.perf_counter()
+        result = None
         try:
             result = subprocess.run(
                 ["git"] + args,
@@ -51,6 +198,7 @@ class GitDB:
             )
             return result
         except subprocess.CalledProcessError as e:
+            result = e
             stderr_str = e.stderr
             if isinstance(stderr_str, bytes):
                 stderr_str = stderr_str.decode("utf-8", "ignore")
@@ -58,6 +206,51 @@ class GitDB:
             if log_error:
                 logger.error(f"Git plumbing error: {stderr_str}")
             raise RuntimeError(f"Git command failed: {' '.join(args)}\n{stderr_str}") from e
+        finally:
+            metrics.record(
+                subcommand_name(args),
+                time.perf_counter() - started,
+                bytes_in=len(input_data) if input_data else 0,
+                bytes_out=len(result.stdout or "") if result is not None else 0,
+            )
+
+    def _stream(self, args: List[str], input_data: Optional[bytes] = None) -> Iterator[bytes]:
+        # 逐块产出子进程的标准输出，调用方无需把完整输出缓存在内存中
+        started = time.perf_counter()
+        bytes_out = 0
+        proc = subprocess.Popen(
+            ["git"] + args,
+            cwd=self.root,
+            stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            if input_data is not None:
+                # git 会在开始输出之前读完 --stdin 的全部输入
+                proc.stdin.write(input_data)
+                proc.stdin.close()
+            while True:
+                chunk = proc.stdout.read1(_STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                bytes_out += len(chunk)
+                yield chunk
+            stderr_str = proc.stderr.read().decode("utf-8", "ignore")
+            if proc.wait() != 0:
+                raise RuntimeError(f"Git command failed: {' '.join(args)}\n{stderr_str}")
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            proc.stderr.close()
+            metrics.record(
+                subcommand_name(args),
+                time.perf_counter() - started,
+                bytes_in=len(input_data) if input_data else 0,
+                bytes_out=bytes_out,
+            )
 
     @contextmanager
     def shadow_index(self):
@@ -87,21 +280,279 @@ class GitDB:
                 except OSError:
                     logger.warning(f"Failed to cleanup shadow index: {index_path}")
 
+    def _shadow_index_layout(self) -> Dict[str, object]:
+        # 这些信息变化时，持久化影子索引中的条目不再可信，需要重新播种
+        config = self.get_config()
+        return {
+            "version": 2,
+            "root": str(self.root),
+            "sparse": config.get("core.sparsecheckout", "false").lower(),
+            "index": self._user_index_signature(),
+        }
+
+    def _user_index_signature(self) -> Optional[str]:
+        # 用户索引以其内容的校验和结尾，只需读取末尾 20 字节即可判断它是否变化 (例如 git add / checkout)
+        user_index_path = self.root / ".git" / "index"
+        try:
+            with open(user_index_path, "rb") as f:
+                f.seek(-20, os.SEEK_END)
+                trailer = f.read(20)
+            if trailer.strip(b"\0"):
+                return trailer.hex()
+            # index.skipHash 开启时校验和全为 0，退回到文件大小与修改时间
+            stat = user_index_path.stat()
+            return f"{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            return None
+
+    def _index_feature_env(self) -> Dict[str, str]:
+        # 通过 GIT_CONFIG_* 环境变量为影子索引开启增量特性，不修改用户的仓库配置
+        features = [("core.untrackedCache", "true"), ("core.splitIndex", "true")]
+        if self._fsmonitor:
+            features.append(("core.fsmonitor", self._fsmonitor))
+
+        offset = int(os.environ.get("GIT_CONFIG_COUNT", "0") or 0)
+        env = {"GIT_CONFIG_COUNT": str(offset + len(features))}
+        for i, (key, value) in enumerate(features, start=offset):
+            env[f"GIT_CONFIG_KEY_{i}"] = key
+            env[f"GIT_CONFIG_VALUE_{i}"] = value
+        return env
+
+    def _seed_shadow_index(self, index_path: Path):
+        index_path.unlink(missing_ok=True)
+        user_index_path = self.root / ".git" / "index"
+        if user_index_path.exists():
+            try:
+                shutil.copy2(user_index_path, index_path)
+            except OSError as e:
+                bus.warning("engine.git.warning.copyIndexFailed", error=str(e))
+
+    @contextmanager
+    def persistent_shadow_index(self, reseed: bool = False):
+        index_dir = self.root / ".git" / "quipu"
+        index_path = index_dir / "shadow_index"
+        meta_path = index_dir / "shadow_index.json"
+        index_dir.mkdir(exist_ok=True)
+
+        layout = self._shadow_index_layout()
+        try:
+            stored_layout = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            stored_layout = None
+
+        if reseed or stored_layout != layout or not index_path.exists():
+            logger.debug(f"Seeding persistent shadow index at {index_path}")
+            self._seed_shadow_index(index_path)
+            meta_path.write_text(json.dumps(layout), encoding="utf-8")
+
+        env = {"GIT_INDEX_FILE": str(index_path)}
+        env.update(self._index_feature_env())
+        yield env
+
+    def get_config(self) -> Dict[str, str]:
+        if self._config is None:
+            result = self._run(["config", "-l", "-z"], check=False, log_error=False)
+            config = {}
+            for item in result.stdout.split("\0"):
+                if not item:
+                    continue
+                key, _, value = item.partition("\n")
+                config[key.lower()] = value
+            self._config = config
+        return self._config
+
+    def _check_tree_hasher_support(self):
+        config = self.get_config()
+        # 这些特性会让 `git add` 对文件内容或模式做额外转换，进程内计算无法保证一致
+        if config.get("core.autocrlf", "false").lower() not in ("false", "no", "off", "0"):
+            raise UnsupportedWorkspaceError("core.autocrlf is enabled")
+        for key in ("core.filemode", "core.symlinks"):
+            if config.get(key, "true").lower() in ("false", "no", "off", "0"):
+                raise UnsupportedWorkspaceError(f"{key} is disabled")
+        if config.get("core.sparsecheckout", "false").lower() in ("true", "yes", "on", "1"):
+            raise UnsupportedWorkspaceError("Sparse checkout is enabled")
+        if config.get("core.attributesfile") or (self.root / ".git" / "info" / "attributes").exists():
+            raise UnsupportedWorkspaceError("Git attributes are configured")
+        xdg_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+        if os.path.exists(os.path.join(xdg_home, "git", "attributes")):
+            raise UnsupportedWorkspaceError("Global git attributes file exists")
+
+    def _list_workspace_paths(self, pathspecs: Optional[List[bytes]] = None) -> List[bytes]:
+        # 一次 ls-files 调用同时列出已跟踪文件与未被忽略的新文件，忽略规则完全由 git 决定
+        args = ["--literal-pathspecs", "ls-files", "-v", "-s", "-c", "-o", "-z", "--exclude-standard"]
+        if pathspecs is not None:
+            args += ["--"] + [os.fsdecode(path) for path in pathspecs]
+        result = self._run(args, capture_as_text=False)
+        paths = {}
+        for record in result.stdout.split(b"\0"):
+            if not record:
+                continue
+            tag, path = record[:1], record[2:]
+            if tag != b"?":
+                if tag not in (b"H", b"M", b"C", b"R", b"K"):
+                    # skip-worktree / assume-unchanged 等条目的索引内容不反映工作区
+                    raise UnsupportedWorkspaceError(f"Index entry flag {tag!r} is not supported")
+                info, _, path = path.partition(b"\t")
+                if info.startswith(b"160000"):
+                    raise UnsupportedWorkspaceError("Submodules are not supported")
+            if path.endswith(b"/"):
+                raise UnsupportedWorkspaceError("Nested repositories are not supported")
+            if path == b".quipu" or path.startswith(b".quipu/"):
+                continue
+            if self._snapshot_policy and self._snapshot_policy.excludes(path):
+                continue
+            if path == b".gitattributes" or path.endswith(b"/.gitattributes"):
+                raise UnsupportedWorkspaceError("Git attributes are configured")
+            paths[path] = None
+        return list(paths)
+
+    def _journal_guards(self) -> Dict[str, List[int]]:
+        # 这些文件的变化会改变哪些路径属于快照，而监视进程无法观察到它们
+        candidates = [self.root / ".git" / "index", self.root / ".git" / "info" / "exclude"]
+        excludes_file = self.get_config().get("core.excludesfile")
+        if excludes_file:
+            candidates.append(Path(os.path.expanduser(excludes_file)))
+        else:
+            xdg_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+            candidates.append(Path(xdg_home) / "git" / "ignore")
+
+        guards = {}
+        for path in candidates:
+            try:
+                st = path.stat()
+                guards[str(path)] = [st.st_mtime_ns, st.st_size]
+            except OSError:
+                guards[str(path)] = []
+        return guards
+
+    def _tree_hash_from_journal(self, changes: JournalChanges) -> Optional[str]:
+        if changes.paths is None or not changes.base_tree or not self._odb.contains(changes.base_tree):
+            return None
+        if not changes.paths:
+            # 自上次计算以来没有任何文件事件：工作区仍是上次的状态
+            return changes.base_tree
+        if len(changes.paths) > _JOURNAL_INCREMENTAL_LIMIT:
+            return None
+        if any(path == b".gitignore" or path.endswith(b"/.gitignore") for path in changes.paths):
+            return None
+
+        dirty = sorted(changes.paths)
+        present = self._list_workspace_paths(dirty)
+        logger.debug(f"Re-staging {len(dirty)} journaled paths on top of {changes.base_tree[:7]}")
+        return self._tree_hasher.update(changes.base_tree, dirty, present)
+
     def get_tree_hash(self) -> str:
-        with self.shadow_index() as env:
-            # 阶段 1: 更新索引以匹配工作区。
-            # 由于 shadow_index 上下文已经通过复制预热了索引，
-            # 此处的 `git add -A` 只会处理少量未暂存的变更，速度非常快。
-            self._run(["add", "-A", "--ignore-errors"], env=env)
+        if self._tree_hasher:
+            try:
+                self._check_tree_hasher_support()
+                guards = self._journal_guards() if self._journal else None
+                # 必须在扫描之前读取 journal 位置，扫描期间发生的事件留给下一次处理
+                changes = self._journal.read_changes(guards) if self._journal else None
+
+                tree_hash = self._tree_hash_from_journal(changes) if changes else None
+                if tree_hash is None:
+                    tree_hash = self._tree_hasher.compute(self._list_workspace_paths())
+                if changes:
+                    self._journal.record_baseline(changes, tree_hash, guards)
+                return tree_hash
+            except (UnsupportedWorkspaceError, OSError) as e:
+                logger.debug(f"In-process tree hashing unavailable, using shadow index: {e}")
+        return self._get_tree_hash_via_index()
+
+    def _get_tree_hash_via_index(self) -> str:
+        if not self._persistent_index:
+            with self.shadow_index() as env:
+                return self._write_index_tree(env)
 
-            # 阶段 2: 显式移除 .quipu 目录作为安全网。
-            self._run(["rm", "--cached", "-r", ".quipu"], env=env, check=False)
+        try:
+            with self.persistent_shadow_index() as env:
+                return self._write_index_tree(env)
+        except RuntimeError as e:
+            if not any(marker in str(e) for marker in _INDEX_CORRUPTION_MARKERS):
+                raise
+            # 持久化索引损坏 (或其引用的 sharedindex 已被清理)，丢弃后重新播种一次
+            logger.warning(f"Persistent shadow index is unusable, re-seeding: {e}")
+            with self.persistent_shadow_index(reseed=True) as env:
+                return self._write_index_tree(env)
+
+    def _write_index_tree(self, env: Dict[str, str]) -> str:
+        # 阶段 1: 更新索引以匹配工作区。
+        # 影子索引已经预热 (复制自用户索引或上次运行的结果)，
+        # 此处的 `git add -A` 只会处理少量变更，速度非常快。
+        # 通过 pathspec 排除 .quipu，避免每次都对其中的数据库文件做哈希。
+        pathspecs = [".", ":(exclude).quipu"]
+        excluded: List[str] = []
+        pointers: Dict[bytes, bytes] = {}
+        if self._snapshot_policy:
+            excluded = self._policy_exclude_pathspecs()
+            pointers = self._index_pointer_entries(env)
+            pathspecs += [f":(exclude){magic}" for magic in excluded]
+            pathspecs += [f":(exclude,literal){os.fsdecode(path)}" for path in pointers]
+        self._run(["add", "-A", "--ignore-errors", "--", *pathspecs], env=env)
+
+        # 阶段 2: 显式移除 .quipu 目录作为安全网 (例如用户索引中已包含 .quipu)。
+        # 需要 -f：其暂存内容可能与 HEAD 和工作区都不同，不加 -f 时 git rm 会拒绝执行。
+        self._run(["rm", "--cached", "-r", "-f", "-q", "--ignore-unmatch", ".quipu"], env=env, check=False)
+        if excluded:
+            # 已被跟踪、但按策略应排除的路径同样移出影子索引
+            rm_args = ["rm", "--cached", "-r", "-f", "-q", "--ignore-unmatch", "--"]
+            self._run(rm_args + [f":{magic}" for magic in excluded], env=env, check=False)
+        if pointers:
+            index_info = b"".join(
+                b"100644 " + self.hash_object(pointer).encode("ascii") + b"\t" + path + b"\0"
+                for path, pointer in pointers.items()
+            )
+            self._run(
+                ["update-index", "-z", "--add", "--index-info"], env=env, input_data=index_info, capture_as_text=False
+            )
 
-            # 阶段 3: 将最终的纯净索引写入对象库，返回 Tree Hash。
-            result = self._run(["write-tree"], env=env)
-            return result.stdout.strip()
+        # 阶段 3: 将最终的纯净索引写入对象库，返回 Tree Hash。
+        result = self._run(["write-tree"], env=env)
+        return result.stdout.strip()
+
+    def _policy_exclude_pathspecs(self) -> List[str]:
+        # 与 SnapshotPolicy.excludes 的语义一致：不含 '/' 的模式匹配任意层级的文件名
+        specs = []
+        for pattern in self._snapshot_policy.exclude:
+            if "/" in pattern:
+                specs += [f"(glob){pattern}", f"(glob){pattern}/**"]
+            else:
+                specs += [f"(glob)**/{pattern}", f"(glob)**/{pattern}/**"]
+        return specs
+
+    def _index_pointer_entries(self, env: Dict[str, str]) -> Dict[bytes, bytes]:
+        # 回退路径无法在 `git add` 内部替换文件内容：先按 stat 找出需要记录为指针的文件，
+        # 把它们排除在 `git add` 之外，再单独写入指针条目
+        result = self._run(
+            ["ls-files", "-c", "-o", "-z", "--exclude-standard", "--", ".", ":(exclude).quipu"],
+            env=env,
+            capture_as_text=False,
+        )
+        pointers = {}
+        for path in dict.fromkeys(result.stdout.split(b"\0")):
+            if not path or self._snapshot_policy.excludes(path):
+                continue
+            full_path = os.path.join(os.fsencode(self.root), path)
+            try:
+                st = os.lstat(full_path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            pointer = self._snapshot_policy.read_pointer(path, full_path, st)
+            if pointer is not None:
+                pointers[path] = pointer
+        return pointers
 
     def hash_object(self, content_bytes: bytes, object_type: str = "blob") -> str:
+        # `hash-object --stdin` 不经过任何过滤器，进程内写入 loose 对象的结果完全一致
+        if object_type == "blob" and self._native_writer:
+            try:
+                return self._odb.write("blob", content_bytes)
+            except OSError as e:
+                logger.debug(f"Native blob write failed, falling back to git: {e}")
+
+        started = time.perf_counter()
         try:
             result = subprocess.run(
                 ["git", "hash-object", "-w", "-t", object_type, "--stdin"],
@@ -115,12 +566,117 @@ class GitDB:
             stderr_str = e.stderr.decode("utf-8") if e.stderr else "No stderr"
             logger.error(f"Git hash-object failed: {stderr_str}")
             raise RuntimeError(f"Git command failed: hash-object\n{stderr_str}") from e
+        finally:
+            metrics.record("hash-object", time.perf_counter() - started, bytes_in=len(content_bytes), bytes_out=41)
+
+    def _native_mktree(self, tree_descriptor: str) -> Optional[str]:
+        lines = tree_descriptor.split("\n")
+        if lines and not lines[-1]:
+            lines.pop()
+
+        entries = []
+        names = set()
+        for line in lines:
+            meta, sep, name = line.partition("\t")
+            parts = meta.split(" ")
+            # 引号路径、重复条目、子模块等不常见输入交给 git mktree，由它给出权威结果或错误
+            if not sep or len(parts) != 3 or not name or name in names or name[0] == '"' or "/" in name:
+                return None
+            mode_str, object_type, object_hash = parts
+            try:
+                mode = int(mode_str, 8)
+            except ValueError:
+                return None
+            is_tree = mode & 0o170000 == 0o040000
+            if mode & 0o170000 == 0o160000 or object_type != ("tree" if is_tree else "blob"):
+                return None
+            if not _OBJECT_ID_RE.match(object_hash) or not self._odb.contains(object_hash.lower()):
+                return None
+
+            names.add(name)
+            name_bytes = name.encode("utf-8")
+            entry = f"{mode:o} ".encode("ascii") + name_bytes + b"\0" + bytes.fromhex(object_hash)
+            # Git 对 tree 条目排序时，目录名按带尾部 '/' 的形式比较
+            entries.append((name_bytes + b"/" if is_tree else name_bytes, entry))
+
+        entries.sort(key=lambda item: item[0])
+        return self._odb.write("tree", b"".join(entry for _, entry in entries))
 
     def mktree(self, tree_descriptor: str) -> str:
+        if self._native_writer:
+            try:
+                tree_hash = self._native_mktree(tree_descriptor)
+                if tree_hash:
+                    return tree_hash
+            except OSError as e:
+                logger.debug(f"Native mktree failed, falling back to git: {e}")
+
         result = self._run(["mktree"], input_data=tree_descriptor)
         return result.stdout.strip()
 
+    def _native_ident(self, role: str) -> Optional[str]:
+        config = self.get_config()
+        name_sources = (os.environ.get(f"GIT_{role.upper()}_NAME"), config.get(f"{role}.name"), config.get("user.name"))
+        email_sources = (
+            os.environ.get(f"GIT_{role.upper()}_EMAIL"),
+            config.get(f"{role}.email"),
+            config.get("user.email"),
+            os.environ.get("EMAIL"),
+        )
+        name = next((value for value in name_sources if value is not None), None)
+        email = next((value for value in email_sources if value is not None), None)
+
+        # 缺失的身份需要 git 自动推断，需要清理的身份由 git 规范化，两者都回退
+        for value in (name, email):
+            if not value or value[0] <= " " or value[-1] <= " " or value[0] in _IDENT_CRUD or value[-1] in _IDENT_CRUD:
+                return None
+            if "<" in value or ">" in value or "\n" in value:
+                return None
+        return f"{name} <{email}>"
+
+    def get_ident(self, role: str) -> str:
+        ident = self._native_ident(role) if self._native_writer else None
+        if ident:
+            return ident
+        # 由 git 自行推断身份，去掉末尾的时间戳与时区
+        result = self._run(["var", f"GIT_{role.upper()}_IDENT"])
+        return result.stdout.strip().rsplit(" ", 2)[0]
+
+    def _native_commit_tree(self, tree_hash: str, parent_hashes: Optional[List[str]], message: str) -> Optional[str]:
+        config = self.get_config()
+        if config.get("commit.gpgsign", "false").lower() not in _FALSE_VALUES:
+            return None
+        if config.get("i18n.commitencoding", "utf-8").lower() not in ("utf-8", "utf8"):
+            return None
+        if "GIT_AUTHOR_DATE" in os.environ or "GIT_COMMITTER_DATE" in os.environ:
+            return None
+
+        author = self._native_ident("author")
+        committer = self._native_ident("committer")
+        if not author or not committer:
+            return None
+
+        # 与 commit-tree 一致：重复的父节点只保留一次
+        parents = list(dict.fromkeys(parent_hashes or []))
+        for object_hash in [tree_hash] + parents:
+            if not _OBJECT_ID_RE.match(object_hash) or not self._odb.contains(object_hash.lower()):
+                return None
+
+        date = format_git_date(int(time.time()))
+        raw = serialize_commit(
+            tree_hash.lower(), [p.lower() for p in parents], f"{author} {date}", f"{committer} {date}", message
+        )
+        return self._odb.write("commit", raw)
+
     def commit_tree(self, tree_hash: str, parent_hashes: Optional[List[str]], message: str) -> str:
+        if self._native_writer:
+            try:
+                commit_hash = self._native_commit_tree(tree_hash, parent_hashes, message)
+                if commit_hash:
+                    return commit_hash
+            except OSError as e:
+                logger.debug(f"Native commit-tree failed, falling back to git: {e}")
+
         cmd = ["commit-tree", tree_hash]
         if parent_hashes:
             for p in parent_hashes:
@@ -129,16 +685,258 @@ class GitDB:
         result = self._run(cmd, input_data=message)
         return result.stdout.strip()
 
+    def _can_write_ref_natively(self, ref_name: str, commit_hash: str) -> bool:
+        if not self._native_writer or not is_simple_refname(ref_name):
+            return False
+        if not _OBJECT_ID_RE.match(commit_hash) or not self._odb.contains(commit_hash.lower()):
+            return False
+
+        config = self.get_config()
+        git_dir = self.root / ".git"
+        if "extensions.refstorage" in config:
+            return False
+        if config.get("core.sharedrepository", "false").lower() not in _FALSE_VALUES:
+            return False
+        # reference-transaction hook 与 reflog 只有 git 自己能正确处理
+        hooks_dir = Path(config["core.hookspath"]) if "core.hookspath" in config else git_dir / "hooks"
+        if not hooks_dir.is_absolute():
+            hooks_dir = self.root / hooks_dir
+        if (hooks_dir / "reference-transaction").exists():
+            return False
+        log_all = config.get("core.logallrefupdates", "true").lower()
+        if log_all == "always" or (log_all not in _FALSE_VALUES and ref_name.startswith(_REFLOG_PREFIXES)):
+            return False
+        return not (git_dir / "logs" / ref_name).exists()
+
     def update_ref(self, ref_name: str, commit_hash: str):
+        self.ref_epoch += 1
+        if self._can_write_ref_natively(ref_name, commit_hash):
+            try:
+                if write_loose_ref(self.root / ".git", ref_name, commit_hash.lower()):
+                    return
+            except OSError as e:
+                logger.debug(f"Native ref update of {ref_name} failed, falling back to git: {e}")
+
         self._run(["update-ref", ref_name, commit_hash])
 
+    def advance_head(self, commit_hash: str, parent_hash: Optional[str] = None):
+        prefix = "refs/quipu/local/heads/"
+        self.update_ref(prefix + commit_hash, commit_hash)
+        if parent_hash and self._compact_heads:
+            # 父节点有了子节点，不再是叶子；它仍可经由新的 head 到达
+            self._drop_head_ref(prefix + parent_hash, parent_hash)
+        self.note_ref_writes(1)
+
+    def retire_heads(self, transaction: RefTransaction, commit_hashes: Iterable[str]):
+        # 在调用方的引用事务中移除已不是叶子的本地 head；未启用压缩时不做任何事
+        if not self._compact_heads:
+            return
+        for commit_hash in sorted(commit_hashes):
+            transaction.delete(f"refs/quipu/local/heads/{commit_hash}")
+
+    def _drop_head_ref(self, ref_name: str, commit_hash: str):
+        self.ref_epoch += 1
+        if self._native_writer and is_simple_refname(ref_name):
+            try:
+                if delete_loose_ref(self.root / ".git", ref_name, commit_hash.lower()):
+                    return
+            except OSError as e:
+                logger.debug(f"Native ref deletion of {ref_name} failed, falling back to git: {e}")
+        self._run(["update-ref", "-d", ref_name], check=False, log_error=False)
+
+    def note_ref_writes(self, count: int):
+        # 跨进程累计写入的 head 数量，定期把 loose 引用打包进 packed-refs
+        if self._pack_refs_interval <= 0 or count <= 0:
+            return
+        try:
+            pending = int(self._cache.get_meta("ref_writes_since_pack") or 0) + count
+            if pending >= self._pack_refs_interval:
+                self.pack_refs()
+                pending = 0
+            self._cache.set_meta("ref_writes_since_pack", str(pending))
+        except (sqlite3.Error, RuntimeError) as e:
+            logger.debug(f"Periodic pack-refs skipped: {e}")
+
+    def pack_refs(self):
+        self._run(["pack-refs", "--all", "--prune"])
+        logger.debug("Packed refs")
+
+    def get_independent_heads(self, commit_hashes: Iterable[str]) -> Set[str]:
+        # 去掉可以从其它 head 到达的 commit，只保留叶子
+        candidates = sorted(set(commit_hashes))
+        if len(candidates) <= 1:
+            return set(candidates)
+        result = self._run(["merge-base", "--independent", *candidates])
+        return set(result.stdout.split())
+
+    @contextmanager
+    def pack_writer(self):
+        writer = PackWriter(self.root / ".git" / "objects" / "pack")
+        try:
+            yield writer
+        except BaseException:
+            writer.abort()
+            raise
+
+        pack_path = writer.finish()
+        if pack_path is None:
+            return
+        try:
+            # 只有生成了 .idx 之后，pack 中的对象才对 git 可见
+            self._run(["index-pack", str(pack_path)])
+        except RuntimeError:
+            pack_path.unlink(missing_ok=True)
+            raise
+        logger.debug(f"Wrote {len(writer)} objects to {pack_path.name}")
+
     def delete_ref(self, ref_name: str):
+        self.ref_epoch += 1
         self._run(["update-ref", "-d", ref_name], check=False)
 
+    @contextmanager
+    def ref_transaction(self):
+        transaction = RefTransaction()
+        yield transaction
+        self.apply_ref_transaction(transaction)
+
+    def apply_ref_transaction(self, transaction: RefTransaction):
+        if not len(transaction):
+            return
+        self.ref_epoch += 1
+        # 所有变更由一个 update-ref 进程原子地完成，而不是每个引用 fork 一次
+        self._run(["update-ref", "--stdin"], input_data=transaction.to_stdin())
+        logger.debug(f"Applied ref transaction with {len(transaction)} commands")
+
+    def get_refs_fingerprint(self, prefix: str = "refs/quipu/") -> str:
+        # 通过文件系统元数据为某个 ref 命名空间生成指纹，无需启动 git 子进程。
+        # update-ref 总是通过 lock 文件 + rename 写入，因此 inode 变化能可靠地反映每次更新。
+        git_dir = self.root / ".git"
+        digest = hashlib.sha1()
+        # 浅克隆边界变化 (例如 --depth 加深) 会改变可见的父子关系，同样计入指纹
+        try:
+            st = (git_dir / "shallow").stat()
+            digest.update(f"shallow {st.st_mtime_ns} {st.st_size} {st.st_ino}\n".encode())
+        except FileNotFoundError:
+            digest.update(b"shallow -\n")
+
+        if (git_dir / "reftable").exists():
+            res = self._run(["for-each-ref", "--format=%(objectname) %(refname)", prefix], check=False)
+            digest.update(res.stdout.encode("utf-8"))
+            return digest.hexdigest()
+
+        try:
+            st = (git_dir / "packed-refs").stat()
+            digest.update(f"packed-refs {st.st_mtime_ns} {st.st_size} {st.st_ino}\n".encode())
+        except FileNotFoundError:
+            digest.update(b"packed-refs -\n")
+
+        for dirpath, dirnames, filenames in os.walk(git_dir / prefix.rstrip("/")):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                digest.update(f"{path} {st.st_mtime_ns} {st.st_size} {st.st_ino}\n".encode("utf-8", "surrogateescape"))
+        return digest.hexdigest()
+
+    def get_shallow_commits(self) -> Set[str]:
+        # 浅拉取的边界 commit：它们在 git log 中没有父节点，被视为历史的根
+        try:
+            return set((self.root / ".git" / "shallow").read_text(encoding="ascii").split())
+        except FileNotFoundError:
+            return set()
+
+    def _scan_output_trees(self, heads: Set[str], exclude: Set[str]) -> List[Tuple[str, str, int]]:
+        # 只遍历 refs/quipu 下新增的部分历史，而不是整个仓库
+        entries = []
+        for entry in self.iter_log(sorted(heads), exclude=sorted(exclude), check=True):
+            match = _OUTPUT_TREE_TRAILER_RE.search(entry.body)
+            if match:
+                entries.append((match.group(1), entry.commit_hash, entry.timestamp))
+        return entries
+
+    def _refresh_output_tree_index(self):
+        # 必须先取指纹再读取 refs：期间发生的变化会在下一次查询时再次触发刷新
+        fingerprint = self.get_refs_fingerprint()
+        if self._cache.get_meta("output_tree_refs_fingerprint") == fingerprint:
+            return
+
+        heads = {commit_hash for commit_hash, _ in self.get_all_ref_heads("refs/quipu/")}
+        known = self._cache.get_indexed_heads()
+        new_heads = heads - known
+        if new_heads:
+            # 写入端压缩会删除父节点的 head：已索引的 head 只要对象仍在，就可以作为遍历边界，
+            # 否则每次写入后都会重新遍历整段历史
+            exclude = known & heads
+            detached = sorted(known - heads)
+            if detached:
+                exclude |= {h for h, info in self.batch_check_objects(detached).items() if info[0] == "commit"}
+            try:
+                entries = self._scan_output_trees(new_heads, exclude)
+            except RuntimeError as e:
+                logger.debug(f"Incremental output tree scan failed, rescanning new heads fully: {e}")
+                entries = self._scan_output_trees(new_heads, set())
+            self._cache.add_output_trees(entries)
+            logger.debug(f"Indexed {len(entries)} output trees from {len(new_heads)} new quipu heads")
+
+        # 浅拉取边界被加深后，原边界之下新出现的历史不在任何新 head 的增量范围内，需要单独补扫
+        shallow = self.get_shallow_commits()
+        indexed_shallow = set((self._cache.get_meta("shallow_commits") or "").split())
+        deepened = indexed_shallow - shallow
+        if deepened:
+            entries = self._scan_output_trees(deepened, set())
+            self._cache.add_output_trees(entries)
+            logger.debug(f"Indexed {len(entries)} output trees below {len(deepened)} deepened shallow commits")
+        if shallow != indexed_shallow:
+            self._cache.set_meta("shallow_commits", " ".join(sorted(shallow)))
+        self._cache.set_indexed_heads(heads, fingerprint)
+
+    def rebuild_output_tree_index(self):
+        self._cache.clear_output_trees()
+        self._refresh_output_tree_index()
+
+    def index_output_tree(self, output_tree: str, commit_hash: str):
+        try:
+            self._cache.add_output_trees([(output_tree, commit_hash, int(time.time()))])
+        except sqlite3.Error as e:
+            logger.debug(f"Failed to index output tree {output_tree[:7]}: {e}")
+
+    def index_output_trees(self, entries: List[Tuple[str, str, int]]):
+        try:
+            self._cache.add_output_trees(entries)
+        except sqlite3.Error as e:
+            logger.debug(f"Failed to index {len(entries)} output trees: {e}")
+
+    def unindex_output_trees(self, entries: List[Tuple[str, str]]):
+        # 被重写的 commit 对象在 gc 之前仍然存在，必须显式移出索引
+        try:
+            self._cache.remove_output_tree_commits(entries)
+        except sqlite3.Error as e:
+            logger.debug(f"Failed to unindex {len(entries)} output trees: {e}")
+
+    def _object_exists(self, object_hash: str) -> bool:
+        if self._odb:
+            try:
+                return self._odb.contains(object_hash)
+            except Exception:
+                pass
+        return object_hash in self.batch_check_objects([object_hash])
+
     def get_commit_by_output_tree(self, tree_hash: str) -> Optional[str]:
-        # 使用 grep 搜索所有 refs/quipu/ 下的记录
-        # 注意：这假设 Output Tree 是唯一的，这在大概率上是成立的，
-        # 且即使有重复（如 merge），找到任意一个作为父节点通常也是可接受的起点。
+        # 通过持久化的 output_tree -> commit 索引查找；多个 commit 共享同一 output_tree 时取最新的一个。
+        try:
+            self._refresh_output_tree_index()
+            for commit_hash in self._cache.find_commits_by_output_tree(tree_hash):
+                if self._object_exists(commit_hash):
+                    return commit_hash
+                # 对应的 commit 已被修剪并回收
+                self._cache.remove_output_tree_commit(tree_hash, commit_hash)
+            return None
+        except (sqlite3.Error, RuntimeError) as e:
+            logger.warning(f"Output tree index unavailable, falling back to git log: {e}")
+
         cmd = ["log", "--all", f"--grep=X-Quipu-Output-Tree: {tree_hash}", "--format=%H", "-n", "1"]
         res = self._run(cmd, check=False)
         if res.returncode == 0 and res.stdout.strip():
@@ -152,26 +950,67 @@ class GitDB:
         except RuntimeError:
             return None  # 可能是空仓库
 
+    def get_ancestry_index(self) -> AncestryIndex:
+        # refs/quipu 下的 commit 图谱，以引用指纹与本进程的写入计数为版本，refs 未变化时复用
+        key = (self.get_refs_fingerprint(), self.ref_epoch)
+        if self._ancestry is not None and self._ancestry[0] == key:
+            return self._ancestry[1]
+        heads = sorted({commit_hash for commit_hash, _ in self.get_all_ref_heads("refs/quipu/")})
+        index = AncestryIndex((commit_hash, "", parents) for commit_hash, parents in self.iter_parents(heads))
+        self._ancestry = (key, index)
+        return index
+
     def is_ancestor(self, ancestor: str, descendant: str) -> bool:
-        # merge-base --is-ancestor A B 返回 0 表示真，1 表示假
-        # 我们在这里直接调用 subprocess，因为我们关心返回码而不是输出
+        index = self.get_ancestry_index()
+        if descendant in index:
+            # 索引包含 descendant 的全部祖先，不在索引中的 ancestor 一定不是它的祖先
+            return index.is_ancestor(ancestor, descendant)
+        # refs/quipu 之外的 commit 交给 git；写入过 commit-graph 时同样按生成号剪枝
         result = self._run(
             ["merge-base", "--is-ancestor", ancestor, descendant],
-            check=False,  # 必须禁用 check，否则非 0 退出码会抛异常
-            log_error=False,  # 我们不认为这是一个错误
+            check=False,  # 返回码 1 表示 "不是祖先"，不是错误
+            log_error=False,
         )
         return result.returncode == 0
 
+    def write_commit_graph(self, prefix: str = "refs/quipu/") -> int:
+        # 为 prefix 下所有引用可达的 commit 写入 (增量拆分的) commit-graph 文件，
+        # 之后 merge-base / rev-list 等祖先查询可以直接利用其中的生成号剪枝
+        heads = sorted({commit_hash for commit_hash, _ in self.get_all_ref_heads(prefix)})
+        if not heads:
+            return 0
+        payload = "".join(f"{h}\n" for h in heads)
+        self._run(["commit-graph", "write", "--stdin-commits", "--split", "--no-progress"], input_data=payload)
+        logger.debug(f"Wrote commit-graph for {len(heads)} heads under {prefix}")
+        return len(heads)
+
+    def _cached_diff(self, old_tree: str, new_tree: str, kind: str, args: List[str]) -> str:
+        if self._diff_cache_size <= 0:
+            return self._run(args).stdout
+        cached = self._cache.get_diff(old_tree, new_tree, kind)
+        if cached is not None:
+            return cached
+        output = self._run(args).stdout
+        self._cache.put_diff(old_tree, new_tree, kind, output, self._diff_cache_size)
+        return output
+
     def get_diff_stat(self, old_tree: str, new_tree: str, count=30) -> str:
         # 使用 --stat=<width>,<name-width>,<count> 格式
         # 我们不关心 width，所以留空，只设置 count
-        result = self._run(["diff-tree", f"--stat=,,{count}", old_tree, new_tree])
-        return result.stdout.strip()
+        output = self._cached_diff(
+            old_tree, new_tree, f"stat:{count}", ["diff-tree", f"--stat=,,{count}", old_tree, new_tree]
+        )
+        return output.strip()
 
     def get_diff_name_status(self, old_tree: str, new_tree: str) -> List[Tuple[str, str]]:
-        result = self._run(["diff-tree", "--name-status", "--no-commit-id", "-r", old_tree, new_tree])
+        output = self._cached_diff(
+            old_tree,
+            new_tree,
+            "name-status",
+            ["diff-tree", "--name-status", "--no-commit-id", "-r", old_tree, new_tree],
+        )
         changes = []
-        for line in result.stdout.strip().splitlines():
+        for line in output.strip().splitlines():
             if not line:
                 continue
             parts = line.split("\t", 1)
@@ -180,14 +1019,35 @@ class GitDB:
                 changes.append((status, path))
         return changes
 
-    def checkout_tree(self, new_tree_hash: str, old_tree_hash: Optional[str] = None):
+    def get_diff_numstat(self, old_tree: str, new_tree: str) -> List[Tuple[Optional[int], Optional[int], str]]:
+        output = self._cached_diff(
+            old_tree, new_tree, "numstat", ["diff-tree", "--numstat", "--no-commit-id", "-r", old_tree, new_tree]
+        )
+        stats = []
+        for line in output.strip().splitlines():
+            parts = line.split("\t", 2)
+            if len(parts) != 3:
+                continue
+            added, deleted, path = parts
+            # 二进制文件的增删行数显示为 "-"
+            stats.append((int(added) if added != "-" else None, int(deleted) if deleted != "-" else None, path))
+        return stats
+
+    def checkout_tree(self, new_tree_hash: str, old_tree_hash: Optional[str] = None) -> Optional[int]:
         bus.info("engine.git.info.checkoutStarted", short_hash=new_tree_hash[:7])
 
+        if self._targeted_checkout and old_tree_hash and old_tree_hash != new_tree_hash:
+            touched = self._targeted_checkout_tree(new_tree_hash, old_tree_hash)
+            if touched is not None:
+                bus.success("engine.git.success.targetedCheckoutComplete", count=touched)
+                return touched
+
         # 1. 高性能检出核心
         # --reset: 类似于 git reset --hard，强制覆盖本地未提交的变更，解决 "not uptodate" 冲突。
         # -u: 更新工作区文件。Git 会自动对比当前索引，只对发生变更的文件执行 I/O (更新 mtime)。
         # 这就是我们要的 "tree-vs-tree" 优化，不需要手动传入 old_tree_hash，因为当前索引就是 old_tree。
         logger.debug(f"执行优化的强制检出: -> {new_tree_hash[:7]}")
+        stashed = self._stash_pointer_targets(new_tree_hash, old_tree_hash) if self._snapshot_policy else {}
         self._run(["read-tree", "--reset", "-u", new_tree_hash])
 
         # 2. 清理工作区中多余的文件和目录
@@ -195,106 +1055,230 @@ class GitDB:
         # 但它不会删除 "未追踪 (Untracked)" 的新文件。我们需要用 clean 来处理它们。
         # -d: 目录, -f: 强制
         # -e .quipu: 排除 .quipu 目录，防止自毁
-        self._run(["clean", "-df", "-e", ".quipu"])
+        clean_args = ["clean", "-df", "-e", ".quipu"]
+        if self._snapshot_policy:
+            # 被快照策略排除的文件从未进入历史，清理掉就无法找回
+            for pattern in self._snapshot_policy.exclude:
+                clean_args += ["-e", pattern]
+        self._run(clean_args)
+        if stashed:
+            self._restore_pointer_targets(stashed)
 
         bus.success("engine.git.success.checkoutComplete")
+        return None
+
+    def _targeted_checkout_tree(self, new_tree_hash: str, old_tree_hash: str) -> Optional[int]:
+        # 只有当工作区与索引都精确处于 old_tree 时，old -> new 的差异才足以描述全部变更；
+        # 否则 (存在未记录的变更、用户手动修改过索引等) 回退到全量检出。
+        if self.get_tree_hash() != old_tree_hash:
+            logger.debug("Workspace has drifted from the old tree, using full checkout")
+            return None
+        index_tree = self._run(["write-tree"], check=False, log_error=False)
+        if index_tree.returncode != 0 or index_tree.stdout.strip() != old_tree_hash:
+            logger.debug("Index does not match the old tree, using full checkout")
+            return None
+
+        result = self._run(
+            ["diff-tree", "-r", "-z", "--raw", "--no-renames", old_tree_hash, new_tree_hash], capture_as_text=False
+        )
+        changes = parse_raw_diff(result.stdout)
+        keep_paths: Set[bytes] = set()
+        if self._snapshot_policy:
+            keep_paths = self._pointer_changes_to_keep(changes)
+        updater = WorkspaceUpdater(self.root, self._checkout_workers)
+        try:
+            touched = updater.apply(changes, self.batch_cat_file, keep_paths=keep_paths)
+        except UnsupportedDiffError as e:
+            logger.debug(f"Targeted checkout unavailable, using full checkout: {e}")
+            return None
+
+        # 索引同样只更新差异条目；被改写的条目 stat 信息为空，下次 git status 时只需刷新这些路径
+        if changes:
+            self._run(["update-index", "-z", "--index-info"], input_data=index_info_for(changes), capture_as_text=False)
+        logger.debug(f"Targeted checkout {old_tree_hash[:7]} -> {new_tree_hash[:7]}: {touched} paths")
+        return touched
+
+    def _pointer_shas(self, blob_sizes: Dict[str, int]) -> Set[str]:
+        # 指针条目体积很小，只需读取小 blob 的内容即可识别
+        candidates = [sha for sha, size in blob_sizes.items() if size <= POINTER_MAX_SIZE]
+        contents = self.batch_cat_file(candidates)
+        return {sha for sha, content in contents.items() if is_pointer(content)}
+
+    def _blob_sizes(self, object_hashes: Iterable[str]) -> Dict[str, int]:
+        checked = self.batch_check_objects([sha for sha in object_hashes if sha != "0" * 40])
+        return {sha: size for sha, (object_type, size) in checked.items() if object_type == "blob"}
+
+    def _tree_pointer_paths(self, tree_hash: str) -> Set[bytes]:
+        result = self._run(["ls-tree", "-r", "-l", "-z", tree_hash], capture_as_text=False)
+        entries: Dict[bytes, Tuple[str, int]] = {}
+        for record in result.stdout.split(b"\0"):
+            if not record:
+                continue
+            meta, path = record.split(b"\t", 1)
+            _, object_type, sha, size = meta.split()
+            if object_type == b"blob":
+                entries[path] = (sha.decode("ascii"), int(size))
+        pointer_shas = self._pointer_shas({sha: size for sha, size in entries.values()})
+        return {path for path, (sha, _) in entries.items() if sha in pointer_shas}
+
+    def _has_real_file(self, path: bytes) -> bool:
+        full_path = os.path.join(os.fsencode(self.root), path)
+        try:
+            st = os.lstat(full_path)
+        except OSError:
+            return False
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        if st.st_size > POINTER_MAX_SIZE:
+            return True
+        with open(full_path, "rb") as f:
+            return not is_pointer(f.read())
+
+    def find_new_pointers(self, old_tree_hash: Optional[str], new_tree_hash: str) -> List[str]:
+        if old_tree_hash:
+            result = self._run(
+                ["diff-tree", "-r", "-z", "--raw", "--no-renames", old_tree_hash, new_tree_hash],
+                capture_as_text=False,
+            )
+            new_blobs = {c.path: c.new_sha for c in parse_raw_diff(result.stdout) if c.status != "D"}
+            pointer_shas = self._pointer_shas(self._blob_sizes(new_blobs.values()))
+            paths = [path for path, sha in new_blobs.items() if sha in pointer_shas]
+        else:
+            paths = sorted(self._tree_pointer_paths(new_tree_hash))
+        return [os.fsdecode(path) for path in paths]
+
+    def report_new_pointers(self, old_tree_hash: Optional[str], new_tree_hash: str) -> List[str]:
+        if not self._snapshot_policy:
+            return []
+        paths = self.find_new_pointers(old_tree_hash, new_tree_hash)
+        if paths:
+            bus.warning("engine.snapshot.warning.pointersCaptured", count=len(paths), paths=", ".join(paths[:3]))
+        return paths
+
+    def _pointer_changes_to_keep(self, changes: List[TreeChange]) -> Set[bytes]:
+        # 指针条目只记录了元数据，真实内容从未进入历史：
+        # 删除 (旧侧为指针) 或写入占位内容 (新侧为指针) 都会毁掉工作区中无法恢复的文件
+        pointer_side = {c.path: (c.status, c.old_sha if c.status == "D" else c.new_sha) for c in changes}
+        pointer_shas = self._pointer_shas(self._blob_sizes(sha for _, sha in pointer_side.values()))
+        keep: Set[bytes] = set()
+        missing: List[bytes] = []
+        for path, (status, sha) in pointer_side.items():
+            if sha not in pointer_shas:
+                continue
+            if self._has_real_file(path):
+                keep.add(path)
+            elif status != "D":
+                missing.append(path)
+        self._report_pointer_checkout(keep, missing)
+        return keep
+
+    def _stash_pointer_targets(self, new_tree_hash: str, old_tree_hash: Optional[str]) -> Dict[bytes, Path]:
+        new_pointers = self._tree_pointer_paths(new_tree_hash)
+        candidates = set(new_pointers)
+        if old_tree_hash and old_tree_hash != new_tree_hash:
+            candidates |= self._tree_pointer_paths(old_tree_hash)
+
+        stash_dir = self.root / ".quipu" / "pointer_stash"
+        stashed: Dict[bytes, Path] = {}
+        missing: List[bytes] = []
+        for index, path in enumerate(sorted(candidates)):
+            if not self._has_real_file(path):
+                if path in new_pointers:
+                    missing.append(path)
+                continue
+            stash_dir.mkdir(parents=True, exist_ok=True)
+            target = stash_dir / str(index)
+            os.replace(os.path.join(os.fsencode(self.root), path), target)
+            stashed[path] = target
+        self._report_pointer_checkout(stashed.keys(), missing)
+        return stashed
+
+    def _restore_pointer_targets(self, stashed: Dict[bytes, Path]):
+        root = os.fsencode(self.root)
+        for path, source in stashed.items():
+            full_path = os.path.join(root, path)
+            parent = os.path.dirname(full_path)
+            if os.path.lexists(full_path) and not os.path.isdir(full_path):
+                os.unlink(full_path)
+            os.makedirs(parent, exist_ok=True)
+            os.replace(source, full_path)
+        shutil.rmtree(self.root / ".quipu" / "pointer_stash", ignore_errors=True)
+
+    def _report_pointer_checkout(self, kept: Iterable[bytes], missing: Iterable[bytes]):
+        kept = sorted(os.fsdecode(p) for p in kept)
+        missing = sorted(os.fsdecode(p) for p in missing)
+        if kept:
+            bus.warning("engine.snapshot.warning.pointersKept", count=len(kept), paths=", ".join(kept[:3]))
+        if missing:
+            bus.warning("engine.snapshot.warning.pointersMissing", count=len(missing), paths=", ".join(missing[:3]))
 
     def cat_file(self, object_hash: str, object_type: str) -> bytes:
-        cmd = ["cat-file", object_type, object_hash]
-        result = self._run(cmd, capture_as_text=False)
-        return result.stdout
+        content = self._native_read(object_hash, object_type)
+        if content is not None:
+            return content
+
+        # 与 `git cat-file <type> <object>` 语义一致：允许按类型解引用 (例如 commit -> tree)
+        spec = f"{object_hash}^{{{object_type}}}"
+        result = self._cat_file_pool.read([spec])[0]
+        if result is None:
+            raise RuntimeError(f"Git command failed: cat-file {object_type} {object_hash}\nobject not found")
+        return result.content
 
     def get_blobs_from_tree(self, tree_hash: str) -> Dict[str, bytes]:
-        # 1. 获取 Tree 的内容
+        # 1. 获取原始 (二进制) Tree 内容并解析出 blob 条目
         tree_content_bytes = self.cat_file(tree_hash, "tree")
-        tree_content = tree_content_bytes.decode("utf-8", "ignore")
-
-        # 2. 解析 Tree 内容以获取 blob 哈希
-        # 格式: <mode> <type> <hash>\t<filename>
-        blob_info = {}
-        for line in tree_content.strip().splitlines():
-            parts = line.split()
-            if len(parts) == 4 and parts[1] == "blob":
-                blob_hash, filename = parts[2], parts[3]
-                blob_info[filename] = blob_hash
+        blob_info = {name: sha for mode, name, sha in parse_tree_entries(tree_content_bytes) if mode != "40000"}
 
         if not blob_info:
             return {}
 
-        # 3. 批量获取所有 blob 的内容
-        return self.batch_cat_file(list(blob_info.values()))
+        # 2. 批量获取所有 blob 的内容，并映射回文件名
+        blob_contents = self.batch_cat_file(list(blob_info.values()))
+        return {name: blob_contents[sha] for name, sha in blob_info.items() if sha in blob_contents}
 
     def batch_cat_file(self, object_hashes: List[str]) -> Dict[str, bytes]:
         if not object_hashes:
             return {}
 
-        # Deduplicate
-        unique_hashes = list(set(object_hashes))
-
-        # Prepare input: <hash>\n
-        input_str = "\n".join(unique_hashes) + "\n"
+        # Deduplicate while keeping request order stable
+        unique_hashes = list(dict.fromkeys(object_hashes))
 
         results = {}
+        pending = []
+        for object_hash in unique_hashes:
+            content = self._native_read(object_hash)
+            if content is not None:
+                results[object_hash] = content
+            else:
+                pending.append(object_hash)
 
-        try:
-            # git cat-file --batch format:
-            # <hash> <type> <size>\n
-            # <content>\n
-            with subprocess.Popen(
-                ["git", "cat-file", "--batch"],
-                cwd=self.root,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                # bufsize=0 is often recommended for binary streams but careful buffering is usually fine
-            ) as proc:
-                # Write requests and close stdin to signal EOF
-                if proc.stdin:
-                    proc.stdin.write(input_str.encode("utf-8"))
-                    proc.stdin.close()
-
-                if not proc.stdout:
-                    return {}
-
-                while True:
-                    # Read header line
-                    header_line = proc.stdout.readline()
-                    if not header_line:
-                        break
-
-                    header_parts = header_line.strip().split()
-                    if not header_parts:
-                        continue
-
-                    obj_hash_bytes = header_parts[0]
-                    obj_hash = obj_hash_bytes.decode("utf-8")
-
-                    # Check for missing object: "<hash> missing"
-                    if len(header_parts) == 2 and header_parts[1] == b"missing":
-                        continue
-
-                    if len(header_parts) < 3:
-                        logger.warning(f"Unexpected git cat-file header: {header_line}")
-                        continue
-
-                    # size is at index 2
-                    try:
-                        size = int(header_parts[2])
-                    except ValueError:
-                        logger.warning(f"Invalid size in header: {header_line}")
-                        continue
-
-                    # Read content bytes + trailing newline
-                    content = proc.stdout.read(size)
-                    proc.stdout.read(1)  # Consume the trailing LF
-
-                    results[obj_hash] = content
+        if not pending:
+            return results
 
+        try:
+            responses = self._cat_file_pool.read(pending)
         except Exception as e:
             logger.error(f"Batch cat-file failed: {e}")
             raise RuntimeError(f"Git batch operation failed: {e}") from e
 
+        for requested_hash, response in zip(pending, responses):
+            # 缺失的对象不会出现在结果中
+            if response is not None:
+                results[requested_hash] = response.content
         return results
 
+    def batch_check_objects(self, object_hashes: List[str]) -> Dict[str, Tuple[str, int]]:
+        if not object_hashes:
+            return {}
+
+        unique_hashes = list(dict.fromkeys(object_hashes))
+        responses = self._cat_file_pool.check(unique_hashes)
+        return {
+            requested_hash: (response.object_type, response.size)
+            for requested_hash, response in zip(unique_hashes, responses)
+            if response is not None
+        }
+
     def get_all_ref_heads(self, prefix: str) -> List[Tuple[str, str]]:
         res = self._run(["for-each-ref", "--format=%(objectname) %(refname)", prefix], check=False)
         if res.returncode != 0 or not res.stdout.strip():
@@ -312,45 +1296,58 @@ class GitDB:
         res = self._run(["show-ref", "--verify", "--quiet", "refs/quipu/"], check=False, log_error=False)
         return res.returncode == 0
 
-    def log_ref(self, ref_names: Union[str, List[str]]) -> List[Dict[str, str]]:
-        # A unique delimiter that's unlikely to appear in commit messages
-        DELIMITER = "---QUIPU-LOG-ENTRY---"
-        # Format: H=hash, P=parent, T=tree, ct=commit_timestamp, B=body
-        log_format = f"%H%n%P%n%T%n%ct%n%B{DELIMITER}"
-
-        if isinstance(ref_names, str):
-            refs_to_log = [ref_names]
-        else:
-            refs_to_log = ref_names
-
+    def iter_log(
+        self, ref_names: Union[str, Sequence[str]], exclude: Sequence[str] = (), check: bool = False
+    ) -> Iterator[LogEntry]:
+        refs_to_log = [ref_names] if isinstance(ref_names, str) else list(ref_names)
         if not refs_to_log:
-            return []
+            return
 
         # Git log on multiple refs will automatically show the union of their histories without duplicates.
-        cmd = ["log", f"--format={log_format}"] + refs_to_log
-        res = self._run(cmd, check=False, log_error=False)
-
-        if res.returncode != 0:
-            return []
+        # 通过 --stdin 传入 refs，避免大量 head 时超出命令行长度限制
+        stdin = "".join(f"{ref}\n" for ref in refs_to_log) + "".join(f"^{ref}\n" for ref in exclude)
+        args = ["log", "--stdin", "-z", f"--format={_LOG_FORMAT}"]
+        try:
+            yield from parse_log_stream(self._stream(args, input_data=stdin.encode("utf-8")))
+        except RuntimeError as e:
+            if check:
+                raise
+            # 与旧实现一致：不存在的引用等错误视为空历史
+            logger.debug(f"git log failed, treating as empty history: {e}")
+
+    def iter_parents(
+        self, ref_names: Union[str, Sequence[str]], exclude: Sequence[str] = (), check: bool = False
+    ) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+        refs_to_walk = [ref_names] if isinstance(ref_names, str) else list(ref_names)
+        if not refs_to_walk:
+            return
 
-        entries = res.stdout.strip().split(DELIMITER)
-        parsed_logs = []
-        for entry in entries:
-            if not entry.strip():
-                continue
+        # 与 iter_log 遍历相同的范围，但只输出 "<commit> <parent>..."，不读取提交正文
+        stdin = "".join(f"{ref}\n" for ref in refs_to_walk) + "".join(f"^{ref}\n" for ref in exclude)
+        pending = b""
+        try:
+            for chunk in self._stream(["rev-list", "--stdin", "--parents"], input_data=stdin.encode("utf-8")):
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    commit_hash, *parents = line.decode("ascii").split()
+                    yield commit_hash, tuple(parents)
+        except RuntimeError as e:
+            if check:
+                raise
+            logger.debug(f"git rev-list failed, treating as empty history: {e}")
 
-            parts = entry.strip().split("\n", 4)
-            if len(parts) >= 4:
-                parsed_logs.append(
-                    {
-                        "hash": parts[0],
-                        "parent": parts[1],
-                        "tree": parts[2],
-                        "timestamp": parts[3],
-                        "body": parts[4] if len(parts) > 4 else "",
-                    }
-                )
-        return parsed_logs
+    def log_ref(self, ref_names: Union[str, List[str]]) -> List[Dict[str, str]]:
+        return [
+            {
+                "hash": entry.commit_hash,
+                "parent": " ".join(entry.parents),
+                "tree": entry.tree,
+                "timestamp": str(entry.timestamp),
+                "body": entry.body,
+            }
+            for entry in self.iter_log(ref_names)
+        ]
 
     def push_quipu_refs(self, remote: str, user_id: str, force: bool = False):
         refspec = f"refs/quipu/local/heads/*:refs/quipu/users/{user_id}/heads/*"
@@ -361,46 +1358,150 @@ class GitDB:
         if force:
             cmd.extend(["--force", "--prune"])
         self._run(cmd)
+        self._mirror_pushed_heads(remote, user_id, prune=force)
 
-    def fetch_quipu_refs(self, remote: str, user_id: str):
-        refspec = f"refs/quipu/users/{user_id}/heads/*:refs/quipu/remotes/{remote}/{user_id}/heads/*"
-        bus.info("engine.git.info.fetching", remote=remote, user_id=user_id)
-        self._run(["fetch", remote, "--prune", refspec])
+    def _mirror_pushed_heads(self, remote: str, user_id: str, prune: bool):
+        # 与 git push 更新 refs/remotes/* 一样，把已推送的 head 记录到远程镜像中，
+        # 这样推送后但尚未重新拉取的历史同样被视为已发布 (例如 capture 压缩不会改写它们)
+        local_prefix = "refs/quipu/local/heads/"
+        mirror_prefix = f"refs/quipu/remotes/{remote}/{user_id}/heads/"
+        snapshot = self.get_all_ref_heads("refs/quipu/")
+        local = {ref[len(local_prefix) :]: c for c, ref in snapshot if ref.startswith(local_prefix)}
+        mirrored = {ref[len(mirror_prefix) :]: c for c, ref in snapshot if ref.startswith(mirror_prefix)}
+        with self.ref_transaction() as transaction:
+            for name, commit_hash in local.items():
+                if mirrored.get(name) != commit_hash:
+                    transaction.update(mirror_prefix + name, commit_hash)
+            if prune:
+                # --prune 删除了远程命名空间中本地已不存在的 head
+                for name in mirrored.keys() - local.keys():
+                    transaction.delete(mirror_prefix + name)
+
+    def fetch_quipu_refs(
+        self, remote: str, user_ids: Iterable[str], depth: Optional[int] = None, since: Optional[str] = None
+    ):
+        self._fetch_quipu_refs(remote, user_ids, depth, since)
+        self.ref_epoch += 1
+
+    def _fetch_quipu_refs(
+        self, remote: str, user_ids: Iterable[str], depth: Optional[int], since: Optional[str]
+    ) -> float:
+        # 所有订阅用户的 refspec 在同一次 fetch 中完成，只需一次连接协商
+        user_ids = sorted(set(user_ids))
+        started = time.perf_counter()
+        if not user_ids:
+            return 0.0
+        refspecs = [f"refs/quipu/users/{u}/heads/*:refs/quipu/remotes/{remote}/{u}/heads/*" for u in user_ids]
+        bus.info("engine.git.info.fetching", remote=remote, count=len(user_ids))
+        # 多个远程并发拉取时不能共享 FETCH_HEAD
+        args = ["fetch", "--prune", "--no-write-fetch-head"]
+        # 浅拉取：被截断的父节点在本地不可见，读取端将边界 commit 视为根节点
+        if depth is not None:
+            args.append(f"--depth={depth}")
+        if since is not None:
+            args.append(f"--shallow-since={since}")
+
+        for attempt in range(_FETCH_LOCK_RETRIES):
+            try:
+                self._run(args + [remote, *refspecs], log_error=False)
+                break
+            except RuntimeError as e:
+                # 并发的 prune 会争用 packed-refs.lock；fetch 是幂等的，稍后重试即可
+                if attempt + 1 < _FETCH_LOCK_RETRIES and _LOCK_CONTENTION_RE.search(str(e)):
+                    logger.debug(f"Lock contention while fetching from {remote}, retrying: {e}")
+                    time.sleep(0.1 * 2**attempt)
+                    continue
+                logger.error(f"Git plumbing error: {e}")
+                raise
+        return time.perf_counter() - started
+
+    def fetch_quipu_refs_from_remotes(
+        self,
+        remotes: Sequence[str],
+        user_ids: Iterable[str],
+        max_workers: int = 4,
+        depth: Optional[int] = None,
+        since: Optional[str] = None,
+    ) -> Dict[str, float]:
+        # 每个远程写入各自的 refs/quipu/remotes/<remote>/ 命名空间，互不冲突，可以并发拉取
+        user_ids = sorted(set(user_ids))
+        timings: Dict[str, float] = {}
+        errors: List[str] = []
+        # 浅拉取需要独占 .git/shallow.lock，只能逐个进行
+        workers = 1 if depth is not None or since is not None else max(1, min(max_workers, len(remotes)))
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    remote: pool.submit(self._fetch_quipu_refs, remote, user_ids, depth, since) for remote in remotes
+                }
+                for remote, future in futures.items():
+                    try:
+                        timings[remote] = future.result()
+                    except RuntimeError as e:
+                        errors.append(f"[{remote}] {e}")
+        finally:
+            # 引用可能已部分更新；只在调用线程上推进一次纪元
+            self.ref_epoch += 1
+        if errors:
+            raise RuntimeError("\n".join(errors))
+        return timings
 
     def reconcile_local_with_remote(self, remote: str, user_id: str):
         remote_heads_prefix = f"refs/quipu/remotes/{remote}/{user_id}/heads/"
-        remote_heads = self.get_all_ref_heads(remote_heads_prefix)
+        local_prefix = "refs/quipu/local/heads/"
+
+        # 一次 for-each-ref 快照同时提供远程头列表与本地引用的存在性检查
+        snapshot = self.get_all_ref_heads("refs/quipu/")
+        remote_heads = [(c, ref) for c, ref in snapshot if ref.startswith(remote_heads_prefix)]
         if not remote_heads:
             logger.debug("No remote refs found to reconcile.")
             return
+        existing_refs = {ref for _, ref in snapshot}
+        local_heads = [(c, ref) for c, ref in snapshot if ref.startswith(local_prefix)]
+        missing = [
+            (c, ref) for c, ref in remote_heads if local_prefix + ref[len(remote_heads_prefix) :] not in existing_refs
+        ]
+
+        # 推送不带 --prune，远程通常保留着历史上所有的 head；压缩模式下只为仍是叶子的 commit 建立本地引用
+        leaves: Optional[Set[str]] = None
+        if self._compact_heads and missing:
+            leaves = self.get_independent_heads([c for c, _ in local_heads] + [c for c, _ in missing])
 
         reconciled_count = 0
-        for commit_hash, remote_ref in remote_heads:
-            # e.g., remote_ref = refs/quipu/remotes/origin/user/heads/abc...
-            #       local_ref should be refs/quipu/local/heads/abc...
-            local_ref_suffix = remote_ref.replace(remote_heads_prefix, "")
-            local_ref = f"refs/quipu/local/heads/{local_ref_suffix}"
-
-            # 使用 rev-parse 检查本地 ref 是否已存在
-            # 如果本地已经存在，我们假设它是最新的或用户有意为之，不做任何操作
-            check_res = self._run(["rev-parse", "--verify", local_ref], check=False, log_error=False)
-            if check_res.returncode != 0:
+        with self.ref_transaction() as transaction:
+            for commit_hash, remote_ref in missing:
+                if leaves is not None and commit_hash not in leaves:
+                    continue
+                # e.g., remote_ref = refs/quipu/remotes/origin/user/heads/abc...
+                #       local_ref should be refs/quipu/local/heads/abc...
+                local_ref = local_prefix + remote_ref[len(remote_heads_prefix) :]
                 # 本地不存在此 ref，从远程镜像创建它
-                self.update_ref(local_ref, commit_hash)
+                transaction.update(local_ref, commit_hash)
                 reconciled_count += 1
                 bus.info("engine.git.info.reconciledNewBranch", short_hash=commit_hash[:7])
+            if leaves is not None:
+                # 被其它设备上的新节点取代的本地 head 不再是叶子
+                for commit_hash, local_ref in local_heads:
+                    if commit_hash not in leaves:
+                        transaction.delete(local_ref)
 
         if reconciled_count > 0:
             bus.success("engine.git.success.reconciliationComplete", count=reconciled_count)
         else:
             logger.debug("✅ Local history is already up-to-date with remote.")
 
-    def prune_local_from_remote(self, remote: str, user_id: str):
+    def prune_local_from_remote(self, remote: Union[str, Sequence[str]], user_id: str):
         local_prefix = "refs/quipu/local/heads/"
-        remote_prefix = f"refs/quipu/remotes/{remote}/{user_id}/heads/"
+        # 多个远程时，只删除在所有远程中都不存在的本地引用
+        remotes = [remote] if isinstance(remote, str) else list(remote)
+        remote_prefixes = [f"refs/quipu/remotes/{r}/{user_id}/heads/" for r in remotes]
 
-        local_heads = {ref.replace(local_prefix, "") for _, ref in self.get_all_ref_heads(local_prefix)}
-        remote_heads = {ref.replace(remote_prefix, "") for _, ref in self.get_all_ref_heads(remote_prefix)}
+        snapshot = self.get_all_ref_heads("refs/quipu/")
+        local_heads = {ref[len(local_prefix) :] for _, ref in snapshot if ref.startswith(local_prefix)}
+        remote_heads = {
+            ref[len(prefix) :] for _, ref in snapshot for prefix in remote_prefixes if ref.startswith(prefix)
+        }
 
         to_delete = local_heads - remote_heads
         if not to_delete:
@@ -408,11 +1509,12 @@ class GitDB:
             return
 
         deleted_count = 0
-        for ref_suffix in to_delete:
-            local_ref_to_delete = local_prefix + ref_suffix
-            self.delete_ref(local_ref_to_delete)
-            deleted_count += 1
-            bus.info("engine.git.info.prunedRef", ref=local_ref_to_delete)
+        with self.ref_transaction() as transaction:
+            for ref_suffix in sorted(to_delete):
+                local_ref_to_delete = local_prefix + ref_suffix
+                transaction.delete(local_ref_to_delete)
+                deleted_count += 1
+                bus.info("engine.git.info.prunedRef", ref=local_ref_to_delete)
 
         if deleted_count > 0:
             bus.success("engine.git.success.pruningComplete", count=deleted_count)
@@ -0,0 +1,86 @@
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Union
+
+logger = logging.getLogger(__name__)
+
+_FIELDS = ("calls", "spawns", "wall_time", "bytes_in", "bytes_out")
+
+
+class GitMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Union[int, float]]] = {}
+        self._roots: Set[Path] = set()
+        self.started_at = time.time()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._roots = set()
+            self.started_at = time.time()
+
+    def register_root(self, root: Path):
+        with self._lock:
+            self._roots.add(root)
+
+    @property
+    def roots(self) -> List[Path]:
+        with self._lock:
+            return sorted(self._roots)
+
+    def record(self, name: str, wall_time: float, bytes_in: int = 0, bytes_out: int = 0, spawned: bool = True):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = dict.fromkeys(_FIELDS, 0)
+            stats["calls"] += 1
+            stats["spawns"] += 1 if spawned else 0
+            stats["wall_time"] += wall_time
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += bytes_out
+
+    def snapshot(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+# 进程级的全局注册表，所有 GitDB 实例共享
+metrics = GitMetrics()
+
+
+def subcommand_name(args: List[str]) -> str:
+    # 跳过 `-c key=value` 等全局选项，取真正的子命令作为统计键
+    idx = 0
+    while idx < len(args) and args[idx].startswith("-"):
+        idx += 2 if args[idx] in ("-c", "-C") else 1
+    return args[idx] if idx < len(args) else "git"
+
+
+def append_perf_record(log_path: Path, record: Dict, keep: int = 200):
+    try:
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        lines = log_path.read_text(encoding="utf-8").splitlines() if log_path.exists() else []
+        lines.append(json.dumps(record, ensure_ascii=False, sort_keys=True))
+        tmp_path = log_path.with_name(log_path.name + ".tmp")
+        tmp_path.write_text("\n".join(lines[-keep:]) + "\n", encoding="utf-8")
+        tmp_path.replace(log_path)
+    except OSError as e:
+        logger.warning(f"Failed to write perf record to {log_path}: {e}")
+
+
+def load_perf_records(log_path: Path, last: Optional[int] = None) -> List[Dict]:
+    try:
+        lines = log_path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return []
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records[-last:] if last else records
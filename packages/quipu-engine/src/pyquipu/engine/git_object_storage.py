@@ -1,74 +1,57 @@
+import hashlib
 import importlib.metadata
+import itertools
 import json
 import logging
 import os
 import platform
 import re
 import time
+from array import array
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set
-
-from pyquipu.engine.git_db import GitDB
-from pyquipu.interfaces.models import QuipuNode
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from pyquipu.engine.ancestry import AncestryIndex
+from pyquipu.engine.git_db import GitDB, LogEntry
+from pyquipu.engine.git_odb import commit_parents, format_git_date, parse_tree_entries, rewrite_commit, serialize_commit
+from pyquipu.engine.graph_snapshot import GraphSnapshot, load_graph_snapshot, save_graph_snapshot
+from pyquipu.engine.graph_store import GraphStore
+from pyquipu.interfaces.models import CompactionResult, ImportRecord, QuipuNode
 from pyquipu.interfaces.storage import HistoryReader, HistoryWriter
 
 logger = logging.getLogger(__name__)
 
+# 加载历史时每批读取的 commit 数量
+_LOAD_BATCH_SIZE = 1000
+
+
+class _GraphSnapshot(NamedTuple):
+    key: Tuple[str, int]
+    store: GraphStore
+    # 按时间倒序排列的节点 id，以及每个节点在其中的位置
+    timeline: array
+    ranks: array
+
 
 class GitObjectHistoryReader(HistoryReader):
-    def __init__(self, git_db: GitDB):
+    def __init__(self, git_db: GitDB, snapshot_path: Optional[Path] = None):
         self.git_db = git_db
+        # 持久化的二进制图快照，None 表示每个进程都从 Git 全量加载
+        self._snapshot_path = snapshot_path
+        self._ancestry: Optional[Tuple[Tuple[str, int], AncestryIndex]] = None
+        self._graph: Optional[_GraphSnapshot] = None
 
     def _parse_output_tree_from_body(self, body: str) -> Optional[str]:
         match = re.search(r"X-Quipu-Output-Tree:\s*([0-9a-f]{40})", body)
         return match.group(1) if match else None
 
     def _parse_tree_binary(self, data: bytes) -> Dict[str, str]:
-        entries = {}
-        idx = 0
-        length = len(data)
-        while idx < length:
-            # 1. Find space after mode
-            space_idx = data.find(b" ", idx)
-            if space_idx == -1:
-                break
-
-            # 2. Find null byte after filename
-            null_idx = data.find(b"\0", space_idx + 1)
-            if null_idx == -1:
-                break
-
-            # 3. Extract filename
-            filename = data[space_idx + 1 : null_idx].decode("utf-8", errors="ignore")
-
-            # 4. Extract hash (next 20 bytes)
-            hash_start = null_idx + 1
-            if hash_start + 20 > length:
-                break
-
-            hash_bytes = data[hash_start : hash_start + 20]
-            hex_hash = hash_bytes.hex()
-
-            entries[filename] = hex_hash
-
-            # Move to next entry
-            idx = hash_start + 20
-        return entries
-
-    def load_all_nodes(self) -> List[QuipuNode]:
-        # Step 1: Get Commits
-        ref_tuples = self.git_db.get_all_ref_heads("refs/quipu/")
-        if not ref_tuples:
-            return []
-
-        all_heads = list(set(t[0] for t in ref_tuples))
-        log_entries = self.git_db.log_ref(all_heads)
-        if not log_entries:
-            return []
+        return {name: sha for _, name, sha in parse_tree_entries(data)}
 
+    def _load_batch(self, log_entries: List[LogEntry], store: GraphStore, parent_keys: bytearray):
         # Step 2: Batch fetch Trees
-        tree_hashes = [entry["tree"] for entry in log_entries]
+        tree_hashes = [entry.tree for entry in log_entries]
         trees_content = self.git_db.batch_cat_file(tree_hashes)
 
         # Step 3: Parse Trees to find Metadata Blob Hashes
@@ -90,16 +73,13 @@ class GitObjectHistoryReader(HistoryReader):
         # Step 4: Batch fetch Metadata Blobs
         metas_content = self.git_db.batch_cat_file(meta_blob_hashes)
 
-        # Step 5: Assemble Nodes
-        temp_nodes: Dict[str, QuipuNode] = {}
-        parent_map: Dict[str, str] = {}
-
+        # Step 5: Append records to the columns
         for entry in log_entries:
-            commit_hash = entry["hash"]
-            tree_hash = entry["tree"]
+            commit_hash = entry.commit_hash
+            tree_hash = entry.tree
 
             # Skip if already processed (though log entries shouldn't duplicate commits usually)
-            if commit_hash in temp_nodes:
+            if commit_hash in store:
                 continue
 
             try:
@@ -117,114 +97,150 @@ class GitObjectHistoryReader(HistoryReader):
                 meta_bytes = metas_content[meta_blob_hash]
                 meta_data = json.loads(meta_bytes)
 
-                output_tree = self._parse_output_tree_from_body(entry["body"])
+                output_tree = self._parse_output_tree_from_body(entry.body)
                 if not output_tree:
                     logger.warning(f"Skipping commit {commit_hash[:7]}: X-Quipu-Output-Tree trailer not found.")
                     continue
 
-                # Content is lazy loaded
-                content = ""
-
-                node = QuipuNode(
-                    commit_hash=commit_hash,
-                    # Placeholder, will be filled in the linking phase
-                    input_tree="",
-                    output_tree=output_tree,
-                    timestamp=datetime.fromtimestamp(
-                        float(meta_data.get("exec", {}).get("start") or entry["timestamp"])
-                    ),
-                    filename=Path(f".quipu/git_objects/{commit_hash}"),
-                    node_type=meta_data.get("type", "unknown"),
-                    content=content,
-                    summary=meta_data.get("summary", "No summary available"),
+                # Content is lazy loaded; 父节点在整次读取结束后统一解析
+                store.append_record(
+                    commit_hash,
+                    output_tree,
+                    float(meta_data.get("exec", {}).get("start") or entry.timestamp),
+                    meta_data.get("type", "unknown"),
+                    meta_data.get("summary", "No summary available"),
                 )
-
-                temp_nodes[commit_hash] = node
-                parent_hash = entry["parent"].split(" ")[0] if entry["parent"] else None
-                if parent_hash:
-                    parent_map[commit_hash] = parent_hash
+                parent_keys += bytes.fromhex(entry.parents[0]) if entry.parents else bytes(20)
 
             except Exception as e:
                 logger.error(f"Failed to load history node from commit {commit_hash[:7]}: {e}")
 
-        # Phase 2: Link nodes (Same as before)
-        for commit_hash, node in temp_nodes.items():
-            parent_commit_hash = parent_map.get(commit_hash)
-            if parent_commit_hash and parent_commit_hash in temp_nodes:
-                parent_node = temp_nodes[parent_commit_hash]
-                node.parent = parent_node
-                parent_node.children.append(node)
-                node.input_tree = parent_node.output_tree
-            else:
-                node.input_tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+    def _cache_key(self) -> Tuple[str, int]:
+        # refs 指纹覆盖其它进程的写入，ref_epoch 覆盖本进程内 (同一 GitDB) 的写入
+        return self.git_db.get_refs_fingerprint("refs/quipu/"), self.git_db.ref_epoch
+
+    def _load_graph(self) -> _GraphSnapshot:
+        key = self._cache_key()
+        if self._graph is not None and self._graph.key == key:
+            return self._graph
 
-        # Sort children by timestamp
-        for node in temp_nodes.values():
-            node.children.sort(key=lambda n: n.timestamp)
+        store = self._build_graph(key[0])
+        timeline = store.sorted_ids()
+        ranks = array("I", bytes(4 * len(timeline)))
+        for position, idx in enumerate(timeline):
+            ranks[idx] = position
+        self._graph = _GraphSnapshot(key, store, timeline, ranks)
+        logger.debug(f"Loaded history graph with {len(store)} nodes")
+        return self._graph
 
-        return list(temp_nodes.values())
+    def load_graph_store(self) -> GraphStore:
+        return self._load_graph().store
+
+    def load_all_nodes(self) -> List[QuipuNode]:
+        # 节点视图由列式存储按需物化，调用方持有期间保持同一对象
+        return list(self._load_graph().store.values())
+
+    def _read_nodes(self, store: GraphStore, heads: Sequence[str], exclude: Sequence[str] = (), check: bool = False):
+        first = len(store)
+        parent_keys = bytearray()
+
+        # 流式读取日志，按批次批量读取 tree 与 metadata 并直接写入列，不创建节点对象
+        batch: List[LogEntry] = []
+        for entry in self.git_db.iter_log(heads, exclude=exclude, check=check):
+            batch.append(entry)
+            if len(batch) >= _LOAD_BATCH_SIZE:
+                self._load_batch(batch, store, parent_keys)
+                batch = []
+        if batch:
+            self._load_batch(batch, store, parent_keys)
+        store.link_parents(first, parent_keys)
+
+    def _load_nodes(self, heads: Set[str]) -> GraphStore:
+        store = GraphStore()
+        if heads:
+            self._read_nodes(store, sorted(heads))
+        return store
+
+    def _build_graph(self, fingerprint: str) -> GraphStore:
+        if self._snapshot_path is None:
+            return self._load_nodes({commit_hash for commit_hash, _ in self.git_db.get_all_ref_heads("refs/quipu/")})
+
+        # 指纹必须在读取 refs 之前获取：期间发生的变化会在下一次加载时再次触发更新
+        shallow_digest = hashlib.sha1(" ".join(sorted(self.git_db.get_shallow_commits())).encode("ascii")).hexdigest()
+        snapshot = load_graph_snapshot(self._snapshot_path)
+        if snapshot is not None and snapshot.shallow_digest != shallow_digest:
+            # 浅拉取边界变化后，原边界之下的历史不在增量范围内
+            snapshot = None
+        if snapshot is not None and snapshot.refs_fingerprint == fingerprint:
+            return snapshot.store
+
+        heads = {commit_hash for commit_hash, _ in self.git_db.get_all_ref_heads("refs/quipu/")}
+        store = self._extend_snapshot(snapshot, heads) if snapshot is not None else None
+        if store is None:
+            store = self._load_nodes(heads)
+        save_graph_snapshot(self._snapshot_path, store, heads, fingerprint, shallow_digest)
+        return store
+
+    def _extend_snapshot(self, snapshot: GraphSnapshot, heads: Set[str]) -> Optional[GraphStore]:
+        # 只读取快照之后新增的 commit 并追加到快照的列中
+        # 旧 head 的 commit 对象已被回收等情况返回 None，由调用方全量重建
+        store = snapshot.store
+        first = len(store)
+        new_heads = heads - snapshot.heads
+        if new_heads:
+            try:
+                self._read_nodes(store, sorted(new_heads), sorted(snapshot.heads), check=True)
+            except RuntimeError as e:
+                logger.debug(f"Incremental graph snapshot update failed, rebuilding: {e}")
+                return None
+
+        if not store.all_reachable_from(heads):
+            logger.debug("Graph snapshot contains unreachable nodes, rebuilding")
+            return None
+        logger.debug(f"Extended graph snapshot with {len(store) - first} new nodes")
+        return store
 
     def get_node_count(self) -> int:
-        return len(self.load_all_nodes())
+        return len(self._load_graph().store)
 
     def get_node_position(self, output_tree_hash: str) -> int:
-        all_nodes = self.load_all_nodes()
-        # load_all_nodes 内部已经按时间倒序排序了
-        # 但为了保险，还是在这里再次确认排序逻辑
-        all_nodes.sort(key=lambda n: n.timestamp, reverse=True)
-
-        for i, node in enumerate(all_nodes):
-            if node.output_tree == output_tree_hash:
-                return i
-        return -1
+        # 按时间倒序排列时的位置；多个节点共享同一 output tree 时取最靠前者
+        graph = self._load_graph()
+        return min((graph.ranks[idx] for idx in graph.store.ids_by_output_tree(output_tree_hash)), default=-1)
 
     def load_nodes_paginated(self, limit: int, offset: int) -> List[QuipuNode]:
-        all_nodes = self.load_all_nodes()
-        # load_all_nodes 通常按时间倒序返回
-        return all_nodes[offset : offset + limit]
+        store = self._load_graph().store
+        return [store.node_at(idx) for idx in range(offset, min(offset + limit, len(store)))]
 
-    def get_ancestor_output_trees(self, start_output_tree_hash: str) -> Set[str]:
-        all_nodes = self.load_all_nodes()
-        node_map = {n.output_tree: n for n in all_nodes}
+    def get_ancestry_index(self) -> AncestryIndex:
+        # 只依赖 commit 消息中的 output tree，无需读取 metadata blob；refs 不变时复用
+        key = self._cache_key()
+        if self._ancestry is not None and self._ancestry[0] == key:
+            return self._ancestry[1]
 
-        ancestors = set()
-        queue = []
-
-        if start_output_tree_hash in node_map:
-            queue.append(node_map[start_output_tree_hash])
+        ref_tuples = self.git_db.get_all_ref_heads("refs/quipu/")
+        heads = list(set(t[0] for t in ref_tuples))
+        entries = []
+        if heads:
+            for entry in self.git_db.iter_log(heads):
+                output_tree = self._parse_output_tree_from_body(entry.body)
+                if output_tree:
+                    entries.append((entry.commit_hash, output_tree, entry.parents))
+        index = AncestryIndex(entries)
+        self._ancestry = (key, index)
+        return index
 
-        while queue:
-            current_node = queue.pop(0)
-            if current_node.parent:
-                p_hash = current_node.parent.output_tree
-                if p_hash not in ancestors:
-                    ancestors.add(p_hash)
-                    queue.append(current_node.parent)
+    def get_ancestor_output_trees(self, start_output_tree_hash: str) -> Set[str]:
+        return self.get_ancestry_index().ancestor_output_trees(start_output_tree_hash)
 
-        return ancestors
+    def get_reachable_output_trees(self, output_tree_hash: str) -> Set[str]:
+        return self.get_ancestry_index().reachable_output_trees(output_tree_hash)
 
     def get_private_data(self, node_commit_hash: str) -> Optional[str]:
         return None
 
     def get_descendant_output_trees(self, start_output_tree_hash: str) -> Set[str]:
-        all_nodes = self.load_all_nodes()
-        node_map = {n.output_tree: n for n in all_nodes}
-
-        descendants = set()
-        queue = []
-
-        if start_output_tree_hash in node_map:
-            queue.append(node_map[start_output_tree_hash])
-
-        while queue:
-            current_node = queue.pop(0)
-            for child in current_node.children:
-                c_hash = child.output_tree
-                if c_hash not in descendants:
-                    descendants.add(c_hash)
-                    queue.append(child)
-
-        return descendants
+        return self.get_ancestry_index().descendant_output_trees(start_output_tree_hash)
 
     def get_node_blobs(self, commit_hash: str) -> Dict[str, bytes]:
         try:
@@ -255,45 +271,48 @@ class GitObjectHistoryReader(HistoryReader):
             return {}
 
     def get_node_content(self, node: QuipuNode) -> str:
-        if node.content:
-            return node.content
-
-        try:
-            commit_hash = node.commit_hash
-
-            # 1. Get Tree Hash from Commit
-            commit_bytes = self.git_db.cat_file(commit_hash, "commit")
-            # Parse "tree {hash}" from the first line
-            tree_line = commit_bytes.split(b"\n", 1)[0].decode("utf-8")
-            if not tree_line.startswith("tree "):
-                raise ValueError("Invalid commit object format")
-            tree_hash = tree_line.split()[1]
-
-            # 2. Get content.md Blob Hash from Tree
-            # Use batch_cat_file to get RAW binary tree content, compatible with _parse_tree_binary
-            tree_content_map = self.git_db.batch_cat_file([tree_hash])
-            if tree_hash not in tree_content_map:
-                return ""
+        return self.get_contents([node]).get(node.commit_hash, "")
 
-            tree_content = tree_content_map[tree_hash]
-            entries = self._parse_tree_binary(tree_content)
-
-            blob_hash = entries.get("content.md")
-
-            if not blob_hash:
-                return ""  # No content found
+    def get_contents(self, nodes: Iterable[QuipuNode]) -> Dict[str, str]:
+        nodes = list(nodes)
+        result = {node.commit_hash: node.content for node in nodes if node.content}
+        pending = [node for node in nodes if not node.content]
+        if not pending:
+            return result
 
-            # 3. Read Blob (also raw binary)
-            content_bytes = self.git_db.cat_file(blob_hash, "blob")
-            content = content_bytes.decode("utf-8", errors="ignore")
+        try:
+            # 1. 批量读取 commit，解析出 tree
+            commits = self.git_db.batch_cat_file([node.commit_hash for node in pending])
+            tree_of: Dict[str, str] = {}
+            for commit_hash, commit_bytes in commits.items():
+                tree_line = commit_bytes.split(b"\n", 1)[0]
+                if tree_line.startswith(b"tree "):
+                    tree_of[commit_hash] = tree_line[5:].decode("ascii").strip()
+
+            # 2. 批量读取 tree，找到 content.md 的 blob
+            trees = self.git_db.batch_cat_file(list(tree_of.values()))
+            blob_of: Dict[str, str] = {}
+            for commit_hash, tree_hash in tree_of.items():
+                if tree_hash in trees:
+                    blob_hash = self._parse_tree_binary(trees[tree_hash]).get("content.md")
+                    if blob_hash:
+                        blob_of[commit_hash] = blob_hash
+
+            # 3. 批量读取 content.md
+            blobs = self.git_db.batch_cat_file(list(blob_of.values()))
+        except Exception as e:
+            logger.error(f"Failed to load content for {len(pending)} nodes: {e}")
+            result.update((node.commit_hash, "") for node in pending)
+            return result
 
+        for node in pending:
+            blob_hash = blob_of.get(node.commit_hash)
+            content = blobs[blob_hash].decode("utf-8", errors="ignore") if blob_hash in blobs else ""
             # Cache it
-            node.content = content
-            return content
-
-        except Exception as e:
-            logger.error(f"Failed to lazy load content for node {node.short_hash}: {e}")
-            return ""
+            if content:
+                node.content = content
+            result[node.commit_hash] = content
+        return result
 
     def find_nodes(
         self,
@@ -301,24 +320,23 @@ class GitObjectHistoryReader(HistoryReader):
         node_type: Optional[str] = None,
         limit: int = 10,
     ) -> List[QuipuNode]:
-        # 这是一个高成本操作，因为它需要加载整个图
-        candidates = self.load_all_nodes()
+        # 首次调用需要加载整个图，之后在 refs 不变时复用缓存；时间线已按时间戳降序排列
+        graph = self._load_graph()
+        candidates: Iterable[QuipuNode] = (graph.store.node_at(idx) for idx in graph.timeline)
 
         if summary_regex:
             try:
                 pattern = re.compile(summary_regex, re.IGNORECASE)
-                candidates = [node for node in candidates if pattern.search(node.summary)]
             except re.error as e:
                 logger.error(f"无效的正则表达式: {summary_regex} ({e})")
                 return []
+            candidates = (node for node in candidates if pattern.search(node.summary))
 
         if node_type:
-            candidates = [node for node in candidates if node.node_type == node_type]
+            candidates = (node for node in candidates if node.node_type == node_type)
 
-        # 按时间戳降序排序
-        candidates.sort(key=lambda n: n.timestamp, reverse=True)
-
-        return candidates[:limit]
+        # 逐个物化视图，凑满 limit 即停止
+        return list(itertools.islice(candidates, limit))
 
 
 class GitObjectHistoryWriter(HistoryWriter):
@@ -440,9 +458,10 @@ class GitObjectHistoryWriter(HistoryWriter):
         new_commit_hash = self.git_db.commit_tree(tree_hash=tree_hash, parent_hashes=parents, message=commit_message)
 
         # 3. 引用管理 (QDPS v1.1 - Local Heads Namespace)
-        # 在本地工作区命名空间中为新的 commit 创建一个持久化的 head 引用。
-        # 这是 push 操作的唯一来源，并且支持多分支图谱，因此不再删除父节点的 head。
-        self.git_db.update_ref(f"refs/quipu/local/heads/{new_commit_hash}", new_commit_hash)
+        # 在本地工作区命名空间中为新的 commit 创建一个持久化的 head 引用，这是 push 操作的唯一来源。
+        # 父节点的 head 随之移除：它已不是叶子，仍可经由新 head 到达，分支图谱不受影响。
+        self.git_db.advance_head(new_commit_hash, parent_commit)
+        self.git_db.index_output_tree(output_tree, new_commit_hash)
 
         logger.info(f"✅ History node created as commit {new_commit_hash[:7]}")
 
@@ -473,3 +492,324 @@ class GitObjectHistoryWriter(HistoryWriter):
             )
 
         return node
+
+    def _resolve_import_parent(self, record: ImportRecord, imported: Dict[str, QuipuNode]) -> Tuple[Optional[str], str]:
+        if not record.parent:
+            return None, record.input_tree or "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        if record.parent in imported:
+            parent = imported[record.parent]
+            return parent.commit_hash, parent.output_tree
+
+        # 父节点是仓库中已存在的 commit
+        try:
+            commit_body = self.git_db.cat_file(record.parent, "commit").decode("utf-8", "ignore")
+        except RuntimeError:
+            raise ValueError(f"Unknown parent '{record.parent}' for record '{record.key}'")
+        match = re.search(r"X-Quipu-Output-Tree:\s*([0-9a-f]{40})", commit_body)
+        if match:
+            return record.parent, match.group(1)
+        if record.input_tree:
+            return record.parent, record.input_tree
+        raise ValueError(f"Parent '{record.parent}' of record '{record.key}' is not a Quipu node")
+
+    def _import(self, records: Iterable[ImportRecord]) -> List[Tuple[QuipuNode, str]]:
+        generator = self._get_generator_info()
+        env = self._get_env_info()
+        author = self.git_db.get_ident("author")
+        committer = self.git_db.get_ident("committer")
+
+        imported: Dict[str, QuipuNode] = {}
+        results: List[Tuple[QuipuNode, str]] = []
+        parent_commits: Set[str] = set()
+        known_trees: Set[str] = set()
+        index_entries: List[Tuple[str, str, int]] = []
+
+        # 所有对象写入同一个 pack，只在最后运行一次 index-pack
+        with self.git_db.pack_writer() as pack:
+            for record in records:
+                if record.key in imported:
+                    raise ValueError(f"Duplicate import record key '{record.key}'")
+                parent_commit, input_tree = self._resolve_import_parent(record, imported)
+                output_tree = record.output_tree or input_tree
+                if output_tree not in known_trees:
+                    if self.git_db.batch_check_objects([output_tree]).get(output_tree, ("",))[0] != "tree":
+                        raise ValueError(f"Snapshot tree {output_tree} of record '{record.key}' does not exist")
+                    known_trees.add(output_tree)
+
+                start_time = record.timestamp if record.timestamp is not None else time.time()
+                summary = record.summary or self._generate_summary(
+                    record.node_type, record.content, input_tree, output_tree
+                )
+                metadata = {
+                    "meta_version": "1.0",
+                    "summary": summary,
+                    "type": record.node_type,
+                    "generator": generator,
+                    "env": env,
+                    "exec": {"start": start_time, "duration_ms": 0},
+                }
+                meta_json = json.dumps(metadata, sort_keys=False, ensure_ascii=False)
+
+                meta_blob_hash = pack.add("blob", meta_json.encode("utf-8"))
+                content_blob_hash = pack.add("blob", record.content.encode("utf-8"))
+                # 与 create_node 中 mktree 产生的 tree 一致 (条目已按 git 的顺序排列)
+                tree_hash = pack.add(
+                    "tree",
+                    b"100444 content.md\0"
+                    + bytes.fromhex(content_blob_hash)
+                    + b"100444 metadata.json\0"
+                    + bytes.fromhex(meta_blob_hash)
+                    + b"40000 snapshot\0"
+                    + bytes.fromhex(output_tree),
+                )
+
+                date = format_git_date(int(start_time))
+                commit_hash = pack.add(
+                    "commit",
+                    serialize_commit(
+                        tree_hash,
+                        [parent_commit] if parent_commit else [],
+                        f"{author} {date}",
+                        f"{committer} {date}",
+                        f"{summary}\n\nX-Quipu-Output-Tree: {output_tree}",
+                    ),
+                )
+                if parent_commit:
+                    parent_commits.add(parent_commit)
+                index_entries.append((output_tree, commit_hash, int(start_time)))
+
+                node = QuipuNode(
+                    commit_hash=commit_hash,
+                    input_tree=input_tree,
+                    output_tree=output_tree,
+                    timestamp=datetime.fromtimestamp(start_time),
+                    filename=Path(f".quipu/git_objects/{commit_hash}"),
+                    node_type=record.node_type,
+                    content=record.content,
+                    summary=summary,
+                )
+                if parent_commit:
+                    node.parent = imported.get(record.parent) or QuipuNode(
+                        commit_hash=parent_commit,
+                        input_tree="",
+                        output_tree=input_tree,
+                        timestamp=datetime.fromtimestamp(0),
+                        filename=Path(f".quipu/git_objects/{parent_commit}"),
+                        node_type="unknown",
+                    )
+                imported[record.key] = node
+                results.append((node, meta_json))
+
+        # 只为叶子节点创建 head 引用，中间节点由其后代保持可达
+        leaves = [node.commit_hash for node, _ in results if node.commit_hash not in parent_commits]
+        with self.git_db.ref_transaction() as transaction:
+            for commit_hash in leaves:
+                transaction.update(f"refs/quipu/local/heads/{commit_hash}", commit_hash)
+            # 导入历史挂在已有节点之下时，这些已有节点不再是叶子
+            imported_hashes = {node.commit_hash for node, _ in results}
+            self.git_db.retire_heads(transaction, parent_commits - imported_hashes)
+        self.git_db.note_ref_writes(len(leaves))
+        self.git_db.index_output_trees(index_entries)
+
+        logger.info(f"✅ Imported {len(results)} history nodes ({len(leaves)} heads)")
+        return results
+
+    def import_nodes(self, records: Iterable[ImportRecord], **kwargs: Any) -> List[QuipuNode]:
+        return [node for node, _ in self._import(records)]
+
+    def _published_commits(self, by_hash: Dict[str, QuipuNode]) -> Set[str]:
+        # 远程镜像 (包括推送时记录的 head) 与用户发布命名空间可达的节点已经发布，
+        # 重写它们会让其它设备上的历史分叉
+        published: Set[str] = set()
+        heads = self.git_db.get_all_ref_heads("refs/quipu/remotes/") + self.git_db.get_all_ref_heads(
+            "refs/quipu/users/"
+        )
+        stack = [by_hash[c] for c, _ in heads if c in by_hash]
+        while stack:
+            node = stack.pop()
+            if node.commit_hash in published:
+                continue
+            published.add(node.commit_hash)
+            if node.parent:
+                stack.append(node.parent)
+        return published
+
+    def _find_capture_chains(
+        self,
+        nodes: List[QuipuNode],
+        before: float,
+        min_length: int,
+        published: Set[str],
+        protected_trees: Set[str],
+    ) -> List[List[QuipuNode]]:
+        def eligible(node: QuipuNode) -> bool:
+            return (
+                node.node_type == "capture"
+                and node.timestamp.timestamp() < before
+                and node.commit_hash not in published
+            )
+
+        def extends(node: QuipuNode) -> bool:
+            # 链只能穿过没有分叉、且不是受保护状态 (如当前 HEAD) 的节点
+            return len(node.children) == 1 and node.output_tree not in protected_trees and eligible(node.children[0])
+
+        chains = []
+        for node in nodes:
+            if not eligible(node):
+                continue
+            if node.parent and eligible(node.parent) and extends(node.parent):
+                continue  # 不是链首
+            chain = [node]
+            while extends(chain[-1]):
+                chain.append(chain[-1].children[0])
+            if len(chain) >= min_length:
+                chains.append(chain)
+        return chains
+
+    def _compacted_content(self, chain: List[QuipuNode]) -> str:
+        diff_summary = self.git_db.get_diff_stat(chain[0].input_tree, chain[-1].output_tree)
+        return (
+            f"# 📸 Snapshot Capture\n\n"
+            f"已合并 {len(chain)} 个连续的捕获节点。\n\n"
+            f"### 📝 变更文件摘要:\n```\n{diff_summary}\n```"
+        )
+
+    def _compact(
+        self, before: float, min_length: int, protected_trees: Iterable[str] = ()
+    ) -> Tuple[CompactionResult, List[Tuple[QuipuNode, str]], List[Tuple[str, str, Optional[str]]]]:
+        nodes = GitObjectHistoryReader(self.git_db).load_all_nodes()
+        by_hash = {node.commit_hash: node for node in nodes}
+        chains = self._find_capture_chains(
+            nodes, before, max(2, min_length), self._published_commits(by_hash), set(protected_trees)
+        )
+        if not chains:
+            return CompactionResult(), [], []
+
+        tails = {chain[-1].commit_hash: chain for chain in chains}
+        absorbed = {node.commit_hash for chain in chains for node in chain[:-1]}
+
+        # 链尾的哈希变化会沿子孙传播：链尾及其全部后代都需要重写
+        affected: Set[str] = set()
+        stack = [chain[-1] for chain in chains]
+        while stack:
+            node = stack.pop()
+            if node.commit_hash not in affected:
+                affected.add(node.commit_hash)
+                stack.extend(node.children)
+        # 链首的原始父节点列表决定合并后节点的父节点 (包括浅拉取边界之外的父节点)
+        affected.update(chain[0].commit_hash for chain in chains)
+        raw_commits = self.git_db.batch_cat_file(sorted(affected))
+
+        generator = self._get_generator_info()
+        env = self._get_env_info()
+        mapping: Dict[str, str] = {}
+        compacted: List[Tuple[QuipuNode, str]] = []
+        moved: List[Tuple[str, str, Optional[str]]] = []
+
+        with self.git_db.pack_writer() as pack:
+            # 按父先子后的顺序遍历，保证重写子节点时父节点的新哈希已经确定
+            queue = [node for node in nodes if node.parent is None]
+            for node in queue:
+                queue.extend(node.children)
+                commit_hash = node.commit_hash
+                if commit_hash in absorbed:
+                    continue
+
+                if commit_hash in tails:
+                    chain = tails[commit_hash]
+                    first, tail = chain[0], chain[-1]
+                    parents = [mapping.get(p, p) for p in commit_parents(raw_commits[first.commit_hash])]
+                    summary = self._generate_summary("capture", "", first.input_tree, tail.output_tree)
+                    content = self._compacted_content(chain)
+                    start = first.timestamp.timestamp()
+                    metadata = {
+                        "meta_version": "1.0",
+                        "summary": summary,
+                        "type": "capture",
+                        "generator": generator,
+                        "env": env,
+                        "exec": {"start": start, "duration_ms": int((tail.timestamp.timestamp() - start) * 1000)},
+                        "compacted": len(chain),
+                    }
+                    meta_json = json.dumps(metadata, sort_keys=False, ensure_ascii=False)
+                    meta_blob_hash = pack.add("blob", meta_json.encode("utf-8"))
+                    content_blob_hash = pack.add("blob", content.encode("utf-8"))
+                    tree_hash = pack.add(
+                        "tree",
+                        b"100444 content.md\0"
+                        + bytes.fromhex(content_blob_hash)
+                        + b"100444 metadata.json\0"
+                        + bytes.fromhex(meta_blob_hash)
+                        + b"40000 snapshot\0"
+                        + bytes.fromhex(tail.output_tree),
+                    )
+                    # 沿用链尾的 author/committer，提交时间仍反映最后一次捕获
+                    new_hash = pack.add(
+                        "commit",
+                        rewrite_commit(
+                            raw_commits[commit_hash],
+                            parents,
+                            tree_hash=tree_hash,
+                            message=f"{summary}\n\nX-Quipu-Output-Tree: {tail.output_tree}",
+                        ),
+                    )
+                    for member in chain:
+                        mapping[member.commit_hash] = new_hash
+
+                    new_node = QuipuNode(
+                        commit_hash=new_hash,
+                        input_tree=first.input_tree,
+                        output_tree=tail.output_tree,
+                        timestamp=first.timestamp,
+                        filename=Path(f".quipu/git_objects/{new_hash}"),
+                        node_type="capture",
+                        content=content,
+                        summary=summary,
+                    )
+                    if first.parent:
+                        parent_hash = mapping.get(first.parent.commit_hash, first.parent.commit_hash)
+                        new_node.parent = QuipuNode(
+                            commit_hash=parent_hash,
+                            input_tree="",
+                            output_tree=first.input_tree,
+                            timestamp=datetime.fromtimestamp(0),
+                            filename=Path(f".quipu/git_objects/{parent_hash}"),
+                            node_type="unknown",
+                        )
+                    compacted.append((new_node, meta_json))
+
+                elif node.parent and node.parent.commit_hash in mapping:
+                    raw = raw_commits[commit_hash]
+                    new_hash = pack.add("commit", rewrite_commit(raw, [mapping.get(p, p) for p in commit_parents(raw)]))
+                    mapping[commit_hash] = new_hash
+                    moved.append((commit_hash, new_hash, mapping[node.parent.commit_hash]))
+
+        # 所有引用变更在同一个事务中完成：旧 head 被移除，指向新 commit 的 head 被创建
+        new_heads: Set[str] = set()
+        with self.git_db.ref_transaction() as transaction:
+            for commit_hash, ref_name in self.git_db.get_all_ref_heads("refs/quipu/local/heads/"):
+                new_hash = mapping.get(commit_hash)
+                if not new_hash:
+                    continue
+                transaction.delete(ref_name, commit_hash)
+                if new_hash not in new_heads:
+                    transaction.update(f"refs/quipu/local/heads/{new_hash}", new_hash)
+                    new_heads.add(new_hash)
+        self.git_db.note_ref_writes(len(new_heads))
+
+        self.git_db.unindex_output_trees([(by_hash[old].output_tree, old) for old in mapping])
+        self.git_db.index_output_trees(
+            [
+                (by_hash[old].output_tree, new, int(by_hash[old].timestamp.timestamp()))
+                for old, new in mapping.items()
+                if old not in absorbed
+            ]
+        )
+
+        result = CompactionResult(chains=len(chains), removed=len(absorbed), rewritten=mapping)
+        logger.info(f"✅ Compacted {result.chains} capture chains, {result.removed} nodes removed")
+        return result, compacted, moved
+
+    def compact_captures(self, before: float, min_length: int = 2, **kwargs: Any) -> CompactionResult:
+        result, _, _ = self._compact(before, min_length, kwargs.get("protected_trees", ()))
+        return result
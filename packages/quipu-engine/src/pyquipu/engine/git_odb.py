@@ -0,0 +1,604 @@
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Pack 内部对象类型编码
+_PACK_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+_PACK_TYPE_CODES = {name: code for code, name in _PACK_TYPES.items()}
+_OFS_DELTA = 6
+_REF_DELTA = 7
+
+_HEX_SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+_IDX_V2_MAGIC = b"\377tOc"
+
+# 超过此大小的文件以流式方式哈希并压缩，避免整体读入内存
+_STREAM_THRESHOLD = 8 * 1024 * 1024
+_STREAM_CHUNK = 1024 * 1024
+
+
+class UnsupportedRepositoryError(Exception):
+    pass
+
+
+def parse_tree_entries(data: bytes) -> List[Tuple[str, str, str]]:
+    # 原始 tree 对象格式: <mode> SP <name> NUL <20-byte sha>，重复出现
+    entries = []
+    idx = 0
+    length = len(data)
+    while idx < length:
+        space_idx = data.find(b" ", idx)
+        if space_idx == -1:
+            break
+        null_idx = data.find(b"\0", space_idx + 1)
+        if null_idx == -1 or null_idx + 21 > length:
+            break
+        mode = data[idx:space_idx].decode("ascii")
+        name = data[space_idx + 1 : null_idx].decode("utf-8", errors="surrogateescape")
+        sha = data[null_idx + 1 : null_idx + 21].hex()
+        entries.append((mode, name, sha))
+        idx = null_idx + 21
+    return entries
+
+
+def _apply_delta(base: bytes, delta: bytes) -> bytes:
+    def read_varint(pos: int) -> Tuple[int, int]:
+        value = shift = 0
+        while True:
+            byte = delta[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, pos
+
+    src_size, pos = read_varint(0)
+    dst_size, pos = read_varint(pos)
+    if src_size != len(base):
+        raise ValueError("Delta base size mismatch")
+
+    out = bytearray()
+    length = len(delta)
+    while pos < length:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            # 复制指令: 低 4 位标记 offset 字节，随后 3 位标记 size 字节
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (1 << (4 + i)):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            if size == 0:
+                size = 0x10000
+            out += base[offset : offset + size]
+        elif op:
+            # 插入指令: op 即为字面量长度
+            out += delta[pos : pos + op]
+            pos += op
+        else:
+            raise ValueError("Invalid delta opcode 0")
+
+    if len(out) != dst_size:
+        raise ValueError("Delta result size mismatch")
+    return bytes(out)
+
+
+def format_git_date(timestamp: int) -> str:
+    offset = time.localtime(timestamp).tm_gmtoff // 60
+    sign = "-" if offset < 0 else "+"
+    return f"{timestamp} {sign}{abs(offset) // 60:02d}{abs(offset) % 60:02d}"
+
+
+def serialize_commit(tree_hash: str, parent_hashes: List[str], author: str, committer: str, message: str) -> bytes:
+    # author/committer 为完整的身份行内容: "Name <email> <timestamp> <tz>"
+    lines = [f"tree {tree_hash}"]
+    lines.extend(f"parent {p}" for p in parent_hashes)
+    lines.append(f"author {author}")
+    lines.append(f"committer {committer}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8") + message.encode("utf-8")
+
+
+def commit_parents(raw: bytes) -> List[str]:
+    header = raw.split(b"\n\n", 1)[0]
+    return [line[7:].decode("ascii") for line in header.split(b"\n") if line.startswith(b"parent ")]
+
+
+def rewrite_commit(
+    raw: bytes, parent_hashes: List[str], tree_hash: Optional[str] = None, message: Optional[str] = None
+) -> bytes:
+    # 只替换 tree/parent (以及可选的消息)，author/committer 等其余头部原样保留
+    header, _, body = raw.partition(b"\n\n")
+    lines: List[bytes] = []
+    for line in header.split(b"\n"):
+        if line.startswith(b"parent "):
+            continue
+        if line.startswith(b"tree ") and not lines:
+            lines.append(b"tree " + (tree_hash.encode("ascii") if tree_hash else line[5:]))
+            lines.extend(b"parent " + p.encode("ascii") for p in parent_hashes)
+            continue
+        lines.append(line)
+    return b"\n".join(lines) + b"\n\n" + (message.encode("utf-8") if message is not None else body)
+
+
+class PackFile:
+    def __init__(self, idx_path: Path):
+        self.idx_path = idx_path
+        self.pack_path = idx_path.with_suffix(".pack")
+        with open(idx_path, "rb") as f:
+            self._idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.pack_path, "rb") as f:
+            self._pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._idx[:4] != _IDX_V2_MAGIC or struct.unpack(">I", self._idx[4:8])[0] != 2:
+            self.close()
+            raise UnsupportedRepositoryError(f"Unsupported pack index version: {idx_path.name}")
+        if self._pack[:4] != b"PACK":
+            self.close()
+            raise UnsupportedRepositoryError(f"Invalid pack file: {self.pack_path.name}")
+
+        self._fanout_offset = 8
+        self.count = struct.unpack(">I", self._idx[8 + 255 * 4 : 8 + 256 * 4])[0]
+        self._sha_offset = 8 + 256 * 4
+        self._crc_offset = self._sha_offset + 20 * self.count
+        self._offset_offset = self._crc_offset + 4 * self.count
+        self._large_offset_offset = self._offset_offset + 4 * self.count
+
+    def close(self):
+        for m in (getattr(self, "_idx", None), getattr(self, "_pack", None)):
+            if m is not None:
+                try:
+                    m.close()
+                except (BufferError, ValueError):
+                    pass
+
+    def _fanout(self, byte: int) -> int:
+        if byte < 0:
+            return 0
+        start = self._fanout_offset + byte * 4
+        return struct.unpack(">I", self._idx[start : start + 4])[0]
+
+    def find_offset(self, sha: bytes) -> Optional[int]:
+        # 借助 fanout 表缩小范围，然后在有序的 sha 表上二分查找
+        lo = self._fanout(sha[0] - 1)
+        hi = self._fanout(sha[0])
+        idx_map = self._idx
+        base = self._sha_offset
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * 20
+            candidate = idx_map[start : start + 20]
+            if candidate < sha:
+                lo = mid + 1
+            elif candidate > sha:
+                hi = mid
+            else:
+                return self._object_offset(mid)
+        return None
+
+    def _object_offset(self, index: int) -> int:
+        start = self._offset_offset + index * 4
+        offset = struct.unpack(">I", self._idx[start : start + 4])[0]
+        if offset & 0x80000000:
+            large_start = self._large_offset_offset + (offset & 0x7FFFFFFF) * 8
+            offset = struct.unpack(">Q", self._idx[large_start : large_start + 8])[0]
+        return offset
+
+    def read_header(self, offset: int) -> Tuple[int, int, int]:
+        pack = self._pack
+        byte = pack[offset]
+        pos = offset + 1
+        type_num = (byte >> 4) & 0x07
+        size = byte & 0x0F
+        shift = 4
+        while byte & 0x80:
+            byte = pack[pos]
+            pos += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+        return type_num, size, pos
+
+    def read_ofs_base(self, pos: int) -> Tuple[int, int]:
+        pack = self._pack
+        byte = pack[pos]
+        pos += 1
+        distance = byte & 0x7F
+        while byte & 0x80:
+            byte = pack[pos]
+            pos += 1
+            distance = ((distance + 1) << 7) | (byte & 0x7F)
+        return distance, pos
+
+    def read_ref_base(self, pos: int) -> Tuple[str, int]:
+        return self._pack[pos : pos + 20].hex(), pos + 20
+
+    def inflate(self, pos: int, size: int) -> bytes:
+        decompressor = zlib.decompressobj()
+        chunk = max(size + 64, 4096)
+        out = []
+        total = 0
+        while not decompressor.eof:
+            data = self._pack[pos : pos + chunk]
+            if not data:
+                break
+            pos += len(data)
+            piece = decompressor.decompress(data)
+            out.append(piece)
+            total += len(piece)
+        result = b"".join(out)
+        if total != size:
+            raise ValueError("Inflated object size mismatch")
+        return result
+
+
+class NativeObjectStore:
+    def __init__(self, objects_dir: Path, alternates: Optional[List["NativeObjectStore"]] = None):
+        self.objects_dir = objects_dir
+        self.pack_dir = objects_dir / "pack"
+        self.alternates = alternates or []
+        self._packs: Dict[str, PackFile] = {}
+        self._pack_dir_mtime: Optional[int] = None
+        self._lock = threading.RLock()
+        # 小型 LRU 缓存，避免在解析 delta 链时重复解压同一个 base
+        self._base_cache: "OrderedDict[Tuple[str, int], Tuple[str, bytes]]" = OrderedDict()
+        self._base_cache_limit = 256
+
+    @classmethod
+    def open(cls, git_dir: Path) -> Optional["NativeObjectStore"]:
+        try:
+            return cls._open(git_dir, depth=0)
+        except (UnsupportedRepositoryError, OSError) as e:
+            logger.debug(f"Native object reader disabled for {git_dir}: {e}")
+            return None
+
+    @classmethod
+    def _open(cls, git_dir: Path, depth: int) -> "NativeObjectStore":
+        if os.environ.get("GIT_OBJECT_DIRECTORY") or os.environ.get("GIT_ALTERNATE_OBJECT_DIRECTORIES"):
+            raise UnsupportedRepositoryError("Object directory overridden by environment")
+        if not git_dir.is_dir():
+            raise UnsupportedRepositoryError("Git directory is not a plain directory")
+
+        config_path = git_dir / "config"
+        if config_path.exists():
+            config_text = config_path.read_text(encoding="utf-8", errors="ignore").lower()
+            if "objectformat" in config_text or "compatobjectformat" in config_text:
+                raise UnsupportedRepositoryError("Non-SHA1 object format")
+
+        objects_dir = git_dir / "objects"
+        if not objects_dir.is_dir():
+            raise UnsupportedRepositoryError("Missing objects directory")
+        return cls._from_objects_dir(objects_dir, depth)
+
+    @classmethod
+    def _from_objects_dir(cls, objects_dir: Path, depth: int) -> "NativeObjectStore":
+        alternates = []
+        alternates_file = objects_dir / "info" / "alternates"
+        if alternates_file.exists():
+            if depth >= 5:
+                raise UnsupportedRepositoryError("Alternates chain too deep")
+            for line in alternates_file.read_text(encoding="utf-8").splitlines():
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith('"'):
+                    raise UnsupportedRepositoryError("Quoted alternates are not supported")
+                alt_dir = Path(line)
+                if not alt_dir.is_absolute():
+                    alt_dir = (objects_dir / alt_dir).resolve()
+                alternates.append(cls._from_objects_dir(alt_dir, depth + 1))
+        return cls(objects_dir, alternates)
+
+    def close(self):
+        with self._lock:
+            for pack in self._packs.values():
+                pack.close()
+            self._packs.clear()
+            self._base_cache.clear()
+            self._pack_dir_mtime = None
+        for alt in self.alternates:
+            alt.close()
+
+    def _refresh_packs(self, force: bool = False) -> bool:
+        try:
+            mtime = self.pack_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if not force and mtime == self._pack_dir_mtime:
+            return False
+
+        self._pack_dir_mtime = mtime
+        changed = False
+        current = set()
+        for idx_path in self.pack_dir.glob("*.idx"):
+            name = idx_path.name
+            current.add(name)
+            if name in self._packs or not idx_path.with_suffix(".pack").exists():
+                continue
+            try:
+                self._packs[name] = PackFile(idx_path)
+                changed = True
+            except (UnsupportedRepositoryError, OSError, ValueError) as e:
+                logger.debug(f"Skipping pack {name}: {e}")
+
+        for name in list(self._packs):
+            if name not in current:
+                self._packs.pop(name).close()
+                changed = True
+        return changed
+
+    def _read_loose(self, hex_sha: str) -> Optional[Tuple[str, bytes]]:
+        path = self.objects_dir / hex_sha[:2] / hex_sha[2:]
+        try:
+            raw = zlib.decompress(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        header_end = raw.index(b"\0")
+        obj_type, size = raw[:header_end].split(b" ")
+        content = raw[header_end + 1 :]
+        if int(size) != len(content):
+            raise ValueError(f"Corrupt loose object {hex_sha}")
+        return obj_type.decode("ascii"), content
+
+    def _cache_get(self, key: Tuple[str, int]) -> Optional[Tuple[str, bytes]]:
+        value = self._base_cache.get(key)
+        if value is not None:
+            self._base_cache.move_to_end(key)
+        return value
+
+    def _cache_put(self, key: Tuple[str, int], value: Tuple[str, bytes]):
+        self._base_cache[key] = value
+        if len(self._base_cache) > self._base_cache_limit:
+            self._base_cache.popitem(last=False)
+
+    def _read_packed_at(self, pack: PackFile, offset: int) -> Tuple[str, bytes]:
+        # 迭代解析 delta 链，避免深链导致递归过深
+        chain: List[bytes] = []
+        current_pack, current_offset = pack, offset
+        while True:
+            cache_key = (current_pack.idx_path.name, current_offset)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                obj_type, data = cached
+                break
+
+            type_num, size, pos = current_pack.read_header(current_offset)
+            if type_num in _PACK_TYPES:
+                obj_type, data = _PACK_TYPES[type_num], current_pack.inflate(pos, size)
+                self._cache_put(cache_key, (obj_type, data))
+                break
+            elif type_num == _OFS_DELTA:
+                distance, pos = current_pack.read_ofs_base(pos)
+                chain.append(current_pack.inflate(pos, size))
+                current_offset = current_offset - distance
+            elif type_num == _REF_DELTA:
+                base_sha, pos = current_pack.read_ref_base(pos)
+                chain.append(current_pack.inflate(pos, size))
+                located = self._locate_packed(bytes.fromhex(base_sha))
+                if located is None:
+                    base = self._read_loose(base_sha)
+                    if base is None:
+                        raise KeyError(f"Missing delta base {base_sha}")
+                    obj_type, data = base
+                    break
+                current_pack, current_offset = located
+            else:
+                raise UnsupportedRepositoryError(f"Unsupported pack object type {type_num}")
+
+        while chain:
+            data = _apply_delta(data, chain.pop())
+        return obj_type, data
+
+    def _locate_packed(self, sha: bytes) -> Optional[Tuple[PackFile, int]]:
+        for pack in self._packs.values():
+            offset = pack.find_offset(sha)
+            if offset is not None:
+                return pack, offset
+        return None
+
+    def read(self, hex_sha: str) -> Optional[Tuple[str, bytes]]:
+        if not _HEX_SHA_RE.match(hex_sha):
+            return None
+        sha = bytes.fromhex(hex_sha)
+
+        with self._lock:
+            if self._pack_dir_mtime is None:
+                self._refresh_packs(force=True)
+
+            located = self._locate_packed(sha)
+            if located is None:
+                loose = self._read_loose(hex_sha)
+                if loose is not None:
+                    return loose
+                # 可能有新的 pack 在打开之后生成 (例如 gc)，重新扫描一次
+                if self._refresh_packs():
+                    located = self._locate_packed(sha)
+
+            if located is not None:
+                return self._read_packed_at(*located)
+
+        for alt in self.alternates:
+            result = alt.read(hex_sha)
+            if result is not None:
+                return result
+        return None
+
+    def read_typed(self, hex_sha: str, object_type: str) -> Optional[bytes]:
+        # 与 `git cat-file <type>` 一致：沿 tag -> object、commit -> tree 方向解引用
+        current = hex_sha
+        for _ in range(16):
+            result = self.read(current)
+            if result is None:
+                return None
+            obj_type, content = result
+            if obj_type == object_type:
+                return content
+            if obj_type == "tag":
+                first_line = content.split(b"\n", 1)[0]
+                if not first_line.startswith(b"object "):
+                    return None
+                current = first_line[7:].decode("ascii")
+            elif obj_type == "commit" and object_type == "tree":
+                first_line = content.split(b"\n", 1)[0]
+                if not first_line.startswith(b"tree "):
+                    return None
+                current = first_line[5:].decode("ascii")
+            else:
+                return None
+        return None
+
+    def contains(self, hex_sha: str) -> bool:
+        if not _HEX_SHA_RE.match(hex_sha):
+            return False
+        if (self.objects_dir / hex_sha[:2] / hex_sha[2:]).exists():
+            return True
+
+        sha = bytes.fromhex(hex_sha)
+        with self._lock:
+            if self._pack_dir_mtime is None:
+                self._refresh_packs(force=True)
+            if self._locate_packed(sha) is not None:
+                return True
+            if self._refresh_packs() and self._locate_packed(sha) is not None:
+                return True
+        return any(alt.contains(hex_sha) for alt in self.alternates)
+
+    def _store_loose(self, hex_sha: str, write_compressed) -> str:
+        target_dir = self.objects_dir / hex_sha[:2]
+        target = target_dir / hex_sha[2:]
+        if target.exists():
+            return hex_sha
+
+        target_dir.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=target_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write_compressed(f)
+            os.chmod(tmp_path, 0o444)
+            # 原子地放置对象文件；内容由哈希决定，因此与并发写入者竞争是安全的
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return hex_sha
+
+    def write(self, object_type: str, content: bytes) -> str:
+        raw = f"{object_type} {len(content)}".encode("ascii") + b"\0" + content
+        hex_sha = hashlib.sha1(raw).hexdigest()
+        if self.contains(hex_sha):
+            return hex_sha
+        return self._store_loose(hex_sha, lambda f: f.write(zlib.compress(raw)))
+
+    def write_blob_from_file(self, path: bytes, size: int) -> str:
+        if size <= _STREAM_THRESHOLD:
+            with open(path, "rb") as f:
+                return self.write("blob", f.read())
+
+        # 大文件: 第一遍流式计算哈希，仅在对象不存在时再流式压缩写入
+        header = f"blob {size}".encode("ascii") + b"\0"
+        digest = hashlib.sha1(header)
+        read_total = 0
+        with open(path, "rb") as f:
+            while chunk := f.read(_STREAM_CHUNK):
+                digest.update(chunk)
+                read_total += len(chunk)
+        if read_total != size:
+            raise OSError(f"File changed while hashing: {os.fsdecode(path)}")
+
+        hex_sha = digest.hexdigest()
+        if self.contains(hex_sha):
+            return hex_sha
+
+        def write_compressed(out):
+            compressor = zlib.compressobj()
+            out.write(compressor.compress(header))
+            with open(path, "rb") as f:
+                while chunk := f.read(_STREAM_CHUNK):
+                    out.write(compressor.compress(chunk))
+            out.write(compressor.flush())
+
+        return self._store_loose(hex_sha, write_compressed)
+
+
+class PackWriter:
+    def __init__(self, pack_dir: Path):
+        self.pack_dir = pack_dir
+        self._written: Set[str] = set()
+        self._count = 0
+        self.pack_dir.mkdir(parents=True, exist_ok=True)
+        # 对象数量事先未知，先把对象数据写入临时文件，finish 时再补上 pack 头
+        fd, body_path = tempfile.mkstemp(prefix="tmp_pack_body_", dir=self.pack_dir)
+        self._body_path = Path(body_path)
+        self._body = os.fdopen(fd, "wb")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, object_type: str, content: bytes) -> str:
+        raw_header = f"{object_type} {len(content)}".encode("ascii") + b"\0"
+        hex_sha = hashlib.sha1(raw_header + content).hexdigest()
+        if hex_sha in self._written:
+            return hex_sha
+        self._written.add(hex_sha)
+
+        size = len(content)
+        header = bytearray([(_PACK_TYPE_CODES[object_type] << 4) | (size & 0x0F)])
+        size >>= 4
+        while size:
+            header[-1] |= 0x80
+            header.append(size & 0x7F)
+            size >>= 7
+        self._body.write(bytes(header))
+        self._body.write(zlib.compress(content))
+        self._count += 1
+        return hex_sha
+
+    def finish(self) -> Optional[Path]:
+        self._body.close()
+        try:
+            if not self._count:
+                return None
+            fd, tmp_path = tempfile.mkstemp(prefix="tmp_pack_", dir=self.pack_dir)
+            digest = hashlib.sha1()
+            try:
+                with os.fdopen(fd, "wb") as out, open(self._body_path, "rb") as body:
+                    header = b"PACK" + struct.pack(">II", 2, self._count)
+                    digest.update(header)
+                    out.write(header)
+                    while chunk := body.read(_STREAM_CHUNK):
+                        digest.update(chunk)
+                        out.write(chunk)
+                    out.write(digest.digest())
+                pack_path = self.pack_dir / f"pack-{digest.hexdigest()}.pack"
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, pack_path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+            return pack_path
+        finally:
+            self._body_path.unlink(missing_ok=True)
+
+    def abort(self):
+        self._body.close()
+        self._body_path.unlink(missing_ok=True)
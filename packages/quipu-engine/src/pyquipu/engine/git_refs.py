@@ -0,0 +1,115 @@
+import os
+import re
+from pathlib import Path
+from typing import List, Optional
+
+ZERO_OID = "0" * 40
+
+# 保守的引用名校验：只接受由 [A-Za-z0-9_-] 及单个点组成的路径分量，其余情况交给 git 判断
+_SIMPLE_REFNAME_RE = re.compile(r"^refs/(?:[A-Za-z0-9_-]+(?:\.[A-Za-z0-9_-]+)*/)*[A-Za-z0-9_-]+(?:\.[A-Za-z0-9_-]+)*$")
+
+
+class RefTransaction:
+    def __init__(self):
+        self._commands: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def create(self, ref_name: str, new_hash: str):
+        # 仅当引用不存在时才会成功
+        self._commands.append(f"create {ref_name} {new_hash}")
+
+    def update(self, ref_name: str, new_hash: str, old_hash: Optional[str] = None):
+        command = f"update {ref_name} {new_hash}"
+        if old_hash:
+            command += f" {old_hash}"
+        self._commands.append(command)
+
+    def delete(self, ref_name: str, old_hash: Optional[str] = None):
+        command = f"delete {ref_name}"
+        if old_hash:
+            command += f" {old_hash}"
+        self._commands.append(command)
+
+    def to_stdin(self) -> str:
+        return "".join(f"{command}\n" for command in self._commands)
+
+
+def is_simple_refname(ref_name: str) -> bool:
+    if not _SIMPLE_REFNAME_RE.match(ref_name):
+        return False
+    return not any(part.endswith(".lock") for part in ref_name.split("/"))
+
+
+def write_loose_ref(git_dir: Path, ref_name: str, object_hash: str) -> bool:
+    ref_path = git_dir / ref_name
+
+    # 目录/文件冲突与符号引用都交给 git 处理 (返回 False 表示调用方应回退)
+    parent = git_dir / "refs"
+    for part in ref_name.split("/")[1:-1]:
+        parent = parent / part
+        if parent.is_file():
+            return False
+    if ref_path.is_dir():
+        return False
+    if ref_path.is_file():
+        with open(ref_path, "rb") as f:
+            if f.read(4) == b"ref:":
+                return False
+
+    ref_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = ref_path.with_name(ref_path.name + ".lock")
+    try:
+        fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    except FileExistsError:
+        raise RuntimeError(
+            f"Git command failed: update-ref {ref_name} {object_hash}\n"
+            f"fatal: cannot lock ref '{ref_name}': Unable to create '{lock_path}': File exists."
+        )
+    try:
+        try:
+            os.write(fd, f"{object_hash}\n".encode("ascii"))
+        finally:
+            os.close(fd)
+        os.replace(lock_path, ref_path)
+    except BaseException:
+        try:
+            os.unlink(lock_path)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+def _in_packed_refs(git_dir: Path, ref_name: str) -> bool:
+    try:
+        with open(git_dir / "packed-refs", "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return False
+    return f" {ref_name}\n".encode() in data
+
+
+def delete_loose_ref(git_dir: Path, ref_name: str, object_hash: str) -> bool:
+    # 只处理 "仅以 loose 文件形式存在" 的引用；出现在 packed-refs 中时返回 False，由 git 重写 packed-refs
+    if _in_packed_refs(git_dir, ref_name):
+        return False
+    ref_path = git_dir / ref_name
+    if not ref_path.is_file():
+        return True  # 引用不存在，无需删除
+
+    lock_path = ref_path.with_name(ref_path.name + ".lock")
+    try:
+        fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    try:
+        with open(ref_path, "rb") as f:
+            if f.read().strip() != object_hash.encode("ascii"):
+                return False
+        os.unlink(ref_path)
+    finally:
+        os.unlink(lock_path)
+    return True
@@ -0,0 +1,175 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Set
+
+from .graph_store import GraphColumns, GraphStore
+
+logger = logging.getLogger(__name__)
+
+_SNAPSHOT_MAGIC = b"QGRS"
+_SNAPSHOT_VERSION = 2
+# magic, version, 节点数, head 数, 字符串数, summary 数据长度, refs 指纹, 浅克隆边界摘要
+_HEADER = struct.Struct("<4sIIIIQ40s40s")
+_HASH_SIZE = 20
+# 列数据统一按小端序存储
+_SWAP = sys.byteorder != "little"
+
+
+class GraphSnapshot(NamedTuple):
+    refs_fingerprint: str
+    shallow_digest: str
+    heads: Set[str]
+    store: GraphStore
+
+
+class _Cursor:
+    def __init__(self, data: memoryview, offset: int):
+        self.data = data
+        self.offset = offset
+        self._chunks: List[memoryview] = []
+
+    def take(self, size: int) -> memoryview:
+        end = self.offset + size
+        if end > len(self.data):
+            raise ValueError("Graph snapshot is truncated")
+        chunk = self.data[self.offset : end]
+        self._chunks.append(chunk)
+        self.offset = end
+        return chunk
+
+    def release(self):
+        # 解析失败时 traceback 仍引用局部变量，切片必须显式释放，mmap 才能关闭
+        for chunk in self._chunks:
+            chunk.release()
+
+    def array(self, typecode: str, count: int) -> array:
+        column = array(typecode)
+        column.frombytes(self.take(count * column.itemsize))
+        if _SWAP:
+            column.byteswap()
+        return column
+
+
+def _dump(column: array) -> bytes:
+    if _SWAP:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _parse(data: memoryview) -> GraphSnapshot:
+    magic, version, node_count, head_count, string_count, summary_size, fingerprint, shallow_digest = (
+        _HEADER.unpack_from(data, 0)
+    )
+    if magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION:
+        raise ValueError("Unknown graph snapshot format")
+
+    cursor = _Cursor(data, _HEADER.size)
+    try:
+        return _parse_columns(cursor, node_count, head_count, string_count, summary_size, fingerprint, shallow_digest)
+    finally:
+        cursor.release()
+
+
+def _parse_columns(
+    cursor: _Cursor,
+    node_count: int,
+    head_count: int,
+    string_count: int,
+    summary_size: int,
+    fingerprint: bytes,
+    shallow_digest: bytes,
+) -> GraphSnapshot:
+    heads_data = cursor.take(head_count * _HASH_SIZE)
+    heads = {heads_data[i : i + _HASH_SIZE].hex() for i in range(0, len(heads_data), _HASH_SIZE)}
+    # 各列整体复制出 mmap，不为单个节点创建对象
+    hashes = bytearray(cursor.take(node_count * _HASH_SIZE))
+    trees = bytearray(cursor.take(node_count * _HASH_SIZE))
+    parents = cursor.array("i", node_count)
+    timestamps = cursor.array("d", node_count)
+    types = cursor.array("I", node_count)
+    owners = cursor.array("I", node_count)
+    summary_offsets = cursor.array("Q", node_count + 1)
+    string_offsets = cursor.array("I", string_count + 1)
+    string_data = cursor.take(string_offsets[-1])
+    summary_blob = bytearray(cursor.take(summary_size))
+    if cursor.offset != len(cursor.data):
+        raise ValueError("Graph snapshot size mismatch")
+
+    # 0 号字符串保留给 None
+    strings: List[Optional[str]] = [None]
+    strings.extend(str(string_data[string_offsets[i] : string_offsets[i + 1]], "utf-8") for i in range(string_count))
+    if node_count:
+        if min(parents) < -1 or max(parents) >= node_count:
+            raise ValueError("Graph snapshot parent index out of range")
+        if max(max(types), max(owners)) > string_count:
+            raise ValueError("Graph snapshot string index out of range")
+    if summary_offsets[0] != 0 or summary_offsets[-1] != summary_size:
+        raise ValueError("Graph snapshot summary offsets mismatch")
+
+    columns = GraphColumns(hashes, trees, parents, timestamps, types, owners, strings, summary_blob, summary_offsets)
+    return GraphSnapshot(
+        fingerprint.decode("ascii"), shallow_digest.decode("ascii"), heads, GraphStore.from_columns(columns)
+    )
+
+
+def load_graph_snapshot(path: Path) -> Optional[GraphSnapshot]:
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                return _parse(view)
+            finally:
+                view.release()
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+        logger.debug(f"Discarding unreadable graph snapshot {path}: {e}")
+        return None
+
+
+def save_graph_snapshot(path: Path, store: GraphStore, heads: Set[str], refs_fingerprint: str, shallow_digest: str):
+    columns = store.columns()
+    strings = [value.encode("utf-8") for value in columns.strings[1:]]
+    string_offsets = array("I", [0])
+    for encoded in strings:
+        string_offsets.append(string_offsets[-1] + len(encoded))
+
+    header = _HEADER.pack(
+        _SNAPSHOT_MAGIC,
+        _SNAPSHOT_VERSION,
+        len(columns.parents),
+        len(heads),
+        len(strings),
+        len(columns.summary_blob),
+        refs_fingerprint.encode("ascii"),
+        shallow_digest.encode("ascii"),
+    )
+    parts = [
+        header,
+        b"".join(bytes.fromhex(h) for h in sorted(heads)),
+        bytes(columns.hashes),
+        bytes(columns.trees),
+        _dump(columns.parents),
+        _dump(columns.timestamps),
+        _dump(columns.types),
+        _dump(columns.owners),
+        _dump(columns.summary_offsets),
+        _dump(string_offsets),
+        *strings,
+        bytes(columns.summary_blob),
+    ]
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_bytes(b"".join(parts))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # 快照只是加速手段，写入失败不影响结果
+        logger.debug(f"Failed to persist graph snapshot {path}: {e}")
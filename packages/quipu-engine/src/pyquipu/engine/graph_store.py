@@ -0,0 +1,437 @@
+import weakref
+from array import array
+from collections.abc import Mapping
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+from pyquipu.interfaces.models import QuipuNode
+
+_HASH_SIZE = 20
+_NO_PARENT = -1
+_NO_HASH = bytes(_HASH_SIZE)
+_GENESIS_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+_UNSET = object()
+
+
+def _default_filename(commit_hash: str) -> str:
+    return f".quipu/git_objects/{commit_hash}"
+
+
+class GraphColumns(NamedTuple):
+    hashes: bytearray
+    trees: bytearray
+    parents: array
+    timestamps: array
+    types: array
+    owners: array
+    strings: List[Optional[str]]
+    summary_blob: bytearray
+    summary_offsets: array
+
+
+class _TextColumn:
+    # UTF-8 文本连续存放在同一块缓冲区中，按偏移切片并在访问时才解码；修改过的值单独保存
+    def __init__(self, blob: Optional[bytearray] = None, offsets: Optional[array] = None):
+        self._blob = blob if blob is not None else bytearray()
+        self._offsets = offsets if offsets is not None else array("Q", [0])
+        self._edits: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        edited = self._edits.get(idx)
+        if edited is not None:
+            return edited
+        return self._blob[self._offsets[idx] : self._offsets[idx + 1]].decode("utf-8", errors="replace")
+
+    def __setitem__(self, idx: int, value: str):
+        self._edits[idx] = value
+
+    def append(self, value: Optional[str]):
+        self._blob += (value or "").encode("utf-8")
+        self._offsets.append(len(self._blob))
+
+    def compact(self) -> "_TextColumn":
+        if not self._edits:
+            return self
+        column = _TextColumn()
+        for idx in range(len(self)):
+            column.append(self[idx])
+        return column
+
+
+class _NodeView(QuipuNode):
+    # 不经过 dataclass 生成的 __init__：标量字段从列中解码，父子关系与内容在访问时才解析
+    def __init__(self, store: "GraphStore", idx: int):
+        self._store = store
+        self._idx = idx
+        overrides = store._overrides.get(idx, {})
+        parent_idx = store._parents[idx]
+        self.commit_hash = store._hash_at(idx)
+        self.output_tree = store._tree_at(idx)
+        self.input_tree = overrides.get(
+            "input_tree", store._tree_at(parent_idx) if parent_idx != _NO_PARENT else _GENESIS_TREE
+        )
+        self.timestamp = datetime.fromtimestamp(store._timestamps[idx])
+        self.parent_hint = overrides.get("parent_hint")
+
+    # summary / node_type / owner_id 直接读写列，赋值在视图被回收后依然有效
+    @property
+    def summary(self) -> str:
+        return self._store._summaries[self._idx]
+
+    @summary.setter
+    def summary(self, value: str):
+        self._store._summaries[self._idx] = value
+
+    @property
+    def node_type(self) -> str:
+        return self._store._strings[self._store._types[self._idx]]
+
+    @node_type.setter
+    def node_type(self, value: str):
+        self._store._types[self._idx] = self._store._intern(value)
+
+    @property
+    def owner_id(self) -> Optional[str]:
+        return self._store._strings[self._store._owners[self._idx]]
+
+    @owner_id.setter
+    def owner_id(self, value: Optional[str]):
+        self._store._owners[self._idx] = self._store._intern(value)
+
+    @property
+    def filename(self) -> Path:
+        filename = self.__dict__.get("_filename")
+        if filename is None:
+            filename = self._store._overrides.get(self._idx, {}).get("filename")
+            filename = self.__dict__["_filename"] = filename or Path(_default_filename(self.commit_hash))
+        return filename
+
+    @filename.setter
+    def filename(self, value: Path):
+        self.__dict__["_filename"] = value
+
+    @property
+    def parent(self) -> Optional[QuipuNode]:
+        override = self.__dict__.get("_parent", _UNSET)
+        if override is not _UNSET:
+            return override
+        parent_idx = self._store._parents[self._idx]
+        return self._store._view(parent_idx) if parent_idx != _NO_PARENT else None
+
+    @parent.setter
+    def parent(self, value: Optional[QuipuNode]):
+        self.__dict__["_parent"] = value
+
+    @property
+    def children(self) -> List[QuipuNode]:
+        children = self.__dict__.get("_children")
+        if children is None:
+            children = [self._store._view(i) for i in self._store._child_ids_of(self._idx)]
+            self.__dict__["_children"] = children
+        return children
+
+    @children.setter
+    def children(self, value: List[QuipuNode]):
+        self.__dict__["_children"] = value
+
+    @property
+    def content(self) -> str:
+        return self._store._contents.get(self._idx, "")
+
+    @content.setter
+    def content(self, value: str):
+        # 内容写回存储，视图被回收后依然有效
+        if value:
+            self._store._contents[self._idx] = value
+        else:
+            self._store._contents.pop(self._idx, None)
+
+
+class GraphStore(Mapping):
+    def __init__(self):
+        # 第 i 个节点的各项属性分别位于各列的第 i 个位置
+        self._hashes = bytearray()
+        self._trees = bytearray()
+        self._parents = array("i")
+        self._timestamps = array("d")
+        self._types = array("I")
+        self._owners = array("I")
+        self._summaries = _TextColumn()
+        # type 与 owner 的取值很少，共用一张驻留字符串表；0 号保留给 None
+        self._strings: List[Optional[str]] = [None]
+        self._string_ids: Dict[Optional[str], int] = {None: 0}
+        # 哈希到 id 的索引在首次按哈希查找时才建立，之后随新增节点增量补齐
+        self._ids: Dict[bytes, int] = {}
+        self._indexed = 0
+        # 与默认推导值不同的少量字段 (input_tree / filename / parent_hint)
+        self._overrides: Dict[int, Dict[str, Any]] = {}
+        self._contents: Dict[int, str] = {}
+        # CSR 布局的子节点索引：节点 i 的子节点为 _child_ids[_child_offsets[i]:_child_offsets[i + 1]]
+        self._child_offsets = array("I", [0])
+        self._child_ids = array("I")
+        self._csr_size = 0
+        self._views: "weakref.WeakValueDictionary[int, QuipuNode]" = weakref.WeakValueDictionary()
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[QuipuNode]) -> "GraphStore":
+        store = cls()
+        order: Dict[str, int] = {}
+        unique: List[QuipuNode] = []
+        # 先分配全部 id，父节点可以出现在子节点之后
+        for node in nodes:
+            if node.commit_hash not in order:
+                order[node.commit_hash] = len(unique)
+                unique.append(node)
+        for node in unique:
+            parent_idx = order.get(node.parent.commit_hash, _NO_PARENT) if node.parent is not None else _NO_PARENT
+            store._append(node, parent_idx)
+        return store
+
+    @classmethod
+    def from_columns(cls, columns: GraphColumns) -> "GraphStore":
+        store = cls()
+        store._hashes = columns.hashes
+        store._trees = columns.trees
+        store._parents = columns.parents
+        store._timestamps = columns.timestamps
+        store._types = columns.types
+        store._owners = columns.owners
+        store._strings = list(columns.strings)
+        store._string_ids = {value: i for i, value in enumerate(store._strings)}
+        store._summaries = _TextColumn(columns.summary_blob, columns.summary_offsets)
+        return store
+
+    def columns(self) -> GraphColumns:
+        summaries = self._summaries.compact()
+        return GraphColumns(
+            self._hashes,
+            self._trees,
+            self._parents,
+            self._timestamps,
+            self._types,
+            self._owners,
+            self._strings,
+            summaries._blob,
+            summaries._offsets,
+        )
+
+    def append_record(
+        self,
+        commit_hash: str,
+        output_tree: str,
+        timestamp: float,
+        node_type: str,
+        summary: str,
+        owner_id: Optional[str] = None,
+    ) -> int:
+        # 直接写入各列，不创建节点对象；父节点由 link_parents 统一解析
+        idx = len(self._parents)
+        self._hashes += bytes.fromhex(commit_hash)
+        self._trees += bytes.fromhex(output_tree)
+        self._parents.append(_NO_PARENT)
+        self._timestamps.append(timestamp)
+        self._types.append(self._intern(node_type))
+        self._owners.append(self._intern(owner_id))
+        self._summaries.append(summary)
+        return idx
+
+    def link_parents(self, first: int, parent_keys: bytes):
+        # parent_keys 依次为 first 起各节点父 commit 的 20 字节哈希，全零表示没有父节点
+        index = self._index()
+        for offset in range(0, len(parent_keys), _HASH_SIZE):
+            key = bytes(parent_keys[offset : offset + _HASH_SIZE])
+            idx = first + offset // _HASH_SIZE
+            parent_idx = index.get(key, _NO_PARENT) if key != _NO_HASH else _NO_PARENT
+            if parent_idx != idx:
+                self._parents[idx] = parent_idx
+        # 父节点列被原地修改，子节点索引需要重建
+        self._csr_size = -1
+
+    def all_reachable_from(self, heads: Iterable[str]) -> bool:
+        # 沿父节点列回溯，用位图记录已访问的节点
+        visited = bytearray(len(self))
+        remaining = len(visited)
+        for head in heads:
+            idx = self.id_of(head)
+            while idx is not None and idx != _NO_PARENT and not visited[idx]:
+                visited[idx] = 1
+                remaining -= 1
+                idx = self._parents[idx]
+        return remaining == 0
+
+    def _parent_id(self, node: QuipuNode) -> int:
+        if node.parent is None:
+            return _NO_PARENT
+        parent_idx = self.id_of(node.parent.commit_hash)
+        return parent_idx if parent_idx is not None else _NO_PARENT
+
+    def _intern(self, value: Optional[str]) -> int:
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+
+    def _append(self, node: QuipuNode, parent_idx: int) -> int:
+        idx = self.append_record(
+            node.commit_hash,
+            node.output_tree,
+            node.timestamp.timestamp(),
+            node.node_type,
+            node.summary,
+            node.owner_id,
+        )
+        self._parents[idx] = parent_idx
+
+        derived_input = node.parent.output_tree if parent_idx != _NO_PARENT else _GENESIS_TREE
+        overrides: Dict[str, Any] = {}
+        if node.input_tree != derived_input:
+            overrides["input_tree"] = node.input_tree
+        if str(node.filename) != _default_filename(node.commit_hash):
+            overrides["filename"] = node.filename
+        if node.parent_hint is not None:
+            overrides["parent_hint"] = node.parent_hint
+        if overrides:
+            self._overrides[idx] = overrides
+        if node.content:
+            self._contents[idx] = node.content
+        return idx
+
+    def _hash_at(self, idx: int) -> str:
+        return self._hashes[idx * _HASH_SIZE : (idx + 1) * _HASH_SIZE].hex()
+
+    def _tree_at(self, idx: int) -> str:
+        return self._trees[idx * _HASH_SIZE : (idx + 1) * _HASH_SIZE].hex()
+
+    def _view(self, idx: int) -> QuipuNode:
+        view = self._views.get(idx)
+        if view is None:
+            view = self._views[idx] = _NodeView(self, idx)
+        return view
+
+    def node_at(self, idx: int) -> QuipuNode:
+        return self._view(idx)
+
+    def _build_children_index(self):
+        count = len(self._parents)
+        parents = self._parents
+        timestamps = self._timestamps
+        # 按 (父节点, 时间戳) 排序后，同一父节点的子节点连续且按时间排列
+        order = sorted((i for i in range(count) if parents[i] != _NO_PARENT), key=lambda i: (parents[i], timestamps[i]))
+        offsets = array("I", bytes(4 * (count + 1)))
+        for i in order:
+            offsets[parents[i] + 1] += 1
+        for i in range(count):
+            offsets[i + 1] += offsets[i]
+        self._child_offsets = offsets
+        self._child_ids = array("I", order)
+        self._csr_size = count
+
+    def _child_ids_of(self, idx: int) -> array:
+        if self._csr_size != len(self._parents):
+            self._build_children_index()
+        return self._child_ids[self._child_offsets[idx] : self._child_offsets[idx + 1]]
+
+    def _index(self) -> Dict[bytes, int]:
+        hashes = self._hashes
+        for idx in range(self._indexed, len(self._parents)):
+            self._ids.setdefault(bytes(hashes[idx * _HASH_SIZE : (idx + 1) * _HASH_SIZE]), idx)
+        self._indexed = len(self._parents)
+        return self._ids
+
+    def id_of(self, commit_hash: Any) -> Optional[int]:
+        try:
+            key = bytes.fromhex(commit_hash)
+        except (TypeError, ValueError):
+            return None
+        return self._index().get(key)
+
+    def __getitem__(self, commit_hash: str) -> QuipuNode:
+        idx = self.id_of(commit_hash)
+        if idx is None:
+            raise KeyError(commit_hash)
+        return self._view(idx)
+
+    def __setitem__(self, commit_hash: str, node: QuipuNode):
+        if commit_hash != node.commit_hash:
+            raise ValueError(f"Key {commit_hash} does not match node {node.commit_hash}")
+        self.add(node)
+
+    def __contains__(self, commit_hash: object) -> bool:
+        return self.id_of(commit_hash) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in range(len(self._parents)):
+            yield self._hash_at(idx)
+
+    def __len__(self) -> int:
+        return len(self._parents)
+
+    def add(self, node: QuipuNode) -> QuipuNode:
+        existing = self.id_of(node.commit_hash)
+        if existing is not None:
+            return self._view(existing)
+        parent_idx = self._parent_id(node)
+        view = self._view(self._append(node, parent_idx))
+        if parent_idx != _NO_PARENT:
+            # 已物化的父节点视图缓存了子节点列表，需要同步追加
+            parent_view = self._views.get(parent_idx)
+            if parent_view is not None and "_children" in parent_view.__dict__:
+                parent_view.children.append(view)
+        return view
+
+    def find_by_output_tree(self, output_tree: str) -> Optional[QuipuNode]:
+        # 多个节点回到同一状态时取最新的一个，与加载顺序无关
+        ids = self.ids_by_output_tree(output_tree)
+        if not ids:
+            return None
+        return self._view(max(ids, key=lambda i: (self._timestamps[i], -i)))
+
+    def _match_prefix(self, column: bytearray, prefix: str) -> List[int]:
+        prefix = prefix.lower()
+        try:
+            # 奇数长度的前缀先按完整字节定位候选，再比较十六进制形式
+            needle = bytes.fromhex(prefix[: len(prefix) // 2 * 2])
+        except ValueError:
+            return []
+        if not needle:
+            count = len(self._parents)
+            return [i for i in range(count) if column[i * _HASH_SIZE : (i + 1) * _HASH_SIZE].hex().startswith(prefix)]
+        matches = []
+        pos = column.find(needle)
+        while pos != -1:
+            if pos % _HASH_SIZE == 0:
+                idx = pos // _HASH_SIZE
+                if len(prefix) % 2 == 0 or column[pos : pos + _HASH_SIZE].hex().startswith(prefix):
+                    matches.append(idx)
+            pos = column.find(needle, pos + 1)
+        return matches
+
+    def find_by_prefix(self, prefix: str, commit: bool = True, tree: bool = True) -> List[QuipuNode]:
+        ids: Set[int] = set()
+        if commit:
+            ids.update(self._match_prefix(self._hashes, prefix))
+        if tree:
+            ids.update(self._match_prefix(self._trees, prefix))
+        return [self._view(i) for i in sorted(ids)]
+
+    def latest(self) -> Optional[QuipuNode]:
+        if not self._parents:
+            return None
+        return self._view(max(range(len(self._timestamps)), key=self._timestamps.__getitem__))
+
+    def ids_by_output_tree(self, output_tree: str) -> List[int]:
+        if len(output_tree) != 2 * _HASH_SIZE:
+            return []
+        return self._match_prefix(self._trees, output_tree)
+
+    def sorted_ids(self, reverse: bool = True) -> array:
+        # 稳定排序：时间戳相同的节点保持插入顺序
+        return array("I", sorted(range(len(self._timestamps)), key=self._timestamps.__getitem__, reverse=reverse))
+
+    def sorted_nodes(self, reverse: bool = True) -> List[QuipuNode]:
+        return [self._view(i) for i in self.sorted_ids(reverse)]
@@ -1,14 +1,18 @@
 import json
 import logging
 import re
-from typing import Dict, List, Optional, Tuple
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
-from .git_db import GitDB
+from .git_db import GitDB, LogEntry
 from .git_object_storage import GitObjectHistoryReader  # Reuse parsing logic
 from .sqlite_db import DatabaseManager
 
 logger = logging.getLogger(__name__)
 
+# 补水时每批读取并写入的节点数量
+_HYDRATE_BATCH_SIZE = 1000
+
 
 class Hydrator:
     def __init__(self, git_db: GitDB, db_manager: DatabaseManager):
@@ -25,10 +29,15 @@ class Hydrator:
             return local_user_id
         return None
 
-    def _get_commit_owners(self, local_user_id: str) -> Dict[str, str]:
-        # 1. 获取所有分支末端 (heads) 及其直接所有者
-        head_ref_tuples = self.git_db.get_all_ref_heads("refs/quipu/")
-        head_owners: Dict[str, str] = {}
+    def _get_commit_owners(
+        self,
+        head_ref_tuples: List[Tuple[str, str]],
+        parent_map: Dict[str, Tuple[str, ...]],
+        local_user_id: str,
+        seed_owners: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, str]:
+        # 1. 获取所有分支末端 (heads) 及其直接所有者；seed_owners 是所有者已知的额外起点
+        head_owners: Dict[str, str] = dict(seed_owners or {})
         for commit_hash, ref_name in head_ref_tuples:
             # 优先级：远程所有者 > 本地所有者。避免本地 ref 覆盖正确的远程所有者。
             owner_id = self._get_owner_from_ref(ref_name, local_user_id)
@@ -41,29 +50,19 @@ class Hydrator:
         if not head_owners:
             return {}
 
-        # 2. 获取完整的历史图谱日志
-        all_git_logs = self.git_db.log_ref(list(head_owners.keys()))
-        log_map = {entry["hash"]: entry for entry in all_git_logs}
-
-        # 3. 从 Heads 开始，通过图遍历传播所有权
-        final_commit_owners: Dict[str, str] = {}
-        queue = list(head_owners.keys())
-
-        # 将 head 节点预先填入，作为遍历的起点
-        for commit_hash in queue:
-            final_commit_owners[commit_hash] = head_owners[commit_hash]
-
+        # 2. 从 Heads 开始，沿着 (与 sync 共用的) 父节点映射传播所有权
+        final_commit_owners: Dict[str, str] = dict(head_owners)
+        queue = deque(head_owners.keys())
         visited = set(head_owners.keys())
 
         while queue:
-            child_hash = queue.pop(0)
+            child_hash = queue.popleft()
             owner = final_commit_owners.get(child_hash)
-            if not owner or child_hash not in log_map:
+            if not owner or child_hash not in parent_map:
                 continue
 
-            parent_hashes = log_map[child_hash]["parent"].split()
-            for parent_hash in parent_hashes:
-                if parent_hash and parent_hash not in visited:
+            for parent_hash in parent_map[child_hash]:
+                if parent_hash not in visited:
                     final_commit_owners[parent_hash] = owner
                     visited.add(parent_hash)
                     queue.append(parent_hash)
@@ -71,63 +70,160 @@ class Hydrator:
         return final_commit_owners
 
     def sync(self, local_user_id: str):
-        # --- 阶段 1: 发现 ---
-        all_ref_heads = [t[0] for t in self.git_db.get_all_ref_heads("refs/quipu/")]
-        if not all_ref_heads:
-            logger.debug("✅ Git 中未发现 Quipu 引用，无需补水。")
+        # --- 阶段 0: 水位线 ---
+        # 必须先取指纹再读取 refs：期间发生的变化会在下一次补水时再次触发
+        fingerprint = self.git_db.get_refs_fingerprint()
+        stored_fingerprint, hydrated_heads = self.db_manager.get_hydration_watermark()
+        if stored_fingerprint == fingerprint:
+            logger.debug("✅ refs/quipu 自上次补水以来未变化，无需补水。")
             return
 
-        all_git_logs = self.git_db.log_ref(all_ref_heads)
-        if not all_git_logs:
-            logger.debug("✅ Git 中未发现 Quipu 历史，无需补水。")
+        # --- 阶段 1: 发现 ---
+        head_ref_tuples = self.git_db.get_all_ref_heads("refs/quipu/")
+        heads = set(t[0] for t in head_ref_tuples)
+        new_heads = heads - hydrated_heads
+        # 浅拉取边界被加深后，原边界节点 (库中的根节点) 之下出现了新的祖先
+        shallow = self.git_db.get_shallow_commits()
+        deepened = self.db_manager.get_existing_hashes(self.db_manager.get_hydrated_shallow_commits() - shallow)
+        if not new_heads and not deepened:
+            logger.debug("✅ Git 中未发现新的 Quipu 历史，无需补水。")
+            self.db_manager.set_hydration_watermark(fingerprint, heads, shallow)
             return
-        log_map = {entry["hash"]: entry for entry in all_git_logs}
-
-        # 1.2 [FIXED] 构建一个覆盖所有历史节点的完整所有权地图
-        commit_owners = self._get_commit_owners(local_user_id)
-
-        # 1.3 计算需要插入的节点 (所有历史节点 - 已在数据库中的节点)
-        db_hashes = self.db_manager.get_all_node_hashes()
-        missing_hashes = set(log_map.keys()) - db_hashes
 
-        if not missing_hashes:
+        # 1.1 第一次流式遍历只读取父节点列表 (rev-list)，不保留任何提交条目
+        parent_map: Dict[str, Tuple[str, ...]] = {}
+        walks: List[Tuple[List[str], List[str]]] = []
+        if new_heads:
+            parent_map, exclude = self._walk_new_history(new_heads, hydrated_heads, heads)
+            walks.append((sorted(new_heads), exclude))
+        seed_owners: Dict[str, str] = {}
+        if deepened:
+            for commit_hash, parents in self.git_db.iter_parents(sorted(deepened)):
+                parent_map.setdefault(commit_hash, parents)
+            walks.append((sorted(deepened), []))
+            # 新出现的祖先继承原边界节点的所有者
+            seed_owners = self.db_manager.get_node_owners(deepened)
+
+        existing = self.db_manager.get_existing_hashes(parent_map)
+        missing_count = len(parent_map) - len(existing)
+
+        if missing_count:
+            logger.info(f"发现 {missing_count} 个需要补水的节点。")
+            self._hydrate(walks, existing, parent_map, head_ref_tuples, local_user_id, seed_owners)
+        else:
             logger.debug("✅ 数据库与 Git 历史一致，无需补水。")
-            return
 
-        logger.info(f"发现 {len(missing_hashes)} 个需要补水的节点。")
+        if deepened:
+            # 原边界节点此前被当作根节点写入，现在为它们补上指向新祖先的边
+            parents = {p for commit_hash in deepened for p in parent_map.get(commit_hash, ())}
+            known = self.db_manager.get_existing_hashes(parents)
+            relink = [(c, p) for c in sorted(deepened) for p in parent_map.get(c, ()) if p in known]
+            if relink:
+                self.db_manager.batch_insert_edges(relink)
+
+        self.db_manager.set_hydration_watermark(fingerprint, heads, shallow)
+
+    def _walk_new_history(
+        self, new_heads: Set[str], hydrated_heads: Set[str], heads: Set[str]
+    ) -> Tuple[Dict[str, Tuple[str, ...]], List[str]]:
+        # 已补水的 head 可能已被移除 (例如被子节点取代后清理)，只要对象仍在，就可以作为遍历边界
+        exclude = hydrated_heads & heads
+        detached = sorted(hydrated_heads - heads)
+        if detached:
+            exclude |= {h for h, info in self.git_db.batch_check_objects(detached).items() if info[0] == "commit"}
+
+        try:
+            parent_map = dict(self.git_db.iter_parents(sorted(new_heads), exclude=sorted(exclude), check=True))
+        except RuntimeError as e:
+            logger.warning(f"增量遍历失败，回退到完整遍历: {e}")
+            exclude = set()
+            parent_map = dict(self.git_db.iter_parents(sorted(new_heads)))
+        return parent_map, sorted(exclude)
+
+    def _iter_missing_batches(
+        self, walks: List[Tuple[List[str], List[str]]], existing: Set[str]
+    ) -> Iterator[List[LogEntry]]:
+        # 第二次遍历流式读取 git log，每次只在内存中保留一批缺失的条目
+        seen = set(existing)
+        batch: List[LogEntry] = []
+        for refs, exclude in walks:
+            for entry in self.git_db.iter_log(refs, exclude=exclude):
+                if entry.commit_hash in seen:
+                    continue
+                seen.add(entry.commit_hash)
+                batch.append(entry)
+                if len(batch) >= _HYDRATE_BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _hydrate(
+        self,
+        walks: List[Tuple[List[str], List[str]]],
+        existing: Set[str],
+        parent_map: Dict[str, Tuple[str, ...]],
+        head_ref_tuples: List[Tuple[str, str]],
+        local_user_id: str,
+        seed_owners: Optional[Dict[str, str]] = None,
+    ):
+        # 1.2 构建一个覆盖新增历史的所有权地图
+        commit_owners = self._get_commit_owners(head_ref_tuples, parent_map, local_user_id, seed_owners)
+
+        # 本次遍历范围之外的父节点 (已补水的历史) 同样可以建立边
+        external_parents = {p for parents in parent_map.values() for p in parents if p not in parent_map}
+        known_parents = set(parent_map) | self.db_manager.get_existing_hashes(external_parents)
+
+        # --- 阶段 2 & 3: 分批准备数据并写入数据库 ---
+        # 父节点在日志中位于子节点之后，因此边在所有节点写入之后再统一插入，以满足外键约束
+        total_nodes = 0
+        edges_to_insert: List[Tuple] = []
+        for entries in self._iter_missing_batches(walks, existing):
+            nodes, edges = self._prepare_batch(entries, known_parents, commit_owners)
+            if nodes:
+                self.db_manager.batch_insert_nodes(nodes)
+                total_nodes += len(nodes)
+            edges_to_insert.extend(edges)
+        if edges_to_insert:
+            self.db_manager.batch_insert_edges(edges_to_insert)
+
+        if total_nodes:
+            logger.info(f"💧 {total_nodes} 个节点元数据已补水。")
+        if edges_to_insert:
+            logger.info(f"💧 {len(edges_to_insert)} 条边关系已补水。")
 
-        # --- 阶段 2: 批量准备数据 ---
+    def _prepare_batch(
+        self, entries: List[LogEntry], known_parents: Set[str], commit_owners: Dict[str, str]
+    ) -> Tuple[List[Tuple], List[Tuple]]:
         nodes_to_insert: List[Tuple] = []
         edges_to_insert: List[Tuple] = []
 
-        tree_hashes = [log_map[h]["tree"] for h in missing_hashes if h in log_map]
-        trees_content = self.git_db.batch_cat_file(tree_hashes)
+        trees_content = self.git_db.batch_cat_file([entry.tree for entry in entries])
 
         tree_to_meta_blob: Dict[str, str] = {}
         meta_blob_hashes: List[str] = []
         for tree_hash, content_bytes in trees_content.items():
-            entries = self._parser._parse_tree_binary(content_bytes)
-            if "metadata.json" in entries:
-                blob_hash = entries["metadata.json"]
+            tree_entries = self._parser._parse_tree_binary(content_bytes)
+            if "metadata.json" in tree_entries:
+                blob_hash = tree_entries["metadata.json"]
                 tree_to_meta_blob[tree_hash] = blob_hash
                 meta_blob_hashes.append(blob_hash)
         metas_content = self.git_db.batch_cat_file(meta_blob_hashes)
 
-        for commit_hash in missing_hashes:
-            log_entry = log_map[commit_hash]
-            tree_hash = log_entry["tree"]
+        for entry in entries:
+            commit_hash = entry.commit_hash
             # [FIXED] 从完整的映射中获取 owner_id，不再使用错误的 fallback
             owner_id = commit_owners.get(commit_hash)
             if not owner_id:
                 logger.warning(f"跳过 {commit_hash[:7]}: 无法确定所有者")
                 continue
 
-            meta_blob_hash = tree_to_meta_blob.get(tree_hash)
+            meta_blob_hash = tree_to_meta_blob.get(entry.tree)
             if not meta_blob_hash or meta_blob_hash not in metas_content:
                 logger.warning(f"跳过 {commit_hash[:7]}: 找不到 metadata.json 内容")
                 continue
 
-            output_tree = self._parser._parse_output_tree_from_body(log_entry["body"])
+            output_tree = self._parser._parse_output_tree_from_body(entry.body)
             if not output_tree:
                 logger.warning(f"跳过 {commit_hash[:7]}: 找不到 Output-Tree trailer")
                 continue
@@ -141,23 +237,17 @@ class Hydrator:
                         owner_id,
                         output_tree,
                         meta_data.get("type", "unknown"),
-                        float(meta_data.get("exec", {}).get("start") or log_entry["timestamp"]),
+                        float(meta_data.get("exec", {}).get("start") or entry.timestamp),
                         meta_data.get("summary", "No summary"),
                         meta_data.get("generator", {}).get("id"),
                         meta_bytes.decode("utf-8"),
                         None,
                     )
                 )
-                for p_hash in log_entry["parent"].split():
-                    if p_hash in log_map:
+                for p_hash in entry.parents:
+                    if p_hash in known_parents:
                         edges_to_insert.append((commit_hash, p_hash))
             except (json.JSONDecodeError, KeyError) as e:
                 logger.error(f"解析 {commit_hash[:7]} 的元数据失败: {e}")
 
-        # --- 阶段 3: 批量写入数据库 ---
-        if nodes_to_insert:
-            self.db_manager.batch_insert_nodes(nodes_to_insert)
-            logger.info(f"💧 {len(nodes_to_insert)} 个节点元数据已补水。")
-        if edges_to_insert:
-            self.db_manager.batch_insert_edges(edges_to_insert)
-            logger.info(f"💧 {len(edges_to_insert)} 条边关系已补水。")
+        return nodes_to_insert, edges_to_insert
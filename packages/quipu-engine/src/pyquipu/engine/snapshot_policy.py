@@ -0,0 +1,104 @@
+import fnmatch
+import hashlib
+import logging
+import os
+from typing import Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+POINTER_MAGIC = b"quipu-pointer v1\n"
+# 指针条目本身很小；超过该大小的 blob 不可能是指针，无需读取内容
+POINTER_MAX_SIZE = 1024
+
+# 与 git 的二进制判定一致：只检查文件开头的这么多字节中是否包含 NUL
+_BINARY_SNIFF_SIZE = 8000
+_SAMPLE_COUNT = 16
+_SAMPLE_SIZE = 64 * 1024
+
+
+def is_pointer(data: bytes) -> bool:
+    return len(data) <= POINTER_MAX_SIZE and data.startswith(POINTER_MAGIC)
+
+
+def parse_pointer(data: bytes) -> Dict[str, str]:
+    fields = {}
+    for line in data[len(POINTER_MAGIC) :].decode("utf-8", "surrogateescape").splitlines():
+        key, _, value = line.partition(" ")
+        if key:
+            fields[key] = value
+    return fields
+
+
+def _sampled_hash(full_path: bytes, size: int) -> str:
+    # 在文件中按固定间隔读取若干块做哈希，成本与文件大小无关
+    digest = hashlib.sha1(str(size).encode("ascii"))
+    with open(full_path, "rb") as f:
+        step = max(size // _SAMPLE_COUNT, _SAMPLE_SIZE)
+        for offset in range(0, size, step):
+            f.seek(offset)
+            digest.update(f.read(_SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+class SnapshotPolicy:
+    def __init__(
+        self,
+        max_file_size: int = 0,
+        binary_max_size: int = 0,
+        exclude: Sequence[str] = (),
+        sample_hash: bool = True,
+    ):
+        self.max_file_size = max_file_size
+        self.binary_max_size = binary_max_size
+        self.exclude = [pattern.rstrip("/") for pattern in exclude if pattern]
+        self.sample_hash = sample_hash
+
+    @property
+    def active(self) -> bool:
+        return bool(self.max_file_size > 0 or self.binary_max_size > 0 or self.exclude)
+
+    @property
+    def cache_key(self) -> str:
+        # 策略变化后，按旧策略缓存的 blob 哈希不再可用
+        raw = f"{self.max_file_size}:{self.binary_max_size}:{self.sample_hash}:{','.join(self.exclude)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+    def excludes(self, path: bytes) -> bool:
+        if not self.exclude:
+            return False
+        text = os.fsdecode(path)
+        name = text.rsplit("/", 1)[-1]
+        for pattern in self.exclude:
+            # 不含 '/' 的模式匹配任意层级的文件名；'dir/*' 形式的模式匹配该目录下的全部内容
+            target = text if "/" in pattern else name
+            if fnmatch.fnmatchcase(target, pattern) or text.startswith(pattern + "/"):
+                return True
+        return False
+
+    def wants_pointer(self, full_path: bytes, size: int) -> bool:
+        if self.max_file_size > 0 and size > self.max_file_size:
+            return True
+        if self.binary_max_size > 0 and size > self.binary_max_size:
+            try:
+                with open(full_path, "rb") as f:
+                    return b"\0" in f.read(_BINARY_SNIFF_SIZE)
+            except OSError:
+                return False
+        return False
+
+    def _pointer_content(self, path: bytes, full_path: bytes, st: os.stat_result) -> bytes:
+        lines = [
+            f"path {os.fsdecode(path)}",
+            f"size {st.st_size}",
+            f"mtime {st.st_mtime_ns}",
+        ]
+        if self.sample_hash:
+            lines.append(f"sample sha1:{_sampled_hash(full_path, st.st_size)}")
+        return POINTER_MAGIC + "\n".join(lines).encode("utf-8", "surrogateescape") + b"\n"
+
+    def read_pointer(self, path: bytes, full_path: bytes, st: os.stat_result) -> Optional[bytes]:
+        # 需要记录为指针条目时返回指针内容，否则返回 None
+        if not self.wants_pointer(full_path, st.st_size):
+            return None
+        logger.debug(f"Recording {os.fsdecode(path)} ({st.st_size} bytes) as a pointer entry")
+        return self._pointer_content(path, full_path, st)
@@ -1,16 +1,35 @@
+import functools
 import logging
+import re
 import sqlite3
 from pathlib import Path
-from typing import List, Optional, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 优先使用 trigram 分词器：支持子串匹配，对中文等无空格分词的文本同样有效
+_FTS_TOKENIZERS = ("trigram", "unicode61 remove_diacritics 2")
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_pattern(pattern: str) -> "re.Pattern[str]":
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _regexp(pattern: Optional[str], value: Optional[str]) -> bool:
+    # SQLite 将 `X REGEXP Y` 翻译为 regexp(Y, X)
+    if pattern is None or value is None:
+        return False
+    return _compile_pattern(pattern).search(value) is not None
+
 
 class DatabaseManager:
     def __init__(self, work_dir: Path):
         self.db_path = work_dir / ".quipu" / "history.sqlite"
         self.db_path.parent.mkdir(exist_ok=True)
         self._conn: Optional[sqlite3.Connection] = None
+        # 实际使用的 FTS5 分词器；为 None 表示当前 SQLite 不支持 FTS5
+        self.fts_tokenizer: Optional[str] = None
 
     def _get_conn(self) -> sqlite3.Connection:
         if self._conn is None:
@@ -19,6 +38,9 @@ class DatabaseManager:
                 self._conn.row_factory = sqlite3.Row
                 # 开启外键约束
                 self._conn.execute("PRAGMA foreign_keys = ON;")
+                # 让 INSERT OR REPLACE 隐式删除的行也触发 DELETE 触发器，保持全文索引同步
+                self._conn.execute("PRAGMA recursive_triggers = ON;")
+                self._conn.create_function("REGEXP", 2, _regexp, deterministic=True)
                 logger.debug(f"🗃️  成功连接到数据库: {self.db_path}")
             except sqlite3.Error as e:
                 logger.error(f"❌ 数据库连接失败: {e}")
@@ -84,16 +106,111 @@ class DatabaseManager:
                     );
                     """
                 )
+
+                # 补水水位线：refs/quipu 指纹与已补水的 heads，用于增量补水
+                conn.execute("CREATE TABLE IF NOT EXISTS hydration_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS hydrated_heads (commit_hash TEXT(40) PRIMARY KEY) WITHOUT ROWID;"
+                )
             logger.debug("✅ 数据库 Schema 已初始化/验证。")
         except sqlite3.Error as e:
             logger.error(f"❌ 初始化 Schema 失败: {e}")
             raise
+        self._init_fulltext_index(conn)
+
+    def _init_fulltext_index(self, conn: sqlite3.Connection):
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'nodes_fts'").fetchone()
+        created = False
+        if row is None:
+            for tokenizer in _FTS_TOKENIZERS:
+                try:
+                    with conn:
+                        # 索引行与 nodes 行通过 rowid 对应
+                        conn.execute(
+                            "CREATE VIRTUAL TABLE nodes_fts USING fts5(summary, content, intent, "
+                            f"tokenize = '{tokenizer}');"
+                        )
+                    self.fts_tokenizer = tokenizer
+                    created = True
+                    break
+                except sqlite3.OperationalError as e:
+                    logger.debug(f"FTS5 分词器 '{tokenizer}' 不可用: {e}")
+            if not created:
+                logger.warning("当前 SQLite 不支持 FTS5，全文搜索将退化为正则扫描。")
+                return
+        else:
+            self.fts_tokenizer = _FTS_TOKENIZERS[0] if "trigram" in row[0] else _FTS_TOKENIZERS[1]
+
+        intent_of = "coalesce((SELECT intent_md FROM private_data WHERE node_hash = new.commit_hash), '')"
+        node_rowid = "(SELECT rowid FROM nodes WHERE commit_hash = {}.node_hash)"
+        triggers = {
+            "nodes_fts_insert": f"""
+                AFTER INSERT ON nodes BEGIN
+                    INSERT OR REPLACE INTO nodes_fts (rowid, summary, content, intent)
+                    VALUES (new.rowid, new.summary, coalesce(new.plan_md_cache, ''), {intent_of});
+                END""",
+            # 内容回填 (plan_md_cache) 走的是 UPDATE
+            "nodes_fts_update": """
+                AFTER UPDATE OF summary, plan_md_cache ON nodes BEGIN
+                    UPDATE nodes_fts SET summary = new.summary, content = coalesce(new.plan_md_cache, '')
+                    WHERE rowid = new.rowid;
+                END""",
+            "nodes_fts_delete": """
+                AFTER DELETE ON nodes BEGIN
+                    DELETE FROM nodes_fts WHERE rowid = old.rowid;
+                END""",
+            "private_fts_insert": f"""
+                AFTER INSERT ON private_data BEGIN
+                    UPDATE nodes_fts SET intent = coalesce(new.intent_md, '') WHERE rowid = {node_rowid.format("new")};
+                END""",
+            "private_fts_update": f"""
+                AFTER UPDATE ON private_data BEGIN
+                    UPDATE nodes_fts SET intent = coalesce(new.intent_md, '') WHERE rowid = {node_rowid.format("new")};
+                END""",
+            "private_fts_delete": f"""
+                AFTER DELETE ON private_data BEGIN
+                    UPDATE nodes_fts SET intent = '' WHERE rowid = {node_rowid.format("old")};
+                END""",
+        }
+        try:
+            with conn:
+                for name, body in triggers.items():
+                    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+        except sqlite3.Error as e:
+            logger.error(f"❌ 初始化全文索引触发器失败: {e}")
+            raise
+
+        if created:
+            # 升级已有数据库时，为触发器出现之前的节点补建索引
+            self.rebuild_fulltext_index()
+
+    def rebuild_fulltext_index(self) -> int:
+        if self.fts_tokenizer is None:
+            return 0
+        conn = self._get_conn()
+        try:
+            with conn:
+                conn.execute("DELETE FROM nodes_fts")
+                conn.execute(
+                    """
+                    INSERT INTO nodes_fts (rowid, summary, content, intent)
+                    SELECT n.rowid, n.summary, coalesce(n.plan_md_cache, ''), coalesce(p.intent_md, '')
+                    FROM nodes n LEFT JOIN private_data p ON p.node_hash = n.commit_hash
+                    """
+                )
+                conn.execute("INSERT INTO nodes_fts (nodes_fts) VALUES ('optimize')")
+                (count,) = conn.execute("SELECT COUNT(*) FROM nodes_fts").fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"❌ 重建全文索引失败: {e}")
+            raise
+        return count
 
     def execute_write(self, sql: str, params: tuple = ()):
         conn = self._get_conn()
         try:
             with conn:
                 conn.execute(sql, params)
+                self._bump_generation(conn)
         except sqlite3.Error as e:
             logger.error(f"❌ 数据库写入失败: {e} | SQL: {sql}")
             raise
@@ -107,6 +224,99 @@ class DatabaseManager:
             logger.error(f"❌ 查询节点哈希失败: {e}")
             return set()
 
+    def get_existing_hashes(self, hashes: Iterable[str]) -> Set[str]:
+        conn = self._get_conn()
+        candidates = list(hashes)
+        found: Set[str] = set()
+        # 分块查询，避免超出 SQLite 的变量数量上限
+        for i in range(0, len(candidates), 500):
+            chunk = candidates[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = conn.execute(f"SELECT commit_hash FROM nodes WHERE commit_hash IN ({placeholders})", chunk)
+            found.update(row[0] for row in cursor)
+        return found
+
+    def get_node_owners(self, hashes: Iterable[str]) -> Dict[str, str]:
+        conn = self._get_conn()
+        candidates = list(hashes)
+        owners: Dict[str, str] = {}
+        for i in range(0, len(candidates), 500):
+            chunk = candidates[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = conn.execute(
+                f"SELECT commit_hash, owner_id FROM nodes WHERE commit_hash IN ({placeholders})", chunk
+            )
+            owners.update((row[0], row[1]) for row in cursor if row[1])
+        return owners
+
+    def get_cached_contents(self, hashes: Iterable[str]) -> Dict[str, str]:
+        conn = self._get_conn()
+        candidates = list(hashes)
+        contents: Dict[str, str] = {}
+        for i in range(0, len(candidates), 500):
+            chunk = candidates[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = conn.execute(
+                f"SELECT commit_hash, plan_md_cache FROM nodes WHERE commit_hash IN ({placeholders})"
+                " AND plan_md_cache IS NOT NULL",
+                chunk,
+            )
+            contents.update((row[0], row[1]) for row in cursor)
+        return contents
+
+    def batch_update_contents(self, entries: List[Tuple[str, str]]):
+        conn = self._get_conn()
+        try:
+            with conn:
+                conn.executemany("UPDATE nodes SET plan_md_cache = ? WHERE commit_hash = ?", entries)
+        except sqlite3.Error as e:
+            logger.error(f"❌ 批量回填内容缓存失败: {e}")
+            raise
+
+    def _bump_generation(self, conn: sqlite3.Connection):
+        # 与写入处于同一事务：节点或边的任何变化都会让图的代数加一
+        conn.execute(
+            "INSERT INTO hydration_meta (key, value) VALUES ('graph_generation', '1')"
+            " ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def get_graph_generation(self) -> int:
+        conn = self._get_conn()
+        row = conn.execute("SELECT value FROM hydration_meta WHERE key = 'graph_generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def get_hydration_watermark(self) -> Tuple[Optional[str], Set[str]]:
+        conn = self._get_conn()
+        try:
+            row = conn.execute("SELECT value FROM hydration_meta WHERE key = 'refs_fingerprint'").fetchone()
+            heads = {r[0] for r in conn.execute("SELECT commit_hash FROM hydrated_heads")}
+        except sqlite3.Error as e:
+            logger.debug(f"读取补水水位线失败: {e}")
+            return None, set()
+        return (row[0] if row else None), heads
+
+    def get_hydrated_shallow_commits(self) -> Set[str]:
+        conn = self._get_conn()
+        try:
+            row = conn.execute("SELECT value FROM hydration_meta WHERE key = 'shallow_commits'").fetchone()
+        except sqlite3.Error as e:
+            logger.debug(f"读取浅拉取边界失败: {e}")
+            return set()
+        return set(row[0].split()) if row else set()
+
+    def set_hydration_watermark(self, fingerprint: str, heads: Iterable[str], shallow: Iterable[str] = ()):
+        conn = self._get_conn()
+        with conn:
+            conn.execute("DELETE FROM hydrated_heads")
+            conn.executemany("INSERT INTO hydrated_heads (commit_hash) VALUES (?)", ((h,) for h in heads))
+            conn.execute(
+                "INSERT OR REPLACE INTO hydration_meta (key, value) VALUES ('refs_fingerprint', ?)", (fingerprint,)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO hydration_meta (key, value) VALUES ('shallow_commits', ?)",
+                (" ".join(sorted(shallow)),),
+            )
+
     def batch_insert_nodes(self, nodes: List[Tuple]):
         conn = self._get_conn()
         sql = """
@@ -117,6 +327,7 @@ class DatabaseManager:
         try:
             with conn:
                 conn.executemany(sql, nodes)
+                self._bump_generation(conn)
         except sqlite3.Error as e:
             logger.error(f"❌ 批量插入节点失败: {e}")
             raise
@@ -127,6 +338,58 @@ class DatabaseManager:
         try:
             with conn:
                 conn.executemany(sql, edges)
+                self._bump_generation(conn)
         except sqlite3.Error as e:
             logger.error(f"❌ 批量插入边失败: {e}")
             raise
+
+    def apply_history_rewrite(
+        self,
+        new_nodes: List[Tuple],
+        moved: List[Tuple[str, str, Optional[str]]],
+        edges: List[Tuple[str, str]],
+        removed: Iterable[str],
+    ):
+        conn = self._get_conn()
+        try:
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT OR IGNORE INTO nodes
+                    (commit_hash, owner_id, output_tree, node_type, timestamp, summary,
+                     generator_id, meta_json, plan_md_cache)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    new_nodes,
+                )
+                # 被重写的后代只有哈希与父节点变化，其余列 (包括内容缓存) 原样复制
+                conn.executemany(
+                    """
+                    INSERT OR IGNORE INTO nodes
+                    (commit_hash, owner_id, output_tree, node_type, timestamp, summary,
+                     generator_id, meta_json, plan_md_cache)
+                    SELECT ?, owner_id, output_tree, node_type, timestamp, summary,
+                           generator_id, meta_json, plan_md_cache
+                    FROM nodes WHERE commit_hash = ?
+                    """,
+                    ((new, old) for old, new, _ in moved),
+                )
+                # 只连接两端都已入库的边，缺失的部分留给补水
+                conn.executemany(
+                    """
+                    INSERT OR IGNORE INTO edges (child_hash, parent_hash)
+                    SELECT ?1, ?2 WHERE EXISTS (SELECT 1 FROM nodes WHERE commit_hash = ?1)
+                                    AND EXISTS (SELECT 1 FROM nodes WHERE commit_hash = ?2)
+                    """,
+                    edges,
+                )
+                conn.executemany(
+                    "UPDATE OR IGNORE private_data SET node_hash = ? WHERE node_hash = ?",
+                    ((new, old) for old, new, _ in moved),
+                )
+                # 旧节点的边与私有数据随外键级联删除
+                conn.executemany("DELETE FROM nodes WHERE commit_hash = ?", ((h,) for h in removed))
+                self._bump_generation(conn)
+        except sqlite3.Error as e:
+            logger.error(f"❌ 重写历史节点失败: {e}")
+            raise
@@ -1,12 +1,15 @@
 import json
 import logging
+import re
 import sqlite3
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
+from pyquipu.engine.ancestry import AncestryIndex
 from pyquipu.engine.git_object_storage import GitObjectHistoryReader, GitObjectHistoryWriter
-from pyquipu.interfaces.models import QuipuNode
+from pyquipu.engine.graph_store import GraphStore
+from pyquipu.interfaces.models import CompactionResult, ImportRecord, QuipuNode, SearchHit
 from pyquipu.interfaces.storage import HistoryReader, HistoryWriter
 
 from .git_db import GitDB
@@ -20,6 +23,7 @@ class SQLiteHistoryReader(HistoryReader):
         self.db_manager = db_manager
         # git_reader 用于按需加载内容和解析二进制 tree
         self._git_reader = GitObjectHistoryReader(git_db)
+        self._ancestry: Optional[Tuple[Tuple, AncestryIndex]] = None
 
     def load_all_nodes(self) -> List[QuipuNode]:
         conn = self.db_manager._get_conn()
@@ -83,6 +87,43 @@ class SQLiteHistoryReader(HistoryReader):
 
         return list(temp_nodes.values())
 
+    def load_graph_store(self) -> GraphStore:
+        conn = self.db_manager._get_conn()
+        store = GraphStore()
+
+        # 1. 逐行把节点元数据写入各列；内容不预先加载，由 get_contents 按需读取缓存
+        rows = conn.execute(
+            "SELECT commit_hash, output_tree, timestamp, node_type, summary, owner_id FROM nodes"
+            " ORDER BY timestamp DESC;"
+        )
+        for row in rows:
+            store.append_record(
+                row["commit_hash"],
+                row["output_tree"],
+                row["timestamp"],
+                row["node_type"],
+                row["summary"],
+                row["owner_id"],
+            )
+
+        # 2. 按节点顺序填写父节点哈希，每个节点只取第一条边
+        parent_keys = bytearray(20 * len(store))
+        for row in conn.execute("SELECT child_hash, parent_hash FROM edges;"):
+            child_hash, parent_hash = row["child_hash"], row["parent_hash"]
+            if child_hash == parent_hash:
+                logger.warning(f"检测到并忽略了一个自引用边: {child_hash[:7]}")
+                continue
+            idx = store.id_of(child_hash)
+            if idx is None or store.id_of(parent_hash) is None:
+                continue
+            slot = slice(idx * 20, (idx + 1) * 20)
+            if parent_keys[slot] == bytes(20):
+                parent_keys[slot] = bytes.fromhex(parent_hash)
+            else:
+                logger.debug(f"节点 {child_hash[:7]} 已有父节点，忽略额外的父节点 {parent_hash[:7]}")
+        store.link_parents(0, parent_keys)
+        return store
+
     def get_node_count(self) -> int:
         conn = self.db_manager._get_conn()
         try:
@@ -190,76 +231,44 @@ class SQLiteHistoryReader(HistoryReader):
             logger.error(f"Failed to load paginated nodes: {e}")
             return []
 
-    def get_descendant_output_trees(self, start_output_tree_hash: str) -> Set[str]:
+    def get_ancestry_index(self) -> AncestryIndex:
         conn = self.db_manager._get_conn()
-        try:
-            # 1. 查找起点的 commit_hash
-            cursor = conn.execute("SELECT commit_hash FROM nodes WHERE output_tree = ?", (start_output_tree_hash,))
-            row = cursor.fetchone()
-            if not row:
-                return set()
-            start_commit_hash = row[0]
-
-            # 2. 使用递归 CTE 查找所有后代 commit_hash
-            sql = """
-            WITH RECURSIVE descendants(h) AS (
-                SELECT child_hash FROM edges WHERE parent_hash = ?
-                UNION ALL
-                SELECT e.child_hash FROM edges e, descendants d WHERE e.parent_hash = d.h AND e.child_hash IS NOT NULL
-            )
-            SELECT h FROM descendants WHERE h IS NOT NULL;
-            """
-            cursor = conn.execute(sql, (start_commit_hash,))
-            descendant_commit_hashes = {row[0] for row in cursor.fetchall()}
-
-            if not descendant_commit_hashes:
-                return set()
-
-            # 3. 将 commit_hash 集合转换为 output_tree 集合
-            placeholders = ",".join("?" * len(descendant_commit_hashes))
-            sql_out = f"SELECT output_tree FROM nodes WHERE commit_hash IN ({placeholders})"
-            cursor = conn.execute(sql_out, tuple(descendant_commit_hashes))
-            return {row[0] for row in cursor.fetchall()}
+        # 所有写入路径都会递增图的代数 (rowid 可能被复用，不能作为版本标记)，代数未变化时复用内存中的索引
+        version = self.db_manager.get_graph_generation()
+        if self._ancestry is not None and self._ancestry[0] == version:
+            return self._ancestry[1]
+
+        parents: Dict[str, List[str]] = {}
+        for child_hash, parent_hash in conn.execute("SELECT child_hash, parent_hash FROM edges"):
+            parents.setdefault(child_hash, []).append(parent_hash)
+        index = AncestryIndex(
+            (commit_hash, output_tree, parents.get(commit_hash, ()))
+            for commit_hash, output_tree in conn.execute("SELECT commit_hash, output_tree FROM nodes")
+        )
+        self._ancestry = (version, index)
+        return index
 
+    def get_descendant_output_trees(self, start_output_tree_hash: str) -> Set[str]:
+        try:
+            return self.get_ancestry_index().descendant_output_trees(start_output_tree_hash)
         except sqlite3.Error as e:
             logger.error(f"Failed to get descendants for {start_output_tree_hash[:7]}: {e}")
             return set()
 
     def get_ancestor_output_trees(self, start_output_tree_hash: str) -> Set[str]:
-        conn = self.db_manager._get_conn()
         try:
-            # 1. 查找起点的 commit_hash
-            cursor = conn.execute("SELECT commit_hash FROM nodes WHERE output_tree = ?", (start_output_tree_hash,))
-            row = cursor.fetchone()
-            if not row:
-                return set()
-            start_commit_hash = row[0]
-
-            # 2. 使用递归 CTE 查找所有祖先 commit_hash
-            sql = """
-            WITH RECURSIVE ancestors(h) AS (
-                SELECT parent_hash FROM edges WHERE child_hash = ?
-                UNION ALL
-                SELECT e.parent_hash FROM edges e, ancestors a WHERE e.child_hash = a.h AND e.parent_hash IS NOT NULL
-            )
-            SELECT h FROM ancestors WHERE h IS NOT NULL;
-            """
-            cursor = conn.execute(sql, (start_commit_hash,))
-            ancestor_commit_hashes = {row[0] for row in cursor.fetchall()}
-
-            if not ancestor_commit_hashes:
-                return set()
-
-            # 3. 将 commit_hash 集合转换为 output_tree 集合
-            placeholders = ",".join("?" * len(ancestor_commit_hashes))
-            sql_out = f"SELECT output_tree FROM nodes WHERE commit_hash IN ({placeholders})"
-            cursor = conn.execute(sql_out, tuple(ancestor_commit_hashes))
-            return {row[0] for row in cursor.fetchall()}
-
+            return self.get_ancestry_index().ancestor_output_trees(start_output_tree_hash)
         except sqlite3.Error as e:
             logger.error(f"Failed to get ancestors for {start_output_tree_hash[:7]}: {e}")
             return set()
 
+    def get_reachable_output_trees(self, output_tree_hash: str) -> Set[str]:
+        try:
+            return self.get_ancestry_index().reachable_output_trees(output_tree_hash)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to get reachable nodes for {output_tree_hash[:7]}: {e}")
+            return {output_tree_hash}
+
     def get_private_data(self, node_commit_hash: str) -> Optional[str]:
         conn = self.db_manager._get_conn()
         try:
@@ -274,25 +283,40 @@ class SQLiteHistoryReader(HistoryReader):
         return self._git_reader.get_node_blobs(commit_hash)
 
     def get_node_content(self, node: QuipuNode) -> str:
-        if node.content:
-            return node.content
+        return self.get_contents([node]).get(node.commit_hash, "")
 
-        commit_hash = node.commit_hash
+    def get_contents(self, nodes: Iterable[QuipuNode]) -> Dict[str, str]:
+        nodes = list(nodes)
+        result = {node.commit_hash: node.content for node in nodes if node.content}
+        pending = [node for node in nodes if not node.content]
+        if not pending:
+            return result
 
-        # 尝试从 Git 加载内容
-        content = self._git_reader.get_node_content(node)
-
-        # 如果成功加载，回填到缓存
-        if content:
+        # 1. 先查缓存 (节点可能并非由本 Reader 加载)
+        try:
+            cached = self.db_manager.get_cached_contents(node.commit_hash for node in pending)
+        except sqlite3.Error as e:
+            logger.warning(f"读取内容缓存失败: {e}")
+            cached = {}
+        missing = []
+        for node in pending:
+            if node.commit_hash in cached:
+                node.content = cached[node.commit_hash]
+                result[node.commit_hash] = node.content
+            else:
+                missing.append(node)
+
+        # 2. 未缓存的内容从 Git 批量加载，并在一个事务中回填
+        loaded = self._git_reader.get_contents(missing)
+        backfill = [(content, commit_hash) for commit_hash, content in loaded.items() if content]
+        if backfill:
             try:
-                self.db_manager.execute_write(
-                    "UPDATE nodes SET plan_md_cache = ? WHERE commit_hash = ?", (content, commit_hash)
-                )
-                logger.debug(f"缓存已回填: {commit_hash[:7]}")
+                self.db_manager.batch_update_contents(backfill)
+                logger.debug(f"缓存已回填: {len(backfill)} 个节点")
             except Exception as e:
-                logger.warning(f"回填缓存失败: {commit_hash[:7]}: {e}")
-
-        return content
+                logger.warning(f"回填缓存失败 ({len(backfill)} 个节点): {e}")
+        result.update(loaded)
+        return result
 
     def find_nodes(
         self,
@@ -308,12 +332,12 @@ class SQLiteHistoryReader(HistoryReader):
             conditions.append("node_type = ?")
             params.append(node_type)
 
-        # 注意: 标准 SQLite 不支持 REGEXP。
-        # 此处使用 LIKE 实现简单的子字符串匹配作为替代。
-        # 完整的正则支持需要加载扩展或在 Python 端进行二次过滤。
+        # REGEXP 由 DatabaseManager 在连接上注册，与 Git 后端一样大小写不敏感
         if summary_regex:
-            conditions.append("summary LIKE ?")
-            params.append(f"%{summary_regex}%")
+            if not self._is_valid_regex(summary_regex):
+                return []
+            conditions.append("summary REGEXP ?")
+            params.append(summary_regex)
 
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
@@ -323,25 +347,87 @@ class SQLiteHistoryReader(HistoryReader):
 
         conn = self.db_manager._get_conn()
         cursor = conn.execute(query, tuple(params))
-        rows = cursor.fetchall()
+        return [self._row_to_node(row) for row in cursor.fetchall()]
 
-        # 将查询结果行映射回 QuipuNode 对象 (不含父子关系)
-        results = []
-        for row in rows:
-            node = QuipuNode(
-                commit_hash=row["commit_hash"],
-                input_tree="",  # 查找结果是扁平列表，不包含父子关系
-                output_tree=row["output_tree"],
-                timestamp=datetime.fromtimestamp(row["timestamp"]),
-                filename=Path(f".quipu/git_objects/{row['commit_hash']}"),
-                node_type=row["node_type"],
-                summary=row["summary"],
-                content=row["plan_md_cache"] if row["plan_md_cache"] is not None else "",
-                owner_id=row["owner_id"],
+    def search_nodes(
+        self,
+        text: str,
+        summary_regex: Optional[str] = None,
+        node_type: Optional[str] = None,
+        limit: int = 10,
+        highlight: Tuple[str, str] = ("[", "]"),
+    ) -> List[SearchHit]:
+        terms = text.split()
+        if not terms:
+            return []
+        if summary_regex and not self._is_valid_regex(summary_regex):
+            return []
+
+        # trigram 分词器无法匹配少于 3 个字符的词；这些词以及不支持 FTS5 时的所有词都退化为正则扫描
+        tokenizer = self.db_manager.fts_tokenizer
+        min_length = 3 if tokenizer == "trigram" else 1
+        match_terms = [t for t in terms if tokenizer and len(t) >= min_length]
+        scan_terms = [t for t in terms if not (tokenizer and len(t) >= min_length)]
+
+        params: List[Any] = []
+        conditions = []
+        if match_terms:
+            # 摘要命中的权重高于正文与意图
+            query = (
+                "SELECT n.*, -bm25(nodes_fts, 10.0, 1.0, 1.0) AS score,"
+                " snippet(nodes_fts, -1, ?, ?, '…', 64) AS snippet"
+                " FROM nodes_fts JOIN nodes n ON n.rowid = nodes_fts.rowid"
+            )
+            params.extend(highlight)
+            conditions.append("nodes_fts MATCH ?")
+            # 每个词作为短语加引号，避免用户输入被解析为 FTS5 查询语法
+            params.append(" ".join('"' + t.replace('"', '""') + '"' for t in match_terms))
+            order = "score DESC, n.timestamp DESC"
+        else:
+            query = "SELECT n.*, 0.0 AS score, n.summary AS snippet FROM nodes n"
+            order = "n.timestamp DESC"
+        query += " LEFT JOIN private_data p ON p.node_hash = n.commit_hash"
+
+        for term in scan_terms:
+            conditions.append(
+                "(n.summary REGEXP ? OR coalesce(n.plan_md_cache, '') REGEXP ? OR coalesce(p.intent_md, '') REGEXP ?)"
             )
-            results.append(node)
+            params.extend([re.escape(term)] * 3)
+        if summary_regex:
+            conditions.append("n.summary REGEXP ?")
+            params.append(summary_regex)
+        if node_type:
+            conditions.append("n.node_type = ?")
+            params.append(node_type)
 
-        return results
+        query += " WHERE " + " AND ".join(conditions) + f" ORDER BY {order} LIMIT ?"
+        params.append(limit)
+
+        conn = self.db_manager._get_conn()
+        rows = conn.execute(query, tuple(params)).fetchall()
+        return [SearchHit(self._row_to_node(row), row["score"], row["snippet"]) for row in rows]
+
+    def _is_valid_regex(self, pattern: str) -> bool:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            logger.error(f"无效的正则表达式: {pattern} ({e})")
+            return False
+        return True
+
+    def _row_to_node(self, row: sqlite3.Row) -> QuipuNode:
+        # 查找结果是扁平列表，不包含父子关系
+        return QuipuNode(
+            commit_hash=row["commit_hash"],
+            input_tree="",
+            output_tree=row["output_tree"],
+            timestamp=datetime.fromtimestamp(row["timestamp"]),
+            filename=Path(f".quipu/git_objects/{row['commit_hash']}"),
+            node_type=row["node_type"],
+            summary=row["summary"],
+            content=row["plan_md_cache"] if row["plan_md_cache"] is not None else "",
+            owner_id=row["owner_id"],
+        )
 
 
 class SQLiteHistoryWriter(HistoryWriter):
@@ -423,3 +509,71 @@ class SQLiteHistoryWriter(HistoryWriter):
 
         # 无论数据库写入是否成功，都返回从 Git 创建的节点
         return git_node
+
+    def import_nodes(self, records: Iterable[ImportRecord], **kwargs: Any) -> List[QuipuNode]:
+        imported = self.git_writer._import(records)
+        owner_id = kwargs.get("owner_id", "unknown-local-user")
+
+        # 一次性补水：所有节点与边各用一次 executemany 写入
+        nodes_to_insert = []
+        edges_to_insert = []
+        for node, meta_json in imported:
+            nodes_to_insert.append(
+                (
+                    node.commit_hash,
+                    owner_id,
+                    node.output_tree,
+                    node.node_type,
+                    node.timestamp.timestamp(),
+                    node.summary,
+                    json.loads(meta_json)["generator"]["id"],
+                    meta_json,
+                    node.content,
+                )
+            )
+            if node.parent:
+                edges_to_insert.append((node.commit_hash, node.parent.commit_hash))
+
+        try:
+            if nodes_to_insert:
+                self.db_manager.batch_insert_nodes(nodes_to_insert)
+            if edges_to_insert:
+                self.db_manager.batch_insert_edges(edges_to_insert)
+        except sqlite3.Error as e:
+            logger.error(f"⚠️  严重: {len(imported)} 个导入节点已写入 Git，但写入 SQLite 失败: {e}")
+            logger.warning("   -> 下次启动或 `sync` 时将通过补水机制修复。")
+
+        return [node for node, _ in imported]
+
+    def compact_captures(self, before: float, min_length: int = 2, **kwargs: Any) -> CompactionResult:
+        result, compacted, moved = self.git_writer._compact(before, min_length, kwargs.get("protected_trees", ()))
+        if not result.rewritten:
+            return result
+        owner_id = kwargs.get("owner_id", "unknown-local-user")
+
+        new_nodes = []
+        edges = [(new, parent) for _, new, parent in moved if parent]
+        for node, meta_json in compacted:
+            new_nodes.append(
+                (
+                    node.commit_hash,
+                    owner_id,
+                    node.output_tree,
+                    node.node_type,
+                    node.timestamp.timestamp(),
+                    node.summary,
+                    json.loads(meta_json)["generator"]["id"],
+                    meta_json,
+                    node.content,
+                )
+            )
+            if node.parent:
+                edges.append((node.commit_hash, node.parent.commit_hash))
+
+        # 节点、边与私有数据的迁移在同一个 SQLite 事务中完成
+        try:
+            self.db_manager.apply_history_rewrite(new_nodes, moved, edges, result.rewritten.keys())
+        except sqlite3.Error as e:
+            logger.error(f"⚠️  严重: 历史已在 Git 中压缩，但更新 SQLite 失败: {e}")
+            logger.warning("   -> 运行 `quipu cache rebuild` 重建数据库。")
+        return result
@@ -1,15 +1,17 @@
 import logging
 import re
 import subprocess
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Iterable, List, Optional, Tuple
 
 from pyquipu.common.identity import get_user_id_from_email
-from pyquipu.interfaces.models import QuipuNode
+from pyquipu.interfaces.models import CompactionResult, ImportRecord, QuipuNode, SearchHit
 from pyquipu.interfaces.storage import HistoryReader, HistoryWriter
 
 from .config import ConfigManager
 from .git_db import GitDB
+from .graph_store import GraphStore
 from .hydrator import Hydrator
 
 # 导入类型以进行类型提示
@@ -84,7 +86,7 @@ class Engine:
         self.reader = reader
         self.writer = writer
         self.db_manager = db_manager  # 持有数据库管理器引用
-        self.history_graph: Dict[str, QuipuNode] = {}
+        self.history_graph = GraphStore()
         self.current_node: Optional[QuipuNode] = None
 
         if isinstance(db, GitDB):
@@ -93,6 +95,8 @@ class Engine:
     def close(self):
         if self.db_manager:
             self.db_manager.close()
+        if isinstance(self.git_db, GitDB):
+            self.git_db.close()
 
     def _get_current_user_id(self) -> str:
         # 1. 尝试从 Quipu 配置中读取
@@ -221,10 +225,14 @@ class Engine:
             except Exception as e:
                 logger.error(f"❌ 自动数据补水失败: {e}", exc_info=True)
 
-        all_nodes = self.reader.load_all_nodes()
-        self.history_graph = {node.commit_hash: node for node in all_nodes}
-        if all_nodes:
-            logger.info(f"从存储中加载了 {len(all_nodes)} 个历史事件，形成 {len(self.history_graph)} 个唯一状态节点。")
+        # 优先直接读取 Reader 的列式存储；不支持的 Reader 先加载节点再压缩为列式存储
+        load_graph_store = getattr(self.reader, "load_graph_store", None)
+        if load_graph_store is not None:
+            self.history_graph = load_graph_store()
+        else:
+            self.history_graph = GraphStore.from_nodes(self.reader.load_all_nodes())
+        if self.history_graph:
+            logger.info(f"从存储中加载了 {len(self.history_graph)} 个历史节点。")
 
         current_hash = self.git_db.get_tree_hash()
         EMPTY_TREE_HASH = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
@@ -233,12 +241,7 @@ class Engine:
             self.current_node = None
             return "CLEAN"
 
-        # Find node by iterating since keys are now commit hashes
-        found_node = None
-        for node in self.history_graph.values():
-            if node.output_tree == current_hash:
-                found_node = node
-                break
+        found_node = self.history_graph.find_by_output_tree(current_hash)
 
         if found_node:
             self.current_node = found_node
@@ -263,6 +266,22 @@ class Engine:
             limit=limit,
         )
 
+    def search_nodes(
+        self,
+        text: str,
+        summary_regex: Optional[str] = None,
+        node_type: Optional[str] = None,
+        limit: int = 10,
+        highlight: Tuple[str, str] = ("[", "]"),
+    ) -> List[SearchHit]:
+        return self.reader.search_nodes(
+            text,
+            summary_regex=summary_regex,
+            node_type=node_type,
+            limit=limit,
+            highlight=highlight,
+        )
+
     def capture_drift(self, current_hash: str, message: Optional[str] = None) -> QuipuNode:
         log_message = f"📸 正在捕获工作区漂移 (Message: {message})" if message else "📸 正在捕获工作区漂移"
         logger.info(f"{log_message}，新状态 Hash: {current_hash[:7]}")
@@ -273,16 +292,14 @@ class Engine:
         parent_node = None
 
         if head_tree_hash:
-            # 正确的逻辑：遍历节点，用 output_tree 匹配 head 的 tree hash
-            parent_node = next(
-                (node for node in self.history_graph.values() if node.output_tree == head_tree_hash), None
-            )
+            # 用 output_tree 匹配 head 的 tree hash
+            parent_node = self.history_graph.find_by_output_tree(head_tree_hash)
 
         if parent_node:
             input_hash = parent_node.output_tree
         elif self.history_graph:
             # 只有当 HEAD 指针无效或丢失时，才执行回退逻辑
-            last_node = max(self.history_graph.values(), key=lambda node: node.timestamp)
+            last_node = self.history_graph.latest()
             input_hash = last_node.output_tree
             logger.warning(
                 f"⚠️  HEAD 指针 '{head_tree_hash[:7] if head_tree_hash else 'N/A'}' 无效或丢失，"
@@ -290,6 +307,8 @@ class Engine:
             )
 
         diff_summary = self.git_db.get_diff_stat(input_hash, current_hash)
+        # 超大或二进制文件只以指针条目进入快照，其内容无法通过 checkout 恢复
+        self.git_db.report_new_pointers(input_hash, current_hash)
         user_message_section = f"### 💬 备注:\n{message}\n\n" if message else ""
         body = (
             f"# 📸 Snapshot Capture\n\n"
@@ -309,13 +328,8 @@ class Engine:
             owner_id=user_id,
         )
 
-        if new_node.parent and new_node.parent.commit_hash in self.history_graph:
-            real_parent = self.history_graph[new_node.parent.commit_hash]
-            new_node.parent = real_parent
-            if new_node not in real_parent.children:
-                real_parent.children.append(new_node)
-
-        self.history_graph[new_node.commit_hash] = new_node
+        # 存储负责把新节点链接到图中已有的父节点
+        new_node = self.history_graph.add(new_node)
         self.current_node = new_node
         self._write_head(current_hash)
         self._append_nav(current_hash)
@@ -342,13 +356,7 @@ class Engine:
             owner_id=user_id,
         )
 
-        if new_node.parent and new_node.parent.commit_hash in self.history_graph:
-            real_parent = self.history_graph[new_node.parent.commit_hash]
-            new_node.parent = real_parent
-            if new_node not in real_parent.children:
-                real_parent.children.append(new_node)
-
-        self.history_graph[new_node.commit_hash] = new_node
+        new_node = self.history_graph.add(new_node)
         self.current_node = new_node
         self._write_head(output_tree)
         self._append_nav(output_tree)
@@ -356,6 +364,30 @@ class Engine:
         logger.info(f"✅ Plan 已归档: {new_node.filename.name}")
         return new_node
 
+    def import_nodes(self, records: Iterable[ImportRecord]) -> List[QuipuNode]:
+        # 记录按拓扑顺序给出，父节点总是先于子节点进入存储
+        new_nodes = [
+            self.history_graph.add(node)
+            for node in self.writer.import_nodes(records, owner_id=self._get_current_user_id())
+        ]
+
+        logger.info(f"✅ 已导入 {len(new_nodes)} 个历史节点")
+        return new_nodes
+
+    def compact_captures(self, older_than: float, min_length: int = 2) -> CompactionResult:
+        # 当前 HEAD 所在的状态不能被合并进链的中间，否则工作区会失去对应的节点
+        head_tree = self._read_head()
+        result = self.writer.compact_captures(
+            time.time() - older_than,
+            min_length,
+            protected_trees={head_tree} if head_tree else set(),
+            owner_id=self._get_current_user_id(),
+        )
+        if result.rewritten:
+            # 节点哈希已变化，重新加载历史图谱
+            self.align()
+        return result
+
     def checkout(self, target_hash: str):
         # 获取切换前的 tree hash 作为 "old_tree"
         current_head_hash = self._read_head()
@@ -364,9 +396,5 @@ class Engine:
         self.git_db.checkout_tree(new_tree_hash=target_hash, old_tree_hash=current_head_hash)
 
         self._write_head(target_hash)
-        self.current_node = None
-        for node in self.history_graph.values():
-            if node.output_tree == target_hash:
-                self.current_node = node
-                break
+        self.current_node = self.history_graph.find_by_output_tree(target_hash)
         logger.info(f"🔄 状态已切换至: {target_hash[:7]}")
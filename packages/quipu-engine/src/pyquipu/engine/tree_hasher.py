@@ -0,0 +1,340 @@
+import hashlib
+import logging
+import os
+import stat
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+
+from .git_odb import NativeObjectStore, parse_tree_entries
+from .snapshot_policy import SnapshotPolicy
+
+logger = logging.getLogger(__name__)
+
+_CACHE_MAGIC = b"QTRC"
+_CACHE_VERSION = 1
+_HEADER = struct.Struct(">4sII")
+_FILE_ENTRY = struct.Struct(">HqqQI20s")
+_DIR_ENTRY = struct.Struct(">H20s")
+_COUNT = struct.Struct(">I")
+
+# mtime 距离本次扫描开始不足该值的条目被视为“racy”，不写入缓存，
+# 以免同一秒内的再次修改因 stat 信息相同而被漏检。
+_RACY_WINDOW_NS = 2_000_000_000
+
+_MODE_REGULAR = 0o100644
+_MODE_EXECUTABLE = 0o100755
+_MODE_SYMLINK = 0o120000
+_MODE_TREE = b"40000"
+
+
+class UnsupportedWorkspaceError(Exception):
+    pass
+
+
+class StatEntry(NamedTuple):
+    mtime_ns: int
+    size: int
+    ino: int
+    mode: int
+    sha: bytes
+
+
+class TreeHashCache:
+    def __init__(self, path: Path):
+        self.path = path
+        self.files: Dict[bytes, StatEntry] = {}
+        self.dirs: Dict[bytes, bytes] = {}
+
+    def load(self):
+        self.files, self.dirs = {}, {}
+        try:
+            data = self.path.read_bytes()
+        except OSError:
+            return
+        try:
+            self._parse(data)
+        except (struct.error, ValueError) as e:
+            logger.debug(f"Discarding corrupt tree cache {self.path}: {e}")
+            self.files, self.dirs = {}, {}
+
+    def _parse(self, data: bytes):
+        magic, version, file_count = _HEADER.unpack_from(data, 0)
+        if magic != _CACHE_MAGIC or version != _CACHE_VERSION:
+            raise ValueError("Unknown tree cache format")
+        pos = _HEADER.size
+        files = {}
+        for _ in range(file_count):
+            path_len, mtime_ns, size, ino, mode, sha = _FILE_ENTRY.unpack_from(data, pos)
+            pos += _FILE_ENTRY.size
+            files[data[pos : pos + path_len]] = StatEntry(mtime_ns, size, ino, mode, sha)
+            pos += path_len
+        (dir_count,) = _COUNT.unpack_from(data, pos)
+        pos += _COUNT.size
+        dirs = {}
+        for _ in range(dir_count):
+            path_len, sha = _DIR_ENTRY.unpack_from(data, pos)
+            pos += _DIR_ENTRY.size
+            dirs[data[pos : pos + path_len]] = sha
+            pos += path_len
+        if pos != len(data):
+            raise ValueError("Trailing data in tree cache")
+        self.files, self.dirs = files, dirs
+
+    def save(self, files: Dict[bytes, StatEntry], dirs: Dict[bytes, bytes]):
+        parts = [_HEADER.pack(_CACHE_MAGIC, _CACHE_VERSION, len(files))]
+        for path, entry in files.items():
+            parts.append(_FILE_ENTRY.pack(len(path), *entry))
+            parts.append(path)
+        parts.append(_COUNT.pack(len(dirs)))
+        for path, sha in dirs.items():
+            parts.append(_DIR_ENTRY.pack(len(path), sha))
+            parts.append(path)
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.path.parent.mkdir(exist_ok=True)
+            tmp_path.write_bytes(b"".join(parts))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # 缓存只是加速手段，写入失败不影响结果
+            logger.debug(f"Failed to persist tree cache {self.path}: {e}")
+            return
+        self.files, self.dirs = files, dirs
+
+
+def _tree_sort_key(item: Tuple[bytes, bytes, bytes]) -> bytes:
+    # Git 对 tree 条目排序时，目录名按带尾部 '/' 的形式比较
+    name, mode, _ = item
+    return name + b"/" if mode == _MODE_TREE else name
+
+
+def _parent_dir(path: bytes) -> bytes:
+    idx = path.rfind(b"/")
+    return path[:idx] if idx != -1 else b""
+
+
+def _ancestor_dirs(paths: Iterable[bytes]) -> Set[bytes]:
+    dirs: Set[bytes] = set()
+    for path in paths:
+        parent = _parent_dir(path)
+        while parent not in dirs:
+            dirs.add(parent)
+            if not parent:
+                break
+            parent = _parent_dir(parent)
+    return dirs
+
+
+class WorkspaceTreeHasher:
+    def __init__(self, root: Path, odb: NativeObjectStore, cache_path: Path, policy: Optional[SnapshotPolicy] = None):
+        self.root = root
+        self._root_bytes = os.fsencode(root)
+        self.odb = odb
+        self.cache = TreeHashCache(cache_path)
+        self._cache_loaded = False
+        self.policy = policy
+
+    def _hash_file(self, full_path: bytes, st: os.stat_result, mode: int) -> bytes:
+        if mode == _MODE_SYMLINK:
+            return bytes.fromhex(self.odb.write("blob", os.readlink(full_path)))
+        if self.policy:
+            # 超大或二进制文件只记录一个指针条目，避免读取并存储全部内容
+            pointer = self.policy.read_pointer(full_path[len(self._root_bytes) + 1 :], full_path, st)
+            if pointer is not None:
+                return bytes.fromhex(self.odb.write("blob", pointer))
+        return bytes.fromhex(self.odb.write_blob_from_file(full_path, st.st_size))
+
+    def compute(self, paths: Iterable[bytes]) -> str:
+        if not self._cache_loaded:
+            self.cache.load()
+            self._cache_loaded = True
+        old_files, old_dirs = self.cache.files, self.cache.dirs
+
+        scan_start_ns = time.time_ns()
+        files: Dict[bytes, Tuple[int, bytes]] = {}
+        new_cache: Dict[bytes, StatEntry] = {}
+        changed: List[bytes] = []
+        hashed = 0
+
+        for path in paths:
+            full_path = self._root_bytes + b"/" + path
+            try:
+                st = os.lstat(full_path)
+            except FileNotFoundError:
+                continue  # 已从工作区删除的已跟踪文件
+            if stat.S_ISREG(st.st_mode):
+                mode = _MODE_EXECUTABLE if st.st_mode & 0o100 else _MODE_REGULAR
+            elif stat.S_ISLNK(st.st_mode):
+                mode = _MODE_SYMLINK
+            else:
+                continue
+
+            cached = old_files.get(path)
+            if (
+                cached is not None
+                and cached.mtime_ns == st.st_mtime_ns
+                and cached.size == st.st_size
+                and cached.ino == st.st_ino
+                and cached.mode == mode
+            ):
+                sha = cached.sha
+            else:
+                sha = self._hash_file(full_path, st, mode)
+                hashed += 1
+                if cached is None or cached.sha != sha or cached.mode != mode:
+                    changed.append(path)
+
+            files[path] = (mode, sha)
+            if scan_start_ns - st.st_mtime_ns > _RACY_WINDOW_NS:
+                new_cache[path] = StatEntry(st.st_mtime_ns, st.st_size, st.st_ino, mode, sha)
+
+        changed.extend(path for path in old_files if path not in files)
+        dirty_dirs = _ancestor_dirs(changed)
+
+        new_dirs: Dict[bytes, bytes] = {}
+        root_sha = self._build_trees(files, old_dirs, dirty_dirs, new_dirs)
+        # 包含 racy 条目的目录不缓存其 tree，下次必须重新计算
+        for dir_path in _ancestor_dirs(path for path in files if path not in new_cache):
+            new_dirs.pop(dir_path, None)
+        self.cache.save(new_cache, new_dirs)
+        logger.debug(f"Tree hasher: {len(files)} files, {hashed} hashed, {len(dirty_dirs)} dirty dirs")
+        return root_sha.hex()
+
+    def update(self, base_tree: str, dirty_paths: Iterable[bytes], present_paths: Iterable[bytes]) -> str:
+        # 增量模式: 先从基准 tree 中移除所有脏路径 (文件或整个目录)，
+        # 再加回这些路径下当前仍应出现在快照中的文件。
+        tree = _MutableTree(self.odb, bytes.fromhex(base_tree))
+        for path in dirty_paths:
+            tree.remove(path.split(b"/"))
+
+        for path in present_paths:
+            full_path = self._root_bytes + b"/" + path
+            try:
+                st = os.lstat(full_path)
+            except FileNotFoundError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                mode = _MODE_EXECUTABLE if st.st_mode & 0o100 else _MODE_REGULAR
+            elif stat.S_ISLNK(st.st_mode):
+                mode = _MODE_SYMLINK
+            else:
+                continue
+            tree.add(path.split(b"/"), b"%o" % mode, self._hash_file(full_path, st, mode))
+
+        root_sha = tree.write()
+        if root_sha is None:
+            return self.odb.write("tree", b"")
+        return root_sha.hex()
+
+    def _build_trees(
+        self,
+        files: Dict[bytes, Tuple[int, bytes]],
+        old_dirs: Dict[bytes, bytes],
+        dirty_dirs: Set[bytes],
+        new_dirs: Dict[bytes, bytes],
+    ) -> bytes:
+        children: Dict[bytes, List[Tuple[bytes, bytes, bytes]]] = {b"": []}
+        for path, (mode, sha) in files.items():
+            parent = _parent_dir(path)
+            name = path[len(parent) + 1 :] if parent else path
+            entries = children.get(parent)
+            if entries is None:
+                entries = children[parent] = []
+                # 首次遇到该目录时，将其登记到各级父目录中
+                child, ancestor = parent, _parent_dir(parent)
+                while True:
+                    child_name = child[len(ancestor) + 1 :] if ancestor else child
+                    ancestor_entries = children.get(ancestor)
+                    placeholder = (child_name, _MODE_TREE, child)
+                    if ancestor_entries is not None:
+                        ancestor_entries.append(placeholder)
+                        break
+                    children[ancestor] = [placeholder]
+                    if not ancestor:
+                        break
+                    child, ancestor = ancestor, _parent_dir(ancestor)
+            entries.append((name, b"%o" % mode, sha))
+
+        def build(dir_path: bytes) -> bytes:
+            cached_sha = old_dirs.get(dir_path)
+            if cached_sha is not None and dir_path not in dirty_dirs and self.odb.contains(cached_sha.hex()):
+                new_dirs[dir_path] = cached_sha
+                return cached_sha
+
+            resolved = []
+            for name, mode, value in children[dir_path]:
+                if mode == _MODE_TREE:
+                    value = build(value)
+                elif not self.odb.contains(value.hex()):
+                    # 缓存命中的 blob 可能已被 gc 清理，重新写入
+                    full_path = self._root_bytes + b"/" + (dir_path + b"/" + name if dir_path else name)
+                    st = os.lstat(full_path)
+                    value = self._hash_file(full_path, st, int(mode, 8))
+                resolved.append((name, mode, value))
+            resolved.sort(key=_tree_sort_key)
+            content = b"".join(mode + b" " + name + b"\0" + sha for name, mode, sha in resolved)
+
+            header = b"tree %d\0" % len(content)
+            sha = hashlib.sha1(header + content).digest()
+            if sha != cached_sha:
+                self.odb.write("tree", content)
+            new_dirs[dir_path] = sha
+            return sha
+
+        return build(b"")
+
+
+class _MutableTree:
+    def __init__(self, odb: NativeObjectStore, sha: Optional[bytes] = None):
+        self.odb = odb
+        self.entries: Dict[bytes, Tuple[bytes, Union[bytes, "_MutableTree"]]] = {}
+        if sha is not None:
+            content = odb.read_typed(sha.hex(), "tree")
+            if content is None:
+                raise KeyError(f"Missing tree object {sha.hex()}")
+            for mode, name, hex_sha in parse_tree_entries(content):
+                self.entries[name.encode("utf-8", "surrogateescape")] = (mode.encode("ascii"), bytes.fromhex(hex_sha))
+
+    def _subtree(self, name: bytes, create: bool) -> Optional["_MutableTree"]:
+        entry = self.entries.get(name)
+        if entry is None or entry[0] != _MODE_TREE:
+            if not create:
+                return None
+            subtree = _MutableTree(self.odb)
+            self.entries[name] = (_MODE_TREE, subtree)
+            return subtree
+        value = entry[1]
+        if not isinstance(value, _MutableTree):
+            value = _MutableTree(self.odb, value)
+            self.entries[name] = (_MODE_TREE, value)
+        return value
+
+    def remove(self, parts: List[bytes]):
+        node = self
+        for part in parts[:-1]:
+            node = node._subtree(part, create=False)
+            if node is None:
+                return
+        node.entries.pop(parts[-1], None)
+
+    def add(self, parts: List[bytes], mode: bytes, sha: bytes):
+        node = self
+        for part in parts[:-1]:
+            node = node._subtree(part, create=True)
+        node.entries[parts[-1]] = (mode, sha)
+
+    def write(self) -> Optional[bytes]:
+        resolved = []
+        for name, (mode, value) in self.entries.items():
+            if isinstance(value, _MutableTree):
+                value = value.write()
+                if value is None:
+                    continue  # Git 不记录空目录
+            resolved.append((name, mode, value))
+        if not resolved:
+            return None
+        resolved.sort(key=_tree_sort_key)
+        content = b"".join(mode + b" " + name + b"\0" + sha for name, mode, sha in resolved)
+        return bytes.fromhex(self.odb.write("tree", content))
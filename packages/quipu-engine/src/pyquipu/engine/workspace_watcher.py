@@ -0,0 +1,391 @@
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Set
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 上没有 fcntl：监视器不可用，读取端把工作区视为未被监视
+    fcntl = None
+
+if TYPE_CHECKING:
+    from .git_db import GitDB
+
+logger = logging.getLogger(__name__)
+
+_JOURNAL_MAGIC = b"QUIPU-WATCH-1 "
+
+# inotify 事件掩码 (见 <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+    | IN_EXCL_UNLINK
+)
+_EVENT_HEADER = struct.Struct("iIII")
+_SKIPPED_TOP_LEVEL = (b".git", b".quipu")
+# 读取端等待监视进程确认 cookie 的最长时间，超时后回退到全量扫描
+_COOKIE_TIMEOUT = 1.0
+
+
+class WatcherUnavailableError(Exception):
+    pass
+
+
+class JournalChanges(NamedTuple):
+    journal_id: str
+    end: int
+    base_tree: Optional[str]
+    paths: Optional[Set[bytes]]
+
+
+class WatchJournal:
+    def __init__(self, watch_dir: Path):
+        self.watch_dir = watch_dir
+        self.journal_path = watch_dir / "journal"
+        self.lock_path = watch_dir / "lock"
+        self.baseline_path = watch_dir / "baseline.json"
+        self.cookie_dir = watch_dir / "cookies"
+
+    # --- 监视进程端 ---
+
+    def start(self) -> str:
+        journal_id = uuid.uuid4().hex
+        self.watch_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.journal_path.with_name("journal.tmp")
+        tmp_path.write_bytes(_JOURNAL_MAGIC + journal_id.encode("ascii") + b"\0")
+        os.replace(tmp_path, self.journal_path)
+        return journal_id
+
+    def append(self, paths: Iterable[bytes]):
+        payload = b"".join(path + b"\0" for path in paths)
+        if not payload:
+            return
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, payload)
+        finally:
+            os.close(fd)
+
+    # --- 读取端 ---
+
+    def is_watcher_running(self) -> bool:
+        if fcntl is None:
+            return False
+        try:
+            fd = os.open(self.lock_path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+    def sync(self, timeout: float = _COOKIE_TIMEOUT) -> bool:
+        # cookie 握手 (同 watchman / git fsmonitor)：inotify 按发生顺序投递事件，
+        # 监视进程删除 cookie 时，创建 cookie 之前的所有文件事件都已写入 journal
+        cookie_path = self.cookie_dir / f"{os.getpid()}-{threading.get_ident()}-{uuid.uuid4().hex}"
+        try:
+            os.close(os.open(cookie_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        except OSError as e:
+            logger.debug(f"Failed to create watch cookie: {e}")
+            return False
+        deadline = time.monotonic() + timeout
+        delay = 0.0005
+        while os.path.lexists(cookie_path):
+            if time.monotonic() >= deadline:
+                logger.debug("Workspace watcher did not acknowledge cookie in time")
+                try:
+                    cookie_path.unlink()
+                except OSError:
+                    pass
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+        return True
+
+    def _load_baseline(self) -> Optional[Dict]:
+        try:
+            return json.loads(self.baseline_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def read_changes(self, guards: Dict[str, List[int]]) -> Optional[JournalChanges]:
+        if not self.is_watcher_running() or not self.sync():
+            return None
+        try:
+            with open(self.journal_path, "rb") as f:
+                header = f.readline(128).split(b"\0", 1)[0]
+                if not header.startswith(_JOURNAL_MAGIC):
+                    return None
+                journal_id = header[len(_JOURNAL_MAGIC) :].decode("ascii")
+                header_end = len(header) + 1
+
+                baseline = self._load_baseline()
+                usable = (
+                    baseline is not None
+                    and baseline.get("journal_id") == journal_id
+                    and baseline.get("guards") == guards
+                    and isinstance(baseline.get("offset"), int)
+                    and baseline["offset"] >= header_end
+                )
+                start = baseline["offset"] if usable else header_end
+                f.seek(start)
+                data = f.read()
+        except OSError:
+            return None
+
+        # 只消费完整的记录；监视进程可能正在写入最后一条
+        complete = data[: data.rfind(b"\0") + 1]
+        end = start + len(complete)
+        if not usable:
+            return JournalChanges(journal_id, end, None, None)
+        paths = {path for path in complete.split(b"\0") if path}
+        return JournalChanges(journal_id, end, baseline.get("tree"), paths)
+
+    def record_baseline(self, changes: JournalChanges, tree_hash: str, guards: Dict[str, List[int]]):
+        baseline = {"journal_id": changes.journal_id, "offset": changes.end, "tree": tree_hash, "guards": guards}
+        tmp_path = self.baseline_path.with_name("baseline.json.tmp")
+        try:
+            tmp_path.write_text(json.dumps(baseline), encoding="utf-8")
+            os.replace(tmp_path, self.baseline_path)
+        except OSError as e:
+            logger.debug(f"Failed to record watch baseline: {e}")
+
+
+class _Inotify:
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise WatcherUnavailableError("inotify is only available on Linux")
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise WatcherUnavailableError(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+
+    def add_watch(self, path: bytes) -> Optional[int]:
+        wd = self._libc.inotify_add_watch(self.fd, path, _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == 28:  # ENOSPC: 超出 fs.inotify.max_user_watches
+                raise WatcherUnavailableError("inotify watch limit reached (fs.inotify.max_user_watches)")
+            return None  # 目录在注册前已被删除等情况
+        return wd
+
+    def read_events(self):
+        try:
+            buf = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(buf):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buf, pos)
+            pos += _EVENT_HEADER.size
+            name = buf[pos : pos + length].rstrip(b"\0")
+            pos += length
+            yield wd, mask, name
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class WorkspaceWatcher:
+    def __init__(self, root: Path, git_db: "GitDB", max_entries: int = 100_000):
+        self.root = root.resolve()
+        self._root_bytes = os.fsencode(self.root)
+        self.git_db = git_db
+        self.journal = WatchJournal(self.root / ".quipu" / "watch")
+        self.max_entries = max_entries
+        self._inotify: Optional[_Inotify] = None
+        self._wd_paths: Dict[int, bytes] = {}
+        self._tracked: Set[bytes] = set()
+        self._cookie_wd: Optional[int] = None
+        self._entries = 0
+
+    def _full_path(self, rel_path: bytes) -> bytes:
+        return self._root_bytes + b"/" + rel_path if rel_path else self._root_bytes
+
+    def _tracked_dirs(self) -> Set[bytes]:
+        result = self.git_db._run(["ls-files", "-z"], capture_as_text=False, check=False)
+        dirs: Set[bytes] = set()
+        for path in result.stdout.split(b"\0"):
+            idx = path.rfind(b"/")
+            while idx > 0:
+                parent = path[:idx]
+                if parent in dirs:
+                    break
+                dirs.add(parent)
+                idx = parent.rfind(b"/")
+        return dirs
+
+    def _ignored(self, rel_dirs: List[bytes]) -> Set[bytes]:
+        if not rel_dirs:
+            return set()
+        payload = b"".join(path + b"/\0" for path in rel_dirs)
+        result = self.git_db._run(
+            ["check-ignore", "-z", "--stdin"], input_data=payload, capture_as_text=False, check=False, log_error=False
+        )
+        return {path.rstrip(b"/") for path in result.stdout.split(b"\0") if path}
+
+    def _watch_tree(self, rel_root: bytes, tracked_dirs: Set[bytes]):
+        # 逐层广度优先注册监视，跳过被忽略且不含已跟踪文件的目录 (如 node_modules)
+        level = [rel_root]
+        while level:
+            next_level: List[bytes] = []
+            for rel_dir in level:
+                wd = self._inotify.add_watch(self._full_path(rel_dir))
+                if wd is None:
+                    continue
+                self._wd_paths[wd] = rel_dir
+                try:
+                    with os.scandir(self._full_path(rel_dir)) as it:
+                        for entry in it:
+                            if not entry.is_dir(follow_symlinks=False):
+                                continue
+                            if not rel_dir and entry.name in _SKIPPED_TOP_LEVEL:
+                                continue
+                            next_level.append(rel_dir + b"/" + entry.name if rel_dir else entry.name)
+                except OSError:
+                    continue
+            ignored = self._ignored([d for d in next_level if d not in tracked_dirs])
+            level = [d for d in next_level if d not in ignored]
+
+    def _reset(self):
+        if self._inotify:
+            self._inotify.close()
+        self._inotify = _Inotify()
+        self._wd_paths = {}
+        self._tracked = self._tracked_dirs()
+        self._watch_tree(b"", self._tracked)
+        self.journal.cookie_dir.mkdir(parents=True, exist_ok=True)
+        self._cookie_wd = self._inotify.add_watch(os.fsencode(self.journal.cookie_dir))
+        self.journal.start()
+        self._entries = 0
+        # 新 journal 开始之前留下的 cookie 直接确认：读取端会因 journal id 变化而回退到全量扫描
+        self._ack_cookies(entry.name for entry in os.scandir(self.journal.cookie_dir))
+        logger.debug(f"Watching {len(self._wd_paths)} directories under {self.root}")
+
+    def _rotate(self, reason: str):
+        # 无法可靠地增量跟踪时，开启新的 journal。读取端会因 id 不匹配而回退到全量扫描一次。
+        logger.info(f"Workspace watcher journal reset: {reason}")
+        self._reset()
+
+    def _ack_cookies(self, names: Iterable[str]):
+        for name in names:
+            try:
+                os.unlink(self.journal.cookie_dir / name)
+            except OSError:
+                pass
+
+    def _process_events(self) -> bool:
+        changed: Set[bytes] = set()
+        cookies: List[str] = []
+        try:
+            return self._collect_events(changed, cookies)
+        finally:
+            # cookie 必须在它之前的事件写入 journal (或 journal 已轮换) 之后才确认
+            self._ack_cookies(cookies)
+
+    def _collect_events(self, changed: Set[bytes], cookies: List[str]) -> bool:
+        for wd, mask, name in self._inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                self._rotate("event queue overflow")
+                return True
+            if wd == self._cookie_wd:
+                if mask & IN_CREATE:
+                    cookies.append(os.fsdecode(name))
+                continue
+            if mask & IN_IGNORED:
+                self._wd_paths.pop(wd, None)
+                continue
+            base = self._wd_paths.get(wd)
+            if base is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if not base:
+                    raise WatcherUnavailableError("Workspace root was moved or deleted")
+                continue
+            if not base and name in _SKIPPED_TOP_LEVEL:
+                continue
+
+            path = base + b"/" + name if base else name
+            if mask & IN_ISDIR:
+                if mask & (IN_MOVED_FROM | IN_MOVED_TO):
+                    # 目录移动会让已注册的 wd 路径失效，直接重建监视
+                    self._rotate("directory moved")
+                    return True
+                if mask & IN_CREATE and (path in self._tracked or not self._ignored([path])):
+                    self._watch_tree(path, self._tracked)
+            changed.add(path)
+
+        if changed:
+            self.journal.append(sorted(changed))
+            self._entries += len(changed)
+            if self._entries > self.max_entries:
+                self._rotate("journal overflow")
+        return bool(changed)
+
+    def run(self, stop_event: Optional[threading.Event] = None, ready_event: Optional[threading.Event] = None):
+        if fcntl is None or not sys.platform.startswith("linux"):
+            raise WatcherUnavailableError("inotify is only available on Linux")
+        self.journal.watch_dir.mkdir(parents=True, exist_ok=True)
+        lock_fd = os.open(self.journal.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise WatcherUnavailableError("Another watcher is already running for this workspace")
+
+            self._reset()
+            if ready_event:
+                ready_event.set()
+            while not (stop_event and stop_event.is_set()):
+                readable, _, _ = select.select([self._inotify.fd], [], [], 0.2)
+                if readable:
+                    self._process_events()
+        finally:
+            if self._inotify:
+                self._inotify.close()
+                self._inotify = None
+            os.close(lock_fd)
@@ -3,7 +3,7 @@ from __future__ import annotations
 import dataclasses
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional  # <-- 引入 List
+from typing import Dict, List, Optional  # <-- 引入 List
 
 
 @dataclasses.dataclass
@@ -43,3 +43,29 @@ class QuipuNode:
         if not self.parent:
             return [self]
         return self.parent.children
+
+
+@dataclasses.dataclass
+class ImportRecord:
+    key: str  # 记录在本次导入中的标识，子记录通过它引用父节点
+    node_type: str  # "plan" | "capture"
+    content: str
+    parent: Optional[str] = None  # 本次导入中先前记录的 key，或已存在的 commit 哈希
+    summary: Optional[str] = None
+    output_tree: Optional[str] = None  # 缺省时沿用父节点的状态
+    input_tree: Optional[str] = None  # 仅在父节点无法解析出 output_tree 时使用
+    timestamp: Optional[float] = None
+
+
+@dataclasses.dataclass
+class SearchHit:
+    node: QuipuNode
+    score: float = 0.0  # 相关度，越大越相关
+    snippet: str = ""  # 命中片段，匹配词已用高亮标记包围
+
+
+@dataclasses.dataclass
+class CompactionResult:
+    chains: int = 0  # 被合并的捕获链数量
+    removed: int = 0  # 从历史图谱中消失的节点数量
+    rewritten: Dict[str, str] = dataclasses.field(default_factory=dict)  # 旧 commit -> 新 commit (含被合并的节点)
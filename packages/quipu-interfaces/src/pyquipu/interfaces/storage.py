@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
-from .models import QuipuNode
+from .models import CompactionResult, ImportRecord, QuipuNode, SearchHit
 
 
 class HistoryReader(ABC):
@@ -13,6 +13,12 @@ class HistoryReader(ABC):
     def get_node_content(self, node: QuipuNode) -> str:
         pass
 
+    def get_contents(self, nodes: Iterable[QuipuNode]) -> Dict[str, str]:
+        return {node.commit_hash: self.get_node_content(node) for node in nodes}
+
+    def prefetch_contents(self, nodes: Iterable[QuipuNode]):
+        self.get_contents(nodes)
+
     @abstractmethod
     def get_node_blobs(self, commit_hash: str) -> Dict[str, bytes]:
         pass
@@ -26,6 +32,16 @@ class HistoryReader(ABC):
     ) -> List[QuipuNode]:
         pass
 
+    def search_nodes(
+        self,
+        text: str,
+        summary_regex: Optional[str] = None,
+        node_type: Optional[str] = None,
+        limit: int = 10,
+        highlight: Tuple[str, str] = ("[", "]"),
+    ) -> List[SearchHit]:
+        raise NotImplementedError(f"{type(self).__name__} does not support full-text search")
+
     @abstractmethod
     def get_node_count(self) -> int:
         pass
@@ -46,6 +62,12 @@ class HistoryReader(ABC):
     def get_descendant_output_trees(self, start_output_tree_hash: str) -> Set[str]:
         pass
 
+    def get_reachable_output_trees(self, output_tree_hash: str) -> Set[str]:
+        reachable = self.get_ancestor_output_trees(output_tree_hash)
+        reachable |= self.get_descendant_output_trees(output_tree_hash)
+        reachable.add(output_tree_hash)
+        return reachable
+
     @abstractmethod
     def get_node_position(self, output_tree_hash: str) -> int:
         pass
@@ -62,3 +84,25 @@ class HistoryWriter(ABC):
         **kwargs: Any,
     ) -> QuipuNode:
         pass
+
+    def import_nodes(self, records: Iterable[ImportRecord], **kwargs: Any) -> List[QuipuNode]:
+        created: Dict[str, QuipuNode] = {}
+        for record in records:
+            parent = created.get(record.parent) if record.parent else None
+            input_tree = (
+                parent.output_tree if parent else (record.input_tree or "4b825dc642cb6eb9a060e54bf8d69288fbee4904")
+            )
+            node_kwargs = dict(kwargs)
+            if parent or record.parent:
+                node_kwargs["parent_commit_hash"] = parent.commit_hash if parent else record.parent
+            if record.summary:
+                node_kwargs["summary_override"] = record.summary
+            if record.timestamp is not None:
+                node_kwargs["start_time"] = record.timestamp
+            created[record.key] = self.create_node(
+                record.node_type, input_tree, record.output_tree or input_tree, record.content, **node_kwargs
+            )
+        return list(created.values())
+
+    def compact_captures(self, before: float, min_length: int = 2, **kwargs: Any) -> CompactionResult:
+        raise NotImplementedError(f"{type(self).__name__} does not support history compaction")
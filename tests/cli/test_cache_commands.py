@@ -1,12 +1,15 @@
+from pathlib import Path
 from unittest.mock import MagicMock
 
 import pytest
+import yaml
+from pyquipu.application.factory import create_engine
 from pyquipu.cli.main import app
 from pyquipu.engine.state_machine import Engine
 
 
 @pytest.fixture
-def history_with_redundant_refs(engine_instance: Engine):
+def history_with_redundant_refs(git_workspace: Path) -> Engine:
     """
     创建一个包含线性和分支历史的仓库，这将生成冗余的 head 引用。
     History: root -> n1 -> n2 (branch point) -> n3a (leaf)
@@ -14,7 +17,11 @@ def history_with_redundant_refs(engine_instance: Engine):
     Expected redundant refs: root, n1, n2
     Expected preserved refs: n3a, n3b
     """
-    engine = engine_instance
+    # 模拟写入端压缩出现之前留下的仓库：每个节点都保留自己的 head
+    config_path = git_workspace / ".quipu" / "config.yml"
+    config_path.parent.mkdir(exist_ok=True)
+    config_path.write_text(yaml.dump({"refs": {"compact_heads": False}}))
+    engine = create_engine(git_workspace)
     ws = engine.root_dir
 
     # root
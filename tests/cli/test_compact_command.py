@@ -0,0 +1,39 @@
+import subprocess
+from unittest.mock import MagicMock
+
+from pyquipu.cli.main import app
+
+
+def _save(runner, work_dir, name):
+    (work_dir / f"{name}.txt").write_text(name)
+    result = runner.invoke(app, ["save", name, "-w", str(work_dir)])
+    assert result.exit_code == 0
+
+
+def test_compact_command_merges_capture_chain(runner, quipu_workspace, monkeypatch):
+    work_dir, _, _ = quipu_workspace
+    for name in ["a", "b", "c", "d"]:
+        _save(runner, work_dir, name)
+    mock_bus = MagicMock()
+    monkeypatch.setattr("pyquipu.cli.commands.compact.bus", mock_bus)
+
+    result = runner.invoke(app, ["compact", "--older-than", "0", "--min-length", "2", "-w", str(work_dir)])
+    assert result.exit_code == 0
+    # HEAD 所在的最后一个状态作为链尾保留
+    mock_bus.success.assert_called_once_with("compact.success", chains=1, removed=3, rewritten=1)
+
+    log = subprocess.check_output(["git", "log", "--format=%s", "--glob=refs/quipu/"], cwd=work_dir, text=True)
+    assert len(log.splitlines()) == 1
+    assert log.startswith("Capture: A a.txt, A b.txt, A c.txt ... and 1 more files")
+
+
+def test_compact_command_skips_recent_history(runner, quipu_workspace, monkeypatch):
+    work_dir, _, _ = quipu_workspace
+    for name in ["a", "b", "c"]:
+        _save(runner, work_dir, name)
+    mock_bus = MagicMock()
+    monkeypatch.setattr("pyquipu.cli.commands.compact.bus", mock_bus)
+
+    result = runner.invoke(app, ["compact", "-w", str(work_dir)])
+    assert result.exit_code == 0
+    mock_bus.success.assert_called_once_with("compact.info.nothingToDo")
@@ -0,0 +1,54 @@
+import json
+from unittest.mock import MagicMock
+
+from pyquipu.cli.main import app
+
+from tests.helpers import EMPTY_TREE_HASH
+
+
+def _make_history(engine):
+    ws = engine.root_dir
+    (ws / "a.txt").write_text("v1\n")
+    h1 = engine.git_db.get_tree_hash()
+    engine.create_plan_node(EMPTY_TREE_HASH, h1, "plan 1", summary_override="First")
+    (ws / "a.txt").write_text("v1\nv2\n")
+    (ws / "b.txt").write_text("new\n")
+    h2 = engine.git_db.get_tree_hash()
+    engine.create_plan_node(h1, h2, "plan 2", summary_override="Second")
+    return h1, h2
+
+
+def test_diff_between_nodes(runner, quipu_workspace, monkeypatch):
+    work_dir, _, engine = quipu_workspace
+    h1, h2 = _make_history(engine)
+    mock_bus = MagicMock()
+    monkeypatch.setattr("pyquipu.cli.commands.diff.bus", mock_bus)
+
+    result = runner.invoke(app, ["diff", h1[:7], h2[:7], "-w", str(work_dir), "--name-status"])
+    assert result.exit_code == 0
+    mock_bus.data.assert_called_once_with("M\ta.txt\nA\tb.txt")
+
+    mock_bus.reset_mock()
+    result = runner.invoke(app, ["diff", h1[:7], h2, "-w", str(work_dir), "--json"])
+    assert result.exit_code == 0
+    payload = json.loads(mock_bus.data.call_args.args[0])
+    assert payload["files"] == [
+        {"status": "M", "path": "a.txt", "added": 1, "deleted": 0},
+        {"status": "A", "path": "b.txt", "added": 1, "deleted": 0},
+    ]
+
+    mock_bus.reset_mock()
+    result = runner.invoke(app, ["diff", h2[:7], h2[:7], "-w", str(work_dir)])
+    assert result.exit_code == 0
+    mock_bus.info.assert_called_once_with("diff.info.noChanges")
+
+
+def test_diff_unknown_ref(runner, quipu_workspace, monkeypatch):
+    work_dir, _, engine = quipu_workspace
+    h1, _ = _make_history(engine)
+    mock_bus = MagicMock()
+    monkeypatch.setattr("pyquipu.cli.commands.diff.bus", mock_bus)
+
+    result = runner.invoke(app, ["diff", h1[:7], "deadbeef", "-w", str(work_dir)])
+    assert result.exit_code == 1
+    mock_bus.error.assert_called_once_with("diff.error.notFound", hash_prefix="deadbeef")
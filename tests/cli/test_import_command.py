@@ -0,0 +1,40 @@
+import json
+import subprocess
+from unittest.mock import MagicMock
+
+from pyquipu.cli.main import app
+
+
+def test_import_command_from_file(runner, quipu_workspace, tmp_path, monkeypatch):
+    work_dir, git_db, _ = quipu_workspace
+    mock_bus = MagicMock()
+    monkeypatch.setattr("pyquipu.cli.commands.importer.bus", mock_bus)
+    (work_dir / "a.txt").write_text("a")
+    tree_a = git_db.get_tree_hash()
+
+    source = tmp_path / "history.jsonl"
+    lines = [
+        {"id": "1", "type": "plan", "content": "# First", "output_tree": tree_a},
+        {"id": "2", "type": "plan", "content": "# Second", "parent": "1"},
+    ]
+    source.write_text("\n".join(json.dumps(line) for line in lines) + "\n", encoding="utf-8")
+
+    result = runner.invoke(app, ["import", str(source), "-w", str(work_dir)])
+    assert result.exit_code == 0
+    mock_bus.success.assert_called_once_with("import.success", count=2)
+
+    log = subprocess.check_output(["git", "log", "--format=%s", "--glob=refs/quipu/"], cwd=work_dir, text=True)
+    assert log.splitlines() == ["Second", "First"]
+
+
+def test_import_command_rejects_invalid_line(runner, quipu_workspace, tmp_path, monkeypatch):
+    work_dir, _, _ = quipu_workspace
+    mock_bus = MagicMock()
+    monkeypatch.setattr("pyquipu.cli.commands.importer.bus", mock_bus)
+    source = tmp_path / "bad.jsonl"
+    source.write_text('{"id": "1", "content": "ok"}\nnot json\n', encoding="utf-8")
+
+    result = runner.invoke(app, ["import", str(source), "-w", str(work_dir)])
+    assert result.exit_code == 1
+    assert mock_bus.error.call_args.args[0] == "import.error.failed"
+    assert "line 2" in mock_bus.error.call_args.kwargs["error"]
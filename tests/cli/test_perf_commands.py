@@ -0,0 +1,53 @@
+import json
+from unittest.mock import MagicMock
+
+from pyquipu.cli.main import app
+
+
+def test_profile_records_git_breakdown(runner, quipu_workspace, monkeypatch):
+    work_dir, _, _ = quipu_workspace
+    mock_bus = MagicMock()
+    monkeypatch.setattr("pyquipu.cli.commands.perf.bus", mock_bus)
+
+    result = runner.invoke(app, ["--profile", "log", "-w", str(work_dir)])
+    assert result.exit_code == 0
+
+    summary = [c for c in mock_bus.info.call_args_list if c.args[0] == "perf.info.summary"]
+    assert len(summary) == 1
+    assert summary[0].kwargs["command"] == "log"
+
+    records = [json.loads(line) for line in (work_dir / ".quipu" / "perf.jsonl").read_text().splitlines()]
+    assert len(records) == 1
+    assert records[0]["command"] == "log"
+    assert all(set(s) == {"calls", "spawns", "wall_time", "bytes_in", "bytes_out"} for s in records[0]["git"].values())
+
+
+def test_without_profile_nothing_is_recorded(runner, quipu_workspace):
+    work_dir, _, _ = quipu_workspace
+    result = runner.invoke(app, ["log", "-w", str(work_dir)])
+    assert result.exit_code == 0
+    assert not (work_dir / ".quipu" / "perf.jsonl").exists()
+
+
+def test_perf_report_last_n(runner, quipu_workspace):
+    work_dir, _, _ = quipu_workspace
+    for _ in range(3):
+        runner.invoke(app, ["--profile", "log", "-w", str(work_dir)])
+
+    result = runner.invoke(app, ["perf", "report", "-w", str(work_dir), "-n", "2", "--json"])
+    assert result.exit_code == 0
+    assert len(json.loads(result.stdout)) == 2
+
+    result = runner.invoke(app, ["perf", "report", "-w", str(work_dir)])
+    assert "quipu log" in result.stdout
+    assert "subcommand" in result.stdout
+
+
+def test_perf_report_empty(runner, quipu_workspace, monkeypatch):
+    work_dir, _, _ = quipu_workspace
+    mock_bus = MagicMock()
+    monkeypatch.setattr("pyquipu.cli.commands.perf.bus", mock_bus)
+
+    result = runner.invoke(app, ["perf", "report", "-w", str(work_dir)])
+    assert result.exit_code == 0
+    mock_bus.info.assert_called_once_with("perf.info.noRecords")
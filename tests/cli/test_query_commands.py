@@ -53,6 +53,40 @@ def test_find_command(runner, quipu_workspace, monkeypatch):
     assert "Fix bug" in mock_bus.data.call_args.args[0]
 
 
+def test_find_text_search(runner, quipu_workspace, monkeypatch):
+    work_dir, _, engine = quipu_workspace
+    mock_bus = MagicMock()
+    monkeypatch.setattr("pyquipu.cli.commands.query.bus", mock_bus)
+    monkeypatch.setattr("pyquipu.cli.commands.cache.bus", MagicMock())
+
+    (work_dir / "f1").touch()
+    hash_v1 = engine.git_db.get_tree_hash()
+    engine.capture_drift(hash_v1, message="Fix bug")
+    (work_dir / "f2").touch()
+    engine.create_plan_node(
+        input_tree=hash_v1,
+        output_tree=engine.git_db.get_tree_hash(),
+        plan_content="Teach the widget factory to recycle gadgets",
+        summary_override="Implement feature",
+    )
+
+    # 补水得到的节点内容是冷的，reindex 回填内容后正文才可被检索
+    assert runner.invoke(app, ["cache", "reindex", "-w", str(work_dir)]).exit_code == 0
+    result = runner.invoke(app, ["find", "--text", "gadgets", "-w", str(work_dir)])
+    assert result.exit_code == 0
+    mock_bus.info.assert_called_once_with("query.find.ui.header")
+    lines = [c.args[0] for c in mock_bus.data.call_args_list]
+    assert len(lines) == 2
+    assert "Implement feature" in lines[0]
+    assert "[gadgets]" in lines[1]
+
+    mock_bus.reset_mock()
+    result = runner.invoke(app, ["find", "--text", "gadgets", "--json", "-w", str(work_dir)])
+    json_data = json.loads(mock_bus.data.call_args.args[0])
+    assert [item["summary"] for item in json_data] == ["Implement feature"]
+    assert json_data[0]["score"] > 0 and "[gadgets]" in json_data[0]["snippet"]
+
+
 def test_log_json_output(runner, quipu_workspace, monkeypatch):
     work_dir, _, engine = quipu_workspace
     mock_bus = MagicMock()
@@ -102,3 +102,98 @@ class TestHydration:
         hydrator.sync("test-user")
 
         assert len(db_manager.get_all_node_hashes()) == 1
+
+    def test_hydration_walks_log_once(self, hydrator_setup, monkeypatch):
+        """补水只遍历一次 git log，所有权传播复用同一次遍历的结果。"""
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+        (repo / "a.txt").touch()
+        hash_a = git_db.get_tree_hash()
+        writer.create_node("plan", "genesis", hash_a, "Node A")
+        (repo / "b.txt").touch()
+        hash_b = git_db.get_tree_hash()
+        writer.create_node("plan", hash_a, hash_b, "Node B")
+
+        calls = []
+        original_iter_log = git_db.iter_log
+        monkeypatch.setattr(git_db, "iter_log", lambda *a, **kw: calls.append(a) or original_iter_log(*a, **kw))
+        monkeypatch.setattr(git_db, "log_ref", lambda *a: pytest.fail("log_ref should not be used"))
+
+        hydrator.sync("test-user")
+
+        assert len(calls) == 1
+        assert len(db_manager.get_all_node_hashes()) == 2
+        rows = db_manager._get_conn().execute("SELECT owner_id FROM nodes").fetchall()
+        assert {row["owner_id"] for row in rows} == {"test-user"}
+
+    def test_hydration_streams_log_in_batches(self, hydrator_setup, monkeypatch):
+        """日志条目按批次流式处理：写入第一批节点时，后续条目尚未被读取。"""
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+        input_tree = "genesis"
+        for name in ("a", "b", "c"):
+            (repo / f"{name}.txt").touch()
+            output_tree = git_db.get_tree_hash()
+            writer.create_node("plan", input_tree, output_tree, f"Node {name}")
+            input_tree = output_tree
+
+        events = []
+        original_iter_log = git_db.iter_log
+        original_insert = db_manager.batch_insert_nodes
+
+        def spy_log(*args, **kwargs):
+            for entry in original_iter_log(*args, **kwargs):
+                events.append("read")
+                yield entry
+
+        monkeypatch.setattr("pyquipu.engine.hydrator._HYDRATE_BATCH_SIZE", 1)
+        monkeypatch.setattr(git_db, "iter_log", spy_log)
+        monkeypatch.setattr(
+            db_manager, "batch_insert_nodes", lambda nodes: events.append(len(nodes)) or original_insert(nodes)
+        )
+        hydrator.sync("test-user")
+
+        assert events == ["read", 1, "read", 1, "read", 1]
+        assert len(db_manager.get_all_node_hashes()) == 3
+
+    def test_unchanged_refs_skip_hydration(self, hydrator_setup, monkeypatch):
+        """refs/quipu 指纹未变化时，补水直接返回，不读取 refs 也不遍历日志。"""
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+        (repo / "a.txt").touch()
+        writer.create_node("plan", "genesis", git_db.get_tree_hash(), "Node A")
+        hydrator.sync("test-user")
+
+        monkeypatch.setattr(git_db, "get_all_ref_heads", lambda *a: pytest.fail("refs should not be listed"))
+        monkeypatch.setattr(git_db, "iter_log", lambda *a, **kw: pytest.fail("log should not be walked"))
+        hydrator.sync("test-user")
+
+    def test_incremental_walk_excludes_hydrated_heads(self, hydrator_setup, monkeypatch):
+        """新的 head 出现时，只遍历 `git log <new> --not <hydrated>`，并与已补水的父节点建立边。"""
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+        (repo / "a.txt").touch()
+        hash_a = git_db.get_tree_hash()
+        node_a = writer.create_node("plan", "genesis", hash_a, "Node A")
+        hydrator.sync("test-user")
+
+        (repo / "b.txt").touch()
+        hash_b = git_db.get_tree_hash()
+        node_b = writer.create_node("plan", hash_a, hash_b, "Node B")
+        # 模拟 head 压缩：A 的引用被其子节点取代
+        git_db.delete_ref(f"refs/quipu/local/heads/{node_a.commit_hash}")
+
+        walked = []
+        original_iter_log = git_db.iter_log
+
+        def spy(*args, **kwargs):
+            for entry in original_iter_log(*args, **kwargs):
+                walked.append(entry.commit_hash)
+                yield entry
+
+        monkeypatch.setattr(git_db, "iter_log", spy)
+        hydrator.sync("test-user")
+
+        assert walked == [node_b.commit_hash]
+        edge = (
+            db_manager._get_conn()
+            .execute("SELECT parent_hash FROM edges WHERE child_hash = ?", (node_b.commit_hash,))
+            .fetchone()
+        )
+        assert edge["parent_hash"] == node_a.commit_hash
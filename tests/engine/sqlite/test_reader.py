@@ -68,6 +68,48 @@ class TestSQLiteHistoryReader:
         assert node_a.children == [node_b]
         assert node_b.input_tree == node_a.output_tree
 
+    def test_load_graph_store_builds_columns_from_rows(self, sqlite_reader_setup):
+        reader, git_writer, hydrator, _, repo, git_db = sqlite_reader_setup
+        (repo / "a.txt").touch()
+        hash_a = git_db.get_tree_hash()
+        node_a = git_writer.create_node("plan", "4b825dc642cb6eb9a060e54bf8d69288fbee4904", hash_a, "Content A")
+        (repo / "b.txt").touch()
+        node_b = git_writer.create_node("plan", hash_a, git_db.get_tree_hash(), "Content B")
+        hydrator.sync("test-user")
+
+        store = reader.load_graph_store()
+        assert len(store) == 2 and len(store._views) == 0
+
+        view_b = store[node_b.commit_hash]
+        assert (view_b.summary, view_b.owner_id, view_b.input_tree) == ("Content B", "test-user", hash_a)
+        assert view_b.parent is store[node_a.commit_hash]
+        # 内容不随图加载，由 get_contents 按需读取
+        assert view_b.content == ""
+        assert reader.get_node_content(view_b) == "Content B"
+
+    def test_ancestry_index_refreshes_when_rowids_are_reused(self, sqlite_reader_setup):
+        """删除最后一个节点再写入新节点会复用 rowid，行数与最大 rowid 都不变，索引仍需重建。"""
+        reader, git_writer, hydrator, db_manager, repo, git_db = sqlite_reader_setup
+        (repo / "a.txt").touch()
+        hash_a = git_db.get_tree_hash()
+        node_a = git_writer.create_node("plan", "4b825dc642cb6eb9a060e54bf8d69288fbee4904", hash_a, "A")
+        (repo / "b.txt").touch()
+        node_b = git_writer.create_node("plan", hash_a, git_db.get_tree_hash(), "B")
+        hydrator.sync("test-user")
+
+        index = reader.get_ancestry_index()
+        assert reader.get_ancestry_index() is index
+        generation = db_manager.get_graph_generation()
+
+        db_manager.execute_write("DELETE FROM nodes WHERE commit_hash = ?", (node_b.commit_hash,))
+        replacement = ("c" * 40, "test-user", "d" * 40, "plan", 0.0, "C", "test", "{}", None)
+        db_manager.batch_insert_nodes([replacement])
+        db_manager.batch_insert_edges([("c" * 40, node_a.commit_hash)])
+
+        assert db_manager.get_graph_generation() == generation + 3
+        assert reader.get_ancestry_index() is not index
+        assert reader.get_reachable_output_trees(hash_a) == {hash_a, "d" * 40}
+
     def test_read_through_cache(self, sqlite_reader_setup):
         """测试通读缓存是否能正确工作（从未缓存到已缓存）。"""
         reader, git_writer, hydrator, db_manager, repo, git_db = sqlite_reader_setup
@@ -105,6 +147,109 @@ class TestSQLiteHistoryReader:
         row_after = cursor_after.fetchone()
         assert row_after["plan_md_cache"] == "Cache Test Content", "Cache was not written back to DB."
 
+    def test_get_contents_backfills_in_one_transaction(self, sqlite_reader_setup, monkeypatch):
+        """测试批量读取内容时，未缓存的节点通过一次 executemany 回填。"""
+        reader, git_writer, hydrator, db_manager, repo, git_db = sqlite_reader_setup
+        tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        for i in range(3):
+            (repo / f"{i}.txt").touch()
+            new_tree = git_db.get_tree_hash()
+            git_writer.create_node("plan", tree, new_tree, f"Batch {i}")
+            tree = new_tree
+        hydrator.sync("test-user")
+
+        nodes = reader.load_all_nodes()
+        assert not any(node.content for node in nodes)
+
+        batches = []
+        original = db_manager.batch_update_contents
+        monkeypatch.setattr(
+            db_manager, "batch_update_contents", lambda entries: batches.append(len(entries)) or original(entries)
+        )
+        reader.prefetch_contents(nodes)
+
+        assert batches == [3]
+        assert sorted(node.content for node in nodes) == ["Batch 0", "Batch 1", "Batch 2"]
+        rows = db_manager._get_conn().execute("SELECT plan_md_cache FROM nodes ORDER BY plan_md_cache").fetchall()
+        assert [row[0] for row in rows] == ["Batch 0", "Batch 1", "Batch 2"]
+
+        # 新加载的节点直接从缓存获得内容，不再访问 Git
+        fresh = reader.load_all_nodes()
+        assert reader.get_contents(fresh) == {node.commit_hash: node.content for node in nodes}
+        assert batches == [3]
+
+
+class TestSQLiteFullTextSearch:
+    def _populate(self, reader, git_writer, hydrator, repo, git_db):
+        tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        contents = [
+            "Fix login timeout\n\nRaise the retry backoff for the 登录接口.",
+            "Refactor parser\n\nSplit tokenizer from the grammar rules.",
+            "Update docs\n\nMention the retry backoff in the FAQ.",
+        ]
+        for i, content in enumerate(contents):
+            (repo / f"{i}.txt").touch()
+            time.sleep(0.01)
+            new_tree = git_db.get_tree_hash()
+            git_writer.create_node("plan", tree, new_tree, content)
+            tree = new_tree
+        hydrator.sync("test-user")
+        return {node.summary: node for node in reader.load_all_nodes()}
+
+    def test_backfilled_content_becomes_searchable(self, sqlite_reader_setup):
+        reader, git_writer, hydrator, _, repo, git_db = sqlite_reader_setup
+        nodes = self._populate(reader, git_writer, hydrator, repo, git_db)
+        # 补水得到的冷节点尚未缓存内容，只有摘要可以命中
+        assert reader.search_nodes("tokenizer") == []
+        assert len(reader.search_nodes("parser")) == 1
+
+        reader.prefetch_contents(list(nodes.values()))
+
+        hits = reader.search_nodes("tokenizer", highlight=("<", ">"))
+        assert len(hits) == 1
+        assert "<tokenizer>" in hits[0].snippet
+        assert hits[0].node.summary == "Refactor parser"
+
+    def test_search_ranks_and_filters(self, sqlite_reader_setup):
+        reader, git_writer, hydrator, db_manager, repo, git_db = sqlite_reader_setup
+        nodes = self._populate(reader, git_writer, hydrator, repo, git_db)
+        reader.prefetch_contents(list(nodes.values()))
+
+        hits = reader.search_nodes("retry backoff")
+        assert {hit.node.summary for hit in hits} == {"Fix login timeout", "Update docs"}
+        assert hits[0].score >= hits[1].score
+
+        assert [h.node.summary for h in reader.search_nodes("retry", summary_regex="^update")] == ["Update docs"]
+        assert reader.search_nodes("retry", node_type="capture") == []
+        # 少于 3 个字符的词 (含中文) 退化为 REGEXP 扫描
+        assert [h.node.summary for h in reader.search_nodes("登录")] == ["Fix login timeout"]
+
+        # 私有意图通过触发器进入索引
+        docs = nodes["Update docs"]
+        db_manager.execute_write(
+            "INSERT INTO private_data (node_hash, intent_md) VALUES (?, ?)", (docs.commit_hash, "clarify onboarding")
+        )
+        assert [h.node.commit_hash for h in reader.search_nodes("onboarding")] == [docs.commit_hash]
+
+    def test_reindex_restores_index(self, sqlite_reader_setup):
+        reader, git_writer, hydrator, db_manager, repo, git_db = sqlite_reader_setup
+        self._populate(reader, git_writer, hydrator, repo, git_db)
+        db_manager.execute_write("DELETE FROM nodes_fts")
+        assert reader.search_nodes("parser") == []
+
+        assert db_manager.rebuild_fulltext_index() == 3
+        assert [h.node.summary for h in reader.search_nodes("parser")] == ["Refactor parser"]
+
+    def test_find_nodes_uses_real_regex(self, sqlite_reader_setup):
+        reader, git_writer, hydrator, _, repo, git_db = sqlite_reader_setup
+        self._populate(reader, git_writer, hydrator, repo, git_db)
+
+        assert [n.summary for n in reader.find_nodes(summary_regex="^(fix|update) ")] == [
+            "Update docs",
+            "Fix login timeout",
+        ]
+        assert reader.find_nodes(summary_regex="(") == []
+
 
 @pytest.fixture(scope="class")
 def populated_db(tmp_path_factory):
@@ -207,3 +352,12 @@ class TestSQLiteReaderPaginated:
         assert output_tree_hashes[0] in ancestor_output_trees
         assert output_tree_hashes[13] in ancestor_output_trees
         assert output_tree_hashes[14] not in ancestor_output_trees  # Should not contain itself
+
+    def test_reachable_set_uses_cached_index(self, populated_db):
+        reader, _, _, output_tree_hashes = populated_db
+        descendants = reader.get_descendant_output_trees(output_tree_hashes[5])
+        assert descendants == set(output_tree_hashes[6:])
+
+        index = reader.get_ancestry_index()
+        assert reader.get_ancestry_index() is index
+        assert reader.get_reachable_output_trees(output_tree_hashes[5]) == set(output_tree_hashes)
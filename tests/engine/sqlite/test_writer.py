@@ -6,6 +6,7 @@ from pyquipu.engine.git_db import GitDB
 from pyquipu.engine.git_object_storage import GitObjectHistoryWriter
 from pyquipu.engine.sqlite_db import DatabaseManager
 from pyquipu.engine.sqlite_storage import SQLiteHistoryWriter
+from pyquipu.interfaces.models import ImportRecord
 
 
 @pytest.fixture
@@ -93,3 +94,64 @@ class TestSQLiteWriterIntegration:
         assert edge_row["parent_hash"] == commit_hash_a, "The edge should point to Node A."
 
         db_manager.close()
+
+    def test_import_nodes_hydrates_in_one_batch(self, sqlite_setup, monkeypatch):
+        """验证批量导入只调用一次节点与边的批量插入。"""
+        writer, db_manager, git_db, ws = sqlite_setup
+        (ws / "a.txt").write_text("A")
+        tree_a = git_db.get_tree_hash()
+
+        calls = []
+        original_nodes = db_manager.batch_insert_nodes
+        monkeypatch.setattr(
+            db_manager, "batch_insert_nodes", lambda rows: calls.append(len(rows)) or original_nodes(rows)
+        )
+
+        records = [ImportRecord(key="n0", node_type="plan", content="Plan 0", output_tree=tree_a)]
+        records += [
+            ImportRecord(key=f"n{i}", node_type="plan", content=f"Plan {i}", parent=f"n{i - 1}") for i in range(1, 5)
+        ]
+        nodes = writer.import_nodes(records, owner_id="tester")
+
+        assert calls == [5]
+        conn = db_manager._get_conn()
+        rows = conn.execute("SELECT commit_hash, owner_id, plan_md_cache FROM nodes").fetchall()
+        assert {r["commit_hash"] for r in rows} == {n.commit_hash for n in nodes}
+        assert all(r["owner_id"] == "tester" for r in rows)
+        edge = conn.execute("SELECT parent_hash FROM edges WHERE child_hash = ?", (nodes[-1].commit_hash,)).fetchone()
+        assert edge["parent_hash"] == nodes[-2].commit_hash
+        db_manager.close()
+
+    def test_compact_captures_rewrites_rows_in_one_transaction(self, sqlite_setup):
+        """验证捕获链压缩后，SQLite 中的节点、边与私有数据与 Git 保持一致。"""
+        writer, db_manager, git_db, ws = sqlite_setup
+        trees = []
+        for name in ["a", "b", "c", "d"]:
+            (ws / f"{name}.txt").write_text(name)
+            trees.append(git_db.get_tree_hash())
+
+        records = [ImportRecord(key="root", node_type="plan", content="Root", output_tree=trees[0], timestamp=100)]
+        records += [
+            ImportRecord(key="c1", node_type="capture", content="", parent="root", output_tree=trees[1], timestamp=101),
+            ImportRecord(key="c2", node_type="capture", content="", parent="c1", output_tree=trees[2], timestamp=102),
+            ImportRecord(key="tip", node_type="plan", content="Tip", parent="c2", output_tree=trees[3], timestamp=103),
+        ]
+        root, c1, c2, tip = writer.import_nodes(records, owner_id="tester")
+        db_manager.execute_write(
+            "INSERT INTO private_data (node_hash, intent_md) VALUES (?, ?)", (tip.commit_hash, "intent")
+        )
+
+        result = writer.compact_captures(before=200, min_length=2, owner_id="tester")
+
+        merged = result.rewritten[c2.commit_hash]
+        new_tip = result.rewritten[tip.commit_hash]
+        conn = db_manager._get_conn()
+        rows = {r["commit_hash"]: r for r in conn.execute("SELECT * FROM nodes")}
+        assert set(rows) == {root.commit_hash, merged, new_tip}
+        assert rows[merged]["node_type"] == "capture" and rows[merged]["output_tree"] == trees[2]
+        assert rows[new_tip]["plan_md_cache"] == "Tip"
+        edges = {(r["child_hash"], r["parent_hash"]) for r in conn.execute("SELECT * FROM edges")}
+        assert edges == {(merged, root.commit_hash), (new_tip, merged)}
+        intent = conn.execute("SELECT intent_md FROM private_data WHERE node_hash = ?", (new_tip,)).fetchone()
+        assert intent["intent_md"] == "intent"
+        db_manager.close()
@@ -0,0 +1,93 @@
+import subprocess
+
+from pyquipu.engine.ancestry import AncestryIndex
+
+
+def _diamond():
+    # A -> B -> D
+    #   \-> C -/      E (与主干无关的另一条根)
+    return AncestryIndex(
+        [
+            ("a", "ta", ()),
+            ("b", "tb", ("a",)),
+            ("c", "tc", ("a",)),
+            ("d", "td", ("b", "c")),
+            ("e", "te", ("missing",)),
+        ]
+    )
+
+
+class TestAncestryIndex:
+    def test_generation_numbers(self):
+        index = _diamond()
+        assert index.generation("a") == 1
+        assert index.generation("b") == 2
+        assert index.generation("d") == 3
+        # 父节点不在索引内时视为根节点
+        assert index.generation("e") == 1
+        assert index.generation("zzz") is None
+
+    def test_is_ancestor(self):
+        index = _diamond()
+        assert index.is_ancestor("a", "d")
+        assert index.is_ancestor("c", "d")
+        assert index.is_ancestor("d", "d")
+        assert not index.is_ancestor("d", "a")
+        assert not index.is_ancestor("b", "c")
+        assert not index.is_ancestor("a", "e")
+        assert not index.is_ancestor("a", "unknown")
+
+    def test_ancestors_and_descendants(self):
+        index = _diamond()
+        assert index.ancestors("d") == {"a", "b", "c"}
+        assert index.descendants("a") == {"b", "c", "d"}
+        assert index.descendants("e") == set()
+
+    def test_output_tree_queries(self):
+        index = _diamond()
+        assert index.ancestor_output_trees("tb") == {"ta"}
+        assert index.descendant_output_trees("tb") == {"td"}
+        assert index.reachable_output_trees("tb") == {"ta", "tb", "td"}
+        assert index.reachable_output_trees("unknown") == {"unknown"}
+
+    def test_deep_history_does_not_recurse(self):
+        entries = [("c0", "t0", ())] + [(f"c{i}", f"t{i}", (f"c{i - 1}",)) for i in range(1, 50_000)]
+        index = AncestryIndex(entries)
+        assert index.generation("c49999") == 50_000
+        assert index.is_ancestor("c0", "c49999")
+        assert len(index.ancestor_output_trees("t49999")) == 49_999
+
+
+class TestReaderAncestryIndex:
+    def test_git_reader_index_follows_refs(self, engine_instance):
+        engine = engine_instance
+        repo = engine.root_dir
+        reader = engine.reader
+
+        (repo / "a.txt").write_text("a")
+        node_a = engine.capture_drift(engine.git_db.get_tree_hash())
+        (repo / "b.txt").write_text("b")
+        node_b = engine.capture_drift(engine.git_db.get_tree_hash())
+
+        index = reader.get_ancestry_index()
+        assert index.is_ancestor(node_a.commit_hash, node_b.commit_hash)
+        assert reader.get_ancestry_index() is index
+        assert reader.get_reachable_output_trees(node_a.output_tree) == {node_a.output_tree, node_b.output_tree}
+
+        # 新节点会移动 refs，索引随之重建
+        (repo / "c.txt").write_text("c")
+        node_c = engine.capture_drift(engine.git_db.get_tree_hash())
+        assert reader.get_ancestry_index() is not index
+        assert reader.get_descendant_output_trees(node_a.output_tree) == {node_b.output_tree, node_c.output_tree}
+
+    def test_write_commit_graph(self, engine_instance):
+        engine = engine_instance
+        repo = engine.root_dir
+        assert engine.git_db.write_commit_graph() == 0
+
+        (repo / "a.txt").write_text("a")
+        engine.capture_drift(engine.git_db.get_tree_hash())
+        assert engine.git_db.write_commit_graph() >= 1
+
+        result = subprocess.run(["git", "commit-graph", "verify"], cwd=repo, capture_output=True)
+        assert result.returncode == 0
@@ -42,9 +42,9 @@ def test_branching_creation(branching_env):
     # 2. Node B (Child of A)
     (repo / "f.txt").write_text("v2")
     hash_b = git_db.get_tree_hash()
-    writer.create_node("plan", hash_a, hash_b, "Node B")
+    node_b = writer.create_node("plan", hash_a, hash_b, "Node B")
     heads_after_b = git_db.get_all_ref_heads(ref_prefix)
-    assert len(heads_after_b) == 2, "创建子节点后，父节点的 head 不应被删除"
+    assert [c for c, _ in heads_after_b] == [node_b.commit_hash], "创建子节点后，父节点的 head 应被压缩掉"
 
     # 3. Branching: Create C from A (Simulate Checkout A then Save C)
     (repo / "f.txt").write_text("v3")
@@ -53,7 +53,7 @@ def test_branching_creation(branching_env):
 
     # 4. Verify Branching State
     heads_after_c = git_db.get_all_ref_heads(ref_prefix)
-    assert len(heads_after_c) == 3, "创建分支节点后，所有节点都应是独立的 head"
+    assert len(heads_after_c) == 2, "引用数量应与叶子数量一致 (B 与 C)"
 
     # 5. Verify Reader sees all and relationships are correct
     nodes = reader.load_all_nodes()
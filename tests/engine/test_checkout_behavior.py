@@ -1,3 +1,4 @@
+import os
 import subprocess
 import time
 from pathlib import Path
@@ -112,3 +113,86 @@ class TestCheckoutBehavior:
         assert mtime_after == mtime_before, "Unchanged file was touched! Optimization failed."
 
         assert changing_file.read_text() == "v2", "Changed file was not updated."
+
+
+def _populate_a(repo: Path):
+    (repo / "keep.txt").write_text("constant")
+    (repo / "mod.txt").write_text("v1")
+    (repo / "gone.txt").write_text("bye")
+    (repo / "dir").mkdir()
+    (repo / "dir" / "nested.txt").write_text("nested")
+    (repo / "run.sh").write_text("#!/bin/sh\n")
+    (repo / "node").write_text("file that becomes a directory")
+
+
+def _mutate_to_b(repo: Path):
+    (repo / "mod.txt").write_text("v2")
+    (repo / "gone.txt").unlink()
+    (repo / "dir" / "nested.txt").unlink()
+    (repo / "dir").rmdir()
+    (repo / "dir").write_text("directory that became a file")
+    (repo / "run.sh").chmod(0o755)
+    (repo / "node").unlink()
+    (repo / "node" / "deep").mkdir(parents=True)
+    (repo / "node" / "deep" / "leaf.txt").write_text("leaf")
+    (repo / "link").symlink_to("keep.txt")
+    (repo / "new.txt").write_text("new")
+
+
+class TestTargetedCheckout:
+    def _prepare(self, repo: Path, db: GitDB):
+        _populate_a(repo)
+        hash_a = db.get_tree_hash()
+        _mutate_to_b(repo)
+        hash_b = db.get_tree_hash()
+        # 全量检出一次，使工作区与索引都处于状态 A
+        db.checkout_tree(hash_a)
+        return hash_a, hash_b
+
+    def test_round_trip_matches_full_checkout(self, git_env, monkeypatch):
+        repo, db = git_env
+        hash_a, hash_b = self._prepare(repo, db)
+
+        calls = []
+        original_run = db._run
+        monkeypatch.setattr(db, "_run", lambda args, **kw: calls.append(args[0]) or original_run(args, **kw))
+
+        assert db.checkout_tree(hash_b, old_tree_hash=hash_a) == 9
+        assert "clean" not in calls and "read-tree" not in calls
+        assert db.get_tree_hash() == hash_b
+        assert (repo / "dir").read_text() == "directory that became a file"
+        assert (repo / "node" / "deep" / "leaf.txt").read_text() == "leaf"
+        assert (repo / "link").is_symlink() and (repo / "run.sh").stat().st_mode & 0o100
+        assert db._run(["write-tree"]).stdout.strip() == hash_b
+
+        assert db.checkout_tree(hash_a, old_tree_hash=hash_b) == 9
+        assert db.get_tree_hash() == hash_a
+        assert (repo / "dir" / "nested.txt").read_text() == "nested"
+        assert not (repo / "new.txt").exists() and not (repo / "run.sh").stat().st_mode & 0o100
+        status = subprocess.check_output(["git", "status", "--porcelain"], cwd=repo, text=True)
+        assert "??" not in status
+
+    def test_untouched_files_keep_mtime(self, git_env):
+        repo, db = git_env
+        hash_a, hash_b = self._prepare(repo, db)
+        past = time.time() - 60
+        os.utime(repo / "keep.txt", (past, past))
+        db.checkout_tree(hash_b, old_tree_hash=hash_a)
+        assert (repo / "keep.txt").stat().st_mtime == pytest.approx(past)
+
+    def test_drifted_workspace_falls_back_to_full_checkout(self, git_env, monkeypatch):
+        repo, db = git_env
+        hash_a, hash_b = self._prepare(repo, db)
+        (repo / "untracked.txt").write_text("drift")
+
+        monkeypatch.setattr("pyquipu.engine.git_db.WorkspaceUpdater.apply", lambda *a: pytest.fail("not targeted"))
+        assert db.checkout_tree(hash_b, old_tree_hash=hash_a) is None
+        assert not (repo / "untracked.txt").exists()
+        assert db.get_tree_hash() == hash_b
+
+    def test_disabled_by_flag(self, git_env):
+        repo, _ = git_env
+        db = GitDB(repo, targeted_checkout=False)
+        hash_a, hash_b = self._prepare(repo, db)
+        assert db.checkout_tree(hash_b, old_tree_hash=hash_a) is None
+        assert db.get_tree_hash() == hash_b
@@ -49,12 +49,10 @@ def test_capture_drift_git_object(engine_instance: Engine):
     assert capture_node.node_type == "capture"
     assert capture_node.input_tree == initial_hash
 
-    # Key Assertion: Verify that two distinct head refs now exist
+    # Key Assertion: 父节点已不是叶子，只保留新节点的 head 引用
     heads_cmd = ["git", "for-each-ref", "--format=%(objectname)", "refs/quipu/local/heads/"]
     all_heads = set(subprocess.check_output(heads_cmd, cwd=repo_path, text=True).strip().splitlines())
-    assert len(all_heads) == 2, "应该存在两个独立的 head 引用"
-    assert initial_node.commit_hash in all_heads
-    assert capture_node.commit_hash in all_heads
+    assert all_heads == {capture_node.commit_hash}, "引用数量应与叶子数量一致"
 
     # Verify the new commit has the correct parent
     parent_of_capture = (
@@ -1,9 +1,11 @@
+import os
 import subprocess
+import time
 from pathlib import Path
 from unittest.mock import MagicMock
 
 import pytest
-from pyquipu.engine.git_db import GitDB
+from pyquipu.engine.git_db import GitDB, parse_log_stream
 
 
 @pytest.fixture
@@ -86,6 +88,312 @@ class TestGitDBPlumbing:
 
         assert hash_base == hash_new
 
+    def test_persistent_shadow_index_reused(self, git_repo, monkeypatch):
+        """测试：持久化影子索引只在首次使用时播种，之后跨实例复用"""
+        subprocess.run(["git", "config", "core.autocrlf", "input"], cwd=git_repo, check=True)
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        subprocess.run(["git", "add", "a.txt"], cwd=git_repo, check=True)
+
+        first = GitDB(git_repo).get_tree_hash()
+        shadow_index = git_repo / ".git" / "quipu" / "shadow_index"
+        assert shadow_index.exists()
+
+        copies = []
+        monkeypatch.setattr("pyquipu.engine.git_db.shutil.copy2", lambda *args: copies.append(args))
+        (git_repo / "b.txt").write_text("b", encoding="utf-8")
+        second = GitDB(git_repo).get_tree_hash()
+
+        assert second != first
+        assert copies == []
+        assert second == GitDB(git_repo, persistent_index=False).get_tree_hash()
+        # 用户暂存区不受影响
+        staged = subprocess.check_output(["git", "diff", "--cached", "--name-only"], cwd=git_repo).decode()
+        assert staged.split() == ["a.txt"]
+
+    def test_persistent_shadow_index_recovers_from_corruption(self, git_repo):
+        """测试：损坏的持久化影子索引会被丢弃并重新播种"""
+        subprocess.run(["git", "config", "core.autocrlf", "input"], cwd=git_repo, check=True)
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        db = GitDB(git_repo)
+        expected = db.get_tree_hash()
+
+        (git_repo / ".git" / "quipu" / "shadow_index").write_bytes(b"DIRC garbage")
+        assert db.get_tree_hash() == expected
+
+    def test_persistent_shadow_index_reseeds_on_layout_change(self, git_repo, monkeypatch):
+        subprocess.run(["git", "config", "core.autocrlf", "input"], cwd=git_repo, check=True)
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        GitDB(git_repo).get_tree_hash()
+
+        meta_path = git_repo / ".git" / "quipu" / "shadow_index.json"
+        meta_path.write_text('{"version": 1, "root": "/elsewhere", "sparse": "false"}', encoding="utf-8")
+
+        seeded = []
+        db = GitDB(git_repo)
+        original = db._seed_shadow_index
+        monkeypatch.setattr(db, "_seed_shadow_index", lambda path: (seeded.append(path), original(path)))
+        db.get_tree_hash()
+        assert len(seeded) == 1
+
+    def test_persistent_shadow_index_reseeds_when_user_index_changes(self, git_repo, monkeypatch):
+        """测试：用户暂存区变化 (例如 git add) 后，持久化影子索引从新的用户索引重新播种"""
+        subprocess.run(["git", "config", "core.autocrlf", "input"], cwd=git_repo, check=True)
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        GitDB(git_repo).get_tree_hash()
+
+        seeded = []
+        db = GitDB(git_repo)
+        original = db._seed_shadow_index
+        monkeypatch.setattr(db, "_seed_shadow_index", lambda path: (seeded.append(path), original(path)))
+        db.get_tree_hash()
+        assert seeded == []
+
+        subprocess.run(["git", "add", "a.txt"], cwd=git_repo, check=True)
+        db.get_tree_hash()
+        assert len(seeded) == 1
+
+    def test_output_tree_index_discovers_external_refs(self, git_repo, db):
+        """测试：其他进程 (或 fetch) 写入的 quipu 引用会在下一次查询时被增量索引"""
+        output_tree = db.mktree(f"100644 blob {db.hash_object(b'x')}\tx.txt")
+        assert db.get_commit_by_output_tree(output_tree) is None
+
+        other = GitDB(git_repo)
+        commit = other.commit_tree(
+            db.mktree(f"040000 tree {output_tree}\tsnapshot"), None, f"s\n\nX-Quipu-Output-Tree: {output_tree}"
+        )
+        other.update_ref(f"refs/quipu/local/heads/{commit}", commit)
+
+        assert db.get_commit_by_output_tree(output_tree) == commit
+
+    def test_output_tree_index_walk_stays_incremental_with_head_compaction(self, git_repo, db, monkeypatch):
+        """测试：父节点 head 被压缩删除后，已索引的 commit 仍是遍历边界，每次写入只遍历新的 commit"""
+        from pyquipu.engine.git_object_storage import GitObjectHistoryWriter
+
+        writer = GitObjectHistoryWriter(db)
+        walked = []
+        original_scan = db._scan_output_trees
+
+        def spy(heads, exclude):
+            entries = original_scan(heads, exclude)
+            walked.append(len(entries))
+            return entries
+
+        monkeypatch.setattr(db, "_scan_output_trees", spy)
+        input_tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        for i in range(12):
+            (git_repo / "f.txt").write_text(str(i), encoding="utf-8")
+            output_tree = db.get_tree_hash()
+            writer.create_node("capture", input_tree, output_tree, f"n{i}")
+            assert db.get_commit_by_output_tree(output_tree) is not None
+            input_tree = output_tree
+
+        assert len(db.get_all_ref_heads("refs/quipu/local/heads/")) == 1
+        assert max(walked) <= 1
+
+    def test_output_tree_index_ignores_user_branches(self, git_repo, db):
+        """测试：索引只覆盖 refs/quipu，普通分支上的同名 trailer 不参与匹配"""
+        tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        commit = db.commit_tree(tree, None, f"user commit\n\nX-Quipu-Output-Tree: {tree}")
+        db.update_ref("refs/heads/feature", commit)
+        assert db.get_commit_by_output_tree(tree) is None
+
+    def test_output_tree_index_drops_pruned_commits(self, git_repo, db):
+        tree = db.mktree(f"100644 blob {db.hash_object(b'y')}\ty.txt")
+        db.index_output_tree(tree, "0" * 40)
+        assert db.get_commit_by_output_tree(tree) is None
+        assert db._cache.find_commits_by_output_tree(tree) == []
+
+    def test_refs_fingerprint_tracks_updates(self, git_repo, db):
+        before = db.get_refs_fingerprint()
+        commit = db.commit_tree("4b825dc642cb6eb9a060e54bf8d69288fbee4904", None, "fp")
+        db.update_ref("refs/quipu/local/heads/a", commit)
+        after_create = db.get_refs_fingerprint()
+        assert after_create != before
+
+        subprocess.run(["git", "pack-refs", "--all"], cwd=git_repo, check=True)
+        assert db.get_refs_fingerprint() != after_create
+
+    def test_ref_transaction_is_atomic(self, git_repo, db):
+        """测试：事务中的任一命令失败时，所有引用都保持原状"""
+        c1 = db.commit_tree("4b825dc642cb6eb9a060e54bf8d69288fbee4904", None, "c1")
+        c2 = db.commit_tree("4b825dc642cb6eb9a060e54bf8d69288fbee4904", [c1], "c2")
+        db.update_ref("refs/quipu/local/heads/a", c1)
+
+        with pytest.raises(RuntimeError):
+            with db.ref_transaction() as txn:
+                txn.update("refs/quipu/local/heads/b", c2)
+                txn.delete("refs/quipu/local/heads/a", old_hash=c2)  # 旧值不匹配
+
+        assert [ref for _, ref in db.get_all_ref_heads("refs/quipu/")] == ["refs/quipu/local/heads/a"]
+
+        with db.ref_transaction() as txn:
+            txn.update("refs/quipu/local/heads/b", c2)
+            txn.delete("refs/quipu/local/heads/a", old_hash=c1)
+            txn.delete("refs/quipu/local/heads/missing")
+        assert db.get_all_ref_heads("refs/quipu/") == [(c2, "refs/quipu/local/heads/b")]
+
+    def test_reconcile_and_prune_use_single_update_ref(self, git_repo, db, monkeypatch):
+        """测试：同步对齐与修剪各自只 fork 一次 update-ref，且不再逐个 rev-parse"""
+        empty = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        commits = [db.commit_tree(empty, None, f"c{i}") for i in range(5)]
+        remote_prefix = "refs/quipu/remotes/origin/alice/heads/"
+        for c in commits[:3]:
+            db.update_ref(remote_prefix + c, c)
+        for c in commits[2:]:
+            db.update_ref(f"refs/quipu/local/heads/{c}", c)
+
+        calls = []
+        original_run = db._run
+
+        def tracking_run(args, **kwargs):
+            calls.append(args[0])
+            return original_run(args, **kwargs)
+
+        monkeypatch.setattr(db, "_run", tracking_run)
+
+        db.reconcile_local_with_remote("origin", "alice")
+        assert calls.count("update-ref") == 1
+        assert "rev-parse" not in calls
+
+        calls.clear()
+        db.prune_local_from_remote("origin", "alice")
+        assert calls.count("update-ref") == 1
+
+        local = {ref.rsplit("/", 1)[1] for _, ref in db.get_all_ref_heads("refs/quipu/local/heads/")}
+        assert local == set(commits[:3])
+
+    def test_fetch_all_subscriptions_in_one_call(self, git_repo, db, tmp_path, monkeypatch):
+        """测试：所有订阅用户的 refspec 在一次 git fetch 中完成"""
+        remote = tmp_path / "remote.git"
+        subprocess.run(["git", "init", "--bare", str(remote)], check=True, capture_output=True)
+        empty = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        users = ["alice", "bob", "carol"]
+        for user in users:
+            c = db.commit_tree(empty, None, user)
+            subprocess.run(
+                ["git", "push", "-q", str(remote), f"{c}:refs/quipu/users/{user}/heads/{c}"],
+                cwd=git_repo,
+                check=True,
+            )
+        subprocess.run(["git", "remote", "add", "origin", str(remote)], cwd=git_repo, check=True)
+
+        calls = []
+        original_run = db._run
+
+        def tracking_run(args, **kwargs):
+            calls.append(args[0])
+            return original_run(args, **kwargs)
+
+        monkeypatch.setattr(db, "_run", tracking_run)
+
+        db.fetch_quipu_refs("origin", users)
+        assert calls.count("fetch") == 1
+        fetched = db.get_all_ref_heads("refs/quipu/remotes/origin/")
+        assert {ref.split("/")[4] for _, ref in fetched} == set(users)
+
+        # 同一个远程以两个名字出现时并发拉取，分别写入各自的命名空间
+        subprocess.run(["git", "remote", "add", "backup", str(remote)], cwd=git_repo, check=True)
+        timings = db.fetch_quipu_refs_from_remotes(["origin", "backup"], users, max_workers=2)
+        assert set(timings) == {"origin", "backup"}
+        assert len(db.get_all_ref_heads("refs/quipu/remotes/backup/")) == 3
+
+    def test_parallel_fetch_retries_lock_contention(self, git_repo, monkeypatch):
+        """测试：并发拉取争用引用锁时重试，浅拉取串行执行，ref_epoch 只推进一次"""
+        db = GitDB(git_repo)
+        real_sleep = time.sleep
+        monkeypatch.setattr(time, "sleep", lambda _: None)
+        attempts = []
+
+        def flaky_run(args, **kwargs):
+            attempts.append(args[-2])
+            if attempts.count(args[-2]) == 1:
+                raise RuntimeError("Git command failed\nerror: Unable to create '.git/packed-refs.lock': File exists.")
+
+        monkeypatch.setattr(db, "_run", flaky_run)
+        epoch = db.ref_epoch
+        db.fetch_quipu_refs_from_remotes(["origin", "backup"], ["alice"], max_workers=2)
+        assert sorted(attempts) == ["backup", "backup", "origin", "origin"]
+        assert db.ref_epoch == epoch + 1
+
+        active, peak = [0], [0]
+
+        def slow_run(args, **kwargs):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            real_sleep(0.05)
+            active[0] -= 1
+
+        monkeypatch.setattr(db, "_run", slow_run)
+        db.fetch_quipu_refs_from_remotes(["origin", "backup", "mirror"], ["alice"], max_workers=3, depth=1)
+        assert peak[0] == 1
+
+    def test_advance_head_compacts_parent_and_packs_periodically(self, git_repo):
+        """测试：新 head 取代父节点的 head，并且每写入 N 个 head 执行一次 pack-refs"""
+        db = GitDB(git_repo, pack_refs_interval=3)
+        empty = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        prefix = "refs/quipu/local/heads/"
+
+        parent = None
+        chain = []
+        for i in range(5):
+            commit = db.commit_tree(empty, [parent] if parent else None, f"c{i}")
+            db.advance_head(commit, parent)
+            chain.append(commit)
+            parent = commit
+            assert [c for c, _ in db.get_all_ref_heads(prefix)] == [commit]
+            if i == 2:
+                # 第 3 次写入后打包，loose 引用被移入 packed-refs
+                assert f"{prefix}{commit}" in (git_repo / ".git" / "packed-refs").read_text()
+                assert not (git_repo / ".git" / prefix / commit).exists()
+
+        # 之后父节点的 head 位于 packed-refs 中，也能被正确移除
+        assert chain[2] not in (git_repo / ".git" / "packed-refs").read_text()
+        assert db.get_all_ref_heads(prefix) == [(chain[4], prefix + chain[4])]
+
+        # 分支：从中间节点创建子节点后，两个叶子各有一个 head
+        branch = db.commit_tree(empty, [chain[1]], "branch")
+        db.advance_head(branch, chain[1])
+        assert {c for c, _ in db.get_all_ref_heads(prefix)} == {chain[4], branch}
+        db.close()
+
+    def test_reconcile_creates_only_leaf_heads(self, git_repo, db):
+        """测试：远程保留的历史 head 中，只为叶子创建本地引用，并移除被取代的本地 head"""
+        empty = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        c0 = db.commit_tree(empty, None, "c0")
+        c1 = db.commit_tree(empty, [c0], "c1")
+        c2 = db.commit_tree(empty, [c1], "c2")
+        remote_prefix = "refs/quipu/remotes/origin/alice/heads/"
+        for c in (c0, c1, c2):
+            db.update_ref(remote_prefix + c, c)
+        db.update_ref(f"refs/quipu/local/heads/{c1}", c1)
+
+        db.reconcile_local_with_remote("origin", "alice")
+
+        assert db.get_all_ref_heads("refs/quipu/local/heads/") == [(c2, f"refs/quipu/local/heads/{c2}")]
+
+    def test_git_calls_are_metered(self, git_repo, monkeypatch):
+        from pyquipu.engine.git_metrics import metrics
+
+        db = GitDB(git_repo, native_writer=False)
+        metrics.reset()
+        monkeypatch.setattr("os.environ.copy", lambda: pytest.fail("os.environ should not be copied"))
+        blob = db.hash_object(b"metered")
+        db.mktree(f"100644 blob {blob}\tm.txt")
+        db._run(["rev-parse", "--git-dir"], env={"GIT_TRACE": "0"})
+        db._cat_file_pool.read([blob])
+        db._cat_file_pool.read([blob])
+
+        stats = metrics.snapshot()
+        assert stats["hash-object"]["calls"] == 1
+        assert stats["mktree"]["bytes_in"] > 0
+        assert stats["mktree"]["bytes_out"] == 41
+        assert stats["rev-parse"]["calls"] == 1
+        assert stats["cat-file --batch"]["calls"] == 2
+        assert stats["cat-file --batch"]["spawns"] == 1
+        assert stats["cat-file --batch"]["bytes_out"] == 2 * len(b"metered")
+        GitDB(git_repo).close()
+        assert metrics.roots == [git_repo.resolve()]
+
     def test_anchor_commit_persistence(self, git_repo, db):
         """测试：创建影子锚点"""
         (git_repo / "f.txt").write_text("content")
@@ -168,6 +476,28 @@ class TestGitDBPlumbing:
         # 验证日志清洁度
         assert "Git plumbing error" not in caplog.text
 
+    def test_is_ancestor_uses_index_for_quipu_history(self, git_repo, db, monkeypatch):
+        """测试：refs/quipu 下的 commit 由祖先索引回答，不再逐次 fork merge-base"""
+        empty = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        c1 = db.commit_tree(empty, None, "c1")
+        c2 = db.commit_tree(empty, [c1], "c2")
+        c3 = db.commit_tree(empty, [c1], "c3")
+        db.update_ref(f"refs/quipu/local/heads/{c2}", c2)
+        db.update_ref(f"refs/quipu/local/heads/{c3}", c3)
+
+        calls = []
+        original_run = db._run
+        monkeypatch.setattr(db, "_run", lambda args, **kw: calls.append(args[0]) or original_run(args, **kw))
+
+        assert db.is_ancestor(c1, c2) and db.is_ancestor(c2, c2)
+        assert not db.is_ancestor(c2, c1) and not db.is_ancestor(c2, c3)
+        assert "merge-base" not in calls
+        assert db.get_ancestry_index() is db.get_ancestry_index()
+
+        c4 = db.commit_tree(empty, [c3], "c4")
+        db.update_ref(f"refs/quipu/local/heads/{c4}", c4)
+        assert db.is_ancestor(c1, c4)
+
     def test_checkout_tree(self, git_repo: Path, db: GitDB):
         """Test the low-level hard reset functionality of checkout_tree."""
         # 1. Create State A
@@ -229,6 +559,43 @@ class TestGitDBPlumbing:
         assert "D" == changes_dict.get("deleted.txt")
         assert len(changes) == 3
 
+    def test_diff_results_are_cached(self, git_repo: Path, db: GitDB, monkeypatch):
+        (git_repo / "a.txt").write_text("line\n", "utf-8")
+        hash_a = db.get_tree_hash()
+        (git_repo / "a.txt").write_text("line\nmore\n", "utf-8")
+        (git_repo / "b.bin").write_bytes(b"\x00\x01")
+        hash_b = db.get_tree_hash()
+
+        expected = (
+            db.get_diff_name_status(hash_a, hash_b),
+            db.get_diff_numstat(hash_a, hash_b),
+            db.get_diff_stat(hash_a, hash_b),
+        )
+        assert expected[1] == [(1, 0, "a.txt"), (None, None, "b.bin")]
+
+        # 新实例同样命中持久化缓存，不再启动 diff-tree
+        fresh = GitDB(git_repo)
+        monkeypatch.setattr(fresh, "_run", lambda args, **kw: pytest.fail(f"unexpected git call: {args}"))
+        assert fresh.get_diff_name_status(hash_a, hash_b) == expected[0]
+        assert fresh.get_diff_numstat(hash_a, hash_b) == expected[1]
+        assert fresh.get_diff_stat(hash_a, hash_b) == expected[2]
+
+    def test_diff_cache_is_lru_bounded(self, git_repo: Path):
+        db = GitDB(git_repo, diff_cache_size=2)
+        trees = []
+        for i in range(4):
+            (git_repo / "f.txt").write_text(str(i), "utf-8")
+            trees.append(db.get_tree_hash())
+
+        db.get_diff_numstat(trees[0], trees[1])
+        db.get_diff_numstat(trees[1], trees[2])
+        db.get_diff_numstat(trees[0], trees[1])  # 刷新使用时间
+        db.get_diff_numstat(trees[2], trees[3])
+
+        assert db._cache.get_diff(trees[0], trees[1], "numstat") is not None
+        assert db._cache.get_diff(trees[1], trees[2], "numstat") is None
+        assert db._cache.get_diff(trees[2], trees[3], "numstat") is not None
+
     def test_log_ref_basic(self, git_repo, db):
         """测试 log_ref 能正确解析 Git 日志格式"""
         # Create 3 commits
@@ -245,6 +612,38 @@ class TestGitDBPlumbing:
         assert "tree" in logs[0]
         assert "timestamp" in logs[0]
 
+    def test_iter_log_streams_entries(self, git_repo, db):
+        """iter_log 是惰性的生成器，并且提交信息中的任意文本都不会破坏解析"""
+        messages = ["plain", "---QUIPU-LOG-ENTRY---\ninside body", "\x1etrailing\n\nX-Quipu-Output-Tree: " + "a" * 40]
+        for i, message in enumerate(messages):
+            (git_repo / f"f{i}").touch()
+            subprocess.run(["git", "add", "."], cwd=git_repo, check=True)
+            subprocess.run(["git", "commit", "-q", "-m", message], cwd=git_repo, check=True)
+
+        stream = db.iter_log(["HEAD"])
+        first = next(stream)
+        assert first.body.strip() == messages[2].strip()
+        rest = list(stream)
+        assert [e.body.strip() for e in rest] == [messages[1], messages[0]]
+        assert rest[-1].parents == ()
+        assert first.parents == (rest[0].commit_hash,)
+        assert (
+            first.tree == subprocess.check_output(["git", "rev-parse", "HEAD^{tree}"], cwd=git_repo, text=True).strip()
+        )
+
+        # 排除已处理的 head 后，只返回新增的部分
+        assert [e.commit_hash for e in db.iter_log(["HEAD"], exclude=[rest[0].commit_hash])] == [first.commit_hash]
+
+    def test_parse_log_stream_handles_arbitrary_chunking(self):
+        record = b"%s\x00%s\x00%s %s\x00123\x00body\nline\n\x00" % (b"1" * 40, b"2" * 40, b"3" * 40, b"4" * 40)
+        data = record + record.replace(b"body", b"other")
+        for size in (1, 7, 64, len(data)):
+            chunks = [data[i : i + size] for i in range(0, len(data), size)]
+            entries = list(parse_log_stream(chunks))
+            assert [e.body for e in entries] == ["body\nline\n", "other\nline\n"]
+            assert entries[0].parents == ("3" * 40, "4" * 40)
+            assert entries[0].timestamp == 123
+
     def test_log_ref_non_existent(self, db):
         """测试读取不存在的引用返回空列表而不是报错"""
         logs = db.log_ref("refs/heads/non-existent")
@@ -294,3 +693,125 @@ class TestGitDBPlumbing:
         assert results[h1] == b"obj1"
         assert results[h2] == b"obj2"
         assert h3_missing not in results
+
+    def test_cat_file_pool_reuses_process(self, git_repo):
+        """测试 cat-file 协进程在多次读取之间被复用，并在 close 后退出"""
+        db = GitDB(git_repo, native_reader=False)
+        h1 = db.hash_object(b"pool-1")
+        h2 = db.hash_object(b"pool-2")
+
+        assert db.cat_file(h1, "blob") == b"pool-1"
+        process = db._cat_file_pool._get("--batch")
+        pid = process._proc.pid
+
+        assert db.batch_cat_file([h2]) == {h2: b"pool-2"}
+        assert db.cat_file(h2, "blob") == b"pool-2"
+        assert process._proc.pid == pid
+
+        proc = process._proc
+        db.close()
+        assert proc.poll() is not None
+
+        # close 之后仍可继续使用 (按需重启)
+        assert db.cat_file(h1, "blob") == b"pool-1"
+        db.close()
+
+    def test_cat_file_pool_recovers_from_dead_process(self, git_repo):
+        """测试协进程意外退出后会被自动重启"""
+        db = GitDB(git_repo, native_reader=False)
+        h1 = db.hash_object(b"survivor")
+        assert db.cat_file(h1, "blob") == b"survivor"
+
+        process = db._cat_file_pool._get("--batch")
+        process._proc.kill()
+        process._proc.wait()
+
+        assert db.batch_cat_file([h1]) == {h1: b"survivor"}
+        db.close()
+
+    def test_cat_file_dereferences_type(self, git_repo, db):
+        """测试 cat_file 与 `git cat-file <type>` 一致，可从 commit 解引用到 tree"""
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        tree_hash = db.get_tree_hash()
+        commit_hash = db.commit_tree(tree_hash, parent_hashes=None, message="peel")
+
+        assert db.cat_file(commit_hash, "tree") == db.cat_file(tree_hash, "tree")
+
+        with pytest.raises(RuntimeError):
+            db.cat_file("b" * 40, "blob")
+        db.close()
+
+    def test_batch_check_objects(self, db):
+        """测试 batch_check_objects 返回类型和大小，并忽略缺失对象"""
+        h1 = db.hash_object(b"12345")
+        missing = "c" * 40
+
+        results = db.batch_check_objects([h1, missing])
+
+        assert results == {h1: ("blob", 5)}
+        db.close()
+
+
+class TestNativeObjectWriter:
+    def _git(self, repo, *args, input_data=None, env=None):
+        return subprocess.run(
+            ["git", *args], cwd=repo, input=input_data, env=env, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    def test_mktree_matches_git(self, git_repo, db):
+        """测试：进程内 mktree 与 git mktree 产生字节一致的对象 (含排序与 040000 模式规范化)"""
+        blob = db.hash_object(b"data")
+        sub = db.mktree(f"100644 blob {blob}\tinner")
+        descriptor = (
+            f"100444 blob {blob}\tmetadata.json\n"
+            f"100755 blob {blob}\ta-b\n"
+            f"040000 tree {sub}\ta\n"
+            f"100644 blob {blob}\ta.b\n"
+            f"120000 blob {blob}\tlink\n"
+            f"040000 tree {sub}\tsnapshot"
+        )
+        native = db.mktree(descriptor)
+        assert native == self._git(git_repo, "mktree", input_data=descriptor)
+        assert self._git(git_repo, "cat-file", "-t", native) == "tree"
+
+    def test_mktree_falls_back_for_missing_objects(self, git_repo, db):
+        with pytest.raises(RuntimeError):
+            db.mktree(f"100644 blob {'d' * 40}\tmissing.txt")
+
+    def test_commit_tree_matches_git(self, git_repo, db):
+        """测试：进程内 commit-tree 与 git commit-tree 在相同时间戳下产生相同的 commit"""
+        tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        root = db.commit_tree(tree, None, "root")
+        message = "摘要\n\nX-Quipu-Output-Tree: " + tree
+        native = db.commit_tree(tree, [root, root], message)
+
+        header = db.cat_file(native, "commit").decode("utf-8")
+        date = header.split("\ncommitter ", 1)[1].split("\n", 1)[0].split("> ", 1)[1]
+        env = {**os.environ, "GIT_AUTHOR_DATE": date, "GIT_COMMITTER_DATE": date}
+        expected = self._git(git_repo, "commit-tree", tree, "-p", root, input_data=message, env=env)
+        assert native == expected
+
+    def test_commit_tree_falls_back_when_signing(self, git_repo, db):
+        subprocess.run(["git", "config", "commit.gpgsign", "true"], cwd=git_repo, check=True)
+        db = GitDB(git_repo)
+        assert db._native_commit_tree("4b825dc642cb6eb9a060e54bf8d69288fbee4904", None, "m") is None
+
+    def test_update_ref_writes_loose_ref(self, git_repo, db):
+        commit = db.commit_tree("4b825dc642cb6eb9a060e54bf8d69288fbee4904", None, "ref")
+        ref = f"refs/quipu/local/heads/{commit}"
+        db.update_ref(ref, commit)
+
+        assert (git_repo / ".git" / ref).read_text() == f"{commit}\n"
+        assert self._git(git_repo, "rev-parse", ref) == commit
+        assert not (git_repo / ".git" / "logs" / ref).exists()
+
+        lock = git_repo / ".git" / "refs" / "quipu" / "local" / "heads" / "held.lock"
+        lock.write_text("")
+        with pytest.raises(RuntimeError):
+            db.update_ref("refs/quipu/local/heads/held", commit)
+
+    def test_update_ref_falls_back_for_logged_refs(self, git_repo, db):
+        """测试：需要 reflog 的引用 (如 refs/heads) 交给 git 更新"""
+        commit = db.commit_tree("4b825dc642cb6eb9a060e54bf8d69288fbee4904", None, "branch")
+        db.update_ref("refs/heads/feature", commit)
+        assert (git_repo / ".git" / "logs" / "refs" / "heads" / "feature").exists()
@@ -0,0 +1,118 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+from pyquipu.engine.git_db import GitDB
+from pyquipu.engine.git_odb import NativeObjectStore, parse_tree_entries
+
+
+@pytest.fixture
+def git_repo(tmp_path: Path) -> Path:
+    root = tmp_path / "repo"
+    root.mkdir()
+    subprocess.run(["git", "init"], cwd=root, check=True, capture_output=True)
+    subprocess.run(["git", "config", "user.email", "test@quipu.dev"], cwd=root, check=True)
+    subprocess.run(["git", "config", "user.name", "Quipu Test"], cwd=root, check=True)
+    return root
+
+
+def _make_history(repo: Path, count: int = 12):
+    """创建一系列内容相近的提交，以便 repack 时产生 delta 对象"""
+    base = "\n".join(f"line {i} of a reasonably long shared file body" for i in range(200))
+    for i in range(count):
+        (repo / "data.txt").write_text(base + f"\nrevision {i}\n", encoding="utf-8")
+        (repo / f"note_{i % 3}.md").write_text(f"note {i}\n" * 20, encoding="utf-8")
+        subprocess.run(["git", "add", "-A"], cwd=repo, check=True)
+        subprocess.run(["git", "commit", "-q", "-m", f"commit {i}"], cwd=repo, check=True)
+
+
+def _all_objects(repo: Path):
+    out = subprocess.check_output(
+        ["git", "cat-file", "--batch-all-objects", "--batch-check=%(objectname) %(objecttype)"], cwd=repo
+    ).decode()
+    return [line.split() for line in out.splitlines()]
+
+
+def _assert_matches_git(repo: Path, store: NativeObjectStore):
+    objects = _all_objects(repo)
+    assert objects
+    for sha, obj_type in objects:
+        expected = subprocess.check_output(["git", "cat-file", obj_type, sha], cwd=repo)
+        assert store.read(sha) == (obj_type, expected)
+
+
+class TestNativeObjectStore:
+    def test_reads_loose_objects(self, git_repo):
+        _make_history(git_repo, count=3)
+        store = NativeObjectStore.open(git_repo / ".git")
+        assert store is not None
+        _assert_matches_git(git_repo, store)
+        store.close()
+
+    @pytest.mark.parametrize("use_ofs_delta", ["true", "false"])
+    def test_reads_packed_objects_with_deltas(self, git_repo, use_ofs_delta):
+        """测试通过 .idx 二分查找读取 packfile，并解析 OFS/REF delta"""
+        _make_history(git_repo)
+        subprocess.run(
+            ["git", "-c", f"repack.useDeltaBaseOffset={use_ofs_delta}", "repack", "-adf", "-q", "--depth=50"],
+            cwd=git_repo,
+            check=True,
+        )
+        assert not any((git_repo / ".git" / "objects").glob("[0-9a-f][0-9a-f]/*"))
+
+        store = NativeObjectStore.open(git_repo / ".git")
+        _assert_matches_git(git_repo, store)
+        assert store.read("0" * 40) is None
+        store.close()
+
+    def test_picks_up_packs_created_after_open(self, git_repo):
+        _make_history(git_repo, count=2)
+        store = NativeObjectStore.open(git_repo / ".git")
+        head = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=git_repo).decode().strip()
+        assert store.read(head)[0] == "commit"
+
+        subprocess.run(["git", "repack", "-adf", "-q"], cwd=git_repo, check=True)
+        subprocess.run(["git", "prune-packed"], cwd=git_repo, check=True)
+
+        assert store.read(head)[0] == "commit"
+        store.close()
+
+    def test_read_typed_dereferences_commit_to_tree(self, git_repo):
+        _make_history(git_repo, count=1)
+        store = NativeObjectStore.open(git_repo / ".git")
+        head = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=git_repo).decode().strip()
+        tree = subprocess.check_output(["git", "rev-parse", "HEAD^{tree}"], cwd=git_repo).decode().strip()
+
+        assert store.read_typed(head, "tree") == store.read(tree)[1]
+        assert store.read_typed(tree, "commit") is None
+        names = {name for _, name, _ in parse_tree_entries(store.read(tree)[1])}
+        assert names == {"data.txt", "note_0.md"}
+        store.close()
+
+    def test_unsupported_object_format_disables_reader(self, git_repo):
+        with open(git_repo / ".git" / "config", "a", encoding="utf-8") as f:
+            f.write("[extensions]\n\tobjectformat = sha256\n")
+        assert NativeObjectStore.open(git_repo / ".git") is None
+
+
+class TestGitDBNativeIntegration:
+    def test_git_db_reads_without_subprocess(self, git_repo):
+        _make_history(git_repo, count=2)
+        subprocess.run(["git", "repack", "-adf", "-q"], cwd=git_repo, check=True)
+        db = GitDB(git_repo)
+        tree = subprocess.check_output(["git", "rev-parse", "HEAD^{tree}"], cwd=git_repo).decode().strip()
+
+        blobs = db.get_blobs_from_tree(tree)
+        assert set(blobs) == {"data.txt", "note_0.md", "note_1.md"}
+        assert blobs["note_1.md"] == b"note 1\n" * 20
+
+        # 所有读取都由进程内读取器完成，cat-file 协进程从未启动
+        assert db._cat_file_pool._processes == {}
+        db.close()
+
+    def test_git_db_falls_back_to_subprocess(self, git_repo):
+        db = GitDB(git_repo, native_reader=False)
+        h = db.hash_object(b"fallback")
+        assert db.batch_cat_file([h]) == {h: b"fallback"}
+        assert db._odb is None
+        db.close()
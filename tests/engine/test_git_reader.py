@@ -5,6 +5,7 @@ import time
 import pytest
 from pyquipu.engine.git_db import GitDB
 from pyquipu.engine.git_object_storage import GitObjectHistoryReader, GitObjectHistoryWriter
+from pyquipu.engine.graph_snapshot import load_graph_snapshot
 
 
 @pytest.fixture
@@ -188,3 +189,194 @@ class TestGitObjectHistoryReader:
         # C should be correctly parented to A, effectively ignoring the bad commit.
         assert found_node_c.parent == found_node_a
         assert found_node_a.children == [found_node_c]
+
+    def test_graph_is_cached_until_refs_change(self, reader_setup, monkeypatch):
+        """测试：refs 不变时各查询复用同一份图，写入新节点后自动失效"""
+        reader, writer, git_db, _ = reader_setup
+        h0 = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        tree_a = git_db.mktree(f"100644 blob {git_db.hash_object(b'a')}\tfile")
+        tree_b = git_db.mktree(f"100644 blob {git_db.hash_object(b'b')}\tfile")
+        writer.create_node("plan", h0, tree_a, "A", start_time=1000)
+
+        loads = []
+        original_build = reader._build_graph
+        monkeypatch.setattr(reader, "_build_graph", lambda key: loads.append(1) or original_build(key))
+
+        assert reader.get_node_count() == 1
+        assert reader.get_node_position(tree_a) == 0
+        assert len(reader.load_nodes_paginated(10, 0)) == 1
+        assert len(reader.find_nodes(node_type="plan")) == 1
+        assert len(loads) == 1
+
+        # 调用方修改返回的列表不影响缓存
+        reader.load_all_nodes().clear()
+        assert reader.get_node_count() == 1
+
+        writer.create_node("plan", tree_a, tree_b, "B", start_time=2000)
+        assert reader.get_node_count() == 2
+        assert reader.get_node_position(tree_b) == 0 and reader.get_node_position(tree_a) == 1
+        assert len(loads) == 2
+
+        # 其它进程写入的引用通过文件系统指纹发现
+        other = GitObjectHistoryWriter(GitDB(git_db.root))
+        other.create_node("plan", tree_b, tree_a, "C", start_time=3000)
+        assert reader.get_node_count() == 3
+
+    def test_get_contents_uses_batched_reads(self, reader_setup, monkeypatch):
+        """测试：批量读取内容时 commit / tree / blob 各只需一次批量读取"""
+        reader, writer, git_db, _ = reader_setup
+        h0 = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        tree = h0
+        for i in range(5):
+            new_tree = git_db.mktree(f"100644 blob {git_db.hash_object(str(i).encode())}\tfile")
+            writer.create_node("plan", tree, new_tree, f"Content {i}", start_time=1000 + i)
+            tree = new_tree
+
+        nodes = reader.load_all_nodes()
+        calls = []
+        original = git_db.batch_cat_file
+        monkeypatch.setattr(git_db, "batch_cat_file", lambda hashes: calls.append(len(hashes)) or original(hashes))
+
+        contents = reader.get_contents(nodes)
+        assert calls == [5, 5, 5]
+        assert sorted(contents.values()) == [f"Content {i}" for i in range(5)]
+        assert all(node.content == contents[node.commit_hash] for node in nodes)
+
+        # 已加载的内容直接复用
+        assert reader.get_node_content(nodes[0]) == nodes[0].content
+        assert calls == [5, 5, 5]
+
+
+class TestReaderGraphStore:
+    def test_cache_holds_columns_not_nodes(self, reader_setup):
+        reader, writer, git_db, _ = reader_setup
+        h0 = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        tree_a = git_db.mktree(f"100644 blob {git_db.hash_object(b'a')}\tfile")
+        tree_b = git_db.mktree(f"100644 blob {git_db.hash_object(b'b')}\tfile")
+        node_a = writer.create_node("plan", h0, tree_a, "Plan A", start_time=1000)
+        writer.create_node("plan", tree_a, tree_b, "Plan B", start_time=2000)
+        writer.create_node("plan", tree_b, tree_a, "Back to A", start_time=3000)
+
+        store = reader.load_graph_store()
+        assert reader.load_graph_store() is store
+        assert len(store) == 3 and len(store._views) == 0
+
+        # 计数、定位与分页查询都直接基于列，不会物化其它节点
+        assert reader.get_node_count() == 3
+        assert reader.get_node_position(tree_a) == 0 and reader.get_node_position(tree_b) == 1
+        assert reader.get_node_position(h0) == -1
+        assert len(store._views) == 0
+        assert [n.summary for n in reader.find_nodes(summary_regex="plan", limit=1)] == ["Plan B"]
+        assert store.find_by_output_tree(tree_a).summary == "Back to A"
+        assert store[node_a.commit_hash].children[0].summary == "Plan B"
+
+
+class TestGraphSnapshot:
+    H0 = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+    def _tree(self, git_db, content: bytes) -> str:
+        return git_db.mktree(f"100644 blob {git_db.hash_object(content)}\tfile")
+
+    def _reader(self, git_db, path, monkeypatch=None, log_calls=None):
+        # 每次使用新的 GitDB 与 Reader，模拟新的 CLI 进程
+        db = GitDB(git_db.root)
+        if monkeypatch is not None:
+            original_iter_log = db.iter_log
+            monkeypatch.setattr(
+                db, "iter_log", lambda *a, **kw: log_calls.append((a, kw)) or original_iter_log(*a, **kw)
+            )
+        return GitObjectHistoryReader(db, snapshot_path=path)
+
+    def _shape(self, nodes):
+        return sorted(
+            (
+                n.commit_hash,
+                n.output_tree,
+                n.input_tree,
+                n.parent.commit_hash if n.parent else None,
+                n.summary,
+                n.node_type,
+            )
+            for n in nodes
+        )
+
+    def test_snapshot_round_trip_skips_git_log(self, reader_setup, tmp_path, monkeypatch):
+        _, writer, git_db, _ = reader_setup
+        path = tmp_path / "graph.snapshot"
+        tree_a, tree_b = self._tree(git_db, b"a"), self._tree(git_db, b"b")
+        node_a = writer.create_node("plan", self.H0, tree_a, "Plan A", start_time=1000)
+        writer.create_node("capture", tree_a, tree_b, "Capture B", start_time=2000)
+
+        expected = self._shape(self._reader(git_db, path).load_all_nodes())
+        assert path.exists()
+
+        log_calls = []
+        nodes = self._reader(git_db, path, monkeypatch, log_calls).load_all_nodes()
+        assert log_calls == []
+        assert self._shape(nodes) == expected
+        by_hash = {n.commit_hash: n for n in nodes}
+        assert by_hash[node_a.commit_hash].children[0].node_type == "capture"
+        assert by_hash[node_a.commit_hash].timestamp.timestamp() == 1000
+
+    def test_snapshot_is_extended_with_new_commits_only(self, reader_setup, tmp_path, monkeypatch):
+        _, writer, git_db, _ = reader_setup
+        path = tmp_path / "graph.snapshot"
+        tree_a, tree_b = self._tree(git_db, b"a"), self._tree(git_db, b"b")
+        node_a = writer.create_node("plan", self.H0, tree_a, "Plan A", start_time=1000)
+        self._reader(git_db, path).load_all_nodes()
+
+        node_b = writer.create_node("plan", tree_a, tree_b, "Plan B", start_time=2000)
+        log_calls = []
+        nodes = self._reader(git_db, path, monkeypatch, log_calls).load_all_nodes()
+
+        assert len(log_calls) == 1
+        args, kwargs = log_calls[0]
+        assert args[0] == [node_b.commit_hash] and node_a.commit_hash in kwargs["exclude"]
+        assert self._shape(nodes) == self._shape(GitObjectHistoryReader(git_db).load_all_nodes())
+
+    def test_snapshot_drops_pruned_branches(self, reader_setup, tmp_path):
+        _, writer, git_db, _ = reader_setup
+        path = tmp_path / "graph.snapshot"
+        tree_a, tree_b, tree_c = (self._tree(git_db, c) for c in (b"a", b"b", b"c"))
+        writer.create_node("plan", self.H0, tree_a, "Plan A", start_time=1000)
+        writer.create_node("plan", tree_a, tree_b, "Plan B", start_time=2000)
+        node_c = writer.create_node("plan", tree_a, tree_c, "Plan C", start_time=3000)
+        assert len(self._reader(git_db, path).load_all_nodes()) == 3
+
+        git_db.delete_ref(f"refs/quipu/local/heads/{node_c.commit_hash}")
+        nodes = self._reader(git_db, path).load_all_nodes()
+        assert sorted(n.summary for n in nodes) == ["Plan A", "Plan B"]
+
+    def test_corrupt_snapshot_is_rebuilt(self, reader_setup, tmp_path):
+        _, writer, git_db, _ = reader_setup
+        path = tmp_path / "graph.snapshot"
+        writer.create_node("plan", self.H0, self._tree(git_db, b"a"), "Plan A", start_time=1000)
+        path.write_bytes(b"QGRS garbage")
+
+        assert [n.summary for n in self._reader(git_db, path).load_all_nodes()] == ["Plan A"]
+        assert path.read_bytes().startswith(b"QGRS") and len(path.read_bytes()) > 100
+
+    def test_truncated_snapshot_is_rebuilt(self, reader_setup, tmp_path):
+        _, writer, git_db, _ = reader_setup
+        path = tmp_path / "graph.snapshot"
+        writer.create_node("plan", self.H0, self._tree(git_db, b"a"), "Plan A", start_time=1000)
+        self._reader(git_db, path).load_all_nodes()
+        path.write_bytes(path.read_bytes()[:-3])
+
+        assert load_graph_snapshot(path) is None
+        assert [n.summary for n in self._reader(git_db, path).load_all_nodes()] == ["Plan A"]
+
+    def test_snapshot_loads_columns_without_materializing_nodes(self, reader_setup, tmp_path):
+        _, writer, git_db, _ = reader_setup
+        path = tmp_path / "graph.snapshot"
+        tree_a, tree_b = self._tree(git_db, b"a"), self._tree(git_db, b"b")
+        node_a = writer.create_node("plan", self.H0, tree_a, "Plan A", start_time=1000)
+        node_b = writer.create_node("plan", tree_a, tree_b, "Plan B", start_time=2000)
+        self._reader(git_db, path).load_all_nodes()
+
+        store = load_graph_snapshot(path).store
+        assert len(store) == 2 and len(store._views) == 0
+        assert store.find_by_output_tree(tree_b).commit_hash == node_b.commit_hash
+        view = store[node_b.commit_hash]
+        assert (view.summary, view.node_type, view.input_tree) == ("Plan B", "plan", tree_a)
+        assert view.parent.commit_hash == node_a.commit_hash
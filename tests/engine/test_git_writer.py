@@ -5,6 +5,7 @@ from unittest.mock import MagicMock
 import pytest
 from pyquipu.engine.git_db import GitDB
 from pyquipu.engine.git_object_storage import GitObjectHistoryWriter
+from pyquipu.interfaces.models import ImportRecord
 
 
 @pytest.fixture
@@ -108,3 +109,187 @@ class TestGitObjectHistoryWriterIntegration:
         assert meta_data["type"] == "plan"
         assert meta_data["summary"] == "feat: Initial implementation"
         assert meta_data["generator"]["id"] == "manual"
+
+    def test_parent_resolved_via_output_tree_index(self, git_writer_setup, monkeypatch):
+        """测试：未显式指定父节点时，通过 output_tree 索引解析父节点，而不扫描整个仓库"""
+        writer, git_db, repo_path = git_writer_setup
+        empty_tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+        (repo_path / "a.txt").write_text("a", "utf-8")
+        tree_a = git_db.get_tree_hash()
+        node_a = writer.create_node("plan", empty_tree, tree_a, "# A")
+
+        original_run = git_db._run
+
+        def guarded_run(args, **kwargs):
+            assert "--all" not in args, "get_commit_by_output_tree should not scan all refs"
+            return original_run(args, **kwargs)
+
+        monkeypatch.setattr(git_db, "_run", guarded_run)
+
+        (repo_path / "b.txt").write_text("b", "utf-8")
+        tree_b = git_db.get_tree_hash()
+        node_b = writer.create_node("plan", tree_a, tree_b, "# B")
+
+        assert node_b.parent.commit_hash == node_a.commit_hash
+        assert git_db.get_commit_by_output_tree(tree_b) == node_b.commit_hash
+
+    def test_create_node_spawns_no_git_processes(self, git_writer_setup, monkeypatch):
+        """测试：进程内写入器创建节点时不启动任何 git 子进程，且对象可被 git 正常读取"""
+        writer, git_db, repo_path = git_writer_setup
+        empty_tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        (repo_path / "a.txt").write_text("a", "utf-8")
+        tree_a = git_db.get_tree_hash()
+        node_a = writer.create_node("plan", empty_tree, tree_a, "# A")
+
+        (repo_path / "b.txt").write_text("b", "utf-8")
+        tree_b = git_db.get_tree_hash()
+        monkeypatch.setattr(git_db, "_run", lambda *a, **k: pytest.fail(f"unexpected git call: {a}"))
+        monkeypatch.setattr(
+            "pyquipu.engine.git_db.subprocess.run", lambda *a, **k: pytest.fail(f"unexpected subprocess: {a}")
+        )
+        node_b = writer.create_node("plan", tree_a, tree_b, "# B", parent_commit_hash=node_a.commit_hash)
+        monkeypatch.undo()
+
+        ref = f"refs/quipu/local/heads/{node_b.commit_hash}"
+        head = subprocess.check_output(["git", "rev-parse", ref], cwd=repo_path, text=True)
+        assert head.strip() == node_b.commit_hash
+        parents = subprocess.check_output(["git", "rev-parse", f"{node_b.commit_hash}^@"], cwd=repo_path, text=True)
+        assert parents.split() == [node_a.commit_hash]
+        subprocess.run(["git", "fsck", "--strict", "--no-dangling"], cwd=repo_path, check=True, capture_output=True)
+
+    def test_import_nodes_writes_single_pack(self, git_writer_setup):
+        """测试：批量导入将所有对象写入一个 pack，只为叶子节点创建 head 引用"""
+        writer, git_db, repo_path = git_writer_setup
+        (repo_path / "a.txt").write_text("a", "utf-8")
+        tree_a = git_db.get_tree_hash()
+        (repo_path / "b.txt").write_text("b", "utf-8")
+        tree_b = git_db.get_tree_hash()
+
+        records = [
+            ImportRecord(key="root", node_type="plan", content="# Root", output_tree=tree_a, timestamp=1700000000),
+            ImportRecord(key="left", node_type="plan", content="# Left", parent="root", output_tree=tree_b),
+            ImportRecord(key="right", node_type="plan", content="# Right", parent="root", output_tree=tree_a),
+        ]
+        root, left, right = writer.import_nodes(records)
+
+        packs = list((repo_path / ".git" / "objects" / "pack").glob("*.pack"))
+        assert len(packs) == 1
+        assert (packs[0].with_suffix(".idx")).exists()
+        subprocess.run(["git", "fsck", "--strict", "--no-dangling"], cwd=repo_path, check=True, capture_output=True)
+
+        heads = subprocess.check_output(
+            ["git", "for-each-ref", "--format=%(objectname)", "refs/quipu/local/heads/"], cwd=repo_path, text=True
+        )
+        assert set(heads.split()) == {left.commit_hash, right.commit_hash}
+
+        assert left.parent is root and right.parent is root
+        assert left.input_tree == tree_a
+        assert root.summary == "Root"
+        parents = subprocess.check_output(["git", "rev-parse", f"{left.commit_hash}^@"], cwd=repo_path, text=True)
+        assert parents.split() == [root.commit_hash]
+
+        # 与 create_node 写出的节点结构一致
+        node_tree = subprocess.check_output(
+            ["git", "rev-parse", f"{left.commit_hash}^{{tree}}"], cwd=repo_path, text=True
+        )
+        raw_tree = git_db.cat_file(node_tree.strip(), "tree")
+        assert raw_tree.startswith(b"100444 content.md\0")
+        assert raw_tree.endswith(b"40000 snapshot\0" + bytes.fromhex(tree_b))
+        assert git_db.get_commit_by_output_tree(tree_b) == left.commit_hash
+
+    def test_import_nodes_rejects_unknown_parent(self, git_writer_setup):
+        writer, git_db, repo_path = git_writer_setup
+        records = [ImportRecord(key="orphan", node_type="plan", content="x", parent="missing")]
+        with pytest.raises(ValueError):
+            writer.import_nodes(records)
+
+        assert not list((repo_path / ".git" / "objects" / "pack").glob("*.pack"))
+        refs = subprocess.check_output(["git", "for-each-ref", "refs/quipu/"], cwd=repo_path, text=True)
+        assert refs == ""
+
+    def _import_capture_history(self, writer, git_db, repo_path):
+        trees = []
+        for name in ["a", "b", "c", "d", "e"]:
+            (repo_path / f"{name}.txt").write_text(name, "utf-8")
+            trees.append(git_db.get_tree_hash())
+        records = [ImportRecord(key="root", node_type="plan", content="# Root", output_tree=trees[0], timestamp=1000)]
+        for i, tree in enumerate(trees[1:4], start=1):
+            parent = "root" if i == 1 else f"c{i - 1}"
+            records.append(
+                ImportRecord(
+                    key=f"c{i}", node_type="capture", content="", parent=parent, output_tree=tree, timestamp=1000 + i
+                )
+            )
+        records.append(
+            ImportRecord(
+                key="tip", node_type="plan", content="# Tip", parent="c3", output_tree=trees[4], timestamp=2000
+            )
+        )
+        return writer.import_nodes(records), trees
+
+    def test_compact_captures_merges_chain_and_rewrites_descendants(self, git_writer_setup):
+        """测试：连续的 capture 链被合并为一个节点，后代被重写，head 在事务中迁移"""
+        writer, git_db, repo_path = git_writer_setup
+        (root, c1, c2, c3, tip), trees = self._import_capture_history(writer, git_db, repo_path)
+
+        result = writer.compact_captures(before=1500, min_length=2)
+
+        assert (result.chains, result.removed) == (1, 2)
+        merged = result.rewritten[c3.commit_hash]
+        assert result.rewritten[c1.commit_hash] == result.rewritten[c2.commit_hash] == merged
+        new_tip = result.rewritten[tip.commit_hash]
+        assert root.commit_hash not in result.rewritten
+
+        heads = subprocess.check_output(
+            ["git", "for-each-ref", "--format=%(objectname)", "refs/quipu/local/heads/"], cwd=repo_path, text=True
+        )
+        assert heads.split() == [new_tip]
+        log = subprocess.check_output(["git", "log", "--format=%H %P", new_tip], cwd=repo_path, text=True)
+        assert [line.split() for line in log.splitlines()] == [
+            [new_tip, merged],
+            [merged, root.commit_hash],
+            [root.commit_hash],
+        ]
+
+        # 合并节点保留链首的输入状态 (父节点的输出) 与链尾的输出状态
+        meta = json.loads(
+            subprocess.check_output(["git", "cat-file", "blob", f"{merged}:metadata.json"], cwd=repo_path)
+        )
+        assert meta["type"] == "capture" and meta["compacted"] == 3
+        assert meta["exec"]["start"] == 1001
+        assert git_db.get_commit_by_output_tree(trees[3]) == merged
+        assert git_db.get_commit_by_output_tree(trees[1]) is None
+        assert git_db.get_commit_by_output_tree(trees[4]) == new_tip
+        subprocess.run(["git", "fsck", "--strict", "--no-dangling"], cwd=repo_path, check=True, capture_output=True)
+
+    def test_compact_captures_respects_age_and_published_history(self, git_writer_setup):
+        writer, git_db, repo_path = git_writer_setup
+        (root, c1, c2, c3, tip), _ = self._import_capture_history(writer, git_db, repo_path)
+
+        # 只有 c1 早于阈值，不足以构成链
+        assert writer.compact_captures(before=1002, min_length=2).chains == 0
+
+        # 已发布到远程镜像的节点不会被改写
+        git_db.update_ref(f"refs/quipu/remotes/origin/someone/heads/{c2.commit_hash}", c2.commit_hash)
+        assert writer.compact_captures(before=1500, min_length=2).chains == 0
+
+    def test_pushed_history_is_not_compacted(self, git_writer_setup, tmp_path):
+        """测试：push → compact → push 不会改写已推送但尚未拉回的历史，远程不会出现重复的链"""
+        writer, git_db, repo_path = git_writer_setup
+        remote = tmp_path / "remote.git"
+        subprocess.run(["git", "init", "--bare", str(remote)], check=True, capture_output=True)
+        subprocess.run(["git", "remote", "add", "origin", str(remote)], cwd=repo_path, check=True)
+        self._import_capture_history(writer, git_db, repo_path)
+
+        def remote_heads():
+            out = subprocess.check_output(["git", "for-each-ref", "--format=%(objectname)"], cwd=remote, text=True)
+            return set(out.split())
+
+        git_db.push_quipu_refs("origin", "alice")
+        pushed = remote_heads()
+        assert git_db.get_all_ref_heads("refs/quipu/remotes/origin/alice/heads/")
+
+        assert writer.compact_captures(before=1500, min_length=2).chains == 0
+        git_db.push_quipu_refs("origin", "alice")
+        assert remote_heads() == pushed
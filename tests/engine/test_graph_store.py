@@ -0,0 +1,166 @@
+import gc
+import hashlib
+from datetime import datetime
+from pathlib import Path
+
+from pyquipu.engine.graph_store import GraphStore
+from pyquipu.engine.state_machine import Engine
+from pyquipu.interfaces.models import QuipuNode
+
+GENESIS = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _node(name: str, day: int, parent: QuipuNode = None, **kwargs) -> QuipuNode:
+    commit = _sha(f"commit-{name}")
+    node = QuipuNode(
+        commit_hash=commit,
+        output_tree=_sha(f"tree-{name}"),
+        input_tree=parent.output_tree if parent else GENESIS,
+        timestamp=datetime(2024, 1, day),
+        filename=Path(f".quipu/git_objects/{commit}"),
+        node_type=kwargs.pop("node_type", "plan"),
+        summary=name,
+        owner_id=kwargs.pop("owner_id", "alice"),
+        **kwargs,
+    )
+    if parent:
+        node.parent = parent
+        parent.children.append(node)
+    return node
+
+
+def _history():
+    # root -> a -> (b, c)，c 晚于 b
+    root = _node("root", 1)
+    a = _node("a", 2, root, content="plan a")
+    c = _node("c", 4, a, node_type="capture", owner_id="bob")
+    b = _node("b", 3, a)
+    return root, a, b, c
+
+
+class TestGraphStore:
+    def test_views_reproduce_object_graph(self):
+        root, a, b, c = _history()
+        # 子节点排在父节点之前，与按时间倒序加载的结果一致
+        store = GraphStore.from_nodes([c, b, a, root, a])
+
+        assert len(store) == 4
+        assert list(store) == [c.commit_hash, b.commit_hash, a.commit_hash, root.commit_hash]
+        assert a.commit_hash in store and "not-a-hash" not in store
+
+        view_a = store[a.commit_hash]
+        assert (view_a.summary, view_a.node_type, view_a.owner_id) == ("a", "plan", "alice")
+        assert view_a.input_tree == root.output_tree and view_a.timestamp == a.timestamp
+        assert view_a.filename == a.filename and view_a.content == "plan a"
+        assert view_a.parent is store[root.commit_hash]
+        assert [child.summary for child in view_a.children] == ["b", "c"]
+        assert store[c.commit_hash].owner_id == "bob" and store[root.commit_hash].parent is None
+
+    def test_views_are_materialized_lazily(self):
+        root, a, b, c = _history()
+        store = GraphStore.from_nodes([root, a, b, c])
+        assert len(store._views) == 0
+
+        view = store[b.commit_hash]
+        assert store[b.commit_hash] is view
+        view.content = "loaded later"
+        del view
+        gc.collect()
+        # 视图被回收后重新物化，内容保存在存储中
+        assert len(store._views) == 0
+        assert store[b.commit_hash].content == "loaded later"
+
+    def test_add_links_into_materialized_parent(self):
+        root, a, b, c = _history()
+        store = GraphStore.from_nodes([root, a, b])
+        parent = store[a.commit_hash]
+        assert [child.summary for child in parent.children] == ["b"]
+
+        added = store.add(c)
+        assert added.parent is parent
+        assert [child.summary for child in parent.children] == ["b", "c"]
+        assert store.add(c) is added
+        assert store[root.commit_hash].children == [parent]
+
+    def test_queries(self):
+        root, a, b, c = _history()
+        store = GraphStore.from_nodes([b, root, c, a])
+
+        assert store.find_by_output_tree(a.output_tree).summary == "a"
+        assert store.find_by_output_tree(GENESIS) is None
+        assert store.latest().summary == "c"
+        assert [n.summary for n in store.sorted_nodes()] == ["c", "b", "a", "root"]
+        assert GraphStore().latest() is None
+
+    def test_find_by_prefix(self):
+        root, a, b, c = _history()
+        store = GraphStore.from_nodes([root, a, b, c])
+
+        # 奇数与偶数长度前缀、大小写、commit 与 tree 两列
+        assert [n.summary for n in store.find_by_prefix(a.commit_hash[:7])] == ["a"]
+        assert [n.summary for n in store.find_by_prefix(b.output_tree[:8].upper())] == ["b"]
+        assert store.find_by_prefix(c.commit_hash[:9], commit=False) == []
+        assert [n.summary for n in store.find_by_prefix(c.output_tree, commit=False)] == ["c"]
+        assert len(store.find_by_prefix("")) == 4
+        assert store.find_by_prefix("zz") == []
+
+    def test_view_field_assignment_is_persisted(self):
+        root, a, b, c = _history()
+        store = GraphStore.from_nodes([root, a, b, c])
+        view = store[b.commit_hash]
+        view.summary, view.node_type, view.owner_id = "renamed", "capture", "carol"
+        del view
+        gc.collect()
+
+        view = store[b.commit_hash]
+        assert (view.summary, view.node_type, view.owner_id) == ("renamed", "capture", "carol")
+
+    def test_records_and_columns_round_trip(self):
+        root, a, b, c = _history()
+        store = GraphStore()
+        # 子节点先于父节点写入，父节点在整批写入后统一解析
+        for node in (c, b, a, root):
+            store.append_record(
+                node.commit_hash, node.output_tree, node.timestamp.timestamp(), node.node_type, node.summary
+            )
+        parents = [a, a, root, None]
+        store.link_parents(0, b"".join(bytes.fromhex(p.commit_hash) if p else bytes(20) for p in parents))
+        store[b.commit_hash].summary = "renamed"
+
+        copy = GraphStore.from_columns(store.columns())
+        assert len(copy._views) == 0
+        assert [n.summary for n in copy.sorted_nodes()] == ["c", "renamed", "a", "root"]
+        assert [child.summary for child in copy[a.commit_hash].children] == ["renamed", "c"]
+        assert copy[a.commit_hash].input_tree == root.output_tree
+        assert copy.all_reachable_from([b.commit_hash, c.commit_hash])
+        assert not copy.all_reachable_from([b.commit_hash])
+
+
+def test_engine_keeps_history_in_graph_store(engine_instance: Engine):
+    engine, repo_path = engine_instance, engine_instance.root_dir
+    (repo_path / "a.txt").write_text("1", "utf-8")
+    first = engine.capture_drift(engine.git_db.get_tree_hash())
+    (repo_path / "a.txt").write_text("2", "utf-8")
+    engine.capture_drift(engine.git_db.get_tree_hash())
+
+    engine.align()
+
+    assert isinstance(engine.history_graph, GraphStore)
+    assert engine.current_node is engine.history_graph.latest()
+    assert engine.current_node.parent.commit_hash == first.commit_hash
+    assert engine.history_graph[first.commit_hash].children == [engine.current_node]
+
+
+def test_engine_shares_reader_graph_store(engine_instance: Engine):
+    engine, repo_path = engine_instance, engine_instance.root_dir
+    (repo_path / "a.txt").write_text("1", "utf-8")
+    engine.capture_drift(engine.git_db.get_tree_hash())
+
+    engine.align()
+
+    # Reader 支持列式加载时，Engine 直接复用其缓存的存储
+    assert engine.history_graph is engine.reader.load_graph_store()
@@ -0,0 +1,148 @@
+import subprocess
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from pyquipu.application.factory import create_engine
+from pyquipu.engine.git_db import GitDB
+from pyquipu.engine.snapshot_policy import SnapshotPolicy, is_pointer, parse_pointer
+
+
+@pytest.fixture
+def git_repo(tmp_path: Path) -> Path:
+    root = tmp_path / "repo"
+    root.mkdir()
+    subprocess.run(["git", "init"], cwd=root, check=True, capture_output=True)
+    subprocess.run(["git", "config", "user.email", "test@quipu.dev"], cwd=root, check=True)
+    subprocess.run(["git", "config", "user.name", "Quipu Test"], cwd=root, check=True)
+    return root
+
+
+@pytest.fixture
+def policy() -> SnapshotPolicy:
+    return SnapshotPolicy(max_file_size=4096, binary_max_size=512, exclude=["*.iso", "data/raw"])
+
+
+def _populate(root: Path):
+    (root / "src").mkdir()
+    (root / "src" / "main.py").write_text("print('hi')\n", encoding="utf-8")
+    (root / "huge.txt").write_text("x" * 5000, encoding="utf-8")
+    (root / "model.bin").write_bytes(b"\x00\x01" * 1000)
+    (root / "small.bin").write_bytes(b"\x00\x01" * 10)
+    (root / "disk.iso").write_bytes(b"iso")
+    (root / "src" / "nested.iso").write_bytes(b"iso")
+    (root / "data" / "raw").mkdir(parents=True)
+    (root / "data" / "raw" / "dump.csv").write_text("a,b\n", encoding="utf-8")
+    (root / "data" / "clean.csv").write_text("a\n", encoding="utf-8")
+
+
+def _tree_entries(root: Path, tree_hash: str) -> dict:
+    output = subprocess.check_output(["git", "ls-tree", "-r", tree_hash], cwd=root, text=True)
+    return {line.split("\t")[1]: line.split()[2] for line in output.splitlines()}
+
+
+def _blob(root: Path, sha: str) -> bytes:
+    return subprocess.check_output(["git", "cat-file", "blob", sha], cwd=root)
+
+
+class TestSnapshotPolicy:
+    def test_excludes_matches_basenames_and_directories(self, policy):
+        assert policy.excludes(b"disk.iso") and policy.excludes(b"a/b/c.iso")
+        assert policy.excludes(b"data/raw") and policy.excludes(b"data/raw/dump.csv")
+        assert not policy.excludes(b"data/clean.csv") and not policy.excludes(b"other/data/raw/x")
+
+    def test_default_config_keeps_full_snapshots(self, git_repo):
+        assert not SnapshotPolicy().active
+        engine = create_engine(git_repo)
+        try:
+            assert engine.git_db._snapshot_policy is None
+        finally:
+            engine.close()
+
+    def test_cache_key_changes_with_settings(self, policy):
+        assert policy.cache_key == SnapshotPolicy(4096, 512, ["*.iso", "data/raw"]).cache_key
+        assert policy.cache_key != SnapshotPolicy(8192, 512, ["*.iso", "data/raw"]).cache_key
+
+    @pytest.mark.parametrize("tree_hasher", [True, False])
+    def test_oversized_files_become_pointer_entries(self, git_repo, policy, tree_hasher):
+        _populate(git_repo)
+        db = GitDB(git_repo, tree_hasher=tree_hasher, snapshot_policy=policy)
+        entries = _tree_entries(git_repo, db.get_tree_hash())
+
+        assert sorted(entries) == ["data/clean.csv", "huge.txt", "model.bin", "small.bin", "src/main.py"]
+        huge = _blob(git_repo, entries["huge.txt"])
+        assert is_pointer(huge)
+        fields = parse_pointer(huge)
+        assert fields["path"] == "huge.txt" and fields["size"] == "5000"
+        assert fields["sample"].startswith("sha1:")
+        assert is_pointer(_blob(git_repo, entries["model.bin"]))
+        assert _blob(git_repo, entries["small.bin"]) == b"\x00\x01" * 10
+
+    def test_tree_hasher_matches_index_path(self, git_repo, policy):
+        _populate(git_repo)
+        db = GitDB(git_repo, snapshot_policy=policy)
+        assert db.get_tree_hash() == db._get_tree_hash_via_index()
+
+    def test_capture_reports_new_pointers(self, git_repo, policy, monkeypatch):
+        mock_bus = MagicMock()
+        monkeypatch.setattr("pyquipu.engine.git_db.bus", mock_bus)
+        db = GitDB(git_repo, snapshot_policy=policy)
+        (git_repo / "a.txt").write_text("a")
+        base = db.get_tree_hash()
+        (git_repo / "huge.txt").write_text("x" * 5000)
+
+        assert db.report_new_pointers(base, db.get_tree_hash()) == ["huge.txt"]
+        mock_bus.warning.assert_called_once_with("engine.snapshot.warning.pointersCaptured", count=1, paths="huge.txt")
+
+
+class TestPointerCheckout:
+    def _prepare(self, repo: Path, db: GitDB):
+        (repo / "a.txt").write_text("v1")
+        (repo / "huge.txt").write_text("x" * 5000)
+        hash_a = db.get_tree_hash()
+        (repo / "a.txt").write_text("v2")
+        hash_b = db.get_tree_hash()
+        db.checkout_tree(hash_a)
+        return hash_a, hash_b
+
+    @pytest.mark.parametrize("targeted", [True, False])
+    def test_checkout_keeps_real_file_behind_pointer(self, git_repo, policy, monkeypatch, targeted):
+        db = GitDB(git_repo, snapshot_policy=policy, targeted_checkout=targeted)
+        hash_a, hash_b = self._prepare(git_repo, db)
+        db.checkout_tree(hash_b, old_tree_hash=hash_a)
+        # 状态 C 中不再包含指针路径；移开再移回以保持 mtime，使工作区仍精确处于状态 B
+        (git_repo / "huge.txt").rename(git_repo.parent / "huge.moved")
+        hash_c = db.get_tree_hash()
+        (git_repo.parent / "huge.moved").rename(git_repo / "huge.txt")
+        assert db.get_tree_hash() == hash_b
+
+        mock_bus = MagicMock()
+        monkeypatch.setattr("pyquipu.engine.git_db.bus", mock_bus)
+        db.checkout_tree(hash_c, old_tree_hash=hash_b)
+
+        assert (git_repo / "huge.txt").read_text() == "x" * 5000
+        assert (git_repo / "a.txt").read_text() == "v2"
+        mock_bus.warning.assert_called_once_with("engine.snapshot.warning.pointersKept", count=1, paths="huge.txt")
+
+    def test_full_checkout_warns_when_content_is_missing(self, git_repo, policy, monkeypatch):
+        db = GitDB(git_repo, snapshot_policy=policy)
+        hash_a, _ = self._prepare(git_repo, db)
+        (git_repo / "huge.txt").unlink()
+
+        mock_bus = MagicMock()
+        monkeypatch.setattr("pyquipu.engine.git_db.bus", mock_bus)
+        db.checkout_tree(hash_a)
+
+        assert is_pointer((git_repo / "huge.txt").read_bytes())
+        mock_bus.warning.assert_called_once_with("engine.snapshot.warning.pointersMissing", count=1, paths="huge.txt")
+
+    def test_full_checkout_preserves_excluded_files(self, git_repo, policy):
+        db = GitDB(git_repo, snapshot_policy=policy)
+        hash_a, _ = self._prepare(git_repo, db)
+        (git_repo / "disk.iso").write_bytes(b"iso")
+        (git_repo / "stray.txt").write_text("untracked")
+
+        db.checkout_tree(hash_a)
+
+        assert (git_repo / "disk.iso").exists()
+        assert not (git_repo / "stray.txt").exists()
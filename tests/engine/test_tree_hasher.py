@@ -0,0 +1,158 @@
+import os
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+from pyquipu.engine.git_db import GitDB
+
+
+@pytest.fixture
+def git_repo(tmp_path: Path) -> Path:
+    root = tmp_path / "repo"
+    root.mkdir()
+    subprocess.run(["git", "init"], cwd=root, check=True, capture_output=True)
+    subprocess.run(["git", "config", "user.email", "test@quipu.dev"], cwd=root, check=True)
+    subprocess.run(["git", "config", "user.name", "Quipu Test"], cwd=root, check=True)
+    return root
+
+
+@pytest.fixture
+def db(git_repo: Path) -> GitDB:
+    return GitDB(git_repo)
+
+
+def _age_files(root: Path, seconds: int = 60):
+    """将工作区文件的 mtime 回拨，使其脱离 racy 窗口并进入 stat 缓存"""
+    past = time.time() - seconds
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != ".git"]
+        for name in filenames:
+            os.utime(os.path.join(dirpath, name), (past, past), follow_symlinks=False)
+
+
+def _populate(root: Path):
+    (root / "src" / "pkg").mkdir(parents=True)
+    (root / "src" / "pkg" / "mod.py").write_text("print('hi')\n", encoding="utf-8")
+    (root / "src" / "pkg.txt").write_text("sorts before pkg/\n", encoding="utf-8")
+    (root / "src" / "pkg-a").write_text("sorts before pkg too\n", encoding="utf-8")
+    (root / "README.md").write_text("# readme\n", encoding="utf-8")
+    (root / "empty.txt").write_bytes(b"")
+    script = root / "run.sh"
+    script.write_text("#!/bin/sh\necho run\n", encoding="utf-8")
+    script.chmod(0o755)
+    os.symlink("README.md", root / "link.md")
+    (root / ".gitignore").write_text("*.log\nbuild/\n", encoding="utf-8")
+    (root / "debug.log").write_text("ignored\n", encoding="utf-8")
+    (root / "build").mkdir()
+    (root / "build" / "out.bin").write_bytes(b"\x00\x01")
+
+
+class TestWorkspaceTreeHasher:
+    def test_matches_git_add_path(self, git_repo, db):
+        """进程内计算的 Tree Hash 必须与 git add -A + write-tree 完全一致"""
+        _populate(git_repo)
+        assert db.get_tree_hash() == db._get_tree_hash_via_index()
+
+    def test_matches_with_tracked_and_deleted_files(self, git_repo, db):
+        _populate(git_repo)
+        subprocess.run(["git", "add", "-A"], cwd=git_repo, check=True)
+        subprocess.run(["git", "commit", "-q", "-m", "init"], cwd=git_repo, check=True)
+
+        (git_repo / "README.md").unlink()
+        (git_repo / "src" / "pkg" / "mod.py").write_text("changed\n", encoding="utf-8")
+        (git_repo / "src" / "new.py").write_text("new\n", encoding="utf-8")
+
+        assert db.get_tree_hash() == db._get_tree_hash_via_index()
+
+    def test_empty_workspace_is_empty_tree(self, git_repo, db):
+        tree_hash = db.get_tree_hash()
+        assert tree_hash == "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+        assert db.cat_file(tree_hash, "tree") == b""
+
+    def test_objects_are_written(self, git_repo, db):
+        _populate(git_repo)
+        tree_hash = db.get_tree_hash()
+        listing = subprocess.check_output(["git", "ls-tree", "-r", tree_hash], cwd=git_repo).decode()
+        assert "src/pkg/mod.py" in listing
+        assert "debug.log" not in listing
+        subprocess.run(["git", "fsck", "--no-dangling"], cwd=git_repo, check=True, capture_output=True)
+
+    def test_cache_detects_changes(self, git_repo, db):
+        """stat 缓存命中后，再次修改、删除、新增文件都必须反映在结果中"""
+        _populate(git_repo)
+        _age_files(git_repo)
+        first = db.get_tree_hash()
+        assert (git_repo / ".git" / "quipu" / "tree_cache").exists()
+        assert db.get_tree_hash() == first
+
+        (git_repo / "src" / "pkg" / "mod.py").write_text("print('changed')\n", encoding="utf-8")
+        changed = db.get_tree_hash()
+        assert changed != first
+        assert changed == db._get_tree_hash_via_index()
+
+        (git_repo / "src" / "pkg.txt").unlink()
+        (git_repo / "src" / "extra" / "deep").mkdir(parents=True)
+        (git_repo / "src" / "extra" / "deep" / "x.txt").write_text("x", encoding="utf-8")
+        assert db.get_tree_hash() == db._get_tree_hash_via_index()
+
+    def test_cache_survives_new_instance(self, git_repo):
+        _populate(git_repo)
+        _age_files(git_repo)
+        first = GitDB(git_repo).get_tree_hash()
+
+        (git_repo / "run.sh").chmod(0o644)
+        second = GitDB(git_repo).get_tree_hash()
+        assert second != first
+        assert second == GitDB(git_repo)._get_tree_hash_via_index()
+
+    def test_corrupt_cache_is_ignored(self, git_repo, db):
+        _populate(git_repo)
+        _age_files(git_repo)
+        expected = db.get_tree_hash()
+
+        (git_repo / ".git" / "quipu" / "tree_cache").write_bytes(b"garbage")
+        assert GitDB(git_repo).get_tree_hash() == expected
+
+    def test_excludes_quipu_dir(self, git_repo, db):
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        base = db.get_tree_hash()
+        (git_repo / ".quipu").mkdir(exist_ok=True)
+        (git_repo / ".quipu" / "history.sqlite").write_bytes(b"data")
+        assert db.get_tree_hash() == base
+
+    @pytest.mark.parametrize(
+        "setup",
+        [
+            lambda root: (root / ".gitattributes").write_text("*.txt text\n", encoding="utf-8"),
+            lambda root: subprocess.run(["git", "config", "core.autocrlf", "input"], cwd=root, check=True),
+            lambda root: subprocess.run(["git", "config", "core.filemode", "false"], cwd=root, check=True),
+        ],
+        ids=["gitattributes", "autocrlf", "filemode"],
+    )
+    def test_falls_back_for_unsupported_features(self, git_repo, setup, monkeypatch):
+        _populate(git_repo)
+        setup(git_repo)
+        db = GitDB(git_repo)
+        monkeypatch.setattr(db._tree_hasher, "compute", lambda paths: pytest.fail("hasher should not run"))
+        assert db.get_tree_hash() == db._get_tree_hash_via_index()
+
+    def test_falls_back_for_nested_repository(self, git_repo, db, monkeypatch):
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        nested = git_repo / "vendor"
+        nested.mkdir()
+        subprocess.run(["git", "init", "-q"], cwd=nested, check=True)
+        (nested / "lib.py").write_text("lib", encoding="utf-8")
+        subprocess.run(["git", "add", "-A"], cwd=nested, check=True)
+        subprocess.run(
+            ["git", "-c", "user.email=a@b", "-c", "user.name=n", "commit", "-q", "-m", "lib"], cwd=nested, check=True
+        )
+
+        monkeypatch.setattr(db._tree_hasher, "compute", lambda paths: pytest.fail("hasher should not run"))
+        assert db.get_tree_hash() == db._get_tree_hash_via_index()
+
+    def test_disabled_by_flag(self, git_repo):
+        db = GitDB(git_repo, tree_hasher=False)
+        assert db._tree_hasher is None
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        assert len(db.get_tree_hash()) == 40
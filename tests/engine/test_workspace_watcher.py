@@ -0,0 +1,157 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from pyquipu.engine.git_db import GitDB
+from pyquipu.engine.workspace_watcher import WatcherUnavailableError, WorkspaceWatcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify 仅在 Linux 上可用")
+
+
+@pytest.fixture
+def git_repo(tmp_path: Path) -> Path:
+    root = tmp_path / "repo"
+    root.mkdir()
+    subprocess.run(["git", "init"], cwd=root, check=True, capture_output=True)
+    subprocess.run(["git", "config", "user.email", "test@quipu.dev"], cwd=root, check=True)
+    subprocess.run(["git", "config", "user.name", "Quipu Test"], cwd=root, check=True)
+    (root / "src").mkdir()
+    (root / "src" / "main.py").write_text("print('main')\n", encoding="utf-8")
+    (root / "README.md").write_text("# readme\n", encoding="utf-8")
+    (root / ".gitignore").write_text("*.log\nnode_modules/\n", encoding="utf-8")
+    return root
+
+
+@pytest.fixture
+def watcher(git_repo: Path):
+    git_db = GitDB(git_repo)
+    instance = WorkspaceWatcher(git_repo, git_db)
+    stop, ready = threading.Event(), threading.Event()
+    thread = threading.Thread(target=instance.run, args=(stop, ready), daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    yield instance
+    stop.set()
+    thread.join(5)
+    git_db.close()
+
+
+def _wait_for_journal(watcher: WorkspaceWatcher, *names: str):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        data = watcher.journal.journal_path.read_bytes()
+        if all(name.encode() in data for name in names):
+            return
+        time.sleep(0.02)
+    pytest.fail(f"watcher did not record {names}")
+
+
+def _forbid_full_scan(db: GitDB, monkeypatch):
+    monkeypatch.setattr(db._tree_hasher, "compute", lambda paths: pytest.fail("unexpected full scan"))
+
+
+class TestWorkspaceWatcher:
+    def test_without_watcher_uses_full_scan(self, git_repo):
+        db = GitDB(git_repo)
+        assert db._journal.read_changes(db._journal_guards()) is None
+        assert db.get_tree_hash() == db._get_tree_hash_via_index()
+        assert not db._journal.baseline_path.exists()
+
+    def test_clean_workspace_answered_from_journal(self, git_repo, watcher, monkeypatch):
+        db = GitDB(git_repo)
+        baseline = db.get_tree_hash()
+        assert db._journal.baseline_path.exists()
+
+        _forbid_full_scan(db, monkeypatch)
+        monkeypatch.setattr(db, "_list_workspace_paths", lambda *a: pytest.fail("unexpected ls-files"))
+        assert db.get_tree_hash() == baseline
+
+    def test_incremental_update_matches_full_scan(self, git_repo, watcher, monkeypatch):
+        db = GitDB(git_repo)
+        db.get_tree_hash()
+        _forbid_full_scan(db, monkeypatch)
+
+        (git_repo / "src" / "main.py").write_text("print('changed')\n", encoding="utf-8")
+        (git_repo / "README.md").unlink()
+        (git_repo / "docs" / "guide").mkdir(parents=True)
+        (git_repo / "docs" / "guide" / "intro.md").write_text("intro\n", encoding="utf-8")
+        (git_repo / "debug.log").write_text("ignored\n", encoding="utf-8")
+        _wait_for_journal(watcher, "src/main.py", "README.md", "docs", "debug.log")
+
+        incremental = db.get_tree_hash()
+        assert incremental == GitDB(git_repo, watch_journal=False).get_tree_hash()
+
+        # 新目录已被加入监视，后续对其中文件的修改同样能被记录
+        (git_repo / "docs" / "guide" / "intro.md").write_text("intro v2\n", encoding="utf-8")
+        _wait_for_journal(watcher, "docs/guide/intro.md")
+        assert db.get_tree_hash() == GitDB(git_repo, watch_journal=False).get_tree_hash()
+
+    def test_ignored_directories_are_not_watched(self, git_repo, watcher):
+        (git_repo / "node_modules" / "pkg").mkdir(parents=True)
+        (git_repo / "src" / "util.py").write_text("util\n", encoding="utf-8")
+        _wait_for_journal(watcher, "src/util.py")
+        assert b"node_modules" in watcher.journal.journal_path.read_bytes()
+
+        (git_repo / "node_modules" / "pkg" / "index.js").write_text("x", encoding="utf-8")
+        (git_repo / "src" / "other.py").write_text("other\n", encoding="utf-8")
+        _wait_for_journal(watcher, "src/other.py")
+        assert b"index.js" not in watcher.journal.journal_path.read_bytes()
+
+    def test_gitignore_change_forces_full_scan(self, git_repo, watcher):
+        db = GitDB(git_repo)
+        db.get_tree_hash()
+        (git_repo / "notes.txt").write_text("notes\n", encoding="utf-8")
+        (git_repo / ".gitignore").write_text("*.log\nnode_modules/\nsrc/\n", encoding="utf-8")
+        _wait_for_journal(watcher, ".gitignore", "notes.txt")
+
+        assert db.get_tree_hash() == GitDB(git_repo, watch_journal=False).get_tree_hash()
+
+    def test_journal_rotation_invalidates_baseline(self, git_repo, watcher):
+        db = GitDB(git_repo)
+        db.get_tree_hash()
+        watcher.max_entries = 1
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        (git_repo / "b.txt").write_text("b", encoding="utf-8")
+
+        deadline = time.time() + 5
+        while db._journal.read_changes(db._journal_guards()).paths is not None and time.time() < deadline:
+            time.sleep(0.02)
+        assert db._journal.read_changes(db._journal_guards()).paths is None
+        assert db.get_tree_hash() == GitDB(git_repo, watch_journal=False).get_tree_hash()
+
+    def test_second_watcher_is_rejected(self, git_repo, watcher):
+        with pytest.raises(WatcherUnavailableError):
+            WorkspaceWatcher(git_repo, GitDB(git_repo)).run(threading.Event())
+
+    def test_platform_without_fcntl_falls_back_to_full_scan(self, git_repo, watcher, monkeypatch):
+        monkeypatch.setattr("pyquipu.engine.workspace_watcher.fcntl", None)
+        db = GitDB(git_repo)
+        assert not db._journal.is_watcher_running()
+        assert db.get_tree_hash() == db._get_tree_hash_via_index()
+        with pytest.raises(WatcherUnavailableError):
+            WorkspaceWatcher(git_repo, db).run(threading.Event())
+
+    def test_cookie_handshake_sees_edits_made_just_before_hashing(self, git_repo, watcher):
+        db = GitDB(git_repo)
+        reference = GitDB(git_repo, tree_hasher=False)
+        db.get_tree_hash()
+        # 写入后立即计算：没有 cookie 屏障时，尚未被监视进程处理的事件会被漏掉
+        for i in range(50):
+            (git_repo / "src" / "main.py").write_text(f"print({i})\n", encoding="utf-8")
+            assert db.get_tree_hash() == reference.get_tree_hash()
+        assert list(db._journal.cookie_dir.iterdir()) == []
+
+    def test_unacknowledged_cookie_falls_back_to_full_scan(self, git_repo, watcher, monkeypatch):
+        db = GitDB(git_repo)
+        db.get_tree_hash()
+        monkeypatch.setattr(watcher, "_ack_cookies", lambda names: None)
+        original_sync = db._journal.sync
+        monkeypatch.setattr(db._journal, "sync", lambda: original_sync(timeout=0.05))
+
+        (git_repo / "README.md").write_text("# changed\n", encoding="utf-8")
+        assert db._journal.read_changes(db._journal_guards()) is None
+        assert db.get_tree_hash() == GitDB(git_repo, watch_journal=False).get_tree_hash()
+        assert list(db._journal.cookie_dir.iterdir()) == []
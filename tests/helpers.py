@@ -122,6 +122,10 @@ class InMemoryDB:
         changes = self.get_diff_name_status(old_tree, new_tree)
         return "\n".join(f"{status}\t{path}" for status, path in changes)
 
+    def report_new_pointers(self, old_tree: Optional[str], new_tree: str) -> List[str]:
+        # 内存文件系统不应用快照策略，不会产生指针条目
+        return []
+
 
 class InMemoryHistoryManager(HistoryReader, HistoryWriter):
     """同时实现 Reader 和 Writer 接口的内存历史管理器。"""
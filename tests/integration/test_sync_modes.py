@@ -1,5 +1,6 @@
 from pathlib import Path
 
+import yaml
 from pyquipu.cli.main import app
 from pyquipu.common.identity import get_user_id_from_email
 from typer.testing import CliRunner
@@ -19,6 +20,15 @@ def get_local_quipu_heads(work_dir: Path) -> set[str]:
     return set(refs_output.splitlines())
 
 
+def disable_head_compaction(work_dir: Path):
+    """让每个节点都保留自己的 head 引用，以便按引用粒度验证推送/修剪语义。"""
+    config_path = work_dir / ".quipu" / "config.yml"
+    config = yaml.safe_load(config_path.read_text()) if config_path.exists() else {}
+    config.setdefault("refs", {})["compact_heads"] = False
+    config_path.parent.mkdir(exist_ok=True)
+    config_path.write_text(yaml.dump(config))
+
+
 def create_node(work_dir: Path, content: str) -> str:
     """Helper to create a node and return its commit hash."""
     heads_before = get_local_quipu_heads(work_dir)
@@ -122,6 +132,7 @@ class TestSyncModes:
     def test_push_force_mode(self, sync_test_environment):
         """User A force-pushes, deleting a stale ref on the remote."""
         remote_path, user_a_path, _ = sync_test_environment
+        disable_head_compaction(user_a_path)
 
         # User A creates two nodes and pushes
         node1 = create_node(user_a_path, "node_to_keep")
@@ -150,6 +161,7 @@ class TestSyncModes:
         """User B has a stale local ref that should be pruned after pulling."""
         remote_path, user_a_path, user_b_path = sync_test_environment
         user_b_id = get_user_id_from_email("user.b@example.com")
+        disable_head_compaction(user_b_path)
 
         # User B creates two nodes and pushes
         node1_b = create_node(user_b_path, "b_node_to_keep")
@@ -204,3 +204,90 @@ class TestSyncWorkflow:
         # Verify Device 1 has the commit in LOCAL heads
         d1_local_refs = run_git_command(user_a_path, ["for-each-ref", "refs/quipu/local/heads"])
         assert d2_new_hash in d1_local_refs
+
+    def test_sync_multiple_remotes(self, sync_test_environment):
+        """--remotes 并发拉取多个远程，并向每个远程推送，输出分阶段耗时。"""
+        remote_path, user_a_path, _ = sync_test_environment
+        user_a_id = get_user_id_from_email("user.a@example.com")
+
+        mirror_path = remote_path.parent / "mirror.git"
+        run_git_command(remote_path.parent, ["init", "--bare", str(mirror_path)])
+        run_git_command(user_a_path, ["remote", "add", "mirror", str(mirror_path)])
+
+        sync_result = runner.invoke(app, ["sync", "--work-dir", str(user_a_path), "--remotes", "origin,mirror"])
+        assert sync_result.exit_code == 0, sync_result.stderr
+        assert "fetch[origin]" in sync_result.stderr
+        assert "fetch[mirror]" in sync_result.stderr
+        assert "push:" in sync_result.stderr
+
+        mirror_refs = run_git_command(mirror_path, ["for-each-ref", "--format=%(refname)", "refs/quipu/"])
+        assert f"refs/quipu/users/{user_a_id}/heads/" in mirror_refs
+
+        # 再次拉取后，每个远程都有自己的镜像命名空间
+        pull_result = runner.invoke(
+            app, ["sync", "--work-dir", str(user_a_path), "--remotes", "origin,mirror", "--mode", "pull-only"]
+        )
+        assert pull_result.exit_code == 0, pull_result.stderr
+        local_refs = run_git_command(user_a_path, ["for-each-ref", "--format=%(refname)", "refs/quipu/remotes/"])
+        assert f"refs/quipu/remotes/origin/{user_a_id}/heads/" in local_refs
+        assert f"refs/quipu/remotes/mirror/{user_a_id}/heads/" in local_refs
+
+    def test_shallow_sync_treats_truncated_parents_as_roots(self, sync_test_environment):
+        """--depth 只拉取最近的历史，截断处的节点作为根节点补水；之后加深会补上更早的历史与边。"""
+        remote_path, user_a_path, _ = sync_test_environment
+        user_a_id = get_user_id_from_email("user.a@example.com")
+
+        for name in ("deep1", "deep2", "deep3"):
+            (user_a_path / f"{name}.md").write_text(f"~~~~~act\necho '{name}'\n~~~~~")
+            runner.invoke(app, ["run", str(user_a_path / f"{name}.md"), "--work-dir", str(user_a_path), "-y"])
+        assert runner.invoke(app, ["sync", "--work-dir", str(user_a_path), "--mode", "push-only"]).exit_code == 0
+
+        user_c_path = remote_path.parent / "user_c"
+        run_git_command(remote_path.parent, ["clone", f"file://{remote_path}", str(user_c_path)])
+        run_git_command(user_c_path, ["config", "user.email", "user.c@example.com"])
+        run_git_command(user_c_path, ["config", "user.name", "User C"])
+        (user_c_path / ".quipu").mkdir(exist_ok=True)
+        (user_c_path / ".quipu" / "config.yml").write_text(
+            yaml.dump({"sync": {"subscriptions": [user_a_id]}, "storage": {"type": "sqlite"}})
+        )
+
+        sync_result = runner.invoke(
+            app, ["sync", "--work-dir", str(user_c_path), "--mode", "pull-only", "--depth", "1"]
+        )
+        assert sync_result.exit_code == 0, sync_result.stderr
+        assert (user_c_path / ".git" / "shallow").exists()
+        assert runner.invoke(app, ["cache", "sync", "--work-dir", str(user_c_path)]).exit_code == 0
+
+        db_path = user_c_path / ".quipu" / "history.sqlite"
+        conn = sqlite3.connect(db_path)
+        shallow_nodes = conn.execute("SELECT COUNT(*) FROM nodes WHERE owner_id = ?", (user_a_id,)).fetchone()[0]
+        remote_heads = run_git_command(
+            user_c_path, ["for-each-ref", "--format=%(objectname)", f"refs/quipu/remotes/origin/{user_a_id}/"]
+        ).splitlines()
+        assert shallow_nodes == len(set(remote_heads))
+        conn.close()
+
+        # 加深后，原来的边界节点获得父节点
+        sync_result = runner.invoke(
+            app, ["sync", "--work-dir", str(user_c_path), "--mode", "pull-only", "--depth", "1000"]
+        )
+        assert sync_result.exit_code == 0, sync_result.stderr
+        assert runner.invoke(app, ["cache", "sync", "--work-dir", str(user_c_path)]).exit_code == 0
+
+        log_lines = run_git_command(
+            user_a_path, ["log", "--all", "--format=%H %P", "--grep=X-Quipu-Output-Tree"]
+        ).splitlines()
+        user_a_commits = {line.split()[0] for line in log_lines}
+        non_roots = {line.split()[0] for line in log_lines if len(line.split()) > 1}
+        conn = sqlite3.connect(db_path)
+        hydrated = {row[0] for row in conn.execute("SELECT commit_hash FROM nodes WHERE owner_id = ?", (user_a_id,))}
+        edge_children = {row[0] for row in conn.execute("SELECT child_hash FROM edges")}
+        conn.close()
+        assert hydrated == user_a_commits
+        assert non_roots <= edge_children
+
+    def test_depth_and_since_are_exclusive(self, sync_test_environment):
+        _, user_a_path, _ = sync_test_environment
+        result = runner.invoke(app, ["sync", "--work-dir", str(user_a_path), "--depth", "1", "--since", "2024-01-01"])
+        assert result.exit_code == 1
+        assert "不能同时使用" in result.stderr